@@ -17,6 +17,7 @@ class UserProfile(models.Model):
     phone_number = models.CharField(max_length=20, blank=True)
     bio = models.TextField(blank=True)
     profile_image = models.ImageField(upload_to='profile_images/', blank=True, null=True)
+    profile_image_variants = models.JSONField(default=dict, blank=True, editable=False)
     date_of_birth = models.DateField(blank=True, null=True)
     location = models.CharField(max_length=100, blank=True)
     country = models.CharField(max_length=100, blank=True)
@@ -199,17 +199,17 @@ def learner_dashboard(request):
         return redirect('accounts:login')
 
     # Import here to avoid circular imports
-    from courses.models import Enrollment, Course
+    from courses.models import Course
+    from courses.services import LearnerDashboardService
 
     profile = request.user.userprofile
     
-    # Get user's enrollments
-    enrollments = Enrollment.objects.filter(user=request.user).order_by('-created_at')
+    # Get user's enrollments (cached, with course and progress preloaded)
+    summary = LearnerDashboardService.get_summary(request.user)
+    enrollments = summary['enrollments']
     
     # Get enrolled courses
-    enrolled_courses = []
-    for enrollment in enrollments:
-        enrolled_courses.append(enrollment.course)
+    enrolled_courses = [enrollment.course for enrollment in enrollments]
     
     # Get available courses (not enrolled)
     enrolled_course_ids = [course.id for course in enrolled_courses]
@@ -217,10 +217,10 @@ def learner_dashboard(request):
         is_active=True
     ).exclude(id__in=enrolled_course_ids)[:6]  # Limit to 6 courses
     
-    # Calculate statistics
-    active_enrollments = enrollments.filter(is_activated=True).count()
-    completed_payments = enrollments.filter(payment_status='completed').count()
-    total_enrollments = enrollments.count()
+    # Statistics are computed once when the summary is built
+    active_enrollments = summary['active_enrollments']
+    completed_payments = summary['completed_payments']
+    total_enrollments = summary['total_enrollments']
 
     context = {
         'profile': profile,
@@ -247,46 +247,36 @@ def instructor_dashboard(request):
 
     # Get instructor's courses and statistics
     try:
-        from courses.models import Course, Enrollment
+        from courses.models import Enrollment
+        from courses.services import InstructorQueueService
         
-        # Get courses assigned to this instructor
-        # Check both instructor field and if user is staff (can see all courses)
-        if request.user.is_staff:
-            instructor_courses = Course.objects.filter(
-                is_active=True
-            ).order_by('-created_at')
-        else:
-            instructor_courses = Course.objects.filter(
-                instructor=request.user,
-                is_active=True
-            ).order_by('-created_at')
-        
-        # If no courses found with instructor field, check if user is marked as instructor in profile
-        if not instructor_courses.exists() and profile.is_instructor:
-            # For now, show all courses if user is marked as instructor but no courses assigned
-            instructor_courses = Course.objects.filter(
-                is_active=True
-            ).order_by('-created_at')
+        # Courses are evaluated once; per-course project counters are
+        # maintained incrementally so they cost one query in total
+        instructor_courses = InstructorQueueService.get_instructor_courses(request.user, profile)
+        project_stats = InstructorQueueService.get_course_stats(instructor_courses)
+        course_ids = [course.id for course in instructor_courses]
         
         # Calculate total students across instructor's courses
         total_students = Enrollment.objects.filter(
-            course__in=instructor_courses,
+            course_id__in=course_ids,
             is_activated=True
         ).count()
         
         # Get recent activity from instructor's courses
         recent_enrollments = Enrollment.objects.filter(
-            course__in=instructor_courses
-        ).order_by('-created_at')[:5]
+            course_id__in=course_ids
+        ).select_related('user', 'course').order_by('-created_at')[:5]
         
     except Exception as e:
         instructor_courses = []
+        project_stats = None
         total_students = 0
         recent_enrollments = []
 
     context = {
         'profile': profile,
         'instructor_courses': instructor_courses,
+        'project_stats': project_stats,
         'total_students': total_students,
         'recent_enrollments': recent_enrollments,
         'completion_percentage': profile.get_profile_completion_percentage(),
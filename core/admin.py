@@ -1,9 +1,16 @@
+from django import forms
+from django.conf import settings
 from django.contrib import admin
 from django.db import models
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
+from django.utils.html import format_html, format_html_join
 from django_ckeditor_5.widgets import CKEditor5Widget
 from .models import (
     Testimonial, Event, BlogPost, ContactSubmission, 
-    Newsletter, AboutPage, Career, Survey
+    Newsletter, AboutPage, Career, Survey, RequestProfile
 )
 
 
@@ -179,4 +186,118 @@ class SurveyAdmin(admin.ModelAdmin):
     
     formfield_overrides = {
         models.TextField: {'widget': CKEditor5Widget(config_name='extends')}
-    }
\ No newline at end of file
+    }
+
+
+class ProfilingLinkForm(forms.Form):
+    path = forms.CharField(
+        max_length=500, initial='/',
+        help_text="Requests to this path, or any path below it, are profiled (e.g. /courses/python-for-data/materials/)"
+    )
+    trace_memory = forms.BooleanField(
+        required=False, help_text="Also record allocation sites with tracemalloc (slower)"
+    )
+
+    def clean_path(self):
+        value = self.cleaned_data['path'].strip()
+        if not value.startswith('/'):
+            raise forms.ValidationError("Enter a path starting with /")
+        return value
+
+
+@admin.register(RequestProfile)
+class RequestProfileAdmin(admin.ModelAdmin):
+    list_display = ('path', 'view_name', 'user', 'status_code', 'duration_ms', 'peak_memory_kb', 'created_at')
+    list_filter = ('view_name', 'created_at')
+    list_select_related = ('user',)
+    search_fields = ('path', 'view_name', 'user__username', 'user__email')
+    date_hierarchy = 'created_at'
+    change_list_template = 'admin/core/requestprofile/change_list.html'
+    exclude = ('stats', 'summary', 'collapsed_stacks', 'allocations')
+    readonly_fields = ('path', 'method', 'view_name', 'status_code', 'user', 'requested_by', 'duration_ms',
+                       'peak_memory_kb', 'created_at', 'downloads', 'summary_text', 'allocation_sites')
+
+    def has_add_permission(self, request):
+        # Profiles are recorded by RequestProfilingMiddleware
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_urls(self):
+        urls = [
+            path('link/', self.admin_site.admin_view(self.profiling_link_view), name='core_requestprofile_link'),
+            path('<int:object_id>/pstats/', self.admin_site.admin_view(self.download_stats_view),
+                 name='core_requestprofile_pstats'),
+            path('<int:object_id>/stacks/', self.admin_site.admin_view(self.download_stacks_view),
+                 name='core_requestprofile_stacks'),
+        ]
+        return urls + super().get_urls()
+
+    def downloads(self, obj):
+        return format_html(
+            '<a href="{}">pstats dump</a> (snakeviz, python -m pstats) &middot; '
+            '<a href="{}">collapsed stacks</a> (flamegraph.pl, speedscope)',
+            reverse('admin:core_requestprofile_pstats', args=[obj.pk]),
+            reverse('admin:core_requestprofile_stacks', args=[obj.pk]),
+        )
+    downloads.short_description = 'Downloads'
+
+    def summary_text(self, obj):
+        return format_html('<pre style="white-space: pre; overflow-x: auto;">{}</pre>', obj.summary)
+    summary_text.short_description = 'Top functions'
+
+    def allocation_sites(self, obj):
+        if not obj.allocations:
+            return 'Memory was not traced for this request.'
+        rows = format_html_join(
+            '', '<tr><td>{}</td><td>{}</td><td><code>{}</code></td></tr>',
+            ((site['size_kb'], site['count'], site['site']) for site in obj.allocations)
+        )
+        return format_html(
+            '<table><thead><tr><th>KiB</th><th>Blocks</th><th>Allocated at</th></tr></thead>'
+            '<tbody>{}</tbody></table>', rows
+        )
+    allocation_sites.short_description = 'Top allocation sites'
+
+    def download_stats_view(self, request, object_id):
+        if not self.has_view_permission(request):
+            return HttpResponse(status=403)
+        profile = get_object_or_404(RequestProfile, pk=object_id)
+        response = HttpResponse(bytes(profile.stats), content_type='application/octet-stream')
+        response['Content-Disposition'] = f'attachment; filename="profile-{profile.pk}.prof"'
+        return response
+
+    def download_stacks_view(self, request, object_id):
+        if not self.has_view_permission(request):
+            return HttpResponse(status=403)
+        profile = get_object_or_404(RequestProfile, pk=object_id)
+        response = HttpResponse(profile.collapsed_stacks, content_type='text/plain; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="profile-{profile.pk}.folded"'
+        return response
+
+    def profiling_link_view(self, request):
+        """Mint a signed link that profiles requests to a path"""
+        from .profiling import PROFILE_HEADER, PROFILE_PARAM, make_profile_token
+
+        if not self.has_view_permission(request):
+            return HttpResponse(status=403)
+        link = token = None
+        form = ProfilingLinkForm(request.POST or None)
+        if request.method == 'POST' and form.is_valid():
+            token = make_profile_token(
+                form.cleaned_data['path'], request.user, trace_memory=form.cleaned_data['trace_memory']
+            )
+            link = request.build_absolute_uri(f"{form.cleaned_data['path']}?{PROFILE_PARAM}={token}")
+
+        context = {
+            **self.admin_site.each_context(request),
+            'title': 'Create profiling link',
+            'opts': self.model._meta,
+            'form': form,
+            'link': link,
+            'token': token,
+            'header': PROFILE_HEADER,
+            'max_age_minutes': getattr(settings, 'PROFILING_TOKEN_MAX_AGE', 60 * 60) // 60,
+        }
+        return TemplateResponse(request, 'admin/core/requestprofile/profiling_link.html', context)
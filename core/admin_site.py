@@ -3,15 +3,8 @@ from django.contrib import admin
 from django.contrib.admin import AdminSite
 from django.template.response import TemplateResponse
 from django.urls import path
-from django.contrib.auth.models import User
-from .models import BlogPost
-
-# Import models for statistics
-try:
-    from courses.models import Course, Enrollment
-except ImportError:
-    Course = None
-    Enrollment = None
+from .metrics import MetricsStore
+from .services import AdminStatsService
 
 class CustomAdminSite(AdminSite):
     site_header = "LUM Data Academy Administration"
@@ -47,22 +40,10 @@ class CustomAdminSite(AdminSite):
         """
         app_list = self.get_app_list(request)
         
-        # Add statistics to context
+        # Add statistics to context (cached, evaluated only when rendered)
         extra_context = extra_context or {}
-        try:
-            extra_context.update({
-                'user_count': User.objects.count(),
-                'course_count': Course.objects.count() if Course else 0,
-                'blog_count': BlogPost.objects.count(),
-                'enrollment_count': Enrollment.objects.count() if Enrollment else 0,
-            })
-        except Exception:
-            extra_context.update({
-                'user_count': 0,
-                'course_count': 0,
-                'blog_count': 0,
-                'enrollment_count': 0,
-            })
+        extra_context.update(AdminStatsService.lazy_stats())
+        extra_context['view_latency'] = MetricsStore.get_view_summaries
         
         extra_context.update({
             'title': self.index_title,
@@ -0,0 +1,302 @@
+"""
+Cache backend shared by all worker processes on a host
+
+SQLiteCache keeps entries in one WAL-mode SQLite file, so every gunicorn
+worker sees the same page, fragment and counter caches and a delete in one
+worker invalidates the entry for all of them. WAL lets any number of
+readers run alongside the single writer.
+
+Eviction is least-recently-used and bounded both by entry count
+(MAX_ENTRIES) and by the size of the stored values (MAX_BYTES). Running
+totals are kept by triggers, so checking the bounds after a write is one
+single-row read. Recording every read as an access would turn each hit into
+a write, so reads are noted in memory and written back in one transaction
+at most every TOUCH_INTERVAL seconds. Eviction order is therefore exact to
+about that interval.
+
+Integers are stored as SQLite integers and everything else is pickled.
+incr()/decr() read and write the value under the database write lock, so
+concurrent increments from different workers are never lost.
+
+    CACHES = {
+        'default': {
+            'BACKEND': 'core.cache.SQLiteCache',
+            'LOCATION': '/var/tmp/lumdata-cache.sqlite3',
+            'OPTIONS': {'MAX_ENTRIES': 50000, 'MAX_BYTES': 256 * 1024 * 1024},
+        }
+    }
+"""
+import os
+import pickle
+import sqlite3
+import time
+from contextlib import contextmanager
+from itertools import islice
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+# SQLite integers are signed 64-bit
+INTEGER_RANGE = range(-2 ** 63, 2 ** 63)
+# Host parameters per statement, below SQLITE_MAX_VARIABLE_NUMBER of older builds
+BATCH_SIZE = 500
+
+
+def batched(iterable, size=BATCH_SIZE):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+class SQLiteCache(BaseCache):
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._path = location
+        self._max_bytes = options.get('MAX_BYTES')
+        self._touch_interval = float(options.get('TOUCH_INTERVAL', 1.0))
+        self._busy_timeout = float(options.get('BUSY_TIMEOUT', 5.0))
+        self._connection = None
+        self._pid = None
+        self._touched = {}
+        self._last_touch_flush = time.monotonic()
+
+    # Storage
+
+    def _connect(self):
+        # A connection must not cross a fork (gunicorn --preload)
+        if self._connection is None or self._pid != os.getpid():
+            connection = sqlite3.connect(self._path, timeout=self._busy_timeout, isolation_level=None)
+            connection.execute('PRAGMA journal_mode = WAL')
+            connection.execute('PRAGMA synchronous = NORMAL')
+            self._create_tables(connection)
+            self._connection, self._pid = connection, os.getpid()
+        return self._connection
+
+    @staticmethod
+    def _create_tables(connection):
+        connection.executescript("""
+            BEGIN IMMEDIATE;
+            CREATE TABLE IF NOT EXISTS cache_entry (
+                key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL,
+                accessed REAL NOT NULL, size INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS cache_entry_accessed ON cache_entry (accessed);
+            CREATE TABLE IF NOT EXISTS cache_stats (
+                id INTEGER PRIMARY KEY CHECK (id = 1), entries INTEGER NOT NULL, bytes INTEGER NOT NULL
+            );
+            INSERT OR IGNORE INTO cache_stats (id, entries, bytes) VALUES (1, 0, 0);
+            CREATE TRIGGER IF NOT EXISTS cache_entry_insert AFTER INSERT ON cache_entry BEGIN
+                UPDATE cache_stats SET entries = entries + 1, bytes = bytes + NEW.size;
+            END;
+            CREATE TRIGGER IF NOT EXISTS cache_entry_update AFTER UPDATE OF size ON cache_entry BEGIN
+                UPDATE cache_stats SET bytes = bytes + NEW.size - OLD.size;
+            END;
+            CREATE TRIGGER IF NOT EXISTS cache_entry_delete AFTER DELETE ON cache_entry BEGIN
+                UPDATE cache_stats SET entries = entries - 1, bytes = bytes - OLD.size;
+            END;
+            COMMIT;
+        """)
+
+    @contextmanager
+    def _write(self):
+        """Transaction holding the write lock from the start, so it never fails part-way on a lock upgrade"""
+        connection = self._connect()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield connection
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+    def _encode(self, value):
+        if type(value) is int and value in INTEGER_RANGE:
+            return value
+        return pickle.dumps(value, self.pickle_protocol)
+
+    @staticmethod
+    def _decode(value):
+        if isinstance(value, int):
+            return value
+        return pickle.loads(value)
+
+    def _row(self, key, value, timeout, now):
+        value = self._encode(value)
+        size = len(key) + (8 if isinstance(value, int) else len(value))
+        return key, value, self.get_backend_timeout(timeout), now, size
+
+    # LRU bookkeeping
+
+    def _note_access(self, keys):
+        now = time.time()
+        for key in keys:
+            self._touched[key] = now
+        if time.monotonic() - self._last_touch_flush >= self._touch_interval:
+            self._flush_access()
+
+    def _flush_access(self, connection=None):
+        touched, self._touched = self._touched, {}
+        self._last_touch_flush = time.monotonic()
+        if not touched:
+            return
+        sql = 'UPDATE cache_entry SET accessed = ? WHERE key = ? AND accessed < ?'
+        rows = [(accessed, key, accessed) for key, accessed in touched.items()]
+        if connection is not None:
+            connection.executemany(sql, rows)
+            return
+        try:
+            with self._write() as connection:
+                connection.executemany(sql, rows)
+        except sqlite3.OperationalError:
+            # Access times only order eviction; losing a batch under contention is harmless
+            pass
+
+    def _cull(self, connection, now):
+        entries, size = connection.execute('SELECT entries, bytes FROM cache_stats').fetchone()
+        over_bytes = self._max_bytes is not None and size > self._max_bytes
+        if entries <= self._max_entries and not over_bytes:
+            return
+        self._flush_access(connection)
+        connection.execute('DELETE FROM cache_entry WHERE expires <= ?', [now])
+        entries, size = connection.execute('SELECT entries, bytes FROM cache_stats').fetchone()
+        if self._cull_frequency == 0:
+            if entries > self._max_entries or (self._max_bytes is not None and size > self._max_bytes):
+                connection.execute('DELETE FROM cache_entry')
+            return
+        # Like Django's backends, free 1/CULL_FREQUENCY of the limit at once so culls stay rare
+        if entries > self._max_entries:
+            excess = entries - self._max_entries + self._max_entries // self._cull_frequency
+            connection.execute(
+                'DELETE FROM cache_entry WHERE key IN (SELECT key FROM cache_entry ORDER BY accessed LIMIT ?)',
+                [excess],
+            )
+            size = connection.execute('SELECT bytes FROM cache_stats').fetchone()[0]
+        if self._max_bytes is not None and size > self._max_bytes:
+            excess = size - self._max_bytes + self._max_bytes // self._cull_frequency
+            connection.execute(
+                'DELETE FROM cache_entry WHERE key IN ('
+                ' SELECT key FROM (SELECT key, size, SUM(size) OVER (ORDER BY accessed) AS freed'
+                ' FROM cache_entry) WHERE freed - size < ?)',
+                [excess],
+            )
+
+    # Cache API
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        row = self._connect().execute(
+            'SELECT value FROM cache_entry WHERE key = ? AND (expires IS NULL OR expires > ?)', [key, time.time()]
+        ).fetchone()
+        if row is None:
+            return default
+        self._note_access([key])
+        return self._decode(row[0])
+
+    def get_many(self, keys, version=None):
+        keys = {self.make_and_validate_key(key, version=version): key for key in keys}
+        connection = self._connect()
+        now = time.time()
+        found = {}
+        for batch in batched(keys):
+            placeholders = ', '.join('?' * len(batch))
+            rows = connection.execute(
+                f'SELECT key, value FROM cache_entry WHERE key IN ({placeholders}) '
+                f'AND (expires IS NULL OR expires > ?)',
+                [*batch, now],
+            )
+            found.update((keys[key], self._decode(value)) for key, value in rows)
+        if found:
+            self._note_access(key for key, original in keys.items() if original in found)
+        return found
+
+    def has_key(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return self._connect().execute(
+            'SELECT 1 FROM cache_entry WHERE key = ? AND (expires IS NULL OR expires > ?)', [key, time.time()]
+        ).fetchone() is not None
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.set_many({key: value}, timeout, version=version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        now = time.time()
+        rows = [
+            self._row(self.make_and_validate_key(key, version=version), value, timeout, now)
+            for key, value in data.items()
+        ]
+        with self._write() as connection:
+            connection.executemany(
+                'INSERT INTO cache_entry (key, value, expires, accessed, size) VALUES (?, ?, ?, ?, ?) '
+                'ON CONFLICT (key) DO UPDATE SET value = excluded.value, expires = excluded.expires, '
+                'accessed = excluded.accessed, size = excluded.size',
+                rows,
+            )
+            self._cull(connection, now)
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        now = time.time()
+        row = self._row(self.make_and_validate_key(key, version=version), value, timeout, now)
+        with self._write() as connection:
+            # An expired entry counts as absent
+            cursor = connection.execute(
+                'INSERT INTO cache_entry (key, value, expires, accessed, size) VALUES (?, ?, ?, ?, ?) '
+                'ON CONFLICT (key) DO UPDATE SET value = excluded.value, expires = excluded.expires, '
+                'accessed = excluded.accessed, size = excluded.size WHERE cache_entry.expires <= ?',
+                [*row, now],
+            )
+            added = cursor.rowcount == 1
+            if added:
+                self._cull(connection, now)
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        now = time.time()
+        with self._write() as connection:
+            cursor = connection.execute(
+                'UPDATE cache_entry SET expires = ?, accessed = ? '
+                'WHERE key = ? AND (expires IS NULL OR expires > ?)',
+                [self.get_backend_timeout(timeout), now, key, now],
+            )
+        return cursor.rowcount == 1
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        now = time.time()
+        with self._write() as connection:
+            row = connection.execute(
+                'SELECT value FROM cache_entry WHERE key = ? AND (expires IS NULL OR expires > ?)', [key, now]
+            ).fetchone()
+            if row is None:
+                raise ValueError(f"Key '{key}' not found")
+            value = self._decode(row[0]) + delta
+            # Stays an integer column unless the result leaves SQLite's range or the value wasn't an int
+            connection.execute(
+                'UPDATE cache_entry SET value = ?, accessed = ? WHERE key = ?', [self._encode(value), now, key]
+            )
+        return value
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        with self._write() as connection:
+            cursor = connection.execute('DELETE FROM cache_entry WHERE key = ?', [key])
+        return cursor.rowcount == 1
+
+    def delete_many(self, keys, version=None):
+        keys = [self.make_and_validate_key(key, version=version) for key in keys]
+        with self._write() as connection:
+            for batch in batched(keys):
+                connection.execute(f"DELETE FROM cache_entry WHERE key IN ({', '.join('?' * len(batch))})", batch)
+
+    def clear(self):
+        self._touched = {}
+        with self._write() as connection:
+            connection.execute('DELETE FROM cache_entry')
+
+    def close(self, **kwargs):
+        # Called at the end of every request: the connection stays open, but pending access times go out
+        if self._touched and time.monotonic() - self._last_touch_flush >= self._touch_interval:
+            self._flush_access()
@@ -0,0 +1,147 @@
+"""
+SQLite tuning for concurrent workers
+
+configure_sqlite_connection runs on every new SQLite connection and applies
+SQLITE_PRAGMAS (WAL, synchronous=NORMAL, mmap, page cache, temp store and
+busy timeout). Together with persistent connections (CONN_MAX_AGE) and
+IMMEDIATE transactions, set in DATABASES, this lets several gunicorn workers
+share one database file.
+
+Writers still queue for a single lock, and a transaction that waits longer
+than busy_timeout fails with "database is locked". Hot write paths are
+wrapped in retry_on_locked, which re-runs the whole transaction with
+jittered exponential backoff.
+
+refresh_sqlite_replica and start_replica_refresher maintain the replica file
+used by core.routers when SQLITE_READ_REPLICA is 'backup'.
+"""
+import functools
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from pathlib import Path
+
+from django.conf import settings
+from django.db import OperationalError, connections, transaction
+
+logger = logging.getLogger(__name__)
+
+# Pragmas that write to the database file, which a mode=ro connection cannot do
+READ_ONLY_SKIPPED_PRAGMAS = {'journal_mode'}
+
+_refresher_lock = threading.Lock()
+_refresher = None
+
+
+def is_read_only_connection(connection):
+    return 'mode=ro' in str(connection.settings_dict['NAME'])
+
+
+def configure_sqlite_connection(sender, connection, **kwargs):
+    """connection_created receiver applying SQLITE_PRAGMAS"""
+    if connection.vendor != 'sqlite':
+        return
+    read_only = is_read_only_connection(connection)
+    with connection.cursor() as cursor:
+        for pragma, value in getattr(settings, 'SQLITE_PRAGMAS', {}).items():
+            if read_only and pragma in READ_ONLY_SKIPPED_PRAGMAS:
+                continue
+            cursor.execute(f'PRAGMA {pragma} = {value}')
+
+
+def is_locked_error(error):
+    return isinstance(error, OperationalError) and 'database is locked' in str(error)
+
+
+def retry_on_locked(func=None, *, attempts=None, base_delay=None, max_delay=1.0, using='default'):
+    """
+    Run the decorated function in a transaction, retrying it when SQLite reports a lock
+
+    Can be used bare (``@retry_on_locked``) or with arguments. When called
+    inside an outer atomic block the function runs once, without retries: only
+    the outermost transaction can be safely re-run, so it should carry the
+    decorator instead.
+    """
+    if attempts is None:
+        attempts = getattr(settings, 'SQLITE_LOCK_RETRY_ATTEMPTS', 5)
+    if base_delay is None:
+        base_delay = getattr(settings, 'SQLITE_LOCK_RETRY_DELAY', 0.05)
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if connections[using].in_atomic_block:
+                return func(*args, **kwargs)
+            for attempt in range(1, attempts + 1):
+                try:
+                    with transaction.atomic(using=using):
+                        return func(*args, **kwargs)
+                except OperationalError as error:
+                    if not is_locked_error(error) or attempt == attempts:
+                        raise
+                    # Full jitter keeps workers that collided from retrying in lockstep
+                    delay = random.uniform(0, min(max_delay, base_delay * 2 ** (attempt - 1)))
+                    logger.warning(
+                        f"Database locked in {func.__qualname__}, retry {attempt}/{attempts - 1} "
+                        f"in {delay * 1000:.0f} ms"
+                    )
+                    time.sleep(delay)
+        return wrapper
+
+    if func is not None:
+        return decorator(func)
+    return decorator
+
+
+def refresh_sqlite_replica(max_age=None, source=None):
+    """
+    Copy the primary database (or the source file) to SQLITE_REPLICA_PATH with the sqlite3 backup API
+
+    The copy is written next to the replica and renamed over it, so readers
+    never see a partial file; connections opened before the rename keep
+    reading the previous copy until they close. With max_age, a replica
+    younger than that many seconds (refreshed by another worker, say) is left
+    alone. Returns True when a new copy was made.
+    """
+    replica = Path(settings.SQLITE_REPLICA_PATH)
+    if max_age is not None and replica.exists() and time.time() - replica.stat().st_mtime < max_age:
+        return False
+
+    started = time.perf_counter()
+    partial = replica.with_name(f'{replica.name}.{os.getpid()}.partial')
+    if source is None:
+        source = connections['default'].settings_dict['NAME']
+    try:
+        with closing(sqlite3.connect(source, uri=True)) as primary, closing(sqlite3.connect(partial)) as target:
+            # One step: a single read transaction, which under WAL doesn't hold up writers
+            primary.backup(target)
+            # The copy inherits WAL mode, which a mode=ro reader can't open without its -shm file
+            target.execute('PRAGMA journal_mode = DELETE')
+        os.replace(partial, replica)
+    finally:
+        partial.unlink(missing_ok=True)
+    logger.info(f"Refreshed SQLite replica {replica} in {(time.perf_counter() - started) * 1000:.0f} ms")
+    return True
+
+
+def start_replica_refresher():
+    """Start, once per process, a daemon thread keeping the replica at most one refresh interval old"""
+    global _refresher
+    interval = settings.SQLITE_REPLICA_REFRESH_SECONDS
+
+    def run():
+        while True:
+            try:
+                refresh_sqlite_replica(max_age=interval)
+            except Exception:
+                logger.exception('SQLite replica refresh failed')
+            time.sleep(interval)
+
+    with _refresher_lock:
+        if _refresher is None:
+            _refresher = threading.Thread(target=run, name='sqlite-replica-refresher', daemon=True)
+            _refresher.start()
@@ -0,0 +1,334 @@
+"""
+Responsive image variants
+
+Uploaded course, blog, testimonial and profile images are re-encoded in the
+background into fixed-width WebP and JPEG variants (IMAGE_VARIANT_WIDTHS)
+and a tiny blurred placeholder. Each image field ``<name>`` has a
+``<name>_variants`` JSON field next to it holding the result:
+
+    {
+        "source": "course_images/photo.jpg",
+        "width": 4032, "height": 3024,
+        "placeholder": "data:image/webp;base64,...",
+        "webp": [[320, "image_variants/3f/3fa1...webp"], [640, ...]],
+        "jpeg": [[320, "image_variants/9c/9c04...jpg"], [640, ...]]
+    }
+
+Variant files are named after a hash of their content, so they can be
+served with far-future cache headers and identical outputs are stored once.
+``source`` records which upload the variants were made from; when it no
+longer matches the field, the variants are stale and are rebuilt.
+
+The {% responsive_image %} tag in core.templatetags.images renders the
+field as a <picture> with srcset, falling back to the original upload
+until the variants exist.
+"""
+import base64
+import hashlib
+import html
+import io
+import logging
+import math
+import posixpath
+import re
+from urllib.parse import unquote, urlparse
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import ExifTags, Image, ImageFilter, ImageOps
+
+from .tasks import enqueue_on_commit
+
+logger = logging.getLogger(__name__)
+
+# Image fields that get variants, by model; each has a <name>_variants JSONField
+RESPONSIVE_IMAGE_FIELDS = {
+    'courses.Course': ['image'],
+    'core.BlogPost': ['featured_image'],
+    'core.Testimonial': ['image'],
+    'accounts.UserProfile': ['profile_image'],
+}
+VARIANTS_DIR = 'image_variants'
+FORMATS = {
+    'webp': {'format': 'WEBP', 'extension': 'webp', 'options': {'method': 4}},
+    'jpeg': {'format': 'JPEG', 'extension': 'jpg', 'options': {'optimize': True, 'progressive': True}},
+}
+PLACEHOLDER_WIDTH = 16
+# EXIF orientations that turn the stored image by 90 degrees
+ROTATED_ORIENTATIONS = {5, 6, 7, 8}
+
+
+def get_variant_widths(original_width):
+    """Configured widths narrower than the original, plus the original capped at the widest"""
+    configured = sorted(settings.IMAGE_VARIANT_WIDTHS)
+    widest = min(original_width, configured[-1])
+    return [width for width in configured if width < widest] + [widest]
+
+
+def resize(image, width):
+    height = max(1, round(image.height * width / image.width))
+    return image.resize((width, height), Image.Resampling.LANCZOS)
+
+
+def encode(image, variant_format, quality, **options):
+    spec = FORMATS[variant_format]
+    if spec['format'] == 'JPEG' and image.mode != 'RGB':
+        # JPEG has no alpha channel: flatten onto white
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A') if 'A' in image.getbands() else None)
+        image = background
+    buffer = io.BytesIO()
+    image.save(buffer, format=spec['format'], quality=quality, **spec['options'], **options)
+    return buffer.getvalue()
+
+
+def store_content_hashed(data, extension, storage=default_storage):
+    digest = hashlib.sha256(data).hexdigest()[:32]
+    name = f'{VARIANTS_DIR}/{digest[:2]}/{digest}.{extension}'
+    if not storage.exists(name):
+        storage.save(name, ContentFile(data))
+    return name
+
+
+def build_variants(source_name, storage=default_storage):
+    """Generate and store the variants of one stored image, returning the ``<name>_variants`` data"""
+    with storage.open(source_name, 'rb') as source:
+        image = Image.open(source)
+        width, height = image.size
+        if image.getexif().get(ExifTags.Base.Orientation, 1) in ROTATED_ORIENTATIONS:
+            width, height = height, width
+        widths = get_variant_widths(width)
+        # JPEG can decode at 1/2, 1/4 or 1/8 scale directly, much faster than a full decode and resize
+        scale = widths[-1] / width
+        image.draft('RGB', (math.ceil(image.width * scale), math.ceil(image.height * scale)))
+        image = ImageOps.exif_transpose(image)
+        image = image.convert('RGBA' if image.mode in ('RGBA', 'LA', 'P') else 'RGB')
+
+    variants = {
+        'source': source_name,
+        'width': width,
+        'height': height,
+    }
+    for variant_format, spec in FORMATS.items():
+        quality = settings.IMAGE_VARIANT_QUALITY[variant_format]
+        variants[variant_format] = []
+        for size in widths:
+            data = encode(resize(image, size), variant_format, quality)
+            variants[variant_format].append([size, store_content_hashed(data, spec['extension'], storage)])
+
+    placeholder = resize(image, min(PLACEHOLDER_WIDTH, image.width)).filter(ImageFilter.GaussianBlur(1))
+    variants['placeholder'] = 'data:image/webp;base64,' + base64.b64encode(encode(placeholder, 'webp', 30)).decode()
+    return variants
+
+
+def variants_field_name(field_name):
+    return f'{field_name}_variants'
+
+
+def needs_variants(instance, field_name):
+    """True when the image field holds an upload its variants were not made from"""
+    image = getattr(instance, field_name)
+    current = getattr(instance, variants_field_name(field_name)) or {}
+    return bool(image) and current.get('source') != image.name
+
+
+def update_variants(model_label, pk, field_name):
+    """Background task: build the variants of one instance's image field and save them"""
+    model = apps.get_model(model_label)
+    instance = model._default_manager.filter(pk=pk).first()
+    if instance is None or not needs_variants(instance, field_name):
+        return
+    source_name = getattr(instance, field_name).name
+    variants = build_variants(source_name)
+    # update() rather than save(): no signals, and no overwriting a newer upload made meanwhile
+    model._default_manager.filter(pk=pk, **{field_name: source_name}).update(
+        **{variants_field_name(field_name): variants}
+    )
+    logger.info(f"Built {len(variants['webp'])} image variants for {model_label} {pk} ({source_name})")
+
+
+def queue_variants(instance, field_name):
+    """post_save helper: rebuild variants after a new upload, drop them when the image is cleared"""
+    if needs_variants(instance, field_name):
+        enqueue_on_commit(update_variants, instance._meta.label, instance.pk, field_name)
+    elif not getattr(instance, field_name) and getattr(instance, variants_field_name(field_name)):
+        type(instance)._default_manager.filter(pk=instance.pk).update(**{variants_field_name(field_name): {}})
+        setattr(instance, variants_field_name(field_name), {})
+
+
+# Images embedded in CKEditor HTML
+#
+# Uploads from the editor are downscaled to CKEDITOR_IMAGE_MAX_SIZE and
+# re-encoded without EXIF by core.storage.CKEditorUploadStorage. After a row
+# is saved, update_inline_images adds srcset, sizes, width and height to its
+# <img> tags, pointing at variants built as above. The src is kept, so the
+# content still renders if the editor drops attributes it does not know;
+# the next save then adds them back without rebuilding any variants.
+
+# HTML fields whose embedded images get variants, by model
+INLINE_IMAGE_FIELDS = {
+    'courses.Course': ['description'],
+    'courses.CourseModule': ['description', 'content'],
+    'courses.CodeExample': ['explanation'],
+    'courses.Exercise': ['description', 'solution'],
+    'courses.CapstoneProject': ['description', 'requirements'],
+    'core.BlogPost': ['content'],
+}
+IMG_TAG_RE = re.compile(r'<img\b[^>]*>', re.IGNORECASE)
+ATTRIBUTE_RE = re.compile(r'''([^\s"'=<>/]+)(?:\s*=\s*("[^"]*"|'[^']*'|[^\s>]+))?''')
+# Added to every rewritten <img>, unless already set
+INLINE_IMAGE_DEFAULTS = {'loading': 'lazy', 'decoding': 'async'}
+
+
+def has_alpha(image):
+    return image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+
+
+def optimize_image(content):
+    """
+    Downscale, orient and re-encode an uploaded image, dropping EXIF
+
+    Returns ``(data, extension)``: WebP for images with transparency, JPEG
+    otherwise. Returns None for files that are not images, and for
+    animations, which are kept as uploaded.
+    """
+    max_size = settings.CKEDITOR_IMAGE_MAX_SIZE
+    try:
+        content.seek(0)
+        image = Image.open(content)
+        if getattr(image, 'is_animated', False):
+            return None
+        image.draft('RGB', (max_size, max_size))
+        icc_profile = image.info.get('icc_profile')
+        image = ImageOps.exif_transpose(image)
+    except (OSError, SyntaxError, ValueError):
+        # Pillow raises these for files it cannot identify or decode
+        return None
+    finally:
+        content.seek(0)
+    image = image.convert('RGBA' if has_alpha(image) else 'RGB')
+    image.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
+    variant_format = 'webp' if image.mode == 'RGBA' else 'jpeg'
+    options = {'icc_profile': icc_profile} if icc_profile else {}
+    data = encode(image, variant_format, settings.IMAGE_VARIANT_QUALITY[variant_format], **options)
+    return data, FORMATS[variant_format]['extension']
+
+
+def parse_attributes(tag):
+    """Attributes of an HTML start tag as ``{name: raw value or None}``, values still HTML-escaped"""
+    attributes = {}
+    for name, value in ATTRIBUTE_RE.findall(tag[len('<img'):].rstrip('/>')):
+        if value[:1] in ('"', "'"):
+            value = value[1:-1]
+        attributes.setdefault(name.lower(), value or None)
+    return attributes
+
+
+def media_name(url):
+    """Storage name of a MEDIA_URL url, or None for anything else"""
+    path = urlparse(url).path if '://' in url else url
+    if not path.startswith(settings.MEDIA_URL):
+        return None
+    return unquote(path[len(settings.MEDIA_URL):])
+
+
+def inline_image_needs_rewrite(attributes):
+    if media_name(html.unescape(attributes.get('src') or '')) is None:
+        return False
+    return 'srcset' not in attributes or any(name not in attributes for name in INLINE_IMAGE_DEFAULTS)
+
+
+def needs_inline_rewrite(content):
+    return any(
+        inline_image_needs_rewrite(parse_attributes(match.group(0)))
+        for match in IMG_TAG_RE.finditer(content or '')
+    )
+
+
+def recompress(name, storage=default_storage):
+    """
+    Apply the upload treatment to an image stored before it existed
+
+    Returns the name of the re-encoded copy, or ``name`` itself when
+    re-encoding would neither shrink the file nor remove EXIF data.
+    """
+    with storage.open(name, 'rb') as source:
+        original = ContentFile(source.read())
+    optimized = optimize_image(original)
+    if optimized is None:
+        return name
+    data, extension = optimized
+    has_exif = bool(Image.open(original).getexif())
+    if len(data) >= original.size and not has_exif:
+        return name
+    return storage.save(f'{posixpath.splitext(name)[0]}.{extension}', ContentFile(data))
+
+
+def rewrite_inline_images(content, recompress_originals=False, storage=default_storage):
+    """
+    Add responsive attributes to the <img> tags of stored HTML that point at uploaded media
+
+    With recompress_originals, images embedded before uploads were
+    optimized are first re-encoded (see recompress()) and the tag's src is
+    switched to the new file. Images that cannot be decoded are logged and
+    their tags left as they are.
+    """
+    def rewrite(match):
+        tag = match.group(0)
+        attributes = parse_attributes(tag)
+        if not inline_image_needs_rewrite(attributes):
+            return tag
+        if 'srcset' not in attributes:
+            name = media_name(html.unescape(attributes['src']))
+            if not storage.exists(name):
+                return tag
+            try:
+                if recompress_originals:
+                    name = recompress(name, storage)
+                    attributes['src'] = html.escape(storage.url(name))
+                variants = build_variants(name, storage)
+            except (OSError, SyntaxError, ValueError, Image.DecompressionBombError) as error:
+                # One image that won't decode leaves its own tag as it was, not the whole field
+                logger.warning(f"Could not build variants of embedded image {name}: {error}")
+                return tag
+            entries = variants[settings.CKEDITOR_IMAGE_SRCSET_FORMAT]
+            attributes['srcset'] = html.escape(', '.join(f'{storage.url(path)} {width}w' for width, path in entries))
+            attributes['sizes'] = html.escape(settings.CKEDITOR_IMAGE_SIZES)
+            attributes.setdefault('width', str(variants['width']))
+            attributes.setdefault('height', str(variants['height']))
+        for name, value in INLINE_IMAGE_DEFAULTS.items():
+            attributes.setdefault(name, value)
+        return '<img ' + ' '.join(
+            name if value is None else f'{name}="{value}"' for name, value in attributes.items()
+        ) + '>'
+
+    return IMG_TAG_RE.sub(rewrite, content)
+
+
+def update_inline_images(model_label, pk, recompress_originals=False):
+    """Background task: rewrite the embedded images of one instance's HTML fields; returns the fields changed"""
+    model = apps.get_model(model_label)
+    instance = model._default_manager.filter(pk=pk).first()
+    if instance is None:
+        return []
+    changed = []
+    for field_name in INLINE_IMAGE_FIELDS[model_label]:
+        content = getattr(instance, field_name) or ''
+        if not needs_inline_rewrite(content):
+            continue
+        rewritten = rewrite_inline_images(content, recompress_originals)
+        # Only if nobody saved the field meanwhile: the next save queues the newer content
+        if rewritten != content and model._default_manager.filter(pk=pk, **{field_name: content}).update(
+            **{field_name: rewritten}
+        ):
+            changed.append(field_name)
+    return changed
+
+
+def queue_inline_images(instance):
+    """post_save helper: process newly embedded images once the row is committed"""
+    label = instance._meta.label
+    if any(needs_inline_rewrite(getattr(instance, field_name)) for field_name in INLINE_IMAGE_FIELDS[label]):
+        enqueue_on_commit(update_inline_images, label, instance.pk)
@@ -0,0 +1,324 @@
+"""
+Per-view latency metrics
+
+RequestMetricsMiddleware times every request (wall clock, database and
+template rendering) under its resolved URL name. Each worker process
+accumulates the timings in log-linear (HDR-style) histograms and
+periodically merges them into a small SQLite file shared by all workers on
+the host, so /metrics and the admin dashboard report totals across workers.
+
+Requests slower than METRICS_SLOW_REQUEST_MS are written to a slow-request
+log together with the SQL they executed.
+"""
+import json
+import logging
+import sqlite3
+import threading
+import time
+from contextlib import closing, contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+
+from django.conf import settings
+from django.template.backends.django import DjangoTemplates, Template
+
+logger = logging.getLogger(__name__)
+
+METRICS = ('wall', 'db', 'template')
+
+# Template render time of the request being handled, see InstrumentedTemplate
+_template_seconds = ContextVar('template_seconds', default=None)
+
+
+class LatencyHistogram:
+    """
+    Log-linear histogram of microsecond values
+
+    Values below SUB_BUCKETS get a bucket each; above that every power of two
+    is split into SUB_BUCKETS equal buckets, so a bucket's upper bound is
+    within 1/SUB_BUCKETS (about 6%) of any value it holds.
+    """
+
+    SUB_BUCKET_BITS = 4
+    SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+
+    def __init__(self, buckets=None, count=0, total=0):
+        self.buckets = dict(buckets or {})
+        self.count = count
+        self.total = total
+
+    @classmethod
+    def bucket_index(cls, value):
+        if value < cls.SUB_BUCKETS:
+            return value
+        shift = value.bit_length() - cls.SUB_BUCKET_BITS - 1
+        return (shift + 1) * cls.SUB_BUCKETS + (value >> shift) - cls.SUB_BUCKETS
+
+    @classmethod
+    def bucket_upper_bound(cls, index):
+        """Largest value that falls in bucket ``index``"""
+        if index < cls.SUB_BUCKETS:
+            return index
+        shift = index // cls.SUB_BUCKETS - 1
+        sub_bucket = index % cls.SUB_BUCKETS + cls.SUB_BUCKETS
+        return ((sub_bucket + 1) << shift) - 1
+
+    def record(self, seconds):
+        value = max(0, int(seconds * 1000000))
+        index = self.bucket_index(value)
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+
+    def percentile(self, percent):
+        """Upper bound in seconds of the bucket holding the given percentile"""
+        if not self.count:
+            return None
+        rank = max(1, int(round(self.count * percent / 100.0)))
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                return self.bucket_upper_bound(index) / 1000000
+        return self.bucket_upper_bound(max(self.buckets)) / 1000000
+
+    def cumulative_counts(self, bounds):
+        """Number of values at or below each bound in seconds (Prometheus ``le``)"""
+        counts = []
+        for bound in bounds:
+            limit = bound * 1000000
+            counts.append(sum(
+                count for index, count in self.buckets.items()
+                if self.bucket_upper_bound(index) <= limit
+            ))
+        return counts
+
+
+class MetricsStore:
+    """
+    Histograms of this process plus the SQLite file they are merged into
+
+    Recording only touches memory; pending counts are flushed at most every
+    METRICS_FLUSH_SECONDS, and always before the shared totals are read.
+    """
+
+    _lock = threading.Lock()
+    _pending = {}
+    _last_flush = time.monotonic()
+    _initialized_paths = set()
+
+    SLOW_LOG_SIZE = 200
+
+    @staticmethod
+    def get_path():
+        return Path(getattr(settings, 'METRICS_DB_PATH', Path(settings.BASE_DIR) / 'metrics.sqlite3'))
+
+    @classmethod
+    @contextmanager
+    def _connect(cls):
+        """Connection to the shared store, committed and closed on exit"""
+        path = cls.get_path()
+        with closing(sqlite3.connect(path, timeout=5)) as connection:
+            if path not in cls._initialized_paths:
+                cls._create_tables(connection)
+                cls._initialized_paths.add(path)
+            with connection:
+                yield connection
+
+    @staticmethod
+    def _create_tables(connection):
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.executescript("""
+            CREATE TABLE IF NOT EXISTS histogram_bucket (
+                view TEXT NOT NULL, metric TEXT NOT NULL, bucket INTEGER NOT NULL,
+                count INTEGER NOT NULL, PRIMARY KEY (view, metric, bucket)
+            );
+            CREATE TABLE IF NOT EXISTS histogram_total (
+                view TEXT NOT NULL, metric TEXT NOT NULL, count INTEGER NOT NULL,
+                total INTEGER NOT NULL, PRIMARY KEY (view, metric)
+            );
+            CREATE TABLE IF NOT EXISTS slow_request (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, recorded_at REAL NOT NULL,
+                method TEXT NOT NULL, path TEXT NOT NULL, view TEXT NOT NULL,
+                status_code INTEGER NOT NULL, wall_ms REAL NOT NULL, db_ms REAL NOT NULL,
+                template_ms REAL NOT NULL, query_count INTEGER NOT NULL, queries TEXT NOT NULL
+            );
+        """)
+
+    @classmethod
+    def record(cls, view, timings):
+        """Add one request's ``{metric: seconds}`` timings to this process"""
+        with cls._lock:
+            for metric, seconds in timings.items():
+                histogram = cls._pending.setdefault((view, metric), LatencyHistogram())
+                histogram.record(seconds)
+            due = time.monotonic() - cls._last_flush >= getattr(settings, 'METRICS_FLUSH_SECONDS', 10)
+        if due:
+            cls.flush()
+
+    @classmethod
+    def flush(cls):
+        """Merge this process's pending counts into the shared store"""
+        with cls._lock:
+            pending, cls._pending = cls._pending, {}
+            cls._last_flush = time.monotonic()
+        if not pending:
+            return
+        try:
+            with cls._connect() as connection:
+                for (view, metric), histogram in pending.items():
+                    connection.executemany(
+                        'INSERT INTO histogram_bucket (view, metric, bucket, count) VALUES (?, ?, ?, ?) '
+                        'ON CONFLICT (view, metric, bucket) DO UPDATE SET count = count + excluded.count',
+                        [(view, metric, index, count) for index, count in histogram.buckets.items()]
+                    )
+                    connection.execute(
+                        'INSERT INTO histogram_total (view, metric, count, total) VALUES (?, ?, ?, ?) '
+                        'ON CONFLICT (view, metric) DO UPDATE SET '
+                        'count = count + excluded.count, total = total + excluded.total',
+                        (view, metric, histogram.count, histogram.total)
+                    )
+        except sqlite3.Error:
+            logger.exception('Could not flush request metrics')
+
+    @classmethod
+    def get_histograms(cls):
+        """All histograms across workers, keyed by ``(view, metric)``"""
+        cls.flush()
+        histograms = {}
+        try:
+            with cls._connect() as connection:
+                for view, metric, count, total in connection.execute(
+                    'SELECT view, metric, count, total FROM histogram_total'
+                ):
+                    histograms[(view, metric)] = LatencyHistogram(count=count, total=total)
+                for view, metric, bucket, count in connection.execute(
+                    'SELECT view, metric, bucket, count FROM histogram_bucket'
+                ):
+                    if (view, metric) in histograms:
+                        histograms[(view, metric)].buckets[bucket] = count
+        except sqlite3.Error:
+            logger.exception('Could not read request metrics')
+        return histograms
+
+    @classmethod
+    def get_view_summaries(cls):
+        """p50/p95/p99 wall time per view, slowest p95 first"""
+        summaries = []
+        for (view, metric), histogram in cls.get_histograms().items():
+            if metric != 'wall':
+                continue
+            summaries.append({
+                'view': view,
+                'count': histogram.count,
+                'p50_ms': histogram.percentile(50) * 1000,
+                'p95_ms': histogram.percentile(95) * 1000,
+                'p99_ms': histogram.percentile(99) * 1000,
+            })
+        return sorted(summaries, key=lambda summary: -summary['p95_ms'])
+
+    @classmethod
+    def log_slow_request(cls, entry):
+        try:
+            with cls._connect() as connection:
+                connection.execute(
+                    'INSERT INTO slow_request (recorded_at, method, path, view, status_code, wall_ms, '
+                    'db_ms, template_ms, query_count, queries) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    (time.time(), entry['method'], entry['path'], entry['view'], entry['status_code'],
+                     entry['wall_ms'], entry['db_ms'], entry['template_ms'], len(entry['queries']),
+                     json.dumps(entry['queries']))
+                )
+                connection.execute(
+                    'DELETE FROM slow_request WHERE id <= (SELECT MAX(id) FROM slow_request) - ?',
+                    (cls.SLOW_LOG_SIZE,)
+                )
+        except sqlite3.Error:
+            logger.exception('Could not write slow request log')
+
+    @classmethod
+    def get_slow_requests(cls, limit=20):
+        try:
+            with cls._connect() as connection:
+                connection.row_factory = sqlite3.Row
+                rows = connection.execute(
+                    'SELECT * FROM slow_request ORDER BY id DESC LIMIT ?', (limit,)
+                ).fetchall()
+        except sqlite3.Error:
+            logger.exception('Could not read slow request log')
+            return []
+        return [dict(row, queries=json.loads(row['queries'])) for row in rows]
+
+    @classmethod
+    def reset(cls):
+        """Drop all recorded metrics (used by tests)"""
+        with cls._lock:
+            cls._pending = {}
+        with cls._connect() as connection:
+            connection.executescript(
+                'DELETE FROM histogram_bucket; DELETE FROM histogram_total; DELETE FROM slow_request;'
+            )
+
+
+PROMETHEUS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+PROMETHEUS_METRIC_NAMES = {
+    'wall': ('lum_request_duration_seconds', 'Wall time of requests by view'),
+    'db': ('lum_request_db_seconds', 'Database time of requests by view'),
+    'template': ('lum_request_template_seconds', 'Template render time of requests by view'),
+}
+
+
+def render_prometheus(histograms):
+    """Histograms in the Prometheus text exposition format"""
+    lines = []
+    for metric in METRICS:
+        name, help_text = PROMETHEUS_METRIC_NAMES[metric]
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} histogram')
+        for (view, histogram_metric), histogram in sorted(histograms.items()):
+            if histogram_metric != metric:
+                continue
+            label = view.replace('\\', '\\\\').replace('"', '\\"')
+            counts = histogram.cumulative_counts(PROMETHEUS_BUCKETS)
+            for bound, count in zip(PROMETHEUS_BUCKETS, counts):
+                lines.append(f'{name}_bucket{{view="{label}",le="{bound}"}} {count}')
+            lines.append(f'{name}_bucket{{view="{label}",le="+Inf"}} {histogram.count}')
+            lines.append(f'{name}_sum{{view="{label}"}} {histogram.total / 1000000:.6f}')
+            lines.append(f'{name}_count{{view="{label}"}} {histogram.count}')
+    return '\n'.join(lines) + '\n'
+
+
+def start_template_timer():
+    # [seconds, depth]: only the outermost render is timed, so templates
+    # rendered from inside another template are not counted twice
+    return _template_seconds.set([0.0, 0])
+
+
+def stop_template_timer(token):
+    timer = _template_seconds.get()
+    _template_seconds.reset(token)
+    return timer[0] if timer else 0.0
+
+
+class InstrumentedTemplate(Template):
+    def render(self, context=None, request=None):
+        timer = _template_seconds.get()
+        if timer is None or timer[1]:
+            return super().render(context, request)
+        timer[1] += 1
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            timer[0] += time.perf_counter() - start
+            timer[1] -= 1
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    """Django template backend that adds top-level render time to the request metrics"""
+
+    def from_string(self, template_code):
+        return InstrumentedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return InstrumentedTemplate(template.template, self)
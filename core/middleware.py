@@ -0,0 +1,308 @@
+"""
+Per-request SQL and timing instrumentation
+
+RequestMetricsMiddleware feeds the per-view latency histograms and the
+slow-request log in core.metrics.
+
+QueryInspectorMiddleware records every statement a request executes, groups
+them by normalised SQL and the project call site that issued them, and flags
+statements repeated from one call site as probable N+1 queries.
+
+It is enabled by QUERY_INSPECTOR_ENABLED (on by default in DEBUG). In DEBUG,
+the totals are added to the response as X-Query-* headers; recent reports
+are kept in the cache for the staff-only panel at core:query_inspector.
+
+RequestProfilingMiddleware profiles requests that carry a signed profiling
+token, see core.profiling.
+
+ReadReplicaMiddleware decides, per request, whether reads may go to the
+read replica, see core.routers.
+"""
+import logging
+import os
+import re
+import time
+import traceback
+from contextlib import ExitStack
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from .metrics import MetricsStore, start_template_timer, stop_template_timer
+from .profiling import get_profile_request, profile_request, profiled_path
+from .routers import REPLICA_DB_ALIAS, get_routing_state, replica_routing
+
+logger = logging.getLogger(__name__)
+
+STRING_LITERAL_RE = re.compile(r"'(?:[^']|'')*'")
+NUMBER_LITERAL_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+IN_LIST_RE = re.compile(r'\bIN \(\?(?:, ?\?)*\)', re.IGNORECASE)
+
+
+def normalize_sql(sql):
+    """Collapse literals, placeholders and IN lists so equivalent statements compare equal"""
+    sql = sql.replace('%s', '?')
+    sql = STRING_LITERAL_RE.sub('?', sql)
+    sql = NUMBER_LITERAL_RE.sub('?', sql)
+    sql = IN_LIST_RE.sub('IN (...)', sql)
+    return ' '.join(sql.split())
+
+
+def get_call_site():
+    """Innermost frame of project code (outside this module) that led to the query"""
+    base_dir = str(Path(settings.BASE_DIR).resolve())
+    for frame in reversed(traceback.extract_stack()):
+        filename = frame.filename
+        if filename.startswith(base_dir) and filename != __file__ and 'site-packages' not in filename:
+            return f"{Path(filename).relative_to(base_dir)}:{frame.lineno} in {frame.name}"
+    return 'unknown'
+
+
+class QueryRecorder:
+    """Database execute wrapper that records each statement with its timing and call site"""
+
+    def __init__(self, capture_call_sites=True):
+        self.queries = []
+        self.capture_call_sites = capture_call_sites
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'sql': sql,
+                'params': repr(params),
+                'duration': time.perf_counter() - start,
+                # Walking the stack is the expensive part; skipped for always-on metrics
+                'call_site': get_call_site() if self.capture_call_sites else 'unknown',
+            })
+
+    def get_db_seconds(self):
+        return sum(query['duration'] for query in self.queries)
+
+    def get_groups(self):
+        """Statements grouped by normalised SQL and call site, most frequent first"""
+        threshold = getattr(settings, 'QUERY_INSPECTOR_N_PLUS_ONE_THRESHOLD', 3)
+        groups = {}
+        for query in self.queries:
+            key = (normalize_sql(query['sql']), query['call_site'])
+            group = groups.setdefault(key, {
+                'sql': key[0],
+                'call_site': key[1],
+                'count': 0,
+                'duration_ms': 0.0,
+            })
+            group['count'] += 1
+            group['duration_ms'] += query['duration'] * 1000
+        for group in groups.values():
+            group['n_plus_one'] = group['count'] >= threshold
+        return sorted(groups.values(), key=lambda group: (-group['count'], -group['duration_ms']))
+
+    def get_duplicate_count(self):
+        """Statements executed more than once with identical SQL and parameters"""
+        seen = set()
+        duplicates = 0
+        for query in self.queries:
+            key = (query['sql'], query['params'])
+            if key in seen:
+                duplicates += 1
+            seen.add(key)
+        return duplicates
+
+    def get_report(self, request, response):
+        groups = self.get_groups()
+        return {
+            'method': request.method,
+            'path': request.get_full_path(),
+            'status_code': response.status_code,
+            'recorded_at': time.time(),
+            'query_count': len(self.queries),
+            'duration_ms': self.get_db_seconds() * 1000,
+            'duplicate_count': self.get_duplicate_count(),
+            'n_plus_one': [group for group in groups if group['n_plus_one']],
+            'groups': groups,
+        }
+
+
+class QueryInspectorStore:
+    """Most recent request reports, shared through the cache"""
+
+    CACHE_KEY = 'query_inspector:reports'
+    MAX_REPORTS = 50
+    CACHE_TIMEOUT = 60 * 60
+
+    @classmethod
+    def add(cls, report):
+        reports = cache.get(cls.CACHE_KEY) or []
+        reports.insert(0, report)
+        cache.set(cls.CACHE_KEY, reports[:cls.MAX_REPORTS], cls.CACHE_TIMEOUT)
+
+    @classmethod
+    def all(cls):
+        return cache.get(cls.CACHE_KEY) or []
+
+    @classmethod
+    def clear(cls):
+        cache.delete(cls.CACHE_KEY)
+
+
+class RequestMetricsMiddleware:
+    """Time each request by resolved URL name; enabled by METRICS_ENABLED"""
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'METRICS_ENABLED', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder(capture_call_sites=False)
+        token = start_template_timer()
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(recorder))
+                response = self.get_response(request)
+        finally:
+            template_seconds = stop_template_timer(token)
+        wall_seconds = time.perf_counter() - start
+        db_seconds = recorder.get_db_seconds()
+
+        match = request.resolver_match
+        view = match.view_name if match else '<unresolved>'
+        MetricsStore.record(view, {'wall': wall_seconds, 'db': db_seconds, 'template': template_seconds})
+
+        if wall_seconds * 1000 >= getattr(settings, 'METRICS_SLOW_REQUEST_MS', 1000):
+            entry = {
+                'method': request.method,
+                'path': request.get_full_path()[:500],
+                'view': view,
+                'status_code': response.status_code,
+                'wall_ms': wall_seconds * 1000,
+                'db_ms': db_seconds * 1000,
+                'template_ms': template_seconds * 1000,
+                'queries': [
+                    {'sql': query['sql'], 'params': query['params'][:500], 'duration_ms': query['duration'] * 1000}
+                    for query in recorder.queries
+                ],
+            }
+            logger.warning(
+                'Slow request %s %s (%s): %.0f ms, %.0f ms in %d queries',
+                request.method, entry['path'], view, entry['wall_ms'], entry['db_ms'], len(recorder.queries),
+                extra={
+                    'view': view,
+                    'status_code': response.status_code,
+                    'wall_ms': entry['wall_ms'],
+                    'db_ms': entry['db_ms'],
+                    'template_ms': entry['template_ms'],
+                    'query_count': len(recorder.queries),
+                }
+            )
+            MetricsStore.log_slow_request(entry)
+        return response
+
+
+class QueryInspectorMiddleware:
+    def __init__(self, get_response):
+        if not getattr(settings, 'QUERY_INSPECTOR_ENABLED', settings.DEBUG):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+
+        report = recorder.get_report(request, response)
+        if report['n_plus_one']:
+            worst = report['n_plus_one'][0]
+            logger.warning(
+                f"Probable N+1 on {request.method} {request.path}: {worst['count']} x "
+                f"{worst['sql'][:200]} ({worst['call_site']})"
+            )
+        if settings.DEBUG:
+            response['X-Query-Count'] = str(report['query_count'])
+            response['X-Query-Duration-Ms'] = f"{report['duration_ms']:.1f}"
+            response['X-Query-Duplicates'] = str(report['duplicate_count'])
+            response['X-Query-N-Plus-One'] = str(len(report['n_plus_one']))
+        QueryInspectorStore.add(report)
+        return response
+
+
+class RequestProfilingMiddleware:
+    """Run requests carrying a signed profiling token under cProfile and store the result"""
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'PROFILING_ENABLED', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        payload = get_profile_request(request)
+        if payload is None:
+            return self.get_response(request)
+
+        response, result = profile_request(self.get_response, request, trace_memory=payload['memory'])
+        if result is None:
+            logger.info(f"Skipped profiling {request.path}: another request is being profiled")
+            return response
+
+        from .models import RequestProfile
+        match = request.resolver_match
+        user = getattr(request, 'user', None)
+        profile = RequestProfile.objects.create(
+            path=profiled_path(request)[:500],
+            method=request.method,
+            view_name=match.view_name if match else '',
+            status_code=response.status_code,
+            user=user if user is not None and user.is_authenticated else None,
+            requested_by=payload['requested_by'],
+            **result
+        )
+        response['X-Profile-Id'] = str(profile.pk)
+        return response
+
+
+class ReadReplicaMiddleware:
+    """Route reads of safe requests to READ_REPLICA_VIEWS to the replica database"""
+
+    pin_cookie = 'db_primary'
+
+    def __init__(self, get_response):
+        self.mode = getattr(settings, 'SQLITE_READ_REPLICA', '')
+        if not self.mode or REPLICA_DB_ALIAS not in settings.DATABASES:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.views = set(settings.READ_REPLICA_VIEWS)
+        if self.mode == 'backup':
+            from .db import start_replica_refresher
+            start_replica_refresher()
+
+    def __call__(self, request):
+        with replica_routing() as state:
+            response = self.get_response(request)
+        # The backup replica lags the primary: keep this client on the primary until it has caught up
+        if state.wrote and self.mode == 'backup':
+            response.set_cookie(
+                self.pin_cookie, '1', max_age=settings.READ_REPLICA_PIN_SECONDS, httponly=True, samesite='Lax'
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if (
+            request.method in ('GET', 'HEAD')
+            and request.resolver_match.view_name in self.views
+            and self.pin_cookie not in request.COOKIES
+            and self.replica_ready()
+        ):
+            get_routing_state().use_replica = True
+
+    def replica_ready(self):
+        # Until the refresher has made the first copy there is nothing to read from
+        return self.mode != 'backup' or os.path.exists(settings.SQLITE_REPLICA_PATH)
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:48
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='blogpost',
+            index=models.Index(condition=models.Q(('is_published', True)), fields=['created_at'], name='blogpost_published_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='career',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['created_at'], name='career_active_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='career',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['department', 'created_at'], name='career_active_dept_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['event_date'], name='event_active_date_idx'),
+        ),
+    ]
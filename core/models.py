@@ -1,4 +1,6 @@
 from django.db import models
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
 from django.contrib.auth.models import User
 from django.urls import reverse
 from django.utils.text import slugify
@@ -11,6 +13,7 @@ class Testimonial(models.Model):
     role = models.CharField(max_length=100, help_text="e.g., Data Analyst at Company X")
     content = CKEditor5Field(config_name='extends', help_text="Testimonial content")
     image = models.ImageField(upload_to='testimonial_images/', blank=True, null=True)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     is_featured = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
@@ -35,6 +38,11 @@ class Event(models.Model):
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['event_date'], condition=models.Q(is_active=True), name='event_active_date_idx'),
+        ]
+
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.title)
@@ -54,12 +62,16 @@ class BlogPost(models.Model):
     excerpt = CKEditor5Field(config_name='default', help_text="Brief excerpt or summary (max 300 characters)")
     author = models.ForeignKey(User, on_delete=models.CASCADE)
     featured_image = models.ImageField(upload_to='blog_images/', blank=True, null=True)
+    featured_image_variants = models.JSONField(default=dict, blank=True, editable=False)
     is_published = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_at'], condition=models.Q(is_published=True), name='blogpost_published_idx'),
+        ]
 
     def save(self, *args, **kwargs):
         if not self.slug:
@@ -160,6 +172,10 @@ class Career(models.Model):
         ordering = ['-created_at']
         verbose_name = 'Career Opportunity'
         verbose_name_plural = 'Career Opportunities'
+        indexes = [
+            models.Index(fields=['created_at'], condition=models.Q(is_active=True), name='career_active_created_idx'),
+            models.Index(fields=['department', 'created_at'], condition=models.Q(is_active=True), name='career_active_dept_idx'),
+        ]
 
     def save(self, *args, **kwargs):
         if not self.slug:
@@ -220,4 +236,81 @@ class Survey(models.Model):
         return now >= self.start_date
 
     def __str__(self):
-        return self.title
\ No newline at end of file
+        return self.title
+
+
+
+class RequestProfile(models.Model):
+    """cProfile/tracemalloc capture of one request, triggered by a signed profiling link"""
+    path = models.CharField(max_length=500)
+    method = models.CharField(max_length=10)
+    view_name = models.CharField(max_length=200, blank=True)
+    status_code = models.PositiveSmallIntegerField()
+    user = models.ForeignKey(
+        User, on_delete=models.SET_NULL, null=True, blank=True, related_name='request_profiles'
+    )
+    requested_by = models.ForeignKey(
+        User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+',
+        help_text="Staff member who created the profiling link"
+    )
+    duration_ms = models.FloatField()
+    stats = models.BinaryField(help_text="Marshalled pstats data, as written by pstats.Stats.dump_stats")
+    summary = models.TextField(help_text="Top functions by cumulative time")
+    collapsed_stacks = models.TextField(blank=True, help_text="Flame graph input (frame;frame microseconds)")
+    allocations = models.JSONField(default=list, blank=True, help_text="Largest allocation sites")
+    peak_memory_kb = models.PositiveIntegerField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.method} {self.path} ({self.duration_ms:.0f} ms)"
+
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender='courses.Course')
+@receiver(post_save, sender=BlogPost)
+@receiver(post_save, sender='courses.Enrollment')
+def increment_admin_stats(sender, instance, created, **kwargs):
+    """Count newly created rows in the cached admin statistics"""
+    if created:
+        from .services import AdminStatsService
+        AdminStatsService.adjust_for_model(sender, 1)
+
+
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender='courses.Course')
+@receiver(post_delete, sender=BlogPost)
+@receiver(post_delete, sender='courses.Enrollment')
+def decrement_admin_stats(sender, instance, **kwargs):
+    """Remove deleted rows from the cached admin statistics"""
+    from .services import AdminStatsService
+    AdminStatsService.adjust_for_model(sender, -1)
+
+
+@receiver(post_save, sender=Testimonial)
+@receiver(post_save, sender=BlogPost)
+@receiver(post_save, sender='courses.Course')
+@receiver(post_save, sender='accounts.UserProfile')
+def queue_image_variants(sender, instance, raw=False, **kwargs):
+    """Build responsive variants of newly uploaded images in the background"""
+    if raw:
+        return
+    from .images import RESPONSIVE_IMAGE_FIELDS, queue_variants
+    for field_name in RESPONSIVE_IMAGE_FIELDS[sender._meta.label]:
+        queue_variants(instance, field_name)
+
+
+@receiver(post_save, sender=BlogPost)
+@receiver(post_save, sender='courses.Course')
+@receiver(post_save, sender='courses.CourseModule')
+@receiver(post_save, sender='courses.CodeExample')
+@receiver(post_save, sender='courses.Exercise')
+@receiver(post_save, sender='courses.CapstoneProject')
+def queue_inline_images(sender, instance, raw=False, **kwargs):
+    """Add responsive srcsets to images newly embedded in CKEditor content, in the background"""
+    if raw:
+        return
+    from .images import queue_inline_images
+    queue_inline_images(instance)
@@ -0,0 +1,205 @@
+"""
+On-demand request profiling
+
+A staff member mints a signed, expiring profiling link for a path from the
+Request profiles admin. A request to that path carrying the token (as the
+?_profile= query parameter or the X-Profile-Token header) is run under
+cProfile, and optionally tracemalloc, and stored as a RequestProfile with
+its pstats dump, the top allocation sites and flame-graph-ready collapsed
+stacks. Requests without a token are passed straight through.
+"""
+import cProfile
+import io
+import marshal
+import pstats
+import threading
+import time
+import tracemalloc
+from pathlib import Path
+
+from django.conf import settings
+from django.core import signing
+
+PROFILE_PARAM = '_profile'
+PROFILE_HEADER = 'X-Profile-Token'
+SIGNING_SALT = 'core.profiling'
+
+# cProfile cannot run two profilers at once; concurrent triggers are served unprofiled
+_profile_lock = threading.Lock()
+
+
+def make_profile_token(path, user, trace_memory=False):
+    """Signed token that profiles requests to ``path`` (and below) until it expires"""
+    payload = {'path': path, 'memory': bool(trace_memory), 'staff': user.pk}
+    return signing.dumps(payload, salt=SIGNING_SALT, compress=True)
+
+
+def read_profile_token(token):
+    """Payload of a valid, unexpired token, or None"""
+    try:
+        return signing.loads(
+            token, salt=SIGNING_SALT, max_age=getattr(settings, 'PROFILING_TOKEN_MAX_AGE', 60 * 60)
+        )
+    except signing.BadSignature:
+        return None
+
+
+def get_profile_request(request):
+    """Token payload if the request asks to be profiled and is allowed to be"""
+    token = request.GET.get(PROFILE_PARAM) or request.headers.get(PROFILE_HEADER)
+    if not token:
+        return None
+    payload = read_profile_token(token)
+    if payload is None or not request.path.startswith(payload['path']):
+        return None
+    # Links stop working as soon as their creator loses staff access
+    from django.contrib.auth.models import User
+    payload['requested_by'] = User.objects.filter(pk=payload['staff'], is_staff=True, is_active=True).first()
+    if payload['requested_by'] is None:
+        return None
+    return payload
+
+
+def profiled_path(request):
+    """Full path of a profiled request without its profiling token, which must not outlive the link"""
+    query = request.GET.copy()
+    query.pop(PROFILE_PARAM, None)
+    return f"{request.path}?{query.urlencode()}" if query else request.path
+
+
+def frame_label(func):
+    """Readable ``name (file:line)`` label of a pstats function key"""
+    filename, lineno, name = func
+    if filename == '~':
+        label = name
+    else:
+        parts = Path(filename).parts
+        if 'site-packages' in parts:
+            parts = parts[parts.index('site-packages') + 1:]
+        else:
+            try:
+                parts = Path(filename).relative_to(settings.BASE_DIR).parts
+            except ValueError:
+                parts = parts[-2:]
+        label = f"{name} ({'/'.join(parts)}:{lineno})"
+    # ';' separates frames in the collapsed format
+    return label.replace(';', ',')
+
+
+def collapse_stats(stats, min_fraction=0.001, max_depth=200):
+    """
+    Approximate flame-graph stacks from a pstats call graph
+
+    Returns ``frame;frame;frame microseconds`` lines as read by flamegraph.pl
+    and speedscope. cProfile only records caller/callee pairs, so a function's
+    time is split between the paths leading to it in proportion to the time
+    each caller spent in it. Branches below ``min_fraction`` of the total are
+    not expanded.
+    """
+    entries = stats.stats
+    callees = {}
+    for func, (_, _, _, _, callers) in entries.items():
+        for caller, edge in callers.items():
+            callees.setdefault(caller, []).append((func, edge[3]))
+
+    roots = [func for func, entry in entries.items() if not entry[4]]
+    total = sum(entries[func][3] for func in roots)
+    if not total:
+        return ''
+    cutoff = total * min_fraction
+
+    samples = {}
+
+    def walk(func, seconds, stack, on_stack):
+        cumulative = entries[func][3]
+        fraction = min(1.0, seconds / cumulative) if cumulative else 0.0
+        stack = stack + [frame_label(func)]
+        own = entries[func][2] * fraction
+        for callee, edge_seconds in callees.get(func, ()):
+            share = edge_seconds * fraction
+            # Recursion is folded into the outermost call, whose time already includes it
+            if callee in on_stack:
+                continue
+            # Small branches are not expanded; their time stays with this frame
+            if share < cutoff or len(stack) >= max_depth:
+                own += share
+                continue
+            walk(callee, share, stack, on_stack | {callee})
+        if own:
+            key = ';'.join(stack)
+            samples[key] = samples.get(key, 0) + own
+
+    for root in roots:
+        walk(root, entries[root][3], [], {root})
+
+    lines = [
+        f'{stack} {round(seconds * 1000000)}'
+        for stack, seconds in sorted(samples.items())
+        if round(seconds * 1000000)
+    ]
+    return '\n'.join(lines)
+
+
+def get_allocation_sites(snapshot, limit):
+    """Largest live allocations by source line"""
+    snapshot = snapshot.filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        tracemalloc.Filter(False, '<unknown>'),
+    ))
+    sites = []
+    for statistic in snapshot.statistics('lineno')[:limit]:
+        frame = statistic.traceback[0]
+        sites.append({
+            'site': f'{frame.filename}:{frame.lineno}',
+            'size_kb': round(statistic.size / 1024, 1),
+            'count': statistic.count,
+        })
+    return sites
+
+
+def profile_request(get_response, request, trace_memory=False):
+    """
+    Run ``get_response(request)`` under cProfile (and tracemalloc)
+
+    Returns ``(response, result)``, where ``result`` holds the fields of a
+    RequestProfile, or is None when another request is already being
+    profiled in this process.
+    """
+    if not _profile_lock.acquire(blocking=False):
+        return get_response(request), None
+    try:
+        started_tracing = trace_memory and not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start(getattr(settings, 'PROFILING_TRACEMALLOC_FRAMES', 10))
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        try:
+            response = profiler.runcall(get_response, request)
+        finally:
+            duration = time.perf_counter() - start
+            snapshot = peak = None
+            if started_tracing:
+                snapshot = tracemalloc.take_snapshot()
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+    finally:
+        _profile_lock.release()
+
+    stream = io.StringIO()
+    stats = pstats.Stats(profiler, stream=stream)
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(40)
+    result = {
+        'duration_ms': duration * 1000,
+        'stats': marshal.dumps(stats.stats),
+        'summary': stream.getvalue(),
+        'collapsed_stacks': collapse_stats(stats),
+        'allocations': [],
+        'peak_memory_kb': None,
+    }
+    if snapshot is not None:
+        result['allocations'] = get_allocation_sites(
+            snapshot, getattr(settings, 'PROFILING_TOP_ALLOCATIONS', 25)
+        )
+        result['peak_memory_kb'] = peak // 1024
+    return response, result
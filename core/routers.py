@@ -0,0 +1,79 @@
+"""
+Read/write split for SQLite
+
+ReadReplicaRouter sends reads made while serving the views in
+READ_REPLICA_VIEWS to the 'replica' database alias, and everything else to
+'default'. SQLITE_READ_REPLICA selects what that alias is:
+
+- 'readonly': a second connection to the primary file opened with
+  ``mode=ro``. With WAL, readers never wait for the writer and always see
+  the last committed transaction.
+- 'backup': a copy of the primary at SQLITE_REPLICA_PATH, refreshed every
+  SQLITE_REPLICA_REFRESH_SECONDS with the sqlite3 backup API (see
+  core.db.refresh_sqlite_replica). Reads never touch the primary file, at
+  the cost of being up to one refresh interval behind.
+
+Routing is per request (ReadReplicaMiddleware). The first write in a request
+pins the rest of it to the primary; in 'backup' mode a short-lived cookie
+keeps the following requests on the primary too, so a user sees their own
+enrollment or progress right after making it.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+REPLICA_DB_ALIAS = 'replica'
+
+_routing = ContextVar('read_replica_routing', default=None)
+
+
+class RoutingState:
+    __slots__ = ('use_replica', 'wrote')
+
+    def __init__(self, use_replica=False):
+        self.use_replica = use_replica
+        self.wrote = False
+
+
+def get_routing_state():
+    return _routing.get()
+
+
+@contextmanager
+def replica_routing(use_replica=False):
+    """Scope for one unit of work (a request); yields its RoutingState"""
+    state = RoutingState(use_replica)
+    token = _routing.set(state)
+    try:
+        yield state
+    finally:
+        _routing.reset(token)
+
+
+class ReadReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _routing.get()
+        if (
+            state is not None and state.use_replica and not state.wrote
+            and model._meta.app_label not in settings.READ_REPLICA_EXCLUDED_APPS
+        ):
+            return REPLICA_DB_ALIAS
+        # Explicit, so objects loaded from the replica don't pull related rows from it after a write
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        state = _routing.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == REPLICA_DB_ALIAS:
+            return False
+        return None
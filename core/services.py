@@ -0,0 +1,71 @@
+"""
+Service classes for the core app
+"""
+from functools import partial
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError
+
+
+class AdminStatsService:
+    """
+    Site-wide row counters for the admin dashboard
+
+    Counts live in the cache. Creates and deletes adjust them in place via
+    signals, and each counter is recounted at most every
+    ADMIN_STATS_REFRESH_SECONDS to correct drift from bulk operations.
+    """
+
+    CACHE_KEY = 'admin_stats:{name}'
+    COUNTED_MODELS = {
+        'user_count': 'auth.User',
+        'course_count': 'courses.Course',
+        'blog_count': 'core.BlogPost',
+        'enrollment_count': 'courses.Enrollment',
+    }
+
+    @staticmethod
+    def get_refresh_seconds():
+        return getattr(settings, 'ADMIN_STATS_REFRESH_SECONDS', 300)
+
+    @classmethod
+    def get_count(cls, name):
+        """Return a cached counter, counting rows on a miss"""
+        cache_key = cls.CACHE_KEY.format(name=name)
+        value = cache.get(cache_key)
+        if value is None:
+            try:
+                value = apps.get_model(cls.COUNTED_MODELS[name])._default_manager.count()
+            except DatabaseError:
+                # In case tables don't exist yet (during migrations)
+                return 0
+            cache.set(cache_key, value, cls.get_refresh_seconds())
+        return value
+
+    @classmethod
+    def adjust(cls, name, delta):
+        """Apply a create/delete to a cached counter"""
+        try:
+            cache.incr(cls.CACHE_KEY.format(name=name), delta)
+        except ValueError:
+            # Not cached yet; the next read counts the table
+            pass
+
+    @classmethod
+    def adjust_for_model(cls, model, delta):
+        label = model._meta.label
+        for name, model_label in cls.COUNTED_MODELS.items():
+            if model_label == label:
+                cls.adjust(name, delta)
+
+    @classmethod
+    def lazy_stats(cls):
+        """
+        Template context of counters that are only read when rendered
+
+        Django templates call callables when resolving a variable, so pages
+        that never display a counter never touch the cache or the database.
+        """
+        return {name: partial(cls.get_count, name) for name in cls.COUNTED_MODELS}
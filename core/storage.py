@@ -0,0 +1,137 @@
+"""
+Deduplicating media storage
+
+ContentHashedStorage writes every upload once, as a blob named after its
+SHA-256 under MEDIA_ROOT/.blobs/, and gives it its usual upload name
+(course_pdfs/syllabus.pdf, certificates/...) as a hard link to that blob.
+Uploading the same logo or dataset twice creates a second name but no
+second copy, and URLs, downloads and FileField values look exactly as they
+did before.
+
+The link count of a blob is its reference count: deleting a name (e.g.
+when a certificate is regenerated) drops it by one, and a blob whose count
+is down to one is referenced by nothing but the blob directory itself. The
+gc_media command removes names that no database row refers to and then
+those blobs.
+
+Hard links need the blobs and the names on one filesystem, so MEDIA_ROOT
+must not be split across mounts.
+
+CKEditorUploadStorage is what the editor's image upload view saves with
+(CKEDITOR_5_FILE_STORAGE): it shrinks and re-encodes each image first.
+"""
+import hashlib
+import os
+import posixpath
+import tempfile
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.utils._os import safe_makedirs
+
+BLOB_DIR = '.blobs'
+
+
+class ContentHashedStorage(FileSystemStorage):
+
+    @property
+    def blob_root(self):
+        return os.path.join(self.location, BLOB_DIR)
+
+    def blob_path(self, digest):
+        return os.path.join(self.blob_root, digest[:2], digest[2:4], digest)
+
+    def _makedirs(self, directory):
+        if self.directory_permissions_mode is not None:
+            safe_makedirs(directory, self.directory_permissions_mode, exist_ok=True)
+        else:
+            os.makedirs(directory, exist_ok=True)
+
+    def store_blob(self, content):
+        """Write content to its blob unless an identical one exists; return the blob path"""
+        temp_dir = os.path.join(self.blob_root, 'tmp')
+        self._makedirs(temp_dir)
+        digest = hashlib.sha256()
+        fd, temp_path = tempfile.mkstemp(dir=temp_dir)
+        try:
+            with os.fdopen(fd, 'wb') as temp:
+                for chunk in content.chunks():
+                    if isinstance(chunk, str):
+                        chunk = chunk.encode()
+                    digest.update(chunk)
+                    temp.write(chunk)
+            if self.file_permissions_mode is not None:
+                os.chmod(temp_path, self.file_permissions_mode)
+            blob = self.blob_path(digest.hexdigest())
+            self._makedirs(os.path.dirname(blob))
+            try:
+                # Creates the blob only if it is absent, even against a concurrent identical upload
+                os.link(temp_path, blob)
+            except FileExistsError:
+                # Reused: restart gc_media's grace period for it
+                os.utime(blob)
+        finally:
+            os.remove(temp_path)
+        return blob
+
+    def _save(self, name, content):
+        blob = self.store_blob(content)
+        while True:
+            full_path = self.path(name)
+            self._makedirs(os.path.dirname(full_path))
+            try:
+                os.link(blob, full_path)
+            except FileExistsError:
+                if self._allow_overwrite:
+                    os.remove(full_path)
+                else:
+                    name = self.get_available_name(name)
+                continue
+            break
+        self._ensure_location_group_id(full_path)
+        return os.path.relpath(full_path, self.location).replace('\\', '/')
+
+    def adopt(self, full_path):
+        """
+        Turn a file saved before this storage was in use into a link to its blob
+
+        Returns True when an identical blob already existed, so the file's
+        own copy was dropped.
+        """
+        digest = hashlib.sha256()
+        with open(full_path, 'rb') as file:
+            while chunk := file.read(64 * 1024):
+                digest.update(chunk)
+        blob = self.blob_path(digest.hexdigest())
+        self._makedirs(os.path.dirname(blob))
+        try:
+            os.link(full_path, blob)
+            return False
+        except FileExistsError:
+            pass
+        # Swap the file for a link to the blob without a moment where the name is missing
+        temp_path = f'{full_path}.{os.getpid()}.link'
+        os.link(blob, temp_path)
+        os.replace(temp_path, full_path)
+        return True
+
+
+class CKEditorUploadStorage(ContentHashedStorage):
+    """
+    Storage for images uploaded from CKEditor
+
+    Images are capped at CKEDITOR_IMAGE_MAX_SIZE pixels, stripped of EXIF
+    (camera details, GPS position) and re-encoded (core.images.optimize_image)
+    before being stored under CKEDITOR_5_UPLOAD_PATH.
+    """
+
+    def save(self, name, content, max_length=None):
+        from .images import optimize_image
+        optimized = optimize_image(content)
+        if optimized is not None:
+            data, extension = optimized
+            name = f'{posixpath.splitext(name)[0]}.{extension}'
+            content = ContentFile(data)
+        name = posixpath.join(settings.CKEDITOR_5_UPLOAD_PATH, posixpath.basename(name))
+        return super().save(name, content, max_length)
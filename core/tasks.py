@@ -0,0 +1,64 @@
+"""
+Lightweight in-process background task queue
+
+Work that should not hold up a request (PDF rendering, notification emails)
+is handed to a daemon worker thread in the current process. There is no
+broker: tasks still queued when the process exits are lost, so tasks must be
+safe to re-run from whatever state they left behind.
+
+Set BACKGROUND_TASKS_EAGER = True to run tasks inline (useful in tests and
+management commands).
+"""
+import logging
+import queue
+import threading
+
+from django.conf import settings
+from django.db import connections, transaction
+
+logger = logging.getLogger(__name__)
+
+_tasks = queue.Queue()
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def _run_task(func, args, kwargs):
+    try:
+        func(*args, **kwargs)
+    except Exception:
+        logger.exception(f"Background task {func.__module__}.{func.__qualname__} failed")
+
+
+def _worker_loop():
+    while True:
+        func, args, kwargs = _tasks.get()
+        try:
+            _run_task(func, args, kwargs)
+        finally:
+            # Worker threads hold their own DB connections; release them between tasks
+            connections.close_all()
+            _tasks.task_done()
+
+
+def _ensure_worker():
+    """Start the worker thread, including after a fork where it did not survive"""
+    global _worker
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_worker_loop, name='background-tasks', daemon=True)
+            _worker.start()
+
+
+def enqueue(func, *args, **kwargs):
+    """Run ``func(*args, **kwargs)`` on the background worker"""
+    if getattr(settings, 'BACKGROUND_TASKS_EAGER', False):
+        _run_task(func, args, kwargs)
+        return
+    _ensure_worker()
+    _tasks.put((func, args, kwargs))
+
+
+def enqueue_on_commit(func, *args, **kwargs):
+    """Queue a task once the current transaction commits, so it sees committed rows"""
+    transaction.on_commit(lambda: enqueue(func, *args, **kwargs))
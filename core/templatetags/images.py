@@ -0,0 +1,43 @@
+from django import template
+from django.core.files.storage import default_storage
+from django.utils.html import format_html, format_html_join
+
+from core.images import variants_field_name
+
+register = template.Library()
+
+
+def srcset(entries):
+    return ', '.join(f'{default_storage.url(name)} {width}w' for width, name in entries)
+
+
+@register.simple_tag
+def responsive_image(instance, field_name, alt='', sizes='100vw', loading='lazy', **attrs):
+    """
+    Render an image field as a <picture> with WebP and JPEG srcsets
+
+    Usage: {% responsive_image course 'image' alt=course.title sizes='(min-width: 1024px) 33vw, 100vw' class='...' %}
+
+    Extra keyword arguments become attributes of the <img>. Until the
+    variants of the current upload exist, the original is rendered.
+    """
+    image = getattr(instance, field_name)
+    if not image:
+        return ''
+    variants = getattr(instance, variants_field_name(field_name)) or {}
+    extra = format_html_join('', ' {}="{}"', attrs.items())
+    if variants.get('source') != image.name:
+        return format_html('<img src="{}" alt="{}" loading="{}"{}>', image.url, alt, loading, extra)
+
+    jpeg = variants['jpeg']
+    # The <picture> box is dropped from layout so classes on the <img> size it as before
+    return format_html(
+        '<picture class="contents">'
+        '<source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" width="{}" height="{}" alt="{}" loading="{}" decoding="async" '
+        'style="background: url({}) center / cover no-repeat"{}>'
+        '</picture>',
+        srcset(variants['webp']), sizes,
+        default_storage.url(jpeg[len(jpeg) // 2][1]), srcset(jpeg), sizes, variants['width'], variants['height'],
+        alt, loading, variants['placeholder'], extra,
+    )
@@ -0,0 +1,132 @@
+"""
+Test runner and assertion helpers shared by the test suites of all apps
+"""
+import re
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connection
+from django.test.runner import DiscoverRunner
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from .middleware import QueryRecorder
+
+class TestRunner(DiscoverRunner):
+    """
+    DiscoverRunner that keeps the suite away from the site's own files
+
+    Tests get a SQLiteCache in a temporary directory instead of the cache
+    shared by the site's workers, whose keys (built from primary keys)
+    would collide with the test database's and which tests clear. Request
+    metrics are off, and kept in the same directory for the tests that turn
+    them back on, so test-client requests never reach the site's histograms.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.directory = tempfile.TemporaryDirectory(prefix='lum-tests-')
+        cache = {**settings.CACHES['default'], 'LOCATION': str(Path(self.directory.name) / 'cache.sqlite3')}
+        self.settings_override = override_settings(
+            CACHES={'default': cache},
+            METRICS_ENABLED=False,
+            METRICS_DB_PATH=str(Path(self.directory.name) / 'metrics.sqlite3'),
+        )
+        self.settings_override.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.settings_override.disable()
+        self.directory.cleanup()
+        super().teardown_test_environment(**kwargs)
+
+
+# Django aliases subquery and self-join tables, e.g. FROM "core_enrollment" U0
+TABLE_ALIAS_RE = re.compile(r'"(\w+)" ([A-Z]\d+)\b')
+SCAN_RE = re.compile(r'^SCAN (\S+)(?: USING (?:COVERING )?INDEX (\S+))?')
+
+
+class QueryPlanAssertionsMixin:
+    """
+    TestCase mixin that checks the plans of the queries a block of code runs
+
+    Every SELECT captured inside ``assertNoFullTableScans`` is passed through
+    EXPLAIN QUERY PLAN, and the test fails if any step scans one of the
+    guarded tables end to end instead of searching an index. Walking a
+    partial index is allowed, since it only holds the matching rows. Plans
+    are only inspected on SQLite; on other backends the block just runs.
+    """
+
+    guarded_models = ()
+
+    def get_query_plan(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            return [row[-1] for row in cursor.fetchall()]
+
+    def get_partial_indexes(self, table):
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA index_list("{table}")')
+            columns = [column[0] for column in cursor.description]
+            return {
+                row['name'] for row in (dict(zip(columns, values)) for values in cursor.fetchall())
+                if row['partial']
+            }
+
+    def get_full_table_scans(self, sql, tables):
+        """Plan steps of ``sql`` that scan one of ``tables``"""
+        aliases = dict((alias, table) for table, alias in TABLE_ALIAS_RE.findall(sql))
+        scans = []
+        for step in self.get_query_plan(sql):
+            match = SCAN_RE.match(step)
+            if not match:
+                continue
+            table = aliases.get(match.group(1), match.group(1))
+            if table in tables and match.group(2) not in self.get_partial_indexes(table):
+                scans.append(step)
+        return scans
+
+    @contextmanager
+    def assertNoFullTableScans(self, models=None):
+        tables = {model._meta.db_table for model in (models or self.guarded_models)}
+        with CaptureQueriesContext(connection) as context:
+            yield context
+        if connection.vendor != 'sqlite':
+            return
+
+        failures = []
+        for query in context.captured_queries:
+            sql = query['sql']
+            if not sql.lstrip().upper().startswith('SELECT'):
+                continue
+            for step in self.get_full_table_scans(sql, tables):
+                failures.append(f'{step}\n    {sql}')
+        if failures:
+            self.fail('Queries fell back to full table scans:\n' + '\n'.join(failures))
+
+
+class QueryBudgetAssertionsMixin:
+    """
+    TestCase mixin that pins the number of queries a view may issue
+
+    Budgets are meant to be independent of the number of rows rendered, so
+    fixtures should create several related rows: a view that queries per row
+    then goes over budget instead of passing by accident.
+    """
+
+    def assertMaxQueries(self, view, n, *, args=None, kwargs=None, data=None, method='get'):
+        """Request the URL named ``view`` and fail if it runs more than ``n`` queries"""
+        url = reverse(view, args=args, kwargs=kwargs)
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            response = getattr(self.client, method)(url, data)
+        if len(recorder.queries) > n:
+            lines = [
+                f"{group['count']:>4} x {group['sql']}\n       at {group['call_site']}"
+                for group in recorder.get_groups()
+            ]
+            self.fail(
+                f"{view} ran {len(recorder.queries)} queries, budget is {n}:\n" + '\n'.join(lines)
+            )
+        return response
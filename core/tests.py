@@ -1,3 +1,672 @@
-from django.test import TestCase
+import re
+import sqlite3
+import tempfile
+from contextlib import closing
+from datetime import timedelta
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache, caches
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import OperationalError, connection, transaction
+from django.template import Context, Template
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import ExifTags, Image
+
+from courses.models import Course, CourseCategory, Enrollment
+from .cache import SQLiteCache
+from .db import refresh_sqlite_replica, retry_on_locked
+from .metrics import LatencyHistogram, MetricsStore
+from .middleware import QueryInspectorStore, QueryRecorder
+from .models import BlogPost, Career, Event, RequestProfile
+from .profiling import make_profile_token
+from .routers import ReadReplicaRouter, replica_routing
+from .services import AdminStatsService
+from .testing import QueryBudgetAssertionsMixin, QueryPlanAssertionsMixin
+
+
+class PublicPagesQueryPlanTests(QueryPlanAssertionsMixin, TestCase):
+    """Public listing and detail pages must be served from indexes"""
+
+    guarded_models = (BlogPost, Career, Course, Event)
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user('author', 'author@example.com', 'password')
+        category = CourseCategory.objects.create(name='data_analytics', display_name='Data Analytics')
+        Course.objects.create(title='Python for Data', category=category, price=100, is_featured=True)
+        cls.event = Event.objects.create(
+            title='Open Day', description='Tour', event_date=timezone.now() + timedelta(days=7),
+            duration='2 hours', registration_deadline=timezone.now() + timedelta(days=6)
+        )
+        cls.post = BlogPost.objects.create(
+            title='Hello', content='Body', excerpt='Intro', author=author, is_published=True
+        )
+        cls.career = Career.objects.create(
+            title='Data Instructor', department='Academic', location='Remote',
+            description='-', responsibilities='-', requirements='-'
+        )
+
+    def test_home(self):
+        with self.assertNoFullTableScans():
+            self.assertEqual(self.client.get(reverse('core:home')).status_code, 200)
+
+    def test_events(self):
+        with self.assertNoFullTableScans():
+            self.assertEqual(self.client.get(reverse('core:events')).status_code, 200)
+            self.assertEqual(self.client.get(self.event.get_absolute_url()).status_code, 200)
+
+    def test_blog(self):
+        with self.assertNoFullTableScans():
+            self.assertEqual(self.client.get(reverse('core:blog')).status_code, 200)
+            self.assertEqual(self.client.get(self.post.get_absolute_url()).status_code, 200)
+
+    def test_careers(self):
+        with self.assertNoFullTableScans():
+            self.assertEqual(self.client.get(reverse('core:careers')).status_code, 200)
+            response = self.client.get(reverse('core:career_detail', kwargs={'slug': self.career.slug}))
+            self.assertEqual(response.status_code, 200)
+
+
+class PublicPagesQueryBudgetTests(QueryBudgetAssertionsMixin, TestCase):
+    """Query counts of public pages must not grow with the number of rows shown"""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user('author', 'author@example.com', 'password')
+        category = CourseCategory.objects.create(name='data_analytics', display_name='Data Analytics')
+        for number in range(3):
+            Course.objects.create(title=f'Course {number}', category=category, price=100, is_featured=True)
+            Event.objects.create(
+                title=f'Event {number}', description='-', event_date=timezone.now() + timedelta(days=7),
+                duration='2 hours', registration_deadline=timezone.now() + timedelta(days=6)
+            )
+            BlogPost.objects.create(
+                title=f'Post {number}', content='Body', excerpt='Intro', author=author, is_published=True
+            )
+
+    def test_home(self):
+        self.assertMaxQueries('core:home', 4)
+
+
+class AdminStatsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_superuser('staff', 'staff@example.com', 'password')
+        cls.category = CourseCategory.objects.create(name='data_analytics', display_name='Data Analytics')
+        Course.objects.create(title='Python for Data', category=cls.category, price=100)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_cold_cache_counts_once(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(AdminStatsService.get_count('user_count'), 1)
+        with self.assertNumQueries(0):
+            self.assertEqual(AdminStatsService.get_count('user_count'), 1)
+
+    def test_creates_and_deletes_adjust_cached_counters(self):
+        for name in AdminStatsService.COUNTED_MODELS:
+            AdminStatsService.get_count(name)
+
+        learner = User.objects.create_user('learner', 'learner@example.com')
+        course = Course.objects.create(title='SQL Basics', category=self.category, price=50)
+        post = BlogPost.objects.create(title='Hello', author=self.staff, content='-', excerpt='-')
+        enrollment = Enrollment.objects.create(user=learner, course=course, total_amount=50)
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                {name: AdminStatsService.get_count(name) for name in AdminStatsService.COUNTED_MODELS},
+                {'user_count': 2, 'course_count': 2, 'blog_count': 1, 'enrollment_count': 1}
+            )
+
+        # Saving an existing row changes nothing
+        course.save()
+        self.assertEqual(AdminStatsService.get_count('course_count'), 2)
+
+        post.delete()
+        learner.delete()  # also deletes the enrollment
+        course.delete()
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                {name: AdminStatsService.get_count(name) for name in AdminStatsService.COUNTED_MODELS},
+                {'user_count': 1, 'course_count': 1, 'blog_count': 0, 'enrollment_count': 0}
+            )
+        self.assertFalse(Enrollment.objects.filter(pk=enrollment.pk).exists())
+
+    def test_uncached_counters_are_not_created_by_signals(self):
+        User.objects.create_user('learner', 'learner@example.com')
+        self.assertIsNone(cache.get(AdminStatsService.CACHE_KEY.format(name='user_count')))
+        self.assertEqual(AdminStatsService.get_count('user_count'), 2)
+
+    def test_admin_index_runs_no_count_queries_when_warm(self):
+        self.client.force_login(self.staff)
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(reverse('admin:index'))
+        self.assertTrue([query for query in context.captured_queries if 'COUNT(' in query['sql']])
+
+        # Session, user and the two about-page checks of the app list
+        with self.assertNumQueries(4), CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('admin:index'))
+        self.assertContains(response, '<h3>1</h3>')
+        self.assertEqual([query['sql'] for query in context.captured_queries if 'COUNT(' in query['sql']], [])
+
+
+@override_settings(DEBUG=True, QUERY_INSPECTOR_ENABLED=True, QUERY_INSPECTOR_N_PLUS_ONE_THRESHOLD=3)
+class QueryInspectorMiddlewareTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('staff', 'staff@example.com', 'password', is_staff=True)
+        category = CourseCategory.objects.create(name='data_analytics', display_name='Data Analytics')
+        for number in range(3):
+            Course.objects.create(title=f'Course {number}', category=category, price=100, is_featured=True)
+
+    def setUp(self):
+        QueryInspectorStore.clear()
+
+    def test_debug_headers(self):
+        response = self.client.get(reverse('core:home'))
+        self.assertEqual(response['X-Query-N-Plus-One'], '0')
+        self.assertEqual(int(response['X-Query-Count']), QueryInspectorStore.all()[0]['query_count'])
+
+    def test_flags_repeated_statements(self):
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            for course in Course.objects.all():
+                course.category.display_name
+        n_plus_one = [group for group in recorder.get_groups() if group['n_plus_one']]
+        self.assertEqual(len(n_plus_one), 1)
+        self.assertEqual(n_plus_one[0]['count'], 3)
+        self.assertIn('core/tests.py', n_plus_one[0]['call_site'])
+
+    def test_staff_panel(self):
+        self.client.get(reverse('core:home'))
+        response = self.client.get(reverse('core:query_inspector'))
+        self.assertEqual(response.status_code, 302)
+
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('core:query_inspector'))
+        self.assertContains(response, reverse('core:home'))
+
+
+class LatencyHistogramTests(TestCase):
+
+    def test_bucket_bounds_contain_values(self):
+        for value in [0, 1, 15, 16, 17, 31, 32, 33, 1000, 123456, 10 ** 9]:
+            index = LatencyHistogram.bucket_index(value)
+            self.assertGreaterEqual(LatencyHistogram.bucket_upper_bound(index), value)
+            if index:
+                self.assertLess(LatencyHistogram.bucket_upper_bound(index - 1), value)
+
+    def test_percentiles_within_bucket_precision(self):
+        histogram = LatencyHistogram()
+        for millisecond in range(1, 101):
+            histogram.record(millisecond / 1000)
+        for percent, expected in [(50, 0.050), (95, 0.095), (99, 0.099)]:
+            self.assertGreaterEqual(histogram.percentile(percent), expected)
+            self.assertLess(histogram.percentile(percent), expected * 1.07)
+
+
+class RequestMetricsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('staff', 'staff@example.com', 'password', is_staff=True)
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = self.settings(
+            METRICS_ENABLED=True, METRICS_DB_PATH=str(Path(directory.name) / 'metrics.sqlite3'),
+            METRICS_TOKEN='scrape-token'
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        MetricsStore.reset()
+
+    def test_records_views_for_prometheus(self):
+        self.client.get(reverse('core:home'))
+        self.client.get(reverse('core:home'))
+
+        self.assertEqual(self.client.get(reverse('core:metrics')).status_code, 403)
+        self.assertEqual(
+            self.client.get(reverse('core:metrics'), HTTP_AUTHORIZATION='Bearer scrape-tokem').status_code, 403
+        )
+        response = self.client.get(reverse('core:metrics'), HTTP_AUTHORIZATION='Bearer scrape-token')
+        body = response.content.decode()
+        self.assertIn('# TYPE lum_request_duration_seconds histogram', body)
+        self.assertIn('lum_request_duration_seconds_count{view="core:home"} 2', body)
+        self.assertIn('lum_request_template_seconds_bucket{view="core:home",le="+Inf"} 2', body)
+
+    def test_slow_requests_are_logged_with_queries(self):
+        with self.settings(METRICS_SLOW_REQUEST_MS=0), self.assertLogs('core.middleware', 'WARNING'):
+            self.client.get(reverse('core:home'))
+        slow = MetricsStore.get_slow_requests()
+        self.assertEqual(slow[0]['view'], 'core:home')
+        self.assertEqual(len(slow[0]['queries']), slow[0]['query_count'])
+
+    def test_admin_index_shows_latency_percentiles(self):
+        self.client.force_login(self.staff)
+        self.client.get(reverse('core:home'))
+        response = self.client.get(reverse('admin:index'))
+        self.assertContains(response, 'View Latency')
+        self.assertContains(response, 'core:home')
+
+
+class TestRunnerMetricsTests(SimpleTestCase):
+
+    def test_suite_does_not_record_into_the_site_store(self):
+        self.assertFalse(settings.METRICS_ENABLED)
+        self.assertNotEqual(MetricsStore.get_path(), Path(settings.BASE_DIR) / 'metrics.sqlite3')
+
+
+class RequestProfilingTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user(
+            'staff', 'staff@example.com', 'password', is_staff=True, is_superuser=True
+        )
+        cls.learner = User.objects.create_user('learner', 'learner@example.com', 'password')
+
+    def test_inert_without_valid_token(self):
+        url = reverse('core:home')
+        self.client.get(url)
+        self.client.get(url, {'_profile': 'tampered'})
+        self.client.get(url, {'_profile': make_profile_token('/blog/', self.staff)})
+        self.assertFalse(RequestProfile.objects.exists())
+
+    def test_profiles_signed_request(self):
+        self.client.force_login(self.learner)
+        token = make_profile_token('/', self.staff, trace_memory=True)
+        response = self.client.get(reverse('core:home'), HTTP_X_PROFILE_TOKEN=token)
+
+        profile = RequestProfile.objects.get(pk=response['X-Profile-Id'])
+        self.assertEqual(profile.view_name, 'core:home')
+        self.assertEqual(profile.user, self.learner)
+        self.assertEqual(profile.requested_by, self.staff)
+        self.assertIn('cumulative', profile.summary)
+        self.assertTrue(profile.allocations)
+        stack, microseconds = profile.collapsed_stacks.splitlines()[0].rsplit(' ', 1)
+        self.assertGreater(int(microseconds), 0)
+
+    def test_saved_path_drops_the_token(self):
+        token = make_profile_token('/', self.staff)
+        response = self.client.get(reverse('core:home'), {'page': '2', '_profile': token})
+
+        profile = RequestProfile.objects.get(pk=response['X-Profile-Id'])
+        self.assertEqual(profile.path, '/?page=2')
+        self.assertNotIn(token, profile.path)
+
+    def test_token_revoked_with_staff_access(self):
+        token = make_profile_token('/', self.staff)
+        User.objects.filter(pk=self.staff.pk).update(is_staff=False)
+        self.client.get(reverse('core:home'), {'_profile': token})
+        self.assertFalse(RequestProfile.objects.exists())
+
+    def test_admin_link_and_downloads(self):
+        self.client.force_login(self.staff)
+        response = self.client.post(reverse('admin:core_requestprofile_link'), {'path': '/courses/'})
+        link = response.context['link']
+        self.assertIn('/courses/?_profile=', link)
+
+        response = self.client.get(link)
+        profile = RequestProfile.objects.get(pk=response['X-Profile-Id'])
+        response = self.client.get(reverse('admin:core_requestprofile_change', args=[profile.pk]))
+        self.assertContains(response, 'Top functions')
+        response = self.client.get(reverse('admin:core_requestprofile_pstats', args=[profile.pk]))
+        self.assertEqual(bytes(response.content), bytes(profile.stats))
+        response = self.client.get(reverse('admin:core_requestprofile_stacks', args=[profile.pk]))
+        self.assertEqual(response.content.decode(), profile.collapsed_stacks)
+
+
+class RetryOnLockedTests(TransactionTestCase):
+
+    def make_flaky(self, failures, message='database is locked'):
+        calls = []
+
+        @retry_on_locked(attempts=3, base_delay=0)
+        def write():
+            calls.append(connection.in_atomic_block)
+            if len(calls) <= failures:
+                raise OperationalError(message)
+            return 'written'
+        return write, calls
+
+    def test_retries_locked_transactions(self):
+        write, calls = self.make_flaky(failures=2)
+        with self.assertLogs('core.db', 'WARNING'):
+            self.assertEqual(write(), 'written')
+        self.assertEqual(calls, [True, True, True])
+
+    def test_gives_up_after_attempts_and_on_other_errors(self):
+        write, calls = self.make_flaky(failures=3)
+        with self.assertLogs('core.db', 'WARNING'), self.assertRaises(OperationalError):
+            write()
+        self.assertEqual(len(calls), 3)
+
+        write, calls = self.make_flaky(failures=1, message='no such table: x')
+        with self.assertRaises(OperationalError):
+            write()
+        self.assertEqual(len(calls), 1)
+
+    def test_no_retry_inside_outer_transaction(self):
+        write, calls = self.make_flaky(failures=1)
+        with self.assertRaises(OperationalError), transaction.atomic():
+            write()
+        self.assertEqual(len(calls), 1)
+
+
+class ReadReplicaRouterTests(TestCase):
+    router = ReadReplicaRouter()
+
+    def test_routes_reads_until_first_write(self):
+        self.assertEqual(self.router.db_for_read(Course), 'default')
+        with replica_routing(use_replica=True) as state:
+            self.assertEqual(self.router.db_for_read(Course), 'replica')
+            self.assertEqual(self.router.db_for_read(User), 'default')
+            self.assertEqual(self.router.db_for_write(Course), 'default')
+            self.assertTrue(state.wrote)
+            self.assertEqual(self.router.db_for_read(Course), 'default')
+        self.assertFalse(self.router.allow_migrate('replica', 'courses'))
+        self.assertIsNone(self.router.allow_migrate('default', 'courses'))
+
+    def test_backup_replica_is_readable_read_only(self):
+        with tempfile.TemporaryDirectory() as directory:
+            primary = Path(directory) / 'primary.sqlite3'
+            with closing(sqlite3.connect(primary)) as db:
+                db.executescript('PRAGMA journal_mode = WAL; CREATE TABLE t (x); INSERT INTO t VALUES (1);')
+            replica = Path(directory) / 'replica.sqlite3'
+            with override_settings(SQLITE_REPLICA_PATH=str(replica)):
+                with self.assertLogs('core.db', 'INFO'):
+                    self.assertTrue(refresh_sqlite_replica(source=str(primary)))
+                self.assertFalse(refresh_sqlite_replica(max_age=60, source=str(primary)))
+
+            with closing(sqlite3.connect(f'file:{replica}?mode=ro', uri=True)) as db:
+                self.assertEqual(db.execute('SELECT x FROM t').fetchall(), [(1,)])
+                self.assertEqual(db.execute('PRAGMA journal_mode').fetchone(), ('delete',))
+            self.assertEqual(sorted(path.name for path in Path(directory).iterdir() if 'replica' in path.name),
+                             ['replica.sqlite3'])
+
+
+class SQLiteCacheTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.location = str(Path(directory.name) / 'cache.sqlite3')
+
+    def make_cache(self, **options):
+        config = {
+            'BACKEND': 'core.cache.SQLiteCache',
+            'LOCATION': self.location,
+            'OPTIONS': {'TOUCH_INTERVAL': 0, **options},
+        }
+        with override_settings(CACHES={'default': config}):
+            cache = caches.create_connection('default')
+        self.assertIsInstance(cache, SQLiteCache)
+        return cache
+
+    def test_suite_does_not_use_the_site_cache(self):
+        cache = caches['default']
+        self.assertIsInstance(cache, SQLiteCache)
+        self.assertNotEqual(Path(cache._path), Path(settings.BASE_DIR) / 'cache.sqlite3')
+
+    def test_shared_between_instances(self):
+        first, second = self.make_cache(), self.make_cache()
+        first.set_many({'page': {'html': '<p>'}, 'version': 1})
+        self.assertEqual(second.get_many(['page', 'version', 'missing']), {'page': {'html': '<p>'}, 'version': 1})
+        self.assertEqual(second.incr('version'), 2)
+        self.assertEqual(first.decr('version', 5), -3)
+        with self.assertRaises(ValueError):
+            first.incr('missing')
+        second.delete('page')
+        self.assertIsNone(first.get('page'))
+
+        self.assertFalse(first.add('version', 10))
+        self.assertTrue(first.add('expired', 1, timeout=0))
+        self.assertTrue(first.add('expired', 2))
+        self.assertEqual(second.get('expired'), 2)
+
+    def test_evicts_least_recently_used(self):
+        cache = self.make_cache(MAX_ENTRIES=10, CULL_FREQUENCY=5)
+        cache.set('hot', 'value')
+        for i in range(20):
+            cache.set(f'cold:{i}', 'value')
+            cache.get('hot')
+        self.assertEqual(cache.get('hot'), 'value')
+        self.assertIsNone(cache.get('cold:0'))
+        self.assertIn('cold:19', cache.get_many([f'cold:{i}' for i in range(20)]))
+        self.assertLessEqual(len(cache.get_many(['hot'] + [f'cold:{i}' for i in range(20)])), 10)
+
+    def test_evicts_by_size(self):
+        cache = self.make_cache(MAX_BYTES=10000)
+        for i in range(10):
+            cache.set(f'blob:{i}', b'x' * 2000)
+        stored = cache.get_many([f'blob:{i}' for i in range(10)])
+        self.assertLessEqual(len(stored), 5)
+        self.assertIn('blob:9', stored)
+
+
+@override_settings(BACKGROUND_TASKS_EAGER=True)
+class ResponsiveImageTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        media = override_settings(MEDIA_ROOT=directory.name)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.category = CourseCategory.objects.create(name='data_analytics', display_name='Data Analytics')
+
+    def make_upload(self, size=(2000, 1000), orientation=None):
+        buffer = BytesIO()
+        exif = Image.Exif()
+        if orientation:
+            exif[ExifTags.Base.Orientation] = orientation
+        Image.new('RGB', size, 'teal').save(buffer, format='JPEG', exif=exif)
+        return SimpleUploadedFile('photo.jpg', buffer.getvalue(), content_type='image/jpeg')
+
+    def create_course(self, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Course.objects.create(title='Python for Data', category=self.category, price=100, **kwargs)
+
+    def test_upload_builds_variants(self):
+        # Orientation 6: stored landscape, displayed portrait
+        with self.assertLogs('core.images', 'INFO'):
+            course = self.create_course(image=self.make_upload(orientation=6))
+        course.refresh_from_db()
+        variants = course.image_variants
+        self.assertEqual(variants['source'], course.image.name)
+        self.assertEqual((variants['width'], variants['height']), (1000, 2000))
+        self.assertEqual([width for width, name in variants['webp']], [320, 640, 960, 1000])
+        self.assertTrue(variants['placeholder'].startswith('data:image/webp;base64,'))
+        for width, name in variants['webp'] + variants['jpeg']:
+            self.assertRegex(name, r'^image_variants/[0-9a-f]{2}/[0-9a-f]{32}\.(webp|jpg)$')
+            with default_storage.open(name) as variant:
+                self.assertEqual(Image.open(variant).width, width)
+
+        html = Template("{% load images %}{% responsive_image course 'image' alt='Cover' class='w-full' %}").render(
+            Context({'course': course})
+        )
+        self.assertIn('<source type="image/webp" srcset="/media/image_variants/', html)
+        self.assertIn(' 320w, ', html)
+        self.assertIn('class="w-full"', html)
+
+    def test_original_served_until_variants_exist(self):
+        # The syllabus and offline copy tasks are kept off the worker thread too, which has no test database
+        with override_settings(BACKGROUND_TASKS_EAGER=False), mock.patch('core.images.enqueue_on_commit'), \
+                mock.patch('courses.services.enqueue_on_commit'):
+            course = self.create_course(image=self.make_upload(size=(200, 100)))
+        html = Template("{% load images %}{% responsive_image course 'image' %}").render(Context({'course': course}))
+        self.assertHTMLEqual(html, f'<img src="{course.image.url}" alt="" loading="lazy">')
+
+        out = StringIO()
+        call_command('process_images', workers=1, stdout=out)
+        self.assertIn('Processed 1 images', out.getvalue())
+        course.refresh_from_db()
+        # Never upscaled past the original
+        self.assertEqual([width for width, name in course.image_variants['jpeg']], [200])
+
+        course.image = None
+        course.save()
+        self.assertEqual(Course.objects.get(pk=course.pk).image_variants, {})
+
+
+class ContentHashedStorageTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = Path(directory.name)
+        media = override_settings(MEDIA_ROOT=directory.name)
+        media.enable()
+        self.addCleanup(media.disable)
+
+    def gc_media(self, **options):
+        out = StringIO()
+        call_command('gc_media', min_age_hours=0, stdout=out, **options)
+        return out.getvalue()
+
+    def test_identical_uploads_share_a_blob(self):
+        first = default_storage.save('course_pdfs/syllabus.pdf', ContentFile(b'%PDF same'))
+        second = default_storage.save('course_pdfs/syllabus.pdf', ContentFile(b'%PDF same'))
+        other = default_storage.save('course_pdfs/other.pdf', ContentFile(b'%PDF different'))
+        self.assertNotEqual(first, second)
+        self.assertEqual(default_storage.open(second).read(), b'%PDF same')
+        first_stat, second_stat = (self.root / first).stat(), (self.root / second).stat()
+        self.assertEqual(first_stat.st_ino, second_stat.st_ino)
+        # Two names plus the blob
+        self.assertEqual(first_stat.st_nlink, 3)
+        self.assertEqual((self.root / other).stat().st_nlink, 2)
+
+    def test_gc_keeps_referenced_files_and_frees_orphans(self):
+        category = CourseCategory.objects.create(name='data_analytics', display_name='Data Analytics')
+        pdf = default_storage.save('course_pdfs/syllabus.pdf', ContentFile(b'%PDF kept'))
+        inline = default_storage.save('uploads/chart.png', ContentFile(b'png kept'))
+        variant = default_storage.save('image_variants/ab/abcdef.webp', ContentFile(b'webp kept'))
+        Course.objects.create(
+            title='Python for Data', category=category, price=100, course_pdf=pdf,
+            description=f'<p><img src="/media/{inline}" srcset="/media/{inline} 320w, /media/x.webp 640w"></p>',
+        )
+        cover = default_storage.save('blog_images/cover.jpg', ContentFile(b'jpeg kept'))
+        BlogPost.objects.create(
+            title='Post', content='', excerpt='', author=User.objects.create_user('author'),
+            featured_image=cover, featured_image_variants={'source': cover, 'webp': [[320, variant]]},
+        )
+        orphan = default_storage.save('certificates/old.pdf', ContentFile(b'%PDF regenerated'))
+        shared_orphan = default_storage.save('course_pdfs/copy.pdf', ContentFile(b'%PDF kept'))
+        legacy = self.root / 'course_images' / 'legacy.jpg'
+        legacy.parent.mkdir()
+        legacy.write_bytes(b'jpeg from before')
+
+        report = self.gc_media(dry_run=True)
+        self.assertIn('Names: 3 unreferenced files would be deleted', report)
+        self.assertIn('Blobs: 1 unreferenced blobs would be deleted', report)
+        self.assertTrue((self.root / orphan).exists())
+
+        report = self.gc_media()
+        self.assertIn('Blobs: 1 unreferenced blobs were deleted', report)
+        for name in (pdf, inline, cover, variant):
+            self.assertTrue((self.root / name).exists(), name)
+        for name in (orphan, shared_orphan, 'course_images/legacy.jpg'):
+            self.assertFalse((self.root / name).exists(), name)
+        self.assertEqual(sum(1 for path in (self.root / '.blobs').rglob('*') if path.is_file()), 4)
+        self.assertIn('Names: 0 unreferenced', self.gc_media())
+
+    def test_dedupe_links_existing_files(self):
+        category = CourseCategory.objects.create(name='data_analytics', display_name='Data Analytics')
+        (self.root / 'course_pdfs').mkdir()
+        for name in ('a.pdf', 'b.pdf'):
+            (self.root / 'course_pdfs' / name).write_bytes(b'%PDF same')
+            Course.objects.create(title=name, category=category, price=100, course_pdf=f'course_pdfs/{name}')
+
+        self.assertIn('Dedupe: 2 files were linked', self.gc_media(dedupe=True))
+        self.assertEqual((self.root / 'course_pdfs' / 'a.pdf').stat().st_ino,
+                         (self.root / 'course_pdfs' / 'b.pdf').stat().st_ino)
+
+
+@override_settings(BACKGROUND_TASKS_EAGER=True)
+class InlineImageTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        media = override_settings(MEDIA_ROOT=directory.name)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.author = User.objects.create_user('author', is_staff=True)
+
+    def make_jpeg(self, size=(3000, 2000)):
+        exif = Image.Exif()
+        exif[ExifTags.Base.Make] = 'Camera'
+        buffer = BytesIO()
+        Image.new('RGB', size, 'teal').save(buffer, format='JPEG', quality=95, exif=exif)
+        return buffer.getvalue()
+
+    def create_post(self, content):
+        with self.captureOnCommitCallbacks(execute=True):
+            post = BlogPost.objects.create(title='Post', content=content, excerpt='', author=self.author)
+        post.refresh_from_db()
+        return post
+
+    def test_editor_upload_is_optimized_and_gets_srcset(self):
+        self.client.force_login(self.author)
+        upload = SimpleUploadedFile('photo.jpeg', self.make_jpeg(), content_type='image/jpeg')
+        response = self.client.post(reverse('ck_editor_5_upload_file'), {'upload': upload})
+        url = response.json()['url']
+        self.assertRegex(url, r'^/media/uploads/photo(_\w+)?\.jpg$')
+        with default_storage.open(url.removeprefix('/media/')) as stored:
+            image = Image.open(stored)
+            self.assertEqual(image.size, (1600, 1067))
+            self.assertFalse(image.getexif())
+
+        post = self.create_post(f'<p>Chart:</p><figure class="image"><img src="{url}" alt="A &amp; B"></figure>')
+        self.assertIn(f'<img src="{url}" alt="A &amp; B" srcset="/media/image_variants/', post.content)
+        self.assertIn(' 320w, ', post.content)
+        self.assertIn('width="1600" height="1067" loading="lazy" decoding="async">', post.content)
+        # Already processed: saving again leaves the content alone
+        with mock.patch('core.images.enqueue_on_commit') as enqueue:
+            post.save()
+        enqueue.assert_not_called()
+
+    def test_undecodable_image_leaves_only_its_own_tag(self):
+        good = default_storage.save('uploads/photo.jpg', ContentFile(self.make_jpeg(size=(800, 600))))
+        broken = default_storage.save('uploads/broken.png', ContentFile(b'not an image'))
+        with self.assertLogs('core.images', 'WARNING') as logs:
+            post = self.create_post(f'<p><img src="/media/{broken}"></p><p><img src="/media/{good}"></p>')
+        self.assertIn(broken, logs.output[0])
+        self.assertIn(f'<img src="/media/{broken}">', post.content)
+        self.assertIn(f'<img src="/media/{good}" srcset="/media/image_variants/', post.content)
+        self.assertIn('width="800" height="600"', post.content)
+
+    def test_command_recompresses_existing_images(self):
+        name = default_storage.save('legacy/photo.jpg', ContentFile(self.make_jpeg(size=(1200, 800))))
+        with mock.patch('core.images.enqueue_on_commit'):
+            post = self.create_post(
+                f'<img src="/media/{name}"><img src="https://example.com/a.png"><img src="/media/missing.png">'
+            )
+
+        out = StringIO()
+        call_command('process_inline_images', dry_run=True, stdout=out)
+        self.assertIn('1 rows have embedded images', out.getvalue())
+        call_command('process_inline_images', stdout=out)
+        self.assertIn('Rewrote 1 of 1 rows', out.getvalue())
+        post.refresh_from_db()
+        new_name = re.search(r'src="/media/([^"]+)"', post.content).group(1)
+        self.assertNotEqual(new_name, name)
+        with default_storage.open(new_name) as stored:
+            self.assertFalse(Image.open(stored).getexif())
+        self.assertIn('width="1200" height="800"', post.content)
+        self.assertIn('<img src="https://example.com/a.png">', post.content)
+        self.assertIn('<img src="/media/missing.png">', post.content)
@@ -38,4 +38,6 @@ urlpatterns = [
     # Surveys
     path('surveys/', views.surveys, name='surveys'),
     path('survey/<slug:slug>/', views.survey_detail, name='survey_detail'),
+    path('staff/queries/', views.query_inspector, name='query_inspector'),
+    path('metrics', views.metrics, name='metrics'),
 ]
\ No newline at end of file
@@ -1,16 +1,19 @@
 from django.shortcuts import render, get_object_or_404, redirect
+from django.conf import settings
 from django.contrib import messages
 from django.core.paginator import Paginator
-from django.http import JsonResponse
+from django.http import HttpResponse, HttpResponseForbidden, JsonResponse
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import csrf_exempt
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth import login
 from django.contrib.auth.models import User
 from django.contrib.auth.forms import UserCreationForm
 from datetime import timedelta, date
 import json
 from django.db.models import Q
+from django.utils.crypto import constant_time_compare
 from decimal import Decimal
 
 from courses.models import Course
@@ -24,9 +27,9 @@ from .forms import ContactForm, NewsletterForm
 def home(request):
     """Modern homepage with dynamic content"""
     # Get featured courses that are active, prioritizing those with discounts
-    featured_courses = Course.objects.filter(is_featured=True, is_active=True).order_by(
-        '-discount_price', '-created_at'
-    )[:3]
+    featured_courses = Course.objects.filter(is_featured=True, is_active=True).select_related(
+        'category'
+    ).order_by('-discount_price', '-created_at')[:3]
     testimonials = Testimonial.objects.filter(is_featured=True)[:6]
     upcoming_events = Event.objects.filter(is_active=True).order_by('event_date')[:3]
     recent_blogs = BlogPost.objects.filter(is_published=True)[:3]
@@ -314,4 +317,44 @@ def survey_detail(request, slug):
     context = {
         'survey': survey,
     }
-    return render(request, 'core/survey_detail.html', context)
\ No newline at end of file
+    return render(request, 'core/survey_detail.html', context)
+
+
+@staff_member_required
+def query_inspector(request):
+    """Staff panel listing the SQL recorded for recent requests"""
+    from .middleware import QueryInspectorStore
+
+    if request.method == 'POST':
+        QueryInspectorStore.clear()
+        messages.success(request, 'Recorded query reports cleared.')
+        return redirect('core:query_inspector')
+
+    reports = QueryInspectorStore.all()
+    if request.GET.get('n_plus_one'):
+        reports = [report for report in reports if report['n_plus_one']]
+
+    context = {
+        'reports': reports,
+        'only_n_plus_one': bool(request.GET.get('n_plus_one')),
+        'inspector_enabled': getattr(settings, 'QUERY_INSPECTOR_ENABLED', settings.DEBUG),
+        'title': 'Query Inspector',
+    }
+    return render(request, 'core/query_inspector.html', context)
+
+
+def metrics(request):
+    """Per-view latency histograms in the Prometheus text format"""
+    from .metrics import MetricsStore, render_prometheus
+
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    authorized = request.user.is_staff or (
+        token and constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}')
+    )
+    if not authorized:
+        return HttpResponseForbidden('Metrics require a staff session or the metrics token.')
+
+    return HttpResponse(
+        render_prometheus(MetricsStore.get_histograms()),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
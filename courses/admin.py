@@ -1,10 +1,138 @@
+import datetime
+import re
+import uuid
+
+from django import forms
 from django.contrib import admin
-from django.db import models
+from django.contrib.admin.views.main import ChangeList
+from django.db import models, transaction
+from django.utils import timezone
 from django_ckeditor_5.widgets import CKEditor5Widget
 from .models import (
-    Course, CourseCategory, CourseModule, CodeExample, Exercise,
-    CapstoneProject, Enrollment, PaymentInstallment, ModuleCompletion, ProjectEnrollment
+    Course, CourseCategory, CourseModule, CodeExample, Exercise, ExerciseSubmission,
+    CapstoneProject, Enrollment, PaymentInstallment, ModuleCompletion, ProjectEnrollment,
+    CourseProjectStats
 )
+from .services import CourseCloneService, EstimatedCountPaginator, ExerciseGradingService
+
+
+ACTIVATION_CODE_RE = re.compile(r'^[A-Z0-9]{4}(?:-[A-Z0-9]{4}){3}$', re.IGNORECASE)
+EMAIL_RE = re.compile(r'^[^@\s]+@[^@\s]+\.[^@\s]+$')
+
+
+class IndexedDateHierarchyQuerySet(models.QuerySet):
+    """
+    Changelist queryset whose date hierarchy lookups stay on the date index
+
+    The admin date_hierarchy tag asks for MIN/MAX of the field and then for
+    the DISTINCT years, months or days present, which truncates every row.
+    Here MIN and MAX are two ordered index seeks, and each candidate period
+    between them is probed with an EXISTS range query.
+    """
+
+    def aggregate(self, *args, **kwargs):
+        if args or not kwargs or not all(
+            isinstance(agg, (models.Min, models.Max)) and len(agg.source_expressions) == 1
+            and isinstance(agg.source_expressions[0], models.F) and not agg.filter
+            for agg in kwargs.values()
+        ):
+            return super().aggregate(*args, **kwargs)
+        result = {}
+        for alias, agg in kwargs.items():
+            field_name = agg.source_expressions[0].name
+            ordering = field_name if isinstance(agg, models.Min) else f'-{field_name}'
+            result[alias] = self.filter(**{f'{field_name}__isnull': False}).order_by(
+                ordering
+            ).values_list(field_name, flat=True).first()
+        return result
+
+    def _probe_periods(self, field_name, kind, is_datetime):
+        bounds = self.aggregate(first=models.Min(field_name), last=models.Max(field_name))
+        first, last = bounds['first'], bounds['last']
+        if first is None or last is None:
+            return []
+        if is_datetime:
+            first, last = timezone.localtime(first).date(), timezone.localtime(last).date()
+
+        if kind == 'year':
+            starts = [datetime.date(year, 1, 1) for year in range(first.year, last.year + 1)]
+            starts.append(datetime.date(last.year + 1, 1, 1))
+        elif kind == 'month':
+            starts = []
+            year, month = first.year, first.month
+            while (year, month) <= (last.year, last.month):
+                starts.append(datetime.date(year, month, 1))
+                year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+            starts.append(datetime.date(year, month, 1))
+        else:
+            days = (last - first).days + 1
+            starts = [first + datetime.timedelta(days=offset) for offset in range(days + 1)]
+
+        if is_datetime:
+            starts = [timezone.make_aware(datetime.datetime.combine(start, datetime.time.min)) for start in starts]
+        return [
+            start for start, end in zip(starts, starts[1:])
+            if self.filter(**{f'{field_name}__gte': start, f'{field_name}__lt': end}).exists()
+        ]
+
+    def dates(self, field_name, kind, order='ASC'):
+        periods = self._probe_periods(field_name, kind, is_datetime=False)
+        return periods[::-1] if order == 'DESC' else periods
+
+    def datetimes(self, field_name, kind, order='ASC', tzinfo=None):
+        periods = self._probe_periods(field_name, kind, is_datetime=True)
+        return periods[::-1] if order == 'DESC' else periods
+
+
+class LargeTableChangeList(ChangeList):
+    def get_queryset(self, request, exclude_parameters=None):
+        queryset = super().get_queryset(request, exclude_parameters)
+        indexed = IndexedDateHierarchyQuerySet(model=queryset.model, query=queryset.query.chain(), using=queryset._db)
+        indexed._prefetch_related_lookups = queryset._prefetch_related_lookups
+        return indexed
+
+
+class LargeTableAdminMixin:
+    """
+    Changelist settings for enrollment tables that grow to millions of rows
+
+    Skips the unfiltered COUNT(*) shown next to the result count, estimates
+    the total for unfiltered pages, and answers searches for an activation
+    code, enrollment ID or email with indexed lookups instead of icontains
+    scans across joins. Emails match case-insensitively, and one that matches
+    no account falls back to the icontains search, which also finds partial
+    addresses. The date hierarchy is built from indexed range probes rather
+    than DISTINCT scans (see IndexedDateHierarchyQuerySet).
+    """
+    show_full_result_count = False
+    paginator = EstimatedCountPaginator
+
+    # Path from this model to its Enrollment, e.g. 'enrollment__'
+    enrollment_lookup_prefix = ''
+
+    def get_changelist(self, request, **kwargs):
+        return LargeTableChangeList
+
+    def get_exact_search_filter(self, search_term):
+        """Indexed filter for an exact-match search term, or None"""
+        prefix = self.enrollment_lookup_prefix
+        if ACTIVATION_CODE_RE.match(search_term):
+            return {f'{prefix}activation_code': search_term.upper()}
+        if EMAIL_RE.match(search_term):
+            return {f'{prefix}user__email__iexact': search_term}
+        try:
+            enrollment_id = uuid.UUID(search_term)
+        except ValueError:
+            return None
+        return {f'{prefix}pk': enrollment_id}
+
+    def get_search_results(self, request, queryset, search_term):
+        exact_filter = self.get_exact_search_filter(search_term.strip())
+        if exact_filter is not None:
+            results = queryset.filter(**exact_filter)
+            if not EMAIL_RE.match(search_term.strip()) or results.exists():
+                return results, False
+        return super().get_search_results(request, queryset, search_term)
 
 
 # Inline classes
@@ -119,6 +247,15 @@ class CourseAdmin(admin.ModelAdmin):
         models.TextField: {'widget': CKEditor5Widget(config_name='extends')}
     }
     readonly_fields = ('created_at', 'updated_at')
+    actions = ['clone_courses']
+
+    def clone_courses(self, request, queryset):
+        """Copy the selected courses and their content as unpublished courses for a new intake"""
+        clones = [CourseCloneService.clone(course) for course in queryset]
+        self.message_user(
+            request, f"Cloned {len(clones)} courses as unpublished copies: {', '.join(clone.slug for clone in clones)}."
+        )
+    clone_courses.short_description = "Clone selected courses for a new intake"
 
 
 @admin.register(CourseModule)
@@ -189,7 +326,7 @@ class ExerciseAdmin(admin.ModelAdmin):
             'fields': ('estimated_time_minutes', 'hints', 'solution', 'dataset_url')
         }),
         ('Grading', {
-            'fields': ('is_graded', 'points')
+            'fields': ('is_graded', 'points', 'test_code')
         }),
     )
 
@@ -197,6 +334,12 @@ class ExerciseAdmin(admin.ModelAdmin):
         models.TextField: {'widget': CKEditor5Widget(config_name='extends')}
     }
 
+    def formfield_for_dbfield(self, db_field, request, **kwargs):
+        if db_field.name == 'test_code':
+            # Python source, not rich text
+            kwargs['widget'] = forms.Textarea(attrs={'rows': 16, 'style': 'font-family: monospace; width: 90%'})
+        return super().formfield_for_dbfield(db_field, request, **kwargs)
+
 
 @admin.register(CapstoneProject)
 class CapstoneProjectAdmin(admin.ModelAdmin):
@@ -227,11 +370,14 @@ class CapstoneProjectAdmin(admin.ModelAdmin):
 
 
 @admin.register(Enrollment)
-class EnrollmentAdmin(admin.ModelAdmin):
+class EnrollmentAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = ('user', 'course', 'payment_status', 'is_activated', 'payment_method', 'installments', 'amount_paid', 'created_at')
-    list_filter = ('payment_status', 'is_activated', 'payment_method', 'installments', 'created_at')
+    list_filter = ('payment_status', 'is_activated', 'payment_method', 'installments')
     search_fields = ('user__username', 'user__email', 'course__title', 'activation_code')
-    readonly_fields = ('activation_code', 'created_at', 'updated_at', 'activated_at')
+    search_help_text = 'Activation codes and enrollment IDs are matched exactly, email addresses in any case.'
+    readonly_fields = ('activation_code', 'created_at', 'updated_at', 'activated_at', 'exercise_points')
+    autocomplete_fields = ('user', 'course')
+    date_hierarchy = 'created_at'
     ordering = ('-created_at',)
 
     fieldsets = (
@@ -242,6 +388,9 @@ class EnrollmentAdmin(admin.ModelAdmin):
             'fields': ('payment_method', 'currency', 'total_amount', 'amount_paid',
                       'payment_status', 'installments')
         }),
+        ('Progress', {
+            'fields': ('exercise_points',)
+        }),
         ('Timestamps', {
             'fields': ('created_at', 'updated_at'),
             'classes': ('collapse',)
@@ -250,6 +399,10 @@ class EnrollmentAdmin(admin.ModelAdmin):
 
     inlines = [PaymentInstallmentInline]
 
+    def get_queryset(self, request):
+        # __str__ renders the user's name and course title (also used by autocomplete)
+        return super().get_queryset(request).select_related('user', 'course')
+
     def save_model(self, request, obj, form, change):
         # Auto-generate activation code if not present
         if not obj.activation_code:
@@ -320,12 +473,17 @@ class EnrollmentAdmin(admin.ModelAdmin):
 
 
 @admin.register(PaymentInstallment)
-class PaymentInstallmentAdmin(admin.ModelAdmin):
+class PaymentInstallmentAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = ('enrollment', 'installment_number', 'amount', 'due_date', 'status', 'payment_date', 'payment_reference')
-    list_filter = ('status', 'due_date', 'payment_date', 'created_at')
+    list_filter = ('status', 'payment_date', 'created_at')
     search_fields = ('enrollment__user__username', 'enrollment__user__email', 'enrollment__course__title', 'payment_reference')
+    search_help_text = 'Activation codes and enrollment IDs are matched exactly, email addresses in any case.'
     readonly_fields = ('created_at', 'updated_at')
-    ordering = ('enrollment', 'installment_number')
+    autocomplete_fields = ('enrollment',)
+    date_hierarchy = 'due_date'
+    # enrollment_id rather than enrollment, which would sort through a join on Enrollment.Meta.ordering
+    ordering = ('enrollment_id', 'installment_number')
+    enrollment_lookup_prefix = 'enrollment__'
 
     fieldsets = (
         ('Installment Information', {
@@ -403,21 +561,68 @@ class PaymentInstallmentAdmin(admin.ModelAdmin):
 
 
 @admin.register(ModuleCompletion)
-class ModuleCompletionAdmin(admin.ModelAdmin):
+class ModuleCompletionAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = ('enrollment', 'module', 'completed_at')
-    list_filter = ('completed_at', 'module__course')
+    list_filter = ('module__course',)
     search_fields = ('enrollment__user__username', 'enrollment__user__email', 'module__title')
-    raw_id_fields = ('enrollment', 'module')
+    search_help_text = 'Activation codes and enrollment IDs are matched exactly, email addresses in any case.'
+    autocomplete_fields = ('enrollment', 'module')
     readonly_fields = ('completed_at',)
+    date_hierarchy = 'completed_at'
+    enrollment_lookup_prefix = 'enrollment__'
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related(
+            'enrollment__user', 'enrollment__course', 'module__course'
+        )
+
+
+@admin.register(ExerciseSubmission)
+class ExerciseSubmissionAdmin(LargeTableAdminMixin, admin.ModelAdmin):
+    list_display = ('enrollment', 'exercise', 'status', 'score', 'tests_passed', 'tests_total', 'submitted_at')
+    list_filter = ('status', 'exercise__module__course')
+    search_fields = ('enrollment__user__username', 'enrollment__user__email', 'exercise__title')
+    search_help_text = 'Activation codes and enrollment IDs are matched exactly, email addresses in any case.'
+    readonly_fields = (
+        'enrollment', 'exercise', 'code', 'content_hash', 'status', 'score', 'tests_passed', 'tests_total',
+        'test_results', 'output', 'submitted_at', 'graded_at'
+    )
+    date_hierarchy = 'submitted_at'
+    enrollment_lookup_prefix = 'enrollment__'
+    actions = ['regrade']
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related(
+            'enrollment__user', 'enrollment__course', 'exercise'
+        )
+
+    def has_add_permission(self, request):
+        return False
+
+    def regrade(self, request, queryset):
+        """Grade again, e.g. after fixing an exercise's tests"""
+        submission_ids = list(queryset.values_list('pk', flat=True))
+        queryset.update(status='pending')
+        transaction.on_commit(lambda: ExerciseGradingService.queue(submission_ids))
+        self.message_user(request, f'Queued {len(submission_ids)} submissions for grading.')
+    regrade.short_description = "Regrade selected submissions"
 
 
 @admin.register(ProjectEnrollment)
-class ProjectEnrollmentAdmin(admin.ModelAdmin):
+class ProjectEnrollmentAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = ('enrollment', 'project', 'status', 'started_at', 'grade')
-    list_filter = ('status', 'started_at', 'completed_at', 'project__course')
+    list_filter = ('status', 'completed_at', 'project__course')
     search_fields = ('enrollment__user__username', 'enrollment__user__email', 'project__title')
-    raw_id_fields = ('enrollment', 'project')
+    search_help_text = 'Activation codes and enrollment IDs are matched exactly, email addresses in any case.'
+    autocomplete_fields = ('enrollment', 'project')
     readonly_fields = ('started_at', 'submitted_at', 'completed_at')
+    date_hierarchy = 'started_at'
+    enrollment_lookup_prefix = 'enrollment__'
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related(
+            'enrollment__user', 'enrollment__course', 'project__course'
+        )
 
     fieldsets = (
         ('Basic Information', {
@@ -429,4 +634,37 @@ class ProjectEnrollmentAdmin(admin.ModelAdmin):
         ('Submission & Grading', {
             'fields': ('submission_notes', 'instructor_feedback', 'grade')
         }),
-    )
\ No newline at end of file
+    )
+
+
+@admin.register(CourseProjectStats)
+class CourseProjectStatsAdmin(admin.ModelAdmin):
+    list_display = ('course', 'in_progress_count', 'submitted_count', 'completed_count', 'average_grade', 'average_review_hours', 'updated_at')
+    list_select_related = ('course',)
+    search_fields = ('course__title',)
+    readonly_fields = ('course', 'in_progress_count', 'submitted_count', 'completed_count', 'graded_count',
+                       'grade_total', 'reviewed_count', 'review_seconds_total', 'updated_at')
+
+    actions = ['rebuild_statistics']
+
+    def has_add_permission(self, request):
+        # Rows are maintained automatically from project enrollments
+        return False
+
+    def average_grade(self, obj):
+        average = obj.get_average_grade()
+        return f"{average:.1f}" if average is not None else '-'
+    average_grade.short_description = 'Avg. Grade'
+
+    def average_review_hours(self, obj):
+        average = obj.get_average_review_hours()
+        return f"{average:.1f}h" if average is not None else '-'
+    average_review_hours.short_description = 'Avg. Review Time'
+
+    def rebuild_statistics(self, request, queryset):
+        """Recompute counters from project enrollments"""
+        from .services import ProjectStatsService
+        course_ids = list(queryset.values_list('course_id', flat=True))
+        ProjectStatsService.rebuild(course_ids)
+        self.message_user(request, f'Rebuilt statistics for {len(course_ids)} courses.')
+    rebuild_statistics.short_description = "Rebuild selected statistics"
@@ -0,0 +1,354 @@
+"""
+Course bundles: whole course trees in one compressed file
+
+A bundle is gzipped JSON Lines. After a header line, each line is one
+record: a category, a course, one of its modules, code examples, exercises
+or capstone projects, or a media file the course refers to (an upload in a
+FileField or an image embedded in CKEditor HTML), base64-encoded. Courses
+are written in batches, parents before children, so neither side ever
+holds more than one batch of rows besides the media it is copying.
+
+Records carry natural keys instead of primary keys:
+
+    course            [slug]
+    coursemodule      [slug, order]
+    codeexample       [slug, module order, order]
+    exercise          [slug, module order, order]
+    capstoneproject   [slug, order]
+
+so a bundle can be imported into any database. import_bundle() upserts each
+table with one bulk_create(update_conflicts=True) on those keys and looks
+up the new primary keys before moving on to the children. Rows that exist
+keep their primary keys, and with them the enrollments, completions and
+submissions that point at them; rows the bundle does not have are left
+alone. diff_bundle() reports what an import would change without writing.
+
+Image variants are not bundled: imported course images get them rebuilt.
+"""
+import base64
+import gzip
+import hashlib
+import json
+import re
+from itertools import islice
+from urllib.parse import unquote
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, transaction
+from django.utils import timezone
+
+from .highlighting import refresh_highlighting
+from .models import CapstoneProject, CodeExample, Course, CourseCategory, CourseModule, Exercise
+
+BUNDLE_VERSION = 1
+# The tables of a course tree, parents first, with the field pointing at the parent
+TREE = [
+    (Course, None),
+    (CourseModule, 'course'),
+    (CodeExample, 'module'),
+    (Exercise, 'module'),
+    (CapstoneProject, 'course'),
+]
+# Lookups that make up each model's natural key
+KEY_LOOKUPS = {
+    Course: ['slug'],
+    CourseModule: ['course__slug', 'order'],
+    CodeExample: ['module__course__slug', 'module__order', 'order'],
+    Exercise: ['module__course__slug', 'module__order', 'order'],
+    CapstoneProject: ['course__slug', 'order'],
+}
+MODEL_TYPES = {model._meta.model_name: model for model, _ in TREE}
+# Derived data the target rebuilds itself
+EXCLUDED_FIELDS = {'image_variants', 'syllabus_pdf', 'syllabus_hash', 'offline_archive', 'offline_archive_hash'}
+CATEGORY_FIELDS = ['name', 'display_name', 'description', 'icon', 'order']
+
+
+class BundleError(ValueError):
+    """The file is not a course bundle this version can read"""
+
+
+def data_fields(model):
+    """Fields copied with a row: everything but the primary key, relations and timestamps"""
+    return [
+        field for field in model._meta.concrete_fields
+        if not field.primary_key and not field.is_relation and field.name not in EXCLUDED_FIELDS
+        and not getattr(field, 'auto_now', False) and not getattr(field, 'auto_now_add', False)
+    ]
+
+
+def field_values(instance):
+    values = {}
+    for field in data_fields(type(instance)):
+        value = field.value_from_object(instance)
+        values[field.name] = value.name or '' if isinstance(field, models.FileField) else value
+    return values
+
+
+def media_names(model, values):
+    """Names of the media files a row's values refer to"""
+    media_url_re = re.compile(re.escape(settings.MEDIA_URL) + r'''([^"'\s<>?#,]+)''')
+    for field in data_fields(model):
+        value = values.get(field.name)
+        if not value:
+            continue
+        if isinstance(field, models.FileField):
+            yield value
+        elif isinstance(value, str) and field.get_internal_type() == 'TextField':
+            yield from (unquote(name) for name in media_url_re.findall(value))
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+# Export
+
+def course_records(courses):
+    """Records of a batch of courses and everything below them, parents first"""
+    course_ids = [course.pk for course in courses]
+    slugs = {course.pk: course.slug for course in courses}
+    instructors = dict(User.objects.filter(pk__in={course.instructor_id for course in courses})
+                       .values_list('pk', 'username'))
+    for course in courses:
+        yield {
+            'type': 'course', 'key': [course.slug], 'fields': field_values(course),
+            'category': course.category.name, 'instructor': instructors.get(course.instructor_id),
+        }
+    module_keys = {}
+    for module in CourseModule.objects.filter(course_id__in=course_ids).order_by('course_id', 'order'):
+        module_keys[module.pk] = [slugs[module.course_id], module.order]
+        yield {'type': 'coursemodule', 'key': module_keys[module.pk], 'fields': field_values(module)}
+    for model in (CodeExample, Exercise):
+        for row in model.objects.filter(module_id__in=module_keys).order_by('module_id', 'order'):
+            yield {
+                'type': model._meta.model_name, 'key': [*module_keys[row.module_id], row.order],
+                'fields': field_values(row),
+            }
+    for project in CapstoneProject.objects.filter(course_id__in=course_ids).order_by('course_id', 'order'):
+        yield {'type': 'capstoneproject', 'key': [slugs[project.course_id], project.order],
+               'fields': field_values(project)}
+
+
+def media_record(name, storage=default_storage):
+    with storage.open(name, 'rb') as file:
+        data = file.read()
+    return {
+        'type': 'media', 'name': name, 'sha256': hashlib.sha256(data).hexdigest(),
+        'data': base64.b64encode(data).decode(),
+    }
+
+
+def export_bundle(courses, path, batch_size=50, storage=default_storage):
+    """Write the courses (a queryset) to a bundle at path; returns counts of records by type"""
+    counts = {}
+    categories = set()
+    media = set()
+
+    with gzip.open(path, 'wt', encoding='utf-8', compresslevel=6) as bundle:
+        def write(record):
+            bundle.write(json.dumps(record, cls=DjangoJSONEncoder, separators=(',', ':')) + '\n')
+            counts[record['type']] = counts.get(record['type'], 0) + 1
+
+        write({'type': 'header', 'version': BUNDLE_VERSION, 'exported_at': timezone.now()})
+        for batch in batched(courses.select_related('category').order_by('pk').iterator(), batch_size):
+            for category in {course.category for course in batch} - categories:
+                categories.add(category)
+                write({'type': 'coursecategory', 'key': [category.name],
+                       'fields': {name: getattr(category, name) for name in CATEGORY_FIELDS}})
+            names = set()
+            for record in course_records(batch):
+                write(record)
+                names.update(media_names(MODEL_TYPES[record['type']], record['fields']))
+            for name in sorted(names - media):
+                media.add(name)
+                if storage.exists(name):
+                    write(media_record(name, storage))
+                else:
+                    counts['missing_media'] = counts.get('missing_media', 0) + 1
+    counts.pop('header')
+    return counts
+
+
+# Import
+
+def read_bundle(path):
+    """Yield the records of a bundle"""
+    with gzip.open(path, 'rt', encoding='utf-8') as bundle:
+        header = json.loads(bundle.readline() or 'null')
+        if not isinstance(header, dict) or header.get('type') != 'header':
+            raise BundleError(f'{path} is not a course bundle')
+        if header['version'] > BUNDLE_VERSION:
+            raise BundleError(f"{path} is a version {header['version']} bundle; this site reads up to {BUNDLE_VERSION}")
+        for line in bundle:
+            yield json.loads(line)
+
+
+def store_media(record, storage=default_storage, dry_run=False):
+    """Save a media record's file; returns (stored name, 'new', 'changed' or 'unchanged')"""
+    name = record['name']
+    if storage.exists(name):
+        digest = hashlib.sha256()
+        with storage.open(name, 'rb') as file:
+            for chunk in file.chunks():
+                digest.update(chunk)
+        if digest.hexdigest() == record['sha256']:
+            return name, 'unchanged'
+        status = 'changed'
+    else:
+        status = 'new'
+    if dry_run:
+        return name, status
+    # A different file of the same name stays; the bundle's is stored next to it and the rows point there
+    return storage.save(name, ContentFile(base64.b64decode(record['data']))), status
+
+
+def load_bundle(path, storage=default_storage, dry_run=False):
+    """
+    Read a bundle into ``{type: [record, ...]}``, storing its media files
+    on the way (unless dry_run) and pointing records at renamed ones
+    """
+    records = {}
+    renamed = {}
+    media = []
+    for record in read_bundle(path):
+        if record['type'] == 'media':
+            name, status = store_media(record, storage, dry_run)
+            media.append((record['name'], status))
+            if name != record['name']:
+                renamed[record['name']] = name
+        else:
+            records.setdefault(record['type'], []).append(record)
+    if renamed:
+        for record_type, model in MODEL_TYPES.items():
+            for record in records.get(record_type, []):
+                rename_media(model, record['fields'], renamed)
+    records['media'] = media
+    return records
+
+
+def rename_media(model, values, renamed):
+    for field in data_fields(model):
+        value = values.get(field.name)
+        if isinstance(field, models.FileField) and value in renamed:
+            values[field.name] = renamed[value]
+        elif isinstance(value, str) and field.get_internal_type() == 'TextField':
+            for old, new in renamed.items():
+                value = value.replace(settings.MEDIA_URL + old, settings.MEDIA_URL + new)
+            values[field.name] = value
+
+
+def python_values(model, values):
+    """Record field values converted back to what the model fields hold"""
+    return {
+        field.name: field.to_python(values[field.name])
+        for field in data_fields(model) if field.name in values
+    }
+
+
+def existing_ids(model, slugs):
+    """{natural key: pk} of the rows of a model below the given course slugs"""
+    lookups = KEY_LOOKUPS[model]
+    rows = model.objects.filter(**{f'{lookups[0]}__in': slugs}).values_list(*lookups, 'pk')
+    return {tuple(row[:-1]): row[-1] for row in rows}
+
+
+@transaction.atomic
+def import_bundle(records, batch_size=500):
+    """
+    Upsert the courses of a loaded bundle, each table with one
+    bulk_create(), in one transaction; returns {'created': [...slugs],
+    'updated': [...slugs], <type>: count}
+    """
+    from core.images import queue_variants
+    from core.services import AdminStatsService
+    from .services import OfflineCopyService, SyllabusService
+
+    CourseCategory.objects.bulk_create(
+        [CourseCategory(**record['fields']) for record in records.get('coursecategory', [])],
+        ignore_conflicts=True,
+    )
+    category_ids = dict(CourseCategory.objects.values_list('name', 'pk'))
+    courses = records.get('course', [])
+    usernames = {record['instructor'] for record in courses if record['instructor']}
+    instructor_ids = dict(User.objects.filter(username__in=usernames).values_list('username', 'pk'))
+    slugs = [record['key'][0] for record in courses]
+    existing_slugs = set(Course.objects.filter(slug__in=slugs).values_list('slug', flat=True))
+
+    counts = {}
+    ids = {}
+    for model, parent_field in TREE:
+        model_records = records.get(model._meta.model_name, [])
+        rows = []
+        for record in model_records:
+            row = model(**python_values(model, record['fields']))
+            if parent_field is None:
+                row.category_id = category_ids[record['category']]
+                row.instructor_id = instructor_ids.get(record['instructor'])
+            else:
+                parent_model = model._meta.get_field(parent_field).related_model
+                setattr(row, f'{parent_field}_id', ids[parent_model][tuple(record['key'][:-1])])
+            if model is CodeExample:
+                # Markup from another Pygments version is rendered again
+                refresh_highlighting(row)
+            rows.append(row)
+        unique_fields = ['slug'] if parent_field is None else [parent_field, 'order']
+        update_fields = [field.name for field in data_fields(model) if field.name not in unique_fields]
+        update_fields += [field.name for field in model._meta.concrete_fields if getattr(field, 'auto_now', False)]
+        if parent_field is None:
+            update_fields += ['category', 'instructor']
+        model.objects.bulk_create(
+            rows, batch_size=batch_size,
+            update_conflicts=True, unique_fields=unique_fields, update_fields=update_fields,
+        )
+        # SQLite does not return the primary keys of updated rows
+        ids[model] = existing_ids(model, slugs)
+        counts[model._meta.model_name] = len(rows)
+
+    created = [slug for slug in slugs if slug not in existing_slugs]
+    if created:
+        AdminStatsService.adjust_for_model(Course, len(created))
+    for course in Course.objects.filter(slug__in=slugs):
+        if course.image:
+            queue_variants(course, 'image')
+        # bulk_create() sends no post_save, which would queue these
+        SyllabusService.queue(course.pk)
+        OfflineCopyService.queue(course.pk)
+    return {'created': created, 'updated': [slug for slug in slugs if slug in existing_slugs], **counts}
+
+
+def diff_bundle(records):
+    """Lines describing what importing a loaded bundle would change: "+ new", "~ changed: fields" """
+    slugs = [record['key'][0] for record in records.get('course', [])]
+    lines = []
+    for model, _ in TREE:
+        model_name = model._meta.model_name
+        fields = [field.name for field in data_fields(model)]
+        lookups = KEY_LOOKUPS[model]
+        current = {}
+        for row in model.objects.filter(**{f'{lookups[0]}__in': slugs}).values_list(*lookups, *fields):
+            current[tuple(row[:len(lookups)])] = dict(zip(fields, row[len(lookups):]))
+        for record in records.get(model_name, []):
+            key = tuple(record['key'])
+            label = f"{model_name} {'/'.join(map(str, key))}"
+            if key not in current:
+                lines.append(f'+ {label}')
+                continue
+            values = python_values(model, record['fields'])
+            if model is CodeExample:
+                # Compared as import_bundle() would store it, with the markup rendered here
+                row = model(**values)
+                refresh_highlighting(row)
+                values.update(highlighted_code=row.highlighted_code, highlight_hash=row.highlight_hash)
+            changed = [name for name in fields if name in values and values[name] != current[key][name]]
+            if changed:
+                lines.append(f"~ {label}: {', '.join(changed)}")
+    for name, status in records.get('media', []):
+        if status != 'unchanged':
+            lines.append(f"{'+' if status == 'new' else '~'} media {name}")
+    return lines
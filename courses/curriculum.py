@@ -0,0 +1,471 @@
+"""
+Course content from the Markdown curriculum documents
+
+The repository ships each course's curriculum as a Markdown document
+(Python_for_Data_Analysis_Course.md and friends), all laid out the same way:
+
+    ## Course Overview            **Course Slug:** python-data-analysis, ...
+    ## Course Syllabus
+    ### Module 1: Title (16 hours)
+    **Learning Objectives:**      - bullet list
+    **Code Examples:**            fenced code blocks (or a bullet list; any "... Examples:")
+    **Exercises:**                - one bullet per exercise (also "Practical ...:")
+    ## Capstone Project: Title    ### Project Description, ...
+
+parse_curriculum() turns a document into plain dicts, converting the
+Markdown to the HTML the CKEditor fields hold, and import_curriculum()
+upserts them: modules and capstone projects by (course, order), code
+examples and exercises by (module, order). Running it again on an
+unchanged document rewrites the same rows, so imports are idempotent and
+keep the primary keys that enrollments and submissions point at. Rows the
+document no longer has are left alone.
+
+Only the Markdown these documents use is supported: headings, paragraphs,
+nested bullet and numbered lists, fenced code, bold, italics, inline code
+and links.
+"""
+import html
+import re
+from decimal import Decimal
+
+from django.db import transaction
+
+from .highlighting import refresh_highlighting
+from .models import CapstoneProject, CodeExample, Course, CourseCategory, CourseModule, Exercise
+from .services import OfflineCopyService, SyllabusService
+
+HEADING_RE = re.compile(r'^(#{1,6})\s+(.*?)\s*#*\s*$')
+FENCE_RE = re.compile(r'^(\s*)(```|~~~)\s*([\w+-]*)')
+LIST_ITEM_RE = re.compile(r'^(\s*)([-*+]|\d+[.)])\s+(.*)$')
+LABEL_RE = re.compile(r'^\*\*(.+?):\*\*\s*(.*?)\s*$')
+MODULE_RE = re.compile(r'^Module\s+(\d+):\s*(.*?)(?:\s*\((\d+)\s*hours?\))?$', re.IGNORECASE)
+INLINE_RE = re.compile(r'`([^`]+)`|\*\*(.+?)\*\*|\*(\S(?:.*?\S)?)\*|\[([^\]]+)\]\(([^)\s]+)\)')
+NUMBER_RE = re.compile(r'\d+(?:[.,]\d+)*')
+
+# "### <prefix>..." sections of a capstone project and the field they fill
+CAPSTONE_SECTIONS = [
+    ('project description', 'description'),
+    ('evaluation', 'evaluation_criteria'),
+    ('deliverables', 'deliverables'),
+    ('sample', 'sample_datasets'),
+    ('project requirements', 'requirements'),
+    ('project scope', 'requirements'),
+    ('technical requirements', 'requirements'),
+    ('key performance', 'requirements'),
+]
+
+
+class CurriculumError(ValueError):
+    """The document is not laid out like a course curriculum"""
+
+
+# Markdown to HTML
+
+def render_inline(text):
+    """HTML of one line of Markdown text: escaped, with emphasis, code and links"""
+    parts = []
+    position = 0
+    for match in INLINE_RE.finditer(text):
+        parts.append(html.escape(text[position:match.start()], quote=False))
+        code, strong, emphasis, label, url = match.groups()
+        if code is not None:
+            parts.append(f'<code>{html.escape(code, quote=False)}</code>')
+        elif strong is not None:
+            parts.append(f'<strong>{render_inline(strong)}</strong>')
+        elif emphasis is not None:
+            parts.append(f'<em>{render_inline(emphasis)}</em>')
+        else:
+            parts.append(f'<a href="{html.escape(url)}">{render_inline(label)}</a>')
+        position = match.end()
+    parts.append(html.escape(text[position:], quote=False))
+    return ''.join(parts)
+
+
+def plain_text(text):
+    """Markdown text without its inline markup"""
+    return re.sub(r'\*\*(.+?)\*\*|\*(\S(?:.*?\S)?)\*|`([^`]+)`', lambda match: next(filter(None, match.groups())), text)
+
+
+def indentation(line):
+    return len(line) - len(line.lstrip(' '))
+
+
+def render_code(lines, language):
+    code = html.escape('\n'.join(lines), quote=False)
+    if language:
+        return f'<pre><code class="language-{html.escape(language)}">{code}</code></pre>'
+    return f'<pre><code>{code}</code></pre>'
+
+
+def read_fence(lines, start):
+    """Return (language, code lines, index after the closing fence) for the fence opening at lines[start]"""
+    indent, marker, language = FENCE_RE.match(lines[start]).groups()
+    end = start + 1
+    while end < len(lines) and not lines[end].strip().startswith(marker):
+        end += 1
+    code = [line[len(indent):] if line.startswith(indent) else line.lstrip() for line in lines[start + 1:end]]
+    return language, code, end + 1
+
+
+def render_list(lines):
+    """HTML of a list whose items start at the indentation of its first line"""
+    base = indentation(lines[0])
+    ordered = LIST_ITEM_RE.match(lines[0]).group(2)[0].isdigit()
+    items = []
+    for line in lines:
+        match = LIST_ITEM_RE.match(line)
+        if match and indentation(line) == base:
+            items.append([match.group(3)])
+        else:
+            items[-1].append(line)
+    rendered = []
+    for text, *children in items:
+        body = render_inline(text.strip())
+        if any(child.strip() for child in children):
+            body += markdown_to_html('\n'.join(child[base:] for child in children), nested=True)
+        rendered.append(f'<li>{body}</li>')
+    tag = 'ol' if ordered else 'ul'
+    return f"<{tag}>{''.join(rendered)}</{tag}>"
+
+
+def markdown_to_html(text, nested=False):
+    """HTML of a Markdown fragment, in the tags CKEditor 5 produces"""
+    lines = text.expandtabs(4).split('\n')
+    if nested:
+        lines = [line[min(indentation(line) for line in lines if line.strip()):] for line in lines]
+    blocks = []
+    paragraph = []
+
+    def end_paragraph():
+        if paragraph:
+            # Two trailing spaces mark a line break
+            blocks.append('<p>' + ''.join(
+                render_inline(line.strip()) + ('<br>' if line.endswith('  ') and index < len(paragraph) - 1 else ' ')
+                for index, line in enumerate(paragraph)
+            ).rstrip() + '</p>')
+            paragraph.clear()
+
+    index = 0
+    while index < len(lines):
+        line = lines[index]
+        if not line.strip():
+            end_paragraph()
+            index += 1
+        elif FENCE_RE.match(line):
+            end_paragraph()
+            language, code, index = read_fence(lines, index)
+            blocks.append(render_code(code, language))
+        elif HEADING_RE.match(line) and not nested:
+            end_paragraph()
+            hashes, title = HEADING_RE.match(line).groups()
+            # CKEditor offers h2 to h4
+            level = min(max(len(hashes), 2), 4)
+            blocks.append(f'<h{level}>{render_inline(title)}</h{level}>')
+            index += 1
+        elif LIST_ITEM_RE.match(line):
+            end_paragraph()
+            base = indentation(line)
+            end = index + 1
+            while end < len(lines):
+                if lines[end].strip():
+                    if indentation(lines[end]) < base or (indentation(lines[end]) == base
+                                                          and not LIST_ITEM_RE.match(lines[end])):
+                        break
+                    end += 1
+                    continue
+                # A blank line ends the list unless it carries on below
+                following = next((candidate for candidate in lines[end:] if candidate.strip()), '')
+                if indentation(following) > base or (indentation(following) == base
+                                                     and LIST_ITEM_RE.match(following)):
+                    end += 1
+                else:
+                    break
+            blocks.append(render_list([item for item in lines[index:end] if item.strip()]))
+            index = end
+        else:
+            paragraph.append(line)
+            index += 1
+    end_paragraph()
+    return ''.join(blocks)
+
+
+# Document structure
+
+def split_sections(lines, level):
+    """[(heading, body lines)] at a heading level, skipping headings inside code fences"""
+    sections = [(None, [])]
+    fence = None
+    for line in lines:
+        fence_match = FENCE_RE.match(line)
+        if fence_match:
+            fence = None if fence else fence_match.group(2)
+        heading = None if fence else HEADING_RE.match(line)
+        if heading and len(heading.group(1)) == level:
+            sections.append((heading.group(2), []))
+        else:
+            sections[-1][1].append(line)
+    return sections
+
+
+def split_labels(lines):
+    """[(label, inline value, body lines)] of the **Label:** blocks in a section"""
+    blocks = [(None, '', [])]
+    fence = False
+    for line in lines:
+        if FENCE_RE.match(line):
+            fence = not fence
+        label = None if fence else LABEL_RE.match(line)
+        if label:
+            blocks.append((label.group(1), label.group(2), []))
+        else:
+            blocks[-1][2].append(line)
+    return [block for block in blocks if block[0] or any(line.strip() for line in block[2])]
+
+
+def overview_fields(lines):
+    """{label: value} of a section of "**Label:** value" lines and "- **Label:** value" bullets"""
+    fields = {}
+    for line in lines:
+        label = LABEL_RE.match(line.strip().removeprefix('- '))
+        if label:
+            fields[label.group(1).strip().lower()] = label.group(2)
+    return fields
+
+
+def first_number(text, default=0):
+    match = NUMBER_RE.search(text or '')
+    return Decimal(match.group().replace(',', '')) if match else default
+
+
+def parse_code_examples(module_title, lines):
+    """(example dicts, lines that are not code) of a "Code Examples" block"""
+    examples = []
+    rest = []
+    index = 0
+    while index < len(lines):
+        if not FENCE_RE.match(lines[index]):
+            rest.append(lines[index])
+            index += 1
+            continue
+        language, code, index = read_fence(lines, index)
+        code = '\n'.join(code).strip('\n')
+        # Examples open with a comment naming them
+        first_line = code.split('\n', 1)[0].strip()
+        title = first_line.lstrip('#/- ').strip() if first_line.startswith(('#', '//', '--')) else ''
+        examples.append({
+            'title': (title or f'{module_title} example {len(examples) + 1}')[:200],
+            'code': code,
+            'language': language.lower() or 'python',
+        })
+    return examples, rest
+
+
+def parse_exercises(lines):
+    """Exercise dicts, one per top-level bullet of an "Exercises" block"""
+    exercises = []
+    for line in lines:
+        match = LIST_ITEM_RE.match(line)
+        if match and not indentation(line):
+            exercises.append({'title': plain_text(match.group(3)).strip()[:200], 'lines': [match.group(3)]})
+        elif exercises and line.strip():
+            exercises[-1]['lines'].append(line)
+    for exercise in exercises:
+        text, *children = exercise.pop('lines')
+        exercise['description'] = f'<p>{render_inline(text.strip())}</p>'
+        if children:
+            exercise['description'] += markdown_to_html('\n'.join(children), nested=True)
+    return exercises
+
+
+def parse_module(heading, lines):
+    match = MODULE_RE.match(heading)
+    order, title, hours = match.groups()
+    module = {
+        'order': int(order), 'title': title.strip()[:200], 'duration_hours': int(hours or 0),
+        'description': '', 'learning_objectives': '', 'content': '', 'code_examples': [], 'exercises': [],
+    }
+    description = []
+    content = []
+    for label, value, body in split_labels(lines):
+        key = (label or '').lower()
+        if label is None or value:
+            # Inline values ("**Duration:** Week 1-2") and any lead-in prose describe the module
+            text = f'**{label}:** {value}' if label else '\n'.join(body)
+            description.append(markdown_to_html(text))
+            if label and any(line.strip() for line in body):
+                content.append(markdown_to_html('\n'.join(body)))
+        elif key == 'learning objectives':
+            module['learning_objectives'] = markdown_to_html('\n'.join(body))
+        elif 'exercises' in key or key.startswith('practical'):
+            module['exercises'].extend(parse_exercises(body))
+        else:
+            if key.endswith('examples'):
+                examples, body = parse_code_examples(module['title'], body)
+                module['code_examples'].extend(examples)
+            if any(line.strip() for line in body):
+                content.append(f'<h3>{render_inline(label)}</h3>' + markdown_to_html('\n'.join(body)))
+    module['description'] = ''.join(description)
+    module['content'] = ''.join(content)
+    return module
+
+
+def parse_capstone(heading, lines):
+    sections = split_sections(lines, 3)
+    fields = overview_fields(sections[0][1])
+    difficulty = fields.get('difficulty level', '').lower()
+    project_type = fields.get('project type', '')
+    group_size = first_number(project_type.partition('Max')[2], default=1)
+    capstone = {
+        'order': 1,
+        'title': (fields.get('project title') or heading.partition(':')[2]).strip()[:200],
+        'estimated_hours': int(first_number(fields.get('estimated time'), default=40)),
+        'difficulty_level': 'advanced' if difficulty in ('advanced', 'expert') else 'intermediate',
+        'is_group_project': 'group' in project_type.lower(),
+        'max_group_size': int(group_size) if 'group' in project_type.lower() else 1,
+        'description': '', 'requirements': '', 'evaluation_criteria': '', 'sample_datasets': '',
+        'deliverables': '', 'resources': '',
+    }
+    for title, body in sections[1:]:
+        field = next((field for prefix, field in CAPSTONE_SECTIONS if title.lower().startswith(prefix)), 'resources')
+        rendered = markdown_to_html('\n'.join(body))
+        if field in ('requirements', 'resources'):
+            # Several sections can land in these two
+            rendered = f'<h3>{render_inline(title)}</h3>' + rendered
+        capstone[field] += rendered
+    return capstone
+
+
+def parse_curriculum(text):
+    """
+    Return the course described by a curriculum document as a dict: course
+    fields, ``modules`` (each with ``code_examples`` and ``exercises``) and
+    ``capstone`` (None when the document has no capstone project)
+    """
+    lines = text.replace('\r\n', '\n').split('\n')
+    sections = {}
+    capstone = None
+    for heading, body in split_sections(lines, 2)[1:]:
+        if heading.lower().startswith('capstone project'):
+            capstone = parse_capstone(heading, body)
+        else:
+            sections[heading.lower()] = body
+    overview = overview_fields(sections.get('course overview', []))
+    if not overview.get('course slug'):
+        raise CurriculumError('The document has no "Course Overview" section with a **Course Slug:**')
+    pricing = overview_fields(sections.get('pricing information', []))
+    modules = [
+        parse_module(heading, body)
+        for heading, body in split_sections(sections.get('course syllabus', []), 3)[1:]
+        if MODULE_RE.match(heading)
+    ]
+    description = markdown_to_html('\n'.join(sections.get('course description', [])))
+    # "- **Pandas** - Data manipulation and analysis" lists the tool as "Pandas"
+    tools = [
+        plain_text(match.group(3)).split(' - ')[0].strip()
+        for line in sections.get('tools & software requirements', [])
+        if (match := LIST_ITEM_RE.match(line))
+    ]
+    return {
+        'slug': overview['course slug'].strip(),
+        'title': overview.get('course title', '').strip()[:200],
+        'duration': overview.get('duration', '').strip()[:100],
+        'schedule': overview.get('schedule', '').strip()[:100],
+        'estimated_hours': int(first_number(overview.get('estimated completion time'))),
+        'price': first_number(pricing.get('original price')),
+        'discount_price': first_number(pricing.get('current price'), default=None),
+        'overview': description,
+        'description': description,
+        'learning_outcomes': markdown_to_html('\n'.join(sections.get('learning outcomes', []))),
+        'prerequisites': markdown_to_html('\n'.join(sections.get('prerequisites', []))),
+        'tools_software': ', '.join(tools),
+        'modules': modules,
+        'capstone': capstone,
+    }
+
+
+# Import
+
+MODULE_FIELDS = ['title', 'description', 'content', 'learning_objectives', 'duration_hours']
+CODE_EXAMPLE_FIELDS = ['title', 'code', 'language', 'description', 'highlighted_code', 'highlight_hash']
+EXERCISE_FIELDS = ['title', 'description']
+CAPSTONE_FIELDS = [
+    'title', 'description', 'requirements', 'evaluation_criteria', 'estimated_hours', 'difficulty_level',
+    'sample_datasets', 'deliverables', 'resources', 'is_group_project', 'max_group_size',
+]
+
+
+def get_or_create_course(curriculum, category=None):
+    course = Course.objects.filter(slug=curriculum['slug']).first()
+    if course is not None:
+        return course, False
+    if category is None:
+        raise CurriculumError(f"There is no course {curriculum['slug']!r}; give a category to create it")
+    course = Course.objects.create(
+        category=CourseCategory.objects.get(name=category),
+        is_published=False,
+        **{key: value for key, value in curriculum.items() if key not in ('modules', 'capstone')},
+    )
+    return course, True
+
+
+@transaction.atomic
+def import_curriculum(curriculum, category=None):
+    """
+    Upsert a parsed curriculum's modules, code examples, exercises and
+    capstone project; returns a dict of counts
+
+    The course itself is looked up by slug and only created (unpublished,
+    in ``category``) when missing: an existing course's pricing and
+    marketing copy are not overwritten.
+    """
+    course, created = get_or_create_course(curriculum, category)
+    modules = curriculum['modules']
+    CourseModule.objects.bulk_create(
+        [CourseModule(course=course, **{field: module[field] for field in ['order', *MODULE_FIELDS]})
+         for module in modules],
+        update_conflicts=True, unique_fields=['course', 'order'], update_fields=MODULE_FIELDS,
+    )
+    # SQLite does not return the primary keys of updated rows
+    module_ids = dict(course.modules.filter(order__in=[module['order'] for module in modules])
+                      .values_list('order', 'id'))
+
+    code_examples = []
+    exercises = []
+    for module in modules:
+        for order, example in enumerate(module['code_examples'], 1):
+            code_example = CodeExample(
+                module_id=module_ids[module['order']], order=order,
+                description=f"<p>{html.escape(example['title'])}</p>",
+                **{key: example[key] for key in ('title', 'code', 'language')},
+            )
+            # bulk_create() skips save(), which renders this
+            refresh_highlighting(code_example)
+            code_examples.append(code_example)
+        exercises.extend(
+            Exercise(module_id=module_ids[module['order']], order=order, **exercise)
+            for order, exercise in enumerate(module['exercises'], 1)
+        )
+    CodeExample.objects.bulk_create(
+        code_examples, update_conflicts=True, unique_fields=['module', 'order'], update_fields=CODE_EXAMPLE_FIELDS,
+    )
+    Exercise.objects.bulk_create(
+        exercises, update_conflicts=True, unique_fields=['module', 'order'], update_fields=EXERCISE_FIELDS,
+    )
+
+    capstone = curriculum['capstone']
+    if capstone:
+        CapstoneProject.objects.bulk_create(
+            [CapstoneProject(course=course, **capstone)],
+            update_conflicts=True, unique_fields=['course', 'order'], update_fields=CAPSTONE_FIELDS,
+        )
+    Course.objects.filter(pk=course.pk).update(total_modules=course.modules.count())
+    SyllabusService.queue(course.pk)
+    OfflineCopyService.queue(course.pk)
+    return {
+        'course': course,
+        'created': created,
+        'modules': len(modules),
+        'code_examples': len(code_examples),
+        'exercises': len(exercises),
+        'capstone_projects': int(bool(capstone)),
+    }
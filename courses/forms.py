@@ -109,4 +109,46 @@ class InstructorReviewForm(forms.ModelForm):
         if grade is not None:
             if grade < 0 or grade > 100:
                 raise forms.ValidationError('Grade must be between 0 and 100.')
-        return grade
\ No newline at end of file
+        return grade
+
+class BulkReviewForm(forms.Form):
+    """One row of the bulk project review table"""
+
+    ACTION_CHOICES = [
+        ('', 'No change'),
+        ('complete', 'Complete'),
+        ('request_changes', 'Return for changes'),
+    ]
+
+    project_enrollment_id = forms.IntegerField(widget=forms.HiddenInput())
+    action = forms.ChoiceField(
+        choices=ACTION_CHOICES,
+        required=False,
+        widget=forms.Select(attrs={
+            'class': 'w-full px-2 py-1 border border-gray-300 rounded-lg text-sm focus:outline-none focus:border-blue-500'
+        })
+    )
+    grade = forms.DecimalField(
+        max_digits=5,
+        decimal_places=2,
+        min_value=0,
+        max_value=100,
+        required=False,
+        widget=forms.NumberInput(attrs={
+            'min': 0,
+            'max': 100,
+            'placeholder': '0-100',
+            'class': 'w-20 px-2 py-1 border border-gray-300 rounded-lg text-sm focus:outline-none focus:border-blue-500'
+        })
+    )
+    instructor_feedback = forms.CharField(
+        required=False,
+        widget=forms.Textarea(attrs={
+            'rows': 2,
+            'placeholder': 'Feedback for the student...',
+            'class': 'w-full px-2 py-1 border border-gray-300 rounded-lg text-sm focus:outline-none focus:border-blue-500'
+        })
+    )
+
+
+BulkReviewFormSet = forms.formset_factory(BulkReviewForm, extra=0)
@@ -0,0 +1,78 @@
+"""
+Save-time syntax highlighting of code examples
+
+CodeExample.save() renders the code with Pygments into
+``highlighted_code``: spans with short token classes, ready to drop into
+``<pre class="highlight"><code>``. The colours come from a static
+stylesheet (core/static/core/css/highlight.css, written by the
+highlight_code_examples command), so module pages ship plain HTML and CSS
+and no highlighter script.
+
+``highlight_hash`` identifies what the stored markup was rendered from:
+the code, the language and the Pygments version. Saving an unchanged
+example does not render it again, and the backfill command only touches
+rows whose hash is out of date.
+"""
+import functools
+import hashlib
+import json
+
+import pygments
+from pygments import highlight
+from pygments.formatters import HtmlFormatter
+from pygments.lexers import TextLexer, get_lexer_by_name
+from pygments.util import ClassNotFound
+
+# CodeExample.language values that are not Pygments lexer names
+LANGUAGE_ALIASES = {
+    'dax': 'text',
+    'excel': 'text',
+    'power bi': 'text',
+    'power query': 'text',
+    'ipython': 'python',
+    'jupyter': 'python',
+    'shell': 'bash',
+    'terminal': 'console',
+}
+CSS_CLASS = 'highlight'
+# Building a formatter computes its whole style table, so one is shared; format() keeps no state
+FORMATTER = HtmlFormatter(nowrap=True)
+
+
+@functools.lru_cache(maxsize=64)
+def get_lexer(language):
+    name = language.strip().lower()
+    name = LANGUAGE_ALIASES.get(name, name)
+    try:
+        return get_lexer_by_name(name, stripnl=False, ensurenl=False)
+    except ClassNotFound:
+        return TextLexer(stripnl=False, ensurenl=False)
+
+
+def highlight_hash(code, language):
+    key = [code, language.strip().lower(), pygments.__version__]
+    return hashlib.sha256(json.dumps(key).encode()).hexdigest()
+
+
+def highlight_code(code, language):
+    """HTML of the code's tokens, without the surrounding <pre>"""
+    return highlight(code, get_lexer(language), FORMATTER)
+
+
+def stylesheet(style):
+    """CSS for the token classes in a Pygments style, scoped to .highlight"""
+    formatter = HtmlFormatter(style=style)
+    # Without the unscoped pre and line number rules of get_style_defs()
+    return '\n'.join(
+        formatter.get_background_style_defs(f'.{CSS_CLASS}') + formatter.get_token_style_defs(f'.{CSS_CLASS}')
+    )
+
+
+def refresh_highlighting(example):
+    """Re-render an example's markup if its code or language changed; returns whether it did"""
+    current = highlight_hash(example.code, example.language)
+    if example.highlight_hash == current:
+        return False
+    example.highlighted_code = highlight_code(example.code, example.language)
+    example.highlight_hash = current
+    return True
@@ -0,0 +1,432 @@
+"""
+Management command to load-test the key views
+
+Every scenario is driven by --concurrency threads, either in process through
+the Django test client or, with --base-url, over HTTP against a running
+server that uses the same database. Sessions for the seeded accounts (see
+seed_scale_data) are created up front, so no login round trips are timed.
+
+For each scenario it reports throughput, p50/p95/p99 latency and queries per
+request, and saves the run as JSON so results can be compared across
+commits:
+
+    python manage.py bench
+    python manage.py bench --compare bench_results/<earlier run>.json
+
+Query counts over HTTP come from the X-Query-Count header, which the server
+only sends with DEBUG and QUERY_INSPECTOR_ENABLED on.
+"""
+import json
+import random
+import subprocess
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from datetime import datetime
+from importlib import import_module
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import Client, override_settings
+from django.urls import reverse
+from django.utils.crypto import get_random_string
+
+from core.middleware import QueryRecorder
+from courses.models import Course, CourseCategory, Enrollment, ModuleCompletion
+from .seed_scale_data import USERNAME_PREFIX
+
+POOL_SIZE = 200
+
+
+def percentile(sorted_values, percent):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(1, round(len(sorted_values) * percent / 100))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class NoRedirectHandler(urllib.request.HTTPRedirectHandler):
+    """Report redirects as responses instead of following them"""
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the key views with concurrent clients and save the results as JSON'
+
+    # name: (method, role, request builder)
+    SCENARIOS = {
+        'home': ('GET', 'anonymous', 'build_home'),
+        'courses': ('GET', 'anonymous', 'build_courses'),
+        'courses_search': ('GET', 'anonymous', 'build_courses_search'),
+        'courses_category': ('GET', 'anonymous', 'build_courses_category'),
+        'courses_deep_page': ('GET', 'anonymous', 'build_courses_deep_page'),
+        'course_detail': ('GET', 'anonymous', 'build_course_detail'),
+        'course_materials': ('GET', 'learner', 'build_course_materials'),
+        'mark_module_complete': ('POST', 'learner', 'build_mark_module_complete'),
+        'enroll_course': ('POST', 'learner', 'build_enroll_course'),
+        'my_enrollments': ('GET', 'learner', 'build_my_enrollments'),
+        'instructor_dashboard': ('GET', 'instructor', 'build_instructor_dashboard'),
+        'instructor_overview': ('GET', 'instructor', 'build_instructor_overview'),
+    }
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Timed requests per scenario')
+        parser.add_argument('--concurrency', type=int, default=4, help='Concurrent clients')
+        parser.add_argument('--warmup', type=int, default=5, help='Untimed requests per scenario')
+        parser.add_argument(
+            '--scenarios', type=str, default='',
+            help=f"Comma-separated subset of: {', '.join(self.SCENARIOS)}",
+        )
+        parser.add_argument(
+            '--base-url', type=str, default='',
+            help='Benchmark a running server (e.g. http://127.0.0.1:8000) instead of the test client',
+        )
+        parser.add_argument('--seed', type=int, default=42, help='Random seed for picking pages and users')
+        parser.add_argument('--output', type=str, default='', help='JSON file for the results')
+        parser.add_argument('--compare', type=str, default='', help='Earlier results file to compare against')
+
+    def handle(self, *args, **options):
+        names = [name.strip() for name in options['scenarios'].split(',') if name.strip()] or list(self.SCENARIOS)
+        unknown = set(names) - set(self.SCENARIOS)
+        if unknown:
+            raise CommandError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+        self.base_url = options['base_url'].rstrip('/')
+        self.rng = random.Random(options['seed'])
+        self.rng_lock = threading.Lock()
+        self.prepare_fixtures()
+
+        started_at = datetime.now().astimezone()
+        results = {
+            'started_at': started_at.isoformat(timespec='seconds'),
+            'commit': self.get_commit(),
+            'driver': 'http' if self.base_url else 'test-client',
+            'base_url': self.base_url,
+            'database': connection.vendor,
+            'concurrency': options['concurrency'],
+            'requests_per_scenario': options['requests'],
+            'dataset': self.get_dataset_counts(),
+            'scenarios': {},
+        }
+        overrides = {}
+        if not self.base_url:
+            # Accept the test client's host and keep enrollment emails in memory
+            overrides = {
+                'ALLOWED_HOSTS': [*settings.ALLOWED_HOSTS, 'testserver'],
+                'EMAIL_BACKEND': 'django.core.mail.backends.locmem.EmailBackend',
+            }
+        try:
+            with override_settings(**overrides):
+                for name in names:
+                    self.stdout.write(f'{name}...', ending='')
+                    self.stdout.flush()
+                    summary = self.run_scenario(name, options['requests'], options['concurrency'], options['warmup'])
+                    results['scenarios'][name] = summary
+                    if summary['requests']:
+                        self.stdout.write(
+                            f" {summary['throughput_rps']:.1f} req/s, p95 {summary['p95_ms']:.1f} ms"
+                            + (f", {summary['errors']} errors" if summary['errors'] else '')
+                        )
+                    else:
+                        self.stdout.write(' no requests')
+        finally:
+            self.cleanup()
+
+        self.print_table(results)
+        output = Path(options['output'] or (
+            Path(settings.BASE_DIR) / 'bench_results'
+            / f"{started_at:%Y%m%d-%H%M%S}-{results['commit'] or 'unknown'}.json"
+        ))
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_text(json.dumps(results, indent=2))
+        self.stdout.write(self.style.SUCCESS(f'Results written to {output}'))
+
+        if options['compare']:
+            self.print_comparison(json.loads(Path(options['compare']).read_text()), results)
+
+    def get_commit(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+                capture_output=True, text=True, check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return ''
+
+    def get_dataset_counts(self):
+        return {
+            'users': User.objects.count(),
+            'courses': Course.objects.count(),
+            'enrollments': Enrollment.objects.count(),
+            'module_completions': ModuleCompletion.objects.count(),
+        }
+
+    # Fixtures
+
+    def prepare_fixtures(self):
+        """Pick the pages and seeded accounts the scenarios draw from"""
+        self.started = datetime.now().astimezone()
+        active_courses = Course.objects.filter(is_active=True)
+        self.course_slugs = list(active_courses.order_by('-created_at').values_list('slug', flat=True)[:POOL_SIZE])
+        self.categories = list(CourseCategory.objects.values_list('name', flat=True))
+        self.last_page = max(1, (active_courses.count() + 8) // 9)
+
+        enrollments = list(
+            Enrollment.objects.filter(
+                is_activated=True, course__is_active=True, user__username__startswith=f'{USERNAME_PREFIX}learner'
+            )
+            .select_related('user', 'course')
+            .order_by('activation_code')[:POOL_SIZE]
+        )
+        instructors = list(User.objects.filter(
+            username__startswith=f'{USERNAME_PREFIX}instructor', instructor_courses__isnull=False
+        ).distinct()[:POOL_SIZE])
+        if not enrollments or not instructors or not self.course_slugs:
+            raise CommandError('No seeded data found; run seed_scale_data first.')
+
+        completed = set(ModuleCompletion.objects.filter(
+            enrollment__in=enrollments
+        ).values_list('enrollment_id', 'module_id'))
+        enrolled = set(Enrollment.objects.filter(
+            user__in=[enrollment.user for enrollment in enrollments]
+        ).values_list('user_id', 'course__slug'))
+
+        self.learners = []
+        for enrollment in enrollments:
+            # Toggling a module the seed left incomplete never deletes seeded rows
+            open_modules = [
+                module_id for module_id in enrollment.course.modules.values_list('pk', flat=True)
+                if (enrollment.pk, module_id) not in completed
+            ]
+            self.learners.append({
+                'user': enrollment.user,
+                'slug': enrollment.course.slug,
+                'module_id': open_modules[-1] if open_modules else None,
+                'not_enrolled': [slug for slug in self.course_slugs if (enrollment.user_id, slug) not in enrolled],
+            })
+        self.instructors = [{'user': user} for user in instructors]
+        self.sessions = {}
+
+    def cleanup(self):
+        """Remove the enrollments and completions created by write scenarios"""
+        user_ids = [learner['user'].pk for learner in self.learners]
+        Enrollment.objects.filter(user_id__in=user_ids, created_at__gte=self.started).delete()
+        ModuleCompletion.objects.filter(
+            enrollment__user_id__in=user_ids, completed_at__gte=self.started
+        ).delete()
+
+    def get_session_key(self, user):
+        """Session that logs ``user`` in, created without going through the login view"""
+        if user.pk not in self.sessions:
+            engine = import_module(settings.SESSION_ENGINE)
+            session = engine.SessionStore()
+            session[SESSION_KEY] = str(user.pk)
+            session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+            session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+            session.save()
+            self.sessions[user.pk] = session.session_key
+        return self.sessions[user.pk]
+
+    def choice(self, values):
+        with self.rng_lock:
+            return self.rng.choice(values)
+
+    # Request builders return (path, POST data or None, extra headers)
+
+    def build_home(self, actor):
+        return reverse('core:home'), None, {}
+
+    def build_courses(self, actor):
+        return reverse('courses:courses'), None, {}
+
+    def build_courses_search(self, actor):
+        term = self.choice(['Python', 'SQL', 'Power BI', 'Data', 'Learning'])
+        return f"{reverse('courses:courses')}?search={urllib.parse.quote(term)}", None, {}
+
+    def build_courses_category(self, actor):
+        return f"{reverse('courses:courses')}?category={self.choice(self.categories)}", None, {}
+
+    def build_courses_deep_page(self, actor):
+        page = self.choice(range(max(1, self.last_page - 5), self.last_page + 1))
+        return f"{reverse('courses:courses')}?page={page}", None, {}
+
+    def build_course_detail(self, actor):
+        return reverse('courses:course_detail', kwargs={'slug': self.choice(self.course_slugs)}), None, {}
+
+    def build_course_materials(self, actor):
+        return reverse('courses:course_materials', kwargs={'slug': actor['slug']}), None, {}
+
+    def build_mark_module_complete(self, actor):
+        if actor['module_id'] is None:
+            return None
+        path = reverse(
+            'courses:mark_module_complete', kwargs={'slug': actor['slug'], 'module_id': actor['module_id']}
+        )
+        return path, {}, {'Accept': 'application/json'}
+
+    def build_enroll_course(self, actor):
+        if not actor['not_enrolled']:
+            return None
+        slug = self.choice(actor['not_enrolled'])
+        data = {'payment_method': 'mpesa', 'installments': '2', 'currency': 'KES'}
+        return reverse('courses:enroll_course', kwargs={'slug': slug}), data, {}
+
+    def build_my_enrollments(self, actor):
+        return reverse('courses:my_enrollments'), None, {}
+
+    def build_instructor_dashboard(self, actor):
+        return reverse('courses:instructor_dashboard'), None, {}
+
+    def build_instructor_overview(self, actor):
+        return reverse('accounts:instructor_dashboard'), None, {}
+
+    # Running
+
+    def run_scenario(self, name, requests, concurrency, warmup):
+        method, role, builder = self.SCENARIOS[name]
+        builder = getattr(self, builder)
+        actors = {'anonymous': [{'user': None}], 'learner': self.learners, 'instructor': self.instructors}[role]
+
+        for _ in range(warmup):
+            self.timed_request(method, builder, self.choice(actors))
+
+        samples = []
+        remaining = [requests]
+        lock = threading.Lock()
+
+        def worker():
+            try:
+                while True:
+                    with lock:
+                        if not remaining[0]:
+                            return
+                        remaining[0] -= 1
+                    sample = self.timed_request(method, builder, self.choice(actors))
+                    with lock:
+                        samples.append(sample)
+            finally:
+                connections.close_all()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for future in [executor.submit(worker) for _ in range(concurrency)]:
+                future.result()
+        elapsed = time.perf_counter() - started
+
+        timed = sorted(sample['seconds'] * 1000 for sample in samples if sample['status'] is not None)
+        query_counts = sorted(sample['queries'] for sample in samples if sample['queries'] is not None)
+        return {
+            'method': method,
+            'requests': len(timed),
+            'errors': sum(1 for sample in samples if sample['status'] is not None and sample['status'] >= 400),
+            'skipped': sum(1 for sample in samples if sample['status'] is None),
+            'throughput_rps': len(timed) / elapsed if elapsed else 0,
+            'mean_ms': sum(timed) / len(timed) if timed else None,
+            'p50_ms': percentile(timed, 50),
+            'p95_ms': percentile(timed, 95),
+            'p99_ms': percentile(timed, 99),
+            'max_ms': timed[-1] if timed else None,
+            'queries_p50': percentile(query_counts, 50),
+            'queries_max': query_counts[-1] if query_counts else None,
+        }
+
+    def timed_request(self, method, builder, actor):
+        built = builder(actor)
+        if built is None:
+            # Nothing left for this actor to do (e.g. enrolled in every course)
+            return {'status': None, 'seconds': 0, 'queries': None}
+        path, data, headers = built
+        session_key = self.get_session_key(actor['user']) if actor['user'] else None
+        if self.base_url:
+            return self.http_request(method, path, data, headers, session_key)
+        return self.client_request(method, path, data, headers, session_key)
+
+    def client_request(self, method, path, data, headers, session_key):
+        client = Client()
+        if session_key:
+            client.cookies[settings.SESSION_COOKIE_NAME] = session_key
+        recorder = QueryRecorder(capture_call_sites=False)
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for db in connections.all():
+                stack.enter_context(db.execute_wrapper(recorder))
+            if method == 'POST':
+                response = client.post(path, data, headers=headers)
+            else:
+                response = client.get(path, headers=headers)
+        return {
+            'status': response.status_code,
+            'seconds': time.perf_counter() - start,
+            'queries': len(recorder.queries),
+        }
+
+    def http_request(self, method, path, data, headers, session_key):
+        # Any well-formed token is accepted as long as cookie and header match
+        csrf_token = get_random_string(32)
+        cookies = [f'{settings.CSRF_COOKIE_NAME}={csrf_token}']
+        if session_key:
+            cookies.append(f'{settings.SESSION_COOKIE_NAME}={session_key}')
+        request = urllib.request.Request(
+            self.base_url + path,
+            data=urllib.parse.urlencode(data).encode() if method == 'POST' else None,
+            headers={**headers, 'Cookie': '; '.join(cookies), 'X-CSRFToken': csrf_token,
+                     'Referer': self.base_url + path},
+            method=method,
+        )
+        opener = urllib.request.build_opener(NoRedirectHandler)
+        start = time.perf_counter()
+        try:
+            with opener.open(request, timeout=60) as response:
+                response.read()
+                status, response_headers = response.status, response.headers
+        except urllib.error.HTTPError as error:
+            status, response_headers = error.code, error.headers
+        except OSError:
+            return {'status': 599, 'seconds': time.perf_counter() - start, 'queries': None}
+        query_count = response_headers.get('X-Query-Count')
+        return {
+            'status': status,
+            'seconds': time.perf_counter() - start,
+            'queries': int(query_count) if query_count else None,
+        }
+
+    # Reporting
+
+    def print_table(self, results):
+        self.stdout.write('')
+        self.stdout.write(
+            f"{'scenario':<22}{'req/s':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'queries':>9}{'errors':>8}"
+        )
+        for name, summary in results['scenarios'].items():
+            if not summary['requests']:
+                self.stdout.write(f'{name:<22}  no requests')
+                continue
+            queries = '-' if summary['queries_p50'] is None else summary['queries_p50']
+            self.stdout.write(
+                f"{name:<22}{summary['throughput_rps']:>8.1f}{summary['p50_ms']:>9.1f}"
+                f"{summary['p95_ms']:>9.1f}{summary['p99_ms']:>9.1f}{queries:>9}{summary['errors']:>8}"
+            )
+
+    def print_comparison(self, baseline, results):
+        self.stdout.write('')
+        self.stdout.write(f"Compared with {baseline.get('commit') or 'baseline'} ({baseline.get('started_at')}):")
+        self.stdout.write(f"{'scenario':<22}{'p95 before':>12}{'p95 after':>11}{'change':>9}{'queries':>12}")
+        for name, summary in results['scenarios'].items():
+            before = baseline.get('scenarios', {}).get(name)
+            if not before or not before.get('p95_ms') or summary['p95_ms'] is None:
+                continue
+            change = (summary['p95_ms'] - before['p95_ms']) / before['p95_ms'] * 100
+            queries = f"{before.get('queries_p50') or '-'} -> {summary['queries_p50'] or '-'}"
+            line = f"{name:<22}{before['p95_ms']:>12.1f}{summary['p95_ms']:>11.1f}{change:>+8.0f}%{queries:>12}"
+            self.stdout.write(self.style.ERROR(line) if change > 10 else line)
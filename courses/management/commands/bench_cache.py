@@ -0,0 +1,97 @@
+"""
+Management command to compare the cache backends available without an external service
+
+Times get (hit and miss), set, get_many/set_many of --batch keys and incr
+for LocMemCache, FileBasedCache and core.cache.SQLiteCache, each on a
+scratch location. With --workers > 1 it also runs a mixed workload (90%
+reads) from that many processes at once against the backends that are
+shared between processes; LocMemCache is per process and is left out.
+
+    python manage.py bench_cache --ops 5000 --workers 4
+"""
+import multiprocessing
+import tempfile
+import time
+from pathlib import Path
+
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand
+
+from core.cache import SQLiteCache
+
+
+def make_backends(directory):
+    params = {'TIMEOUT': 3600, 'OPTIONS': {'MAX_ENTRIES': 100000}}
+    return {
+        'locmem': LocMemCache(f'bench-{directory}', params),
+        'filebased': FileBasedCache(str(Path(directory) / 'filebased'), params),
+        'sqlite': SQLiteCache(str(Path(directory) / 'cache.sqlite3'), params),
+    }
+
+
+def mixed_worker(backend, ops, keys, value):
+    for op in range(ops):
+        key = f'mixed:{op % keys}'
+        if op % 10 == 0:
+            backend.set(key, value)
+        else:
+            backend.get(key)
+
+
+class Command(BaseCommand):
+    help = 'Benchmark LocMemCache, FileBasedCache and SQLiteCache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ops', type=int, default=2000, help='Operations per measurement')
+        parser.add_argument('--value-size', type=int, default=1024, help='Bytes per cached value')
+        parser.add_argument('--batch', type=int, default=20, help='Keys per get_many/set_many')
+        parser.add_argument('--workers', type=int, default=4, help='Processes for the shared workload')
+
+    def handle(self, *args, **options):
+        ops, batch = options['ops'], options['batch']
+        value = {'html': 'x' * options['value_size']}
+        with tempfile.TemporaryDirectory() as directory:
+            backends = make_backends(directory)
+            self.stdout.write(f"Single process, microseconds per call ({ops} calls, {batch} keys per batch)")
+            self.stdout.write(f"{'operation':<12}" + ''.join(f'{name:>12}' for name in backends))
+            rows = {
+                'set': lambda cache, i: cache.set(f'key:{i}', value),
+                'get hit': lambda cache, i: cache.get(f'key:{i}'),
+                'get miss': lambda cache, i: cache.get(f'missing:{i}'),
+                'set_many': lambda cache, i: cache.set_many({f'many:{i}:{n}': value for n in range(batch)}),
+                'get_many': lambda cache, i: cache.get_many([f'many:{i}:{n}' for n in range(batch)]),
+                'incr': lambda cache, i: cache.incr('counter'),
+            }
+            for backend in backends.values():
+                backend.set('counter', 0)
+            for label, operation in rows.items():
+                # Batches are slow on file-based caches; fewer calls keep the run short
+                calls = ops // batch if label.endswith('_many') else ops
+                timings = []
+                for backend in backends.values():
+                    started = time.perf_counter()
+                    for i in range(calls):
+                        operation(backend, i)
+                    timings.append((time.perf_counter() - started) / calls * 1e6)
+                self.stdout.write(f'{label:<12}' + ''.join(f'{timing:>12.1f}' for timing in timings))
+
+            if options['workers'] > 1:
+                self.stdout.write('')
+                self.run_shared(backends, options['workers'], ops, value)
+
+    def run_shared(self, backends, workers, ops, value):
+        self.stdout.write(f"{workers} processes, 90% get / 10% set over 500 keys, total calls per second")
+        context = multiprocessing.get_context('fork')
+        for name in ('filebased', 'sqlite'):
+            processes = [
+                context.Process(target=mixed_worker, args=(backends[name], ops, 500, value))
+                for _ in range(workers)
+            ]
+            started = time.perf_counter()
+            for process in processes:
+                process.start()
+            for process in processes:
+                process.join()
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f'{name:<12}{workers * ops / elapsed:>12.0f}')
@@ -0,0 +1,145 @@
+"""
+Management command to measure SQLite write throughput under concurrent workers
+
+Starts --workers processes against a scratch database file, once with
+SQLITE_TUNING=0 (Django's defaults: rollback journal, deferred transactions,
+a new connection per request, no retries) and once with the tuning in
+core.db. Each worker repeats the shape of mark_module_complete, a read
+followed by a toggle and a counter update in one transaction, and closes its
+connection between "requests" the way the request cycle does.
+
+    python manage.py bench_db_writes --workers 8 --duration 10
+"""
+import argparse
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import closing
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, close_old_connections, connection, transaction
+
+from core.db import is_locked_error, retry_on_locked
+from .bench import percentile
+
+MODES = {'default': '0', 'tuned': '1'}
+
+
+def write_transaction(worker, item):
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT id FROM bench_completion WHERE worker = %s AND item = %s', [worker, item])
+        row = cursor.fetchone()
+        if row:
+            cursor.execute('DELETE FROM bench_completion WHERE id = %s', [row[0]])
+        else:
+            cursor.execute('INSERT INTO bench_completion (worker, item) VALUES (%s, %s)', [worker, item])
+        cursor.execute('UPDATE bench_counter SET value = value + 1 WHERE id = 1')
+
+
+class Command(BaseCommand):
+    help = 'Compare SQLite write throughput with and without the tuning in core.db'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8, help='Concurrent worker processes')
+        parser.add_argument('--duration', type=float, default=5.0, help='Seconds each mode runs')
+        parser.add_argument('--modes', type=str, default='default,tuned', help='Comma-separated: default, tuned')
+        # Internal: run as one worker process and print its results as JSON
+        parser.add_argument('--worker', type=int, default=None, help=argparse.SUPPRESS)
+        parser.add_argument('--start-at', type=float, default=0, help=argparse.SUPPRESS)
+
+    def handle(self, *args, **options):
+        if options['worker'] is not None:
+            return self.run_worker(options['worker'], options['start_at'], options['duration'])
+
+        modes = [mode.strip() for mode in options['modes'].split(',') if mode.strip()]
+        if set(modes) - set(MODES):
+            raise CommandError(f"Unknown modes: {', '.join(sorted(set(modes) - set(MODES)))}")
+
+        self.stdout.write(f"{'mode':<10}{'commits/s':>11}{'commits':>9}{'locked':>8}{'p50 ms':>9}{'p95 ms':>9}")
+        with tempfile.TemporaryDirectory() as directory:
+            for mode in modes:
+                path = Path(directory) / f'{mode}.sqlite3'
+                summary = self.run_mode(mode, path, options['workers'], options['duration'])
+                self.stdout.write(
+                    f"{mode:<10}{summary['commits_per_second']:>11.1f}{summary['commits']:>9}"
+                    f"{summary['locked_errors']:>8}{summary['p50_ms']:>9.1f}{summary['p95_ms']:>9.1f}"
+                )
+
+    def run_mode(self, mode, path, workers, duration):
+        with closing(sqlite3.connect(path)) as scratch:
+            scratch.executescript("""
+                CREATE TABLE bench_completion (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT, worker INTEGER NOT NULL, item INTEGER NOT NULL
+                );
+                CREATE INDEX bench_completion_item ON bench_completion (worker, item);
+                CREATE TABLE bench_counter (id INTEGER PRIMARY KEY, value INTEGER NOT NULL);
+                INSERT INTO bench_counter (id, value) VALUES (1, 0);
+            """)
+
+        env = {**os.environ, 'SQLITE_PATH': str(path), 'SQLITE_TUNING': MODES[mode]}
+        # Workers wait for a common start time so Django's startup is not measured
+        start_at = time.time() + 3
+        processes = [
+            subprocess.Popen(
+                [sys.executable, str(Path(settings.BASE_DIR) / 'manage.py'), 'bench_db_writes',
+                 '--worker', str(worker), '--start-at', str(start_at), '--duration', str(duration)],
+                env=env, stdout=subprocess.PIPE, text=True,
+            )
+            for worker in range(workers)
+        ]
+        results = []
+        for process in processes:
+            output, _ = process.communicate()
+            if process.returncode:
+                raise CommandError(f'Worker failed in {mode} mode')
+            results.append(json.loads(output.strip().splitlines()[-1]))
+
+        latencies = sorted(latency for result in results for latency in result['latencies_ms'])
+        commits = sum(result['commits'] for result in results)
+        return {
+            'commits': commits,
+            'commits_per_second': commits / duration,
+            'locked_errors': sum(result['locked_errors'] for result in results),
+            'p50_ms': percentile(latencies, 50) or 0,
+            'p95_ms': percentile(latencies, 95) or 0,
+        }
+
+    def run_worker(self, worker, start_at, duration):
+        if settings.SQLITE_TUNING:
+            run = retry_on_locked(write_transaction)
+        else:
+            def run(*args):
+                with transaction.atomic():
+                    write_transaction(*args)
+
+        time.sleep(max(0, start_at - time.time()))
+        deadline = start_at + duration
+        commits = locked_errors = 0
+        latencies = []
+        item = 0
+        while time.time() < deadline:
+            item = (item + 1) % 50
+            started = time.perf_counter()
+            try:
+                run(worker, item)
+            except OperationalError as error:
+                if not is_locked_error(error):
+                    raise
+                locked_errors += 1
+            else:
+                commits += 1
+                latencies.append((time.perf_counter() - started) * 1000)
+            # End of "request": closes the connection unless CONN_MAX_AGE keeps it
+            close_old_connections()
+
+        self.stdout.write(json.dumps({
+            'commits': commits,
+            'locked_errors': locked_errors,
+            'latencies_ms': latencies,
+        }))
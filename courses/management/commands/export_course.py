@@ -0,0 +1,47 @@
+"""
+Management command to export courses to a bundle file
+
+Writes the courses, their modules, code examples, exercises, capstone
+projects and the media they refer to into one gzipped JSON Lines bundle
+(see courses.bundles), for import_course to load on another site.
+
+    python manage.py export_course python-data-analysis -o python.jsonl.gz
+"""
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from courses.bundles import export_bundle
+from courses.models import Course
+
+
+class Command(BaseCommand):
+    help = 'Export courses with their content and media to a compressed bundle'
+
+    def add_arguments(self, parser):
+        parser.add_argument('slugs', nargs='*', help='Courses to export')
+        parser.add_argument('--all', action='store_true', help='Export every course')
+        parser.add_argument('-o', '--output', required=True, help='Bundle file to write (.jsonl.gz)')
+        parser.add_argument('--batch-size', type=int, default=50, help='Courses read per batch')
+
+    def handle(self, *args, **options):
+        if options['all'] == bool(options['slugs']):
+            raise CommandError('Give course slugs or --all')
+        courses = Course.objects.all()
+        if options['slugs']:
+            courses = courses.filter(slug__in=options['slugs'])
+            missing = set(options['slugs']) - set(courses.values_list('slug', flat=True))
+            if missing:
+                raise CommandError(f"Unknown courses: {', '.join(sorted(missing))}")
+
+        started = time.perf_counter()
+        counts = export_bundle(courses, options['output'], batch_size=options['batch_size'])
+        missing_media = counts.pop('missing_media', 0)
+        self.stdout.write(self.style.SUCCESS(
+            f"Exported {counts.get('course', 0)} courses to {options['output']} "
+            f"({os.path.getsize(options['output']) / 1024 / 1024:.1f} MB) in {time.perf_counter() - started:.1f}s: "
+            + ', '.join(f'{count} {record_type}' for record_type, count in counts.items() if record_type != 'course')
+        ))
+        if missing_media:
+            self.stderr.write(f'{missing_media} referenced media files were missing and are not in the bundle')
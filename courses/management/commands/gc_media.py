@@ -0,0 +1,206 @@
+"""
+Management command to delete media files that nothing refers to
+
+Works in three passes, with memory bounded by the batch size rather than
+the size of the media tree:
+
+1. References: every FileField/ImageField value, every MEDIA_URL path in
+   text fields (CKEditor HTML, including srcset entries) and every string in
+   JSON fields (image variant lists) is streamed into a scratch SQLite table.
+2. Names: the files under MEDIA_ROOT are walked and looked up in that table
+   in batches; unreferenced files older than --min-age-hours are deleted.
+   With --dedupe, referenced files saved before ContentHashedStorage was
+   introduced are turned into links to their blob.
+3. Blobs: blobs under MEDIA_ROOT/.blobs whose link count shows no remaining
+   names are deleted.
+
+The age limit keeps files that were just uploaded but whose row is not
+saved yet, such as CKEditor images in an unsaved post.
+
+    python manage.py gc_media --dry-run -v 2
+"""
+import json
+import os
+import re
+import sqlite3
+import stat
+import tempfile
+import time
+from contextlib import closing
+from itertools import islice
+from pathlib import Path
+from urllib.parse import unquote
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import models
+
+from core.storage import BLOB_DIR, ContentHashedStorage
+
+
+def walk_files(root, skip=()):
+    """Yield os.DirEntry objects of regular files below root, depth first, skipping dot files"""
+    stack = [root]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.name.startswith('.') or entry.path in skip:
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    yield entry
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def json_strings(value):
+    if isinstance(value, str):
+        yield value
+    elif isinstance(value, dict):
+        for item in value.values():
+            yield from json_strings(item)
+    elif isinstance(value, list):
+        for item in value:
+            yield from json_strings(item)
+
+
+def format_bytes(size):
+    return f'{size / 1024 / 1024:.1f} MB'
+
+
+class Command(BaseCommand):
+    help = 'Delete media files and blobs that no database row refers to'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report what would be deleted')
+        parser.add_argument('--min-age-hours', type=float, default=24 * 7,
+                            help='Never delete files modified more recently than this')
+        parser.add_argument('--dedupe', action='store_true',
+                            help='Also link referenced pre-existing files to shared blobs')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if not isinstance(default_storage, FileSystemStorage):
+            raise CommandError('gc_media only supports filesystem media storage')
+        self.dry_run = options['dry_run']
+        self.verbosity = options['verbosity']
+        self.batch_size = options['batch_size']
+        self.cutoff = time.time() - options['min_age_hours'] * 3600
+        self.media_url_re = re.compile(re.escape(settings.MEDIA_URL) + r'''([^"'\s<>?#]+)''')
+        root = default_storage.location
+        if not os.path.isdir(root):
+            self.stdout.write('No media directory')
+            return
+
+        with tempfile.TemporaryDirectory() as directory, \
+                closing(sqlite3.connect(Path(directory) / 'gc_media.sqlite3')) as scratch:
+            scratch.executescript("""
+                CREATE TABLE reference (name TEXT PRIMARY KEY) WITHOUT ROWID;
+                CREATE TABLE removed (inode INTEGER NOT NULL);
+                CREATE INDEX removed_inode ON removed (inode);
+            """)
+            self.collect_references(scratch)
+            self.sweep_names(scratch, root, options['dedupe'])
+            blob_root = os.path.join(root, BLOB_DIR)
+            if os.path.isdir(blob_root):
+                self.sweep_blobs(scratch, blob_root)
+
+    def collect_references(self, scratch):
+        total = 0
+        for model in apps.get_models():
+            fields = [
+                field for field in model._meta.concrete_fields
+                # CKEditor5Field is not a TextField subclass, only stored as one
+                if isinstance(field, (models.FileField, models.JSONField)) or field.get_internal_type() == 'TextField'
+            ]
+            if not fields:
+                continue
+            rows = model._base_manager.values_list(*[field.attname for field in fields]).iterator(chunk_size=2000)
+            for batch in batched(rows, self.batch_size):
+                names = [name for row in batch for name in self.referenced_names(fields, row)]
+                scratch.executemany('INSERT OR IGNORE INTO reference (name) VALUES (?)', [(name,) for name in names])
+                total += len(names)
+        scratch.commit()
+        count = scratch.execute('SELECT COUNT(*) FROM reference').fetchone()[0]
+        self.stdout.write(f'References: {count} distinct media names ({total} references)')
+
+    def referenced_names(self, fields, row):
+        for field, value in zip(fields, row):
+            if not value:
+                continue
+            if isinstance(field, models.FileField):
+                yield value
+            elif isinstance(field, models.JSONField):
+                if isinstance(value, str):
+                    # Some backends return undecoded JSON from values_list()
+                    value = json.loads(value)
+                yield from json_strings(value)
+            else:
+                for match in self.media_url_re.finditer(value):
+                    yield unquote(match.group(1))
+
+    def sweep_names(self, scratch, root, dedupe):
+        unreferenced = freed = deduped = 0
+        entries = walk_files(root, skip={os.path.join(root, BLOB_DIR)})
+        for batch in batched(entries, self.batch_size):
+            names = {os.path.relpath(entry.path, root).replace(os.sep, '/'): entry for entry in batch}
+            placeholders = ', '.join('?' * len(names))
+            referenced = {
+                name for (name,) in
+                scratch.execute(f'SELECT name FROM reference WHERE name IN ({placeholders})', list(names))
+            }
+            for name, entry in names.items():
+                info = entry.stat(follow_symlinks=False)
+                if name in referenced:
+                    if dedupe and info.st_nlink == 1 and isinstance(default_storage, ContentHashedStorage):
+                        deduped += 1
+                        if not self.dry_run:
+                            default_storage.adopt(entry.path)
+                    continue
+                if info.st_mtime > self.cutoff:
+                    continue
+                unreferenced += 1
+                if info.st_nlink > 1:
+                    # Its blob is freed in the next pass if this was the last name
+                    scratch.execute('INSERT INTO removed (inode) VALUES (?)', [info.st_ino])
+                else:
+                    freed += info.st_size
+                if self.verbosity >= 2:
+                    self.stdout.write(f'  {name}')
+                if not self.dry_run:
+                    os.remove(entry.path)
+
+        verb = 'would be' if self.dry_run else 'were'
+        self.stdout.write(f'Names: {unreferenced} unreferenced files {verb} deleted, '
+                          f'{format_bytes(freed)} in unshared files')
+        if dedupe:
+            self.stdout.write(f'Dedupe: {deduped} files {verb} linked to blobs')
+
+    def sweep_blobs(self, scratch, blob_root):
+        count = freed = 0
+        for entry in walk_files(blob_root):
+            info = entry.stat(follow_symlinks=False)
+            if info.st_mtime > self.cutoff or not stat.S_ISREG(info.st_mode):
+                continue
+            links = info.st_nlink
+            if self.dry_run:
+                links -= scratch.execute('SELECT COUNT(*) FROM removed WHERE inode = ?', [info.st_ino]).fetchone()[0]
+            # Leftovers of interrupted uploads under tmp/ have no other names either
+            if links > 1:
+                continue
+            count += 1
+            freed += info.st_size
+            if not self.dry_run:
+                os.remove(entry.path)
+
+        verb = 'would be' if self.dry_run else 'were'
+        self.stdout.write(self.style.SUCCESS(
+            f'Blobs: {count} unreferenced blobs {verb} deleted, {format_bytes(freed)} {verb} freed'
+        ))
@@ -0,0 +1,87 @@
+"""
+Management command to grade pending exercise submissions
+
+The web process grades submissions in memory (ExerciseGradingService), so
+submissions still pending after a restart, or marked failed when no sandbox
+worker was available, are graded here. Grading runs --workers submissions
+at a time, each in its own sandbox worker. Of submissions with identical
+code for the same exercise, common in a deadline burst, only the first is
+run; the others copy its result once it is in.
+
+    python manage.py grade_submissions --workers 8
+"""
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from courses.models import ExerciseSubmission
+from courses.runner import grading_pool
+from courses.services import ExerciseGradingService
+
+
+class Command(BaseCommand):
+    help = 'Grade pending and failed exercise submissions in parallel sandboxes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Submissions graded at once')
+        parser.add_argument('--exercise', type=int, action='append', help='Only this exercise ID (repeatable)')
+        parser.add_argument('--pending-only', action='store_true', help='Leave failed submissions alone')
+
+    def handle(self, *args, **options):
+        submissions = ExerciseSubmission.objects.filter(
+            status__in=['pending'] if options['pending_only'] else ['pending', 'failed']
+        )
+        if options['exercise']:
+            submissions = submissions.filter(exercise_id__in=options['exercise'])
+        first_ids, duplicate_ids = {}, []
+        for pk, exercise_id, content_hash in submissions.order_by('submitted_at').values_list(
+            'pk', 'exercise_id', 'content_hash'
+        ):
+            if first_ids.setdefault((exercise_id, content_hash), pk) != pk:
+                duplicate_ids.append(pk)
+        submission_ids = list(first_ids.values()) + duplicate_ids
+        if not submission_ids:
+            self.stdout.write('No submissions to grade')
+            return
+
+        started = time.perf_counter()
+        grading_pool.start(options['workers'])
+        self.stdout.write(f"Grading {len(submission_ids)} submissions ({len(duplicate_ids)} duplicates) "
+                          f"with {options['workers']} workers "
+                          f"({grading_pool.runtime}, started in {time.perf_counter() - started:.1f}s)")
+
+        started = time.perf_counter()
+        if options['workers'] > 1:
+            with ThreadPoolExecutor(options['workers']) as executor:
+                list(executor.map(self.grade_in_thread, first_ids.values()))
+        else:
+            for submission_id in first_ids.values():
+                self.grade(submission_id)
+        # Now served from the results above
+        for submission_id in duplicate_ids:
+            self.grade(submission_id)
+        elapsed = time.perf_counter() - started
+        grading_pool.stop()
+
+        counts = dict.fromkeys(('graded', 'failed', 'pending'), 0)
+        for status in ExerciseSubmission.objects.filter(pk__in=submission_ids).values_list('status', flat=True):
+            counts[status] += 1
+        self.stdout.write(self.style.SUCCESS(
+            f"Graded {counts['graded']} submissions in {elapsed:.1f}s "
+            f"({len(submission_ids) / elapsed:.1f}/s), {counts['failed']} failed"
+        ))
+
+    def grade(self, submission_id):
+        try:
+            ExerciseGradingService.grade(submission_id)
+        except Exception as error:
+            self.stderr.write(f'Submission {submission_id}: {error}')
+
+    def grade_in_thread(self, submission_id):
+        try:
+            self.grade(submission_id)
+        finally:
+            connections.close_all()
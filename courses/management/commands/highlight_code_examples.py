@@ -0,0 +1,54 @@
+"""
+Management command to pre-render the syntax highlighting of code examples
+
+CodeExample.save() highlights new and edited examples. This command
+backfills examples saved before that, and re-renders all of them after a
+Pygments upgrade changes its output. With --css it also writes the token
+colours for CODE_HIGHLIGHT_STYLE to the static stylesheet the module
+pages link to.
+
+    python manage.py highlight_code_examples --css
+"""
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from courses.highlighting import refresh_highlighting, stylesheet
+from courses.models import CodeExample
+
+STYLESHEET = Path(settings.BASE_DIR) / 'core' / 'static' / 'core' / 'css' / 'highlight.css'
+
+
+class Command(BaseCommand):
+    help = 'Render and store Pygments highlighting for code examples'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Re-render examples that are up to date')
+        parser.add_argument('--css', action='store_true', help=f'Write the stylesheet to {STYLESHEET}')
+        parser.add_argument('--batch-size', type=int, default=200)
+
+    def handle(self, *args, **options):
+        if options['css']:
+            STYLESHEET.parent.mkdir(parents=True, exist_ok=True)
+            STYLESHEET.write_text(
+                f'/* Generated by "manage.py highlight_code_examples --css" from the Pygments '
+                f'{settings.CODE_HIGHLIGHT_STYLE!r} style */\n' + stylesheet(settings.CODE_HIGHLIGHT_STYLE) + '\n'
+            )
+            self.stdout.write(f'Wrote {STYLESHEET}')
+
+        examples = CodeExample.objects.only('pk', 'code', 'language', 'highlighted_code', 'highlight_hash')
+        changed = []
+        total = updated = 0
+        for example in examples.iterator(chunk_size=options['batch_size']):
+            total += 1
+            if options['force']:
+                example.highlight_hash = ''
+            if refresh_highlighting(example):
+                changed.append(example)
+                updated += 1
+            if len(changed) >= options['batch_size']:
+                CodeExample.objects.bulk_update(changed, ['highlighted_code', 'highlight_hash'])
+                changed = []
+        CodeExample.objects.bulk_update(changed, ['highlighted_code', 'highlight_hash'])
+        self.stdout.write(self.style.SUCCESS(f'Highlighted {updated} of {total} code examples'))
@@ -0,0 +1,48 @@
+"""
+Management command to import courses from a bundle file
+
+Loads a bundle written by export_course and upserts its courses by slug,
+and their modules, code examples, exercises and capstone projects by
+order, in one transaction (see courses.bundles). Existing rows keep their
+primary keys, so enrollments and submissions stay attached.
+
+--dry-run lists what the import would add ("+") or change ("~", with the
+changed fields) without writing anything, media included.
+
+    python manage.py import_course python.jsonl.gz --dry-run
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from courses.bundles import BundleError, diff_bundle, import_bundle, load_bundle
+
+
+class Command(BaseCommand):
+    help = 'Create or update courses from a bundle written by export_course'
+
+    def add_arguments(self, parser):
+        parser.add_argument('bundle', help='Bundle file (.jsonl.gz)')
+        parser.add_argument('--dry-run', action='store_true', help='Show what would change and write nothing')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            records = load_bundle(options['bundle'], dry_run=options['dry_run'])
+        except (OSError, ValueError, BundleError) as error:
+            raise CommandError(f"{options['bundle']}: {error}")
+
+        if options['dry_run']:
+            lines = diff_bundle(records)
+            for line in lines:
+                self.stdout.write(line)
+            self.stdout.write(f"{len(lines)} changes in {len(records.get('course', []))} courses")
+            return
+
+        result = import_bundle(records)
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {len(result['created'])} new and {len(result['updated'])} existing courses "
+            f"in {time.perf_counter() - started:.1f}s: {result['coursemodule']} modules, "
+            f"{result['codeexample']} code examples, {result['exercise']} exercises, "
+            f"{result['capstoneproject']} capstone projects, {len(records['media'])} media files"
+        ))
@@ -0,0 +1,57 @@
+"""
+Management command to import course content from the Markdown curricula
+
+Reads the curriculum documents shipped with the repository (or the files
+given) and upserts each course's modules, code examples, exercises and
+capstone project (see courses.curriculum). Importing an unchanged document
+again changes nothing, so the command can run on every deploy. A course
+that does not exist yet is created unpublished in --category, so its
+pricing and copy can be reviewed before it goes live.
+
+    python manage.py import_course_markdown Python_for_Data_Analysis_Course.md --category beginner
+"""
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from courses.curriculum import CurriculumError, import_curriculum, parse_curriculum
+from courses.models import CourseCategory
+
+
+class Command(BaseCommand):
+    help = 'Create or update course modules, code examples, exercises and capstones from Markdown curricula'
+
+    def add_arguments(self, parser):
+        parser.add_argument('files', nargs='*', help='Curriculum documents (default: *_Course.md in the project root)')
+        parser.add_argument('--category', choices=[name for name, _ in CourseCategory.CATEGORY_CHOICES],
+                            help='Category for courses that do not exist yet')
+        parser.add_argument('--dry-run', action='store_true', help='Parse the documents and report what they hold')
+
+    def handle(self, *args, **options):
+        paths = [Path(name) for name in options['files']] or sorted(Path(settings.BASE_DIR).glob('*_Course.md'))
+        if not paths:
+            raise CommandError('No curriculum documents found')
+
+        for path in paths:
+            started = time.perf_counter()
+            try:
+                curriculum = parse_curriculum(path.read_text(encoding='utf-8'))
+                if options['dry_run']:
+                    counts = {
+                        'modules': len(curriculum['modules']),
+                        'code_examples': sum(len(module['code_examples']) for module in curriculum['modules']),
+                        'exercises': sum(len(module['exercises']) for module in curriculum['modules']),
+                        'capstone_projects': int(bool(curriculum['capstone'])),
+                    }
+                else:
+                    counts = import_curriculum(curriculum, options['category'])
+            except (OSError, CurriculumError) as error:
+                raise CommandError(f'{path}: {error}')
+            action = 'Parsed' if options['dry_run'] else 'Created' if counts.get('created') else 'Updated'
+            self.stdout.write(self.style.SUCCESS(
+                f"{action} {curriculum['slug']} from {path.name}: {counts['modules']} modules, "
+                f"{counts['code_examples']} code examples, {counts['exercises']} exercises, "
+                f"{counts['capstone_projects']} capstone projects ({time.perf_counter() - started:.2f}s)"
+            ))
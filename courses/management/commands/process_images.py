@@ -0,0 +1,75 @@
+"""
+Management command to build responsive image variants for existing uploads
+
+New uploads get their variants from a background task (core.images). This
+command backfills the images uploaded before that, or rebuilds all of them
+with --force after IMAGE_VARIANT_WIDTHS or IMAGE_VARIANT_QUALITY change.
+Decoding and encoding run in a pool of --workers processes; the database
+is only written from this process.
+
+    python manage.py process_images --workers 4
+"""
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from core.images import RESPONSIVE_IMAGE_FIELDS, build_variants, needs_variants, variants_field_name
+
+
+class Command(BaseCommand):
+    help = 'Build responsive image variants for uploaded images'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Image processing processes')
+        parser.add_argument('--model', action='append', default=None,
+                            help=f"Only this model (repeatable): {', '.join(RESPONSIVE_IMAGE_FIELDS)}")
+        parser.add_argument('--force', action='store_true', help='Rebuild variants that are already current')
+
+    def handle(self, *args, **options):
+        labels = options['model'] or list(RESPONSIVE_IMAGE_FIELDS)
+        unknown = set(labels) - set(RESPONSIVE_IMAGE_FIELDS)
+        if unknown:
+            raise CommandError(f"Unknown models: {', '.join(sorted(unknown))}")
+
+        jobs = []
+        for label in labels:
+            model = apps.get_model(label)
+            for field_name in RESPONSIVE_IMAGE_FIELDS[label]:
+                queryset = model._default_manager.exclude(**{field_name: ''}).exclude(**{f'{field_name}__isnull': True})
+                for instance in queryset.only('pk', field_name, variants_field_name(field_name)).iterator():
+                    if options['force'] or needs_variants(instance, field_name):
+                        jobs.append((model, instance.pk, field_name, getattr(instance, field_name).name))
+        if not jobs:
+            self.stdout.write('All image variants are up to date')
+            return
+
+        self.stdout.write(f"Processing {len(jobs)} images with {options['workers']} workers")
+        started = time.perf_counter()
+        processed = failed = 0
+        # Forked workers must not inherit open database connections
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        with ProcessPoolExecutor(max_workers=options['workers'], mp_context=context) as pool:
+            futures = {pool.submit(build_variants, job[3]): job for job in jobs}
+            for future in as_completed(futures):
+                model, pk, field_name, source_name = futures[future]
+                try:
+                    variants = future.result()
+                except Exception as error:
+                    failed += 1
+                    self.stderr.write(f'{model._meta.label} {pk}: {source_name}: {error}')
+                    continue
+                # Skip instances whose image was replaced while the batch ran; their own task handles them
+                model._default_manager.filter(pk=pk, **{field_name: source_name}).update(
+                    **{variants_field_name(field_name): variants}
+                )
+                processed += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Processed {processed} images in {time.perf_counter() - started:.1f}s' + (f', {failed} failed' if failed else '')
+        ))
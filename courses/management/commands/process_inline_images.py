@@ -0,0 +1,67 @@
+"""
+Management command to optimize images already embedded in CKEditor content
+
+Images uploaded through the editor since CKEditorUploadStorage was
+introduced are downscaled and stripped of EXIF on upload, and saving a row
+adds srcset attributes to them (core.images). This command gives content
+written before that the same treatment: each embedded upload is re-encoded
+(kept only when that makes it smaller or removes EXIF data), its <img> tag
+is pointed at the new file and given responsive variants.
+
+The replaced originals stay on disk until gc_media finds them unreferenced.
+
+    python manage.py process_inline_images --dry-run
+"""
+import time
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+
+from core.images import INLINE_IMAGE_FIELDS, needs_inline_rewrite, update_inline_images
+
+
+class Command(BaseCommand):
+    help = 'Re-encode images embedded in CKEditor content and add responsive srcsets'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', action='append', default=None,
+                            help=f"Only this model (repeatable): {', '.join(INLINE_IMAGE_FIELDS)}")
+        parser.add_argument('--dry-run', action='store_true', help='Only count the rows that would be rewritten')
+
+    def handle(self, *args, **options):
+        labels = options['model'] or list(INLINE_IMAGE_FIELDS)
+        unknown = set(labels) - set(INLINE_IMAGE_FIELDS)
+        if unknown:
+            raise CommandError(f"Unknown models: {', '.join(sorted(unknown))}")
+
+        started = time.perf_counter()
+        pending = rewritten = failed = 0
+        for label in labels:
+            model = apps.get_model(label)
+            field_names = INLINE_IMAGE_FIELDS[label]
+            for instance in model._default_manager.only('pk', *field_names).iterator():
+                if not any(needs_inline_rewrite(getattr(instance, field_name)) for field_name in field_names):
+                    continue
+                pending += 1
+                if options['dry_run']:
+                    if options['verbosity'] >= 2:
+                        self.stdout.write(f'  {label} {instance.pk}')
+                    continue
+                try:
+                    changed = update_inline_images(label, instance.pk, recompress_originals=True)
+                except Exception as error:
+                    failed += 1
+                    self.stderr.write(f'{label} {instance.pk}: {error}')
+                    continue
+                if changed:
+                    rewritten += 1
+                    if options['verbosity'] >= 2:
+                        self.stdout.write(f"  {label} {instance.pk}: {', '.join(changed)}")
+
+        if options['dry_run']:
+            self.stdout.write(f'{pending} rows have embedded images to process')
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'Rewrote {rewritten} of {pending} rows in {time.perf_counter() - started:.1f}s'
+            + (f', {failed} failed' if failed else '')
+        ))
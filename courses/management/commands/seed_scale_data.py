@@ -0,0 +1,402 @@
+"""
+Management command to fill a database with a large synthetic dataset
+
+Rows are generated from a seeded random generator and written with
+bulk_create, so two runs with the same options produce the same data and
+benchmark results stay comparable across commits. Use a dedicated database:
+
+    SQLITE_PATH=/tmp/scale.sqlite3 python manage.py migrate
+    SQLITE_PATH=/tmp/scale.sqlite3 python manage.py seed_scale_data
+
+Seeded accounts are named scale_learner_<n> and scale_instructor_<n>.
+"""
+import random
+import string
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+from itertools import islice
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from accounts.models import UserProfile
+from core.models import BlogPost, Event
+from courses.models import (
+    CapstoneProject, CodeExample, Course, CourseCategory, CourseModule, Enrollment,
+    Exercise, ModuleCompletion, PaymentInstallment, ProjectEnrollment
+)
+
+USERNAME_PREFIX = 'scale_'
+SLUG_PREFIX = 'scale-'
+PASSWORD = 'scale-password'
+
+FIRST_NAMES = ['Amina', 'Brian', 'Cynthia', 'David', 'Esther', 'Felix', 'Grace', 'Hassan', 'Irene', 'James',
+               'Kevin', 'Lucy', 'Mercy', 'Njeri', 'Otieno', 'Purity', 'Samuel', 'Tabitha', 'Wanjiru', 'Zawadi']
+LAST_NAMES = ['Achieng', 'Barasa', 'Chebet', 'Kamau', 'Kariuki', 'Mutua', 'Njoroge', 'Ochieng', 'Odhiambo',
+              'Omondi', 'Otieno', 'Wafula', 'Wambui', 'Wanjiku', 'Adeyemi', 'Okafor', 'Mensah', 'Banda']
+TOPICS = ['Python', 'SQL', 'Power BI', 'Excel', 'R', 'Tableau', 'Machine Learning', 'Statistics',
+          'Data Engineering', 'Deep Learning', 'Pandas', 'Data Visualization', 'Spark', 'Forecasting']
+LEVELS = ['Foundations', 'for Analysts', 'in Practice', 'Bootcamp', 'Masterclass', 'Advanced Techniques']
+LANGUAGES = ['python', 'python', 'python', 'sql', 'r']
+DIFFICULTIES = ['beginner', 'intermediate', 'advanced']
+DEFAULT_CATEGORIES = [
+    ('beginner', 'Beginner Courses'),
+    ('intermediate', 'Intermediate Courses'),
+    ('advanced', 'Advanced Programs'),
+    ('masterclass', 'Masterclasses & Short Workshops'),
+]
+
+
+@contextmanager
+def explicit_timestamps(*models):
+    """Let bulk_create keep the generated created_at/completed_at values"""
+    fields = [
+        field for model in models for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now_add', False) or getattr(field, 'auto_now', False)
+    ]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class Command(BaseCommand):
+    help = 'Generate a large, reproducible synthetic dataset for load benchmarks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100000, help='Number of learners')
+        parser.add_argument('--courses', type=int, default=500, help='Number of courses')
+        parser.add_argument('--modules-per-course', type=int, default=10)
+        parser.add_argument('--enrollments', type=int, default=300000)
+        parser.add_argument('--completions', type=int, default=1000000, help='Number of module completions')
+        parser.add_argument('--posts', type=int, default=2000, help='Number of blog posts')
+        parser.add_argument('--events', type=int, default=500)
+        parser.add_argument(
+            '--scale', type=float, default=1.0,
+            help='Multiply every row count, e.g. 0.01 for a quick local dataset',
+        )
+        parser.add_argument('--seed', type=int, default=42, help='Random seed')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Seed even though DEBUG is off (never point this at production)',
+        )
+
+    def handle(self, *args, **options):
+        if not settings.DEBUG and not options['force']:
+            raise CommandError('DEBUG is off. Seed a dedicated benchmark database and pass --force.')
+        if User.objects.filter(username__startswith=USERNAME_PREFIX).exists():
+            raise CommandError('Scale data is already present; seed a fresh database.')
+
+        scale = options['scale']
+        counts = {
+            name: max(1, int(options[name] * scale))
+            for name in ('users', 'courses', 'enrollments', 'completions', 'posts', 'events')
+        }
+        counts['enrollments'] = min(counts['enrollments'], counts['users'] * counts['courses'])
+        self.modules_per_course = options['modules_per_course']
+        self.batch_size = options['batch_size']
+        self.rng = random.Random(options['seed'])
+        self.now = timezone.now().replace(microsecond=0)
+        self.password = make_password(PASSWORD)
+
+        started = time.monotonic()
+        with explicit_timestamps(User, UserProfile, Course, CourseModule, CodeExample, Exercise,
+                                 CapstoneProject, Enrollment, PaymentInstallment, ModuleCompletion,
+                                 ProjectEnrollment, BlogPost, Event):
+            instructors = self.create_users('instructor', max(1, counts['courses'] // 10))
+            learners = self.create_users('learner', counts['users'])
+            courses = self.create_courses(counts['courses'], instructors)
+            enrollments = self.create_enrollments(counts['enrollments'], learners, courses)
+            self.create_completions(counts['completions'], enrollments)
+            self.create_project_enrollments(enrollments)
+            self.create_posts_and_events(counts['posts'], counts['events'], instructors[0])
+
+        from courses.services import ProjectStatsService
+        ProjectStatsService.rebuild()
+        if connection.vendor in ('sqlite', 'postgresql'):
+            with connection.cursor() as cursor:
+                # Fresh planner statistics, also used by EstimatedCountPaginator
+                cursor.execute('ANALYZE')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Seeded scale data in {time.monotonic() - started:.0f}s '
+            f'(password for all seeded accounts: {PASSWORD})'
+        ))
+
+    def bulk_create(self, model, rows, keep=True):
+        """
+        Insert an iterable of unsaved instances in batches
+
+        Returns the instances, with primary keys, unless ``keep`` is False
+        (which keeps memory flat for the largest tables).
+        """
+        rows = iter(rows)
+        created = []
+        total = 0
+        while True:
+            batch = list(islice(rows, self.batch_size))
+            if not batch:
+                break
+            with transaction.atomic():
+                model.objects.bulk_create(batch)
+            total += len(batch)
+            if keep:
+                created.extend(batch)
+        self.stdout.write(f'  {model._meta.verbose_name_plural}: {total}')
+        return created
+
+    def random_past(self, days=730):
+        return self.now - timedelta(seconds=self.rng.randrange(days * 86400))
+
+    def create_users(self, role, count):
+        rng = self.rng
+        users = self.bulk_create(User, (
+            User(
+                username=f'{USERNAME_PREFIX}{role}_{number}',
+                email=f'{USERNAME_PREFIX}{role}_{number}@example.com',
+                first_name=rng.choice(FIRST_NAMES),
+                last_name=rng.choice(LAST_NAMES),
+                password=self.password,
+                date_joined=self.random_past(),
+            )
+            for number in range(count)
+        ))
+        # Profiles are normally created by the post_save signal, which bulk_create skips
+        self.bulk_create(UserProfile, (
+            UserProfile(
+                user_id=user.pk, role=role, is_email_verified=True,
+                created_at=user.date_joined, updated_at=user.date_joined,
+            )
+            for user in users
+        ))
+        return users
+
+    def create_courses(self, count, instructors):
+        rng = self.rng
+        categories = []
+        for order, (name, display_name) in enumerate(DEFAULT_CATEGORIES):
+            category, _ = CourseCategory.objects.get_or_create(
+                name=name, defaults={'display_name': display_name, 'description': display_name,
+                                     'icon': 'fas fa-chart-line', 'order': order}
+            )
+            categories.append(category)
+
+        courses = []
+        for number in range(count):
+            created_at = self.random_past()
+            title = f'{rng.choice(TOPICS)} {rng.choice(LEVELS)} {number}'
+            price = Decimal(rng.randrange(50, 500) * 100)
+            courses.append(Course(
+                title=title,
+                slug=f'{SLUG_PREFIX}course-{number}',
+                instructor=instructors[number % len(instructors)],
+                category=rng.choice(categories),
+                overview=f'<p>{title} overview.</p>',
+                description=f'<p>{title} takes you from first principles to real projects.</p>' * 5,
+                duration=f'{rng.randrange(4, 16)} weeks',
+                schedule=rng.choice(['Online, evenings', 'Online, weekends', 'Hybrid']),
+                learning_outcomes='<ul><li>Clean data</li><li>Build models</li><li>Present results</li></ul>',
+                tools_software='Python, SQL, Power BI',
+                price=price,
+                discount_price=price * Decimal('0.8') if rng.random() < 0.3 else None,
+                is_featured=rng.random() < 0.02,
+                is_active=rng.random() < 0.95,
+                total_modules=self.modules_per_course,
+                estimated_hours=self.modules_per_course * 4,
+                created_at=created_at,
+                updated_at=created_at,
+            ))
+        courses = self.bulk_create(Course, courses)
+
+        modules = self.bulk_create(CourseModule, (
+            CourseModule(
+                course=course, title=f'Module {order}: {rng.choice(TOPICS)}', order=order,
+                description=f'<p>Module {order} of {course.title}.</p>', duration_hours=4,
+                content='<p>' + 'Lesson text. ' * 200 + '</p>', created_at=course.created_at,
+            )
+            for course in courses for order in range(1, self.modules_per_course + 1)
+        ))
+        self.bulk_create(CodeExample, (
+            CodeExample(
+                module=module, title=f'Example {order}', order=order,
+                code=f'import pandas as pd\n\ndf = pd.DataFrame({{"x": range({order + 3})}})\nprint(df.sum())\n',
+                language=rng.choice(LANGUAGES), difficulty_level=rng.choice(DIFFICULTIES),
+                created_at=module.created_at,
+            )
+            for module in modules for order in range(1, 4)
+        ))
+        self.bulk_create(Exercise, (
+            Exercise(
+                module=module, title=f'Exercise {order}', order=order,
+                description='<p>Load the dataset and answer the questions.</p>',
+                difficulty_level=rng.choice(DIFFICULTIES), created_at=module.created_at,
+            )
+            for module in modules for order in range(1, 3)
+        ))
+        self.bulk_create(CapstoneProject, (
+            CapstoneProject(
+                course=course, title=f'{course.title} capstone {order}', order=order,
+                description='<p>Build an end-to-end analysis.</p>', requirements='<p>Python, SQL</p>',
+                evaluation_criteria='<p>Correctness and clarity</p>', deliverables='<p>Notebook and report</p>',
+                created_at=course.created_at,
+            )
+            for course in courses for order in range(1, 3)
+        ))
+
+        self.module_ids = {}
+        for module in modules:
+            self.module_ids.setdefault(module.course_id, []).append(module.pk)
+        self.project_ids = {}
+        for course_id, project_id in CapstoneProject.objects.filter(
+            course__in=courses
+        ).order_by('course_id', 'order').values_list('course_id', 'pk'):
+            self.project_ids.setdefault(course_id, []).append(project_id)
+        return courses
+
+    def create_enrollments(self, count, learners, courses):
+        rng = self.rng
+        per_user, remainder = divmod(count, len(learners))
+        codes = set()
+        enrollments = []
+        for index, learner in enumerate(learners):
+            for course in rng.sample(courses, per_user + (1 if index < remainder else 0)):
+                created_at = max(learner.date_joined, self.random_past())
+                outcome = rng.random()
+                installments = rng.choice([1, 1, 2, 3])
+                total = course.discount_price or course.price
+                if outcome < 0.2:
+                    status, payment_status, paid_installments = 'inactive', 'pending', 0
+                elif outcome < 0.3:
+                    status, payment_status, paid_installments = 'completed', 'verified', installments
+                else:
+                    status = 'active'
+                    paid_installments = rng.randint(1, installments)
+                    payment_status = 'verified' if paid_installments == installments else 'partial'
+
+                code = None
+                while code is None or code in codes:
+                    code = '-'.join(
+                        ''.join(rng.choices(string.ascii_uppercase + string.digits, k=4)) for _ in range(4)
+                    )
+                codes.add(code)
+                activated_at = created_at + timedelta(days=1) if status != 'inactive' else None
+                enrollment = Enrollment(
+                    id=uuid.UUID(int=rng.getrandbits(128), version=4),
+                    user=learner, course=course, payment_method=rng.choice(['mpesa', 'mpesa', 'paypal', 'bank']),
+                    total_amount=total, installments=installments,
+                    amount_paid=total * paid_installments / installments,
+                    payment_status=payment_status, enrollment_status=status, activation_code=code,
+                    is_activated=status != 'inactive', activated_at=activated_at,
+                    created_at=created_at, updated_at=activated_at or created_at,
+                )
+                enrollment.paid_installments = paid_installments
+                enrollments.append(enrollment)
+        enrollments = self.bulk_create(Enrollment, enrollments)
+
+        def installment_rows():
+            for enrollment in enrollments:
+                for number in range(enrollment.installments):
+                    paid = number < enrollment.paid_installments
+                    due = enrollment.created_at + timedelta(days=30 * number)
+                    yield PaymentInstallment(
+                        enrollment=enrollment, installment_number=number + 1,
+                        amount=(enrollment.total_amount / enrollment.installments).quantize(Decimal('0.01')),
+                        due_date=due.date(), status='verified' if paid else 'pending',
+                        payment_date=due if paid else None,
+                        created_at=enrollment.created_at, updated_at=enrollment.created_at,
+                    )
+
+        self.bulk_create(PaymentInstallment, installment_rows(), keep=False)
+        return enrollments
+
+    def create_completions(self, count, enrollments):
+        rng = self.rng
+        activated = [enrollment for enrollment in enrollments if enrollment.is_activated]
+        rng.shuffle(activated)
+
+        def rows():
+            remaining = count
+            for enrollment in activated:
+                module_ids = self.module_ids[enrollment.course_id]
+                done = len(module_ids) if enrollment.enrollment_status == 'completed' else rng.randint(
+                    0, len(module_ids)
+                )
+                # Learners work through the modules in order
+                for module_id in module_ids[:min(done, remaining)]:
+                    yield ModuleCompletion(
+                        enrollment=enrollment, module_id=module_id,
+                        completed_at=enrollment.activated_at + timedelta(hours=rng.randrange(1, 24 * 90)),
+                    )
+                remaining -= min(done, remaining)
+                if not remaining:
+                    return
+
+        self.bulk_create(ModuleCompletion, rows(), keep=False)
+
+    def create_project_enrollments(self, enrollments):
+        """Capstone work for completed enrollments and a slice of active ones, for the review queues"""
+        rng = self.rng
+
+        def rows():
+            for enrollment in enrollments:
+                if enrollment.enrollment_status == 'completed':
+                    status = 'completed'
+                elif enrollment.enrollment_status == 'active' and rng.random() < 0.1:
+                    status = rng.choice(['in_progress', 'submitted', 'submitted'])
+                else:
+                    continue
+                started_at = enrollment.activated_at + timedelta(days=rng.randrange(30, 90))
+                submitted_at = started_at + timedelta(days=14) if status != 'in_progress' else None
+                completed = status == 'completed'
+                yield ProjectEnrollment(
+                    enrollment=enrollment, project_id=self.project_ids[enrollment.course_id][0], status=status,
+                    started_at=started_at, submitted_at=submitted_at,
+                    completed_at=submitted_at + timedelta(days=3) if completed else None,
+                    reviewed_at=submitted_at + timedelta(days=3) if completed else None,
+                    reviewed_by_id=enrollment.course.instructor_id if completed else None,
+                    grade=Decimal(rng.randrange(50, 100)) if completed else None,
+                    submission_notes='Submitted for review.' if submitted_at else '',
+                    github_repo_url='https://github.com/example/capstone' if submitted_at else '',
+                )
+
+        self.bulk_create(ProjectEnrollment, rows(), keep=False)
+
+    def create_posts_and_events(self, post_count, event_count, author):
+        rng = self.rng
+
+        def posts():
+            for number in range(post_count):
+                created_at = self.random_past()
+                title = f'{rng.choice(TOPICS)} tips, part {number}'
+                yield BlogPost(
+                    title=title, slug=f'{SLUG_PREFIX}post-{number}', author=author,
+                    content='<p>' + 'Practical advice for analysts. ' * 100 + '</p>',
+                    excerpt=f'<p>{title}</p>', is_published=rng.random() < 0.9,
+                    created_at=created_at, updated_at=created_at,
+                )
+
+        def events():
+            for number in range(event_count):
+                event_date = self.now + timedelta(days=rng.randrange(-365, 180))
+                yield Event(
+                    title=f'{rng.choice(TOPICS)} webinar {number}', slug=f'{SLUG_PREFIX}event-{number}',
+                    description='<p>Live session with Q&amp;A.</p>', event_date=event_date,
+                    duration='2 hours', registration_deadline=event_date - timedelta(days=1),
+                    price=Decimal(rng.choice([0, 0, 500, 1000])), is_active=rng.random() < 0.9,
+                    created_at=event_date - timedelta(days=30),
+                )
+
+        self.bulk_create(BlogPost, posts(), keep=False)
+        self.bulk_create(Event, events(), keep=False)
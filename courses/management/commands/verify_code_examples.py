@@ -0,0 +1,175 @@
+"""
+Management command to check code examples against their expected output
+
+Runs every Python code example with an expected_output in the sandbox pool,
+--workers at a time, and diffs what it prints against what the lesson says
+it prints (normalised, see CodeExampleVerificationService). Examples whose
+code, expected output and runtime (Python and preloaded library versions)
+already passed are skipped, so after a pandas upgrade everything runs once
+and later runs only check what was edited.
+
+--accept writes the actual output into expected_output for examples that
+ran but printed something else; --junit and --json write reports for CI.
+The command fails when an example fails and was not accepted.
+
+    python manage.py verify_code_examples --workers 8 --junit reports/examples.xml
+"""
+import json
+import os
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from courses.models import CodeExample
+from courses.runner import RunnerUnavailable, pool
+from courses.services import CodeExampleVerificationService, CodeRunnerService
+
+
+class Command(BaseCommand):
+    help = 'Run code examples in sandboxes and diff their output against expected_output'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Examples run at once')
+        parser.add_argument('--course', action='append', help='Only this course slug (repeatable)')
+        parser.add_argument('--accept', action='store_true',
+                            help='Store the actual output as expected_output, including for examples without one')
+        parser.add_argument('--force', action='store_true', help='Verify examples that already passed too')
+        parser.add_argument('--junit', metavar='PATH', help='Write a JUnit XML report')
+        parser.add_argument('--json', metavar='PATH', help='Write a JSON report')
+
+    def handle(self, *args, **options):
+        examples = CodeExample.objects.select_related('module__course').order_by(
+            'module__course__slug', 'module__order', 'order', 'id'
+        )
+        if options['course']:
+            examples = examples.filter(module__course__slug__in=options['course'])
+        if not options['accept']:
+            examples = examples.exclude(expected_output='')
+        examples = [example for example in examples if CodeRunnerService.supports(example.language)]
+        if not examples:
+            self.stdout.write('No code examples to verify')
+            return
+
+        started = time.perf_counter()
+        try:
+            pool.start(options['workers'])
+        except RunnerUnavailable as error:
+            raise CommandError(str(error))
+        runtime = pool.runtime
+        self.stdout.write(f"Verifying {len(examples)} code examples with {options['workers']} workers ({runtime})")
+
+        hashes = {}
+        pending = []
+        for example in examples:
+            hashes[example.pk] = CodeExampleVerificationService.verification_hash(
+                example.code, example.expected_output, runtime
+            )
+            if options['force'] or example.verified_hash != hashes[example.pk]:
+                pending.append(example)
+
+        with ThreadPoolExecutor(options['workers']) as executor:
+            results = dict(zip(
+                [example.pk for example in pending],
+                executor.map(self.verify, [(example.code, example.expected_output) for example in pending]),
+            ))
+        pool.stop()
+        elapsed = time.perf_counter() - started
+
+        changed = []
+        for example in pending:
+            result = results[example.pk]
+            if result['status'] == 'failed' and options['accept']:
+                example.expected_output = result['stdout'].rstrip()
+                hashes[example.pk] = CodeExampleVerificationService.verification_hash(
+                    example.code, example.expected_output, runtime
+                )
+                result['status'] = 'accepted'
+            if result['status'] in ('passed', 'accepted'):
+                example.verified_hash = hashes[example.pk]
+                changed.append(example)
+            elif options['verbosity'] >= 1:
+                self.stderr.write(f"{self.label(example)}: {result['status']}\n{result['diff'] or result['stderr']}")
+        CodeExample.objects.bulk_update(changed, ['expected_output', 'verified_hash'], batch_size=500)
+
+        counts = dict.fromkeys(('passed', 'accepted', 'failed', 'error', 'timeout', 'unavailable'), 0)
+        for result in results.values():
+            counts[result['status']] += 1
+        skipped = len(examples) - len(pending)
+        if options['junit']:
+            self.write_junit(options['junit'], examples, results, elapsed)
+        if options['json']:
+            self.write_json(options['json'], examples, results, runtime, elapsed, counts, skipped)
+
+        failed = len(pending) - counts['passed'] - counts['accepted']
+        summary = (f"Verified {len(pending)} code examples in {elapsed:.1f}s: {counts['passed']} passed, "
+                   f"{counts['accepted']} accepted, {failed} failed, {skipped} skipped as already verified")
+        if failed:
+            raise CommandError(summary)
+        self.stdout.write(self.style.SUCCESS(summary))
+
+    def verify(self, args):
+        try:
+            return CodeExampleVerificationService.verify(*args)
+        except RunnerUnavailable as error:
+            return {'status': 'unavailable', 'stdout': '', 'stderr': str(error), 'diff': '', 'duration_ms': 0}
+
+    def label(self, example):
+        return f'{example.module.course.slug} / {example.module.title} / {example.title} (#{example.pk})'
+
+    def write_junit(self, path, examples, results, elapsed):
+        suite = ET.Element('testsuite', name='verify_code_examples', tests=str(len(examples)),
+                           time=f'{elapsed:.3f}', timestamp=timezone.now().isoformat())
+        failures = errors = skipped = 0
+        for example in examples:
+            case = ET.SubElement(suite, 'testcase', name=f'{example.title} (#{example.pk})',
+                                 classname=f'{example.module.course.slug}.module{example.module.order}')
+            result = results.get(example.pk)
+            if result is None:
+                skipped += 1
+                ET.SubElement(case, 'skipped', message='Already verified with this runtime')
+                continue
+            case.set('time', f"{result['duration_ms'] / 1000:.3f}")
+            if result['status'] == 'failed':
+                failures += 1
+                ET.SubElement(case, 'failure', message='Output differs from expected_output').text = result['diff']
+            elif result['status'] not in ('passed', 'accepted'):
+                errors += 1
+                ET.SubElement(case, 'error', message=result['status']).text = result['stderr']
+            if result['stdout']:
+                ET.SubElement(case, 'system-out').text = result['stdout']
+        suite.set('failures', str(failures))
+        suite.set('errors', str(errors))
+        suite.set('skipped', str(skipped))
+        self.ensure_directory(path)
+        ET.ElementTree(suite).write(path, encoding='utf-8', xml_declaration=True)
+
+    def write_json(self, path, examples, results, runtime, elapsed, counts, skipped):
+        report = {
+            'runtime': runtime,
+            'finished_at': timezone.now().isoformat(),
+            'seconds': round(elapsed, 3),
+            'summary': {**counts, 'skipped': skipped},
+            'examples': [
+                {
+                    'id': example.pk,
+                    'course': example.module.course.slug,
+                    'module': example.module.title,
+                    'title': example.title,
+                    **({'status': 'skipped'} if example.pk not in results else {
+                        key: results[example.pk][key] for key in ('status', 'duration_ms', 'diff', 'stderr')
+                    }),
+                }
+                for example in examples
+            ],
+        }
+        self.ensure_directory(path)
+        with open(path, 'w') as file:
+            json.dump(report, file, indent=2)
+
+    def ensure_directory(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
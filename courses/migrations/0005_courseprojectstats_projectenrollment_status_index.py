@@ -0,0 +1,69 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:37
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def populate_course_project_stats(apps, schema_editor):
+    """Build the initial counters from existing project enrollments"""
+    ProjectEnrollment = apps.get_model('courses', 'ProjectEnrollment')
+    CourseProjectStats = apps.get_model('courses', 'CourseProjectStats')
+
+    stats_by_course = {}
+    rows = ProjectEnrollment.objects.values_list(
+        'project__course_id', 'status', 'grade', 'submitted_at', 'reviewed_at'
+    ).iterator()
+    for course_id, status, grade, submitted_at, reviewed_at in rows:
+        stats = stats_by_course.setdefault(course_id, CourseProjectStats(course_id=course_id))
+        if status in ('in_progress', 'submitted', 'completed'):
+            counter = f'{status}_count'
+            setattr(stats, counter, getattr(stats, counter) + 1)
+        if status == 'completed' and grade is not None:
+            stats.graded_count += 1
+            stats.grade_total += grade
+        if status == 'completed' and submitted_at and reviewed_at:
+            stats.reviewed_count += 1
+            stats.review_seconds_total += max(0, int((reviewed_at - submitted_at).total_seconds()))
+
+    CourseProjectStats.objects.bulk_create(stats_by_course.values())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0004_projectenrollment_additional_links_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CourseProjectStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('in_progress_count', models.PositiveIntegerField(default=0)),
+                ('submitted_count', models.PositiveIntegerField(default=0)),
+                ('completed_count', models.PositiveIntegerField(default=0)),
+                ('graded_count', models.PositiveIntegerField(default=0)),
+                ('grade_total', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('reviewed_count', models.PositiveIntegerField(default=0)),
+                ('review_seconds_total', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Course Project Statistics',
+                'verbose_name_plural': 'Course Project Statistics',
+                'db_table': 'core_courseprojectstats',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='projectenrollment',
+            index=models.Index(fields=['status', 'submitted_at'], name='projenroll_status_submit_idx'),
+        ),
+        migrations.AddField(
+            model_name='courseprojectstats',
+            name='course',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='project_stats', to='courses.course'),
+        ),
+        migrations.RunPython(populate_course_project_stats, migrations.RunPython.noop),
+    ]
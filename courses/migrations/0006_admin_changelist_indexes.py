@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:42
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0005_courseprojectstats_projectenrollment_status_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='enrollment',
+            index=models.Index(fields=['created_at'], name='enrollment_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='modulecompletion',
+            index=models.Index(fields=['completed_at'], name='modcompletion_completed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='paymentinstallment',
+            index=models.Index(fields=['due_date'], name='installment_due_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='projectenrollment',
+            index=models.Index(fields=['started_at'], name='projenroll_started_idx'),
+        ),
+        # Exact email searches in the enrollment admins join on auth_user.email,
+        # which django.contrib.auth leaves unindexed. The index is this app's,
+        # not auth's: it is raw SQL because auth_user's migrations are not ours
+        # to add to, and migrating courses back before 0006 drops it again.
+        migrations.RunSQL(
+            'CREATE INDEX IF NOT EXISTS courses_auth_user_email_idx ON auth_user (email)',
+            reverse_sql='DROP INDEX IF EXISTS courses_auth_user_email_idx',
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:48
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0006_admin_changelist_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['category', 'created_at'], name='course_active_category_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(condition=models.Q(('is_active', True), ('is_featured', True)), fields=['created_at'], name='course_active_featured_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='paymentinstallment',
+            index=models.Index(fields=['status', 'due_date'], name='installment_status_due_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='projectenrollment',
+            index=models.Index(fields=['project', 'status', 'submitted_at'], name='projenroll_project_status_idx'),
+        ),
+    ]
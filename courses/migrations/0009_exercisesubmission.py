@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0008_course_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='enrollment',
+            name='exercise_points',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='exercise',
+            name='test_code',
+            field=models.TextField(blank=True, help_text="Hidden Python tests for graded exercises: test_* functions run after the learner's code, with its functions and variables in scope. Each passing test earns an equal share of the points."),
+        ),
+        migrations.CreateModel(
+            name='ExerciseSubmission',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.TextField()),
+                ('content_hash', models.CharField(max_length=64)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('graded', 'Graded'), ('failed', 'Grading Failed')], default='pending', max_length=20)),
+                ('score', models.PositiveIntegerField(default=0)),
+                ('tests_passed', models.PositiveIntegerField(default=0)),
+                ('tests_total', models.PositiveIntegerField(default=0)),
+                ('test_results', models.JSONField(blank=True, default=list)),
+                ('output', models.TextField(blank=True, help_text='Output and errors of the submitted code')),
+                ('submitted_at', models.DateTimeField(auto_now_add=True)),
+                ('graded_at', models.DateTimeField(blank=True, null=True)),
+                ('enrollment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='exercise_submissions', to='courses.enrollment')),
+                ('exercise', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='submissions', to='courses.exercise')),
+            ],
+            options={
+                'db_table': 'core_exercisesubmission',
+                'ordering': ['-submitted_at'],
+                'indexes': [models.Index(fields=['exercise', 'content_hash', 'status'], name='exsub_exercise_hash_idx'), models.Index(fields=['enrollment', 'exercise', 'score'], name='exsub_enrollment_score_idx'), models.Index(fields=['status', 'submitted_at'], name='exsub_status_submitted_idx'), models.Index(fields=['submitted_at'], name='exsub_submitted_idx')],
+            },
+        ),
+    ]
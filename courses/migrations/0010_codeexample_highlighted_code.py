@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0009_exercisesubmission'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='codeexample',
+            name='highlight_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='codeexample',
+            name='highlighted_code',
+            field=models.TextField(blank=True, editable=False),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0010_codeexample_highlighted_code'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='codeexample',
+            name='verified_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+    ]
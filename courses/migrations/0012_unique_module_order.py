@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:42
+
+from django.db import migrations
+
+
+def renumber_duplicate_orders(apps, schema_editor):
+    """Number a module's examples and exercises 1, 2, ... where two share an order, keeping their display order"""
+    for model_name in ('CodeExample', 'Exercise'):
+        model = apps.get_model('courses', model_name)
+        rows = model.objects.order_by('module_id', 'order', 'id').values_list('module_id', 'order', 'id')
+        by_module = {}
+        for module_id, order, pk in rows:
+            by_module.setdefault(module_id, []).append((order, pk))
+        renumbered = []
+        for items in by_module.values():
+            orders = [order for order, _ in items]
+            if len(set(orders)) < len(orders):
+                renumbered.extend(model(pk=pk, order=index) for index, (_, pk) in enumerate(items, 1))
+        model.objects.bulk_update(renumbered, ['order'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0011_codeexample_verified_hash'),
+    ]
+
+    operations = [
+        migrations.RunPython(renumber_duplicate_orders, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='codeexample',
+            unique_together={('module', 'order')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='exercise',
+            unique_together={('module', 'order')},
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0012_unique_module_order'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='syllabus_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='syllabus_pdf',
+            field=models.FileField(blank=True, editable=False, upload_to='course_syllabi/'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0013_course_syllabus'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='offline_archive',
+            field=models.FileField(blank=True, editable=False, upload_to='course_offline/'),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='offline_archive_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+    ]
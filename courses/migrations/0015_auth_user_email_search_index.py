@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:50
+
+from django.conf import settings
+from django.db import migrations
+
+# Case-insensitive index for the iexact email search of the enrollment admins.
+# Like courses_auth_user_email_idx (0006) it sits on django.contrib.auth's
+# table but belongs to this app: migrating courses back before this migration
+# drops it again, leaving auth_user as django.contrib.auth created it.
+INDEX_NAME = 'courses_auth_user_email_iexact_idx'
+CREATE_INDEX_SQL = {
+    # iexact compiles to LIKE, which SQLite serves from a NOCASE index
+    'sqlite': f'CREATE INDEX IF NOT EXISTS {INDEX_NAME} ON auth_user (email COLLATE NOCASE)',
+    # and to UPPER("email") = UPPER(%s) on PostgreSQL
+    'postgresql': f'CREATE INDEX IF NOT EXISTS {INDEX_NAME} ON auth_user (UPPER(email))',
+}
+
+
+def create_email_search_index(apps, schema_editor):
+    sql = CREATE_INDEX_SQL.get(schema_editor.connection.vendor)
+    if sql:
+        schema_editor.execute(sql)
+
+
+def drop_email_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in CREATE_INDEX_SQL:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {INDEX_NAME}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0014_course_offline_archive'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(create_email_search_index, drop_email_search_index),
+    ]
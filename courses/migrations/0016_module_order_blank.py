@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0015_auth_user_email_search_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='codeexample',
+            name='order',
+            field=models.PositiveIntegerField(blank=True, help_text='Position in the module; leave blank to add it at the end'),
+        ),
+        migrations.AlterField(
+            model_name='exercise',
+            name='order',
+            field=models.PositiveIntegerField(blank=True, help_text='Position in the module; leave blank to add it at the end'),
+        ),
+    ]
@@ -1,4 +1,6 @@
 from django.db import models
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
 from django.contrib.auth.models import User
 from django.urls import reverse
 from django.utils.text import slugify
@@ -51,7 +53,14 @@ class Course(models.Model):
     USD_TO_KES_RATE = 150.0  # 1 USD = 150 KES (approximate)
     USD_TO_NGN_RATE = 800.0  # 1 USD = 800 NGN (approximate)
     course_pdf = models.FileField(upload_to='course_pdfs/', blank=True, null=True)
+    # Rendered from the fields below and the modules by SyllabusService whenever they change
+    syllabus_pdf = models.FileField(upload_to='course_syllabi/', blank=True, editable=False)
+    syllabus_hash = models.CharField(max_length=64, blank=True, editable=False)
+    # Static HTML copy of the materials for learners to download, kept current by OfflineCopyService
+    offline_archive = models.FileField(upload_to='course_offline/', blank=True, editable=False)
+    offline_archive_hash = models.CharField(max_length=64, blank=True, editable=False)
     image = models.ImageField(upload_to='course_images/', blank=True, null=True)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     video_intro_url = models.URLField(blank=True, help_text="YouTube or Vimeo URL for course intro")
     is_featured = models.BooleanField(default=False)
     is_active = models.BooleanField(default=True)
@@ -64,6 +73,12 @@ class Course(models.Model):
     class Meta:
         db_table = 'core_course'
         ordering = ['-created_at']
+        indexes = [
+            # Partial indexes: Django filters booleans as a bare column, which
+            # SQLite can only match against an index's WHERE clause
+            models.Index(fields=['category', 'created_at'], condition=models.Q(is_active=True), name='course_active_category_idx'),
+            models.Index(fields=['created_at'], condition=models.Q(is_active=True, is_featured=True), name='course_active_featured_idx'),
+        ]
     
     def save(self, *args, **kwargs):
         if not self.slug:
@@ -189,6 +204,12 @@ class CourseModule(models.Model):
         return self.code_examples.count()
 
 
+def next_module_order(row):
+    """Order after the last code example or exercise of ``row``'s module, for rows added without one"""
+    last = type(row).objects.filter(module_id=row.module_id).aggregate(last=models.Max('order'))['last']
+    return (last or 0) + 1
+
+
 class CodeExample(models.Model):
     module = models.ForeignKey(CourseModule, on_delete=models.CASCADE, related_name='code_examples')
     title = models.CharField(max_length=200)
@@ -202,16 +223,31 @@ class CodeExample(models.Model):
         ('intermediate', 'Intermediate'),
         ('advanced', 'Advanced')
     ], default='beginner')
-    order = models.PositiveIntegerField(default=0)
+    order = models.PositiveIntegerField(blank=True, help_text="Position in the module; leave blank to add it at the end")
     is_interactive = models.BooleanField(default=False, help_text="Can students run this code?")
+    # Pygments markup of ``code``, rendered on save (see courses/highlighting.py)
+    highlighted_code = models.TextField(blank=True, editable=False)
+    highlight_hash = models.CharField(max_length=64, blank=True, editable=False)
+    # What expected_output last matched: see CodeExampleVerificationService
+    verified_hash = models.CharField(max_length=64, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
         db_table = 'core_codeexample'
         ordering = ['order', 'id']
+        unique_together = ['module', 'order']
     
     def __str__(self):
         return f"{self.module.title} - {self.title}"
+    
+    def save(self, *args, **kwargs):
+        from .highlighting import refresh_highlighting
+        if self.order is None:
+            self.order = next_module_order(self)
+        update_fields = kwargs.get('update_fields')
+        if refresh_highlighting(self) and update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'highlighted_code', 'highlight_hash'}
+        super().save(*args, **kwargs)
 
 
 class Exercise(models.Model):
@@ -227,17 +263,31 @@ class Exercise(models.Model):
     hints = CKEditor5Field(config_name='default', blank=True, help_text="Helpful hints for students")
     solution = CKEditor5Field(config_name='extends', blank=True, help_text="Sample solution (optional)")
     dataset_url = models.URLField(blank=True, help_text="URL to download exercise dataset")
-    order = models.PositiveIntegerField(default=0)
+    order = models.PositiveIntegerField(blank=True, help_text="Position in the module; leave blank to add it at the end")
     is_graded = models.BooleanField(default=False)
     points = models.PositiveIntegerField(default=0, help_text="Points awarded for completion")
+    test_code = models.TextField(
+        blank=True,
+        help_text="Hidden Python tests for graded exercises: test_* functions run after the learner's code, "
+                  "with its functions and variables in scope. Each passing test earns an equal share of the points."
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
         db_table = 'core_exercise'
         ordering = ['order', 'id']
+        unique_together = ['module', 'order']
     
     def __str__(self):
         return f"{self.module.title} - Exercise: {self.title}"
+    
+    def save(self, *args, **kwargs):
+        if self.order is None:
+            self.order = next_module_order(self)
+        super().save(*args, **kwargs)
+    
+    def accepts_submissions(self):
+        return self.is_graded and bool(self.test_code.strip())
 
 
 class CapstoneProject(models.Model):
@@ -319,6 +369,8 @@ class Enrollment(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     expires_at = models.DateTimeField(null=True, blank=True)
+    # Best score per graded exercise, summed; kept up to date by ExerciseGradingService
+    exercise_points = models.PositiveIntegerField(default=0)
     
     # Admin notes
     admin_notes = models.TextField(blank=True, help_text="Internal notes for administrators")
@@ -327,6 +379,9 @@ class Enrollment(models.Model):
         db_table = 'core_enrollment'
         ordering = ['-created_at']
         unique_together = ['user', 'course']
+        indexes = [
+            models.Index(fields=['created_at'], name='enrollment_created_idx'),
+        ]
     
     def save(self, *args, **kwargs):
         if not self.activation_code:
@@ -353,12 +408,35 @@ class Enrollment(models.Model):
             return min(100, int((self.amount_paid / self.total_amount) * 100))
         return 0
     
+    def get_module_progress_percentage(self):
+        """Calculate module completion progress as percentage"""
+        completed = getattr(self, 'completed_modules_count', None)
+        total = getattr(self, 'active_modules_count', None)
+        if completed is None or total is None:
+            completed = self.module_completions.filter(module__is_active=True).count()
+            total = self.course.modules.filter(is_active=True).count()
+        if total > 0:
+            return min(100, int((completed / total) * 100))
+        return 0
+    
+    def get_exercise_progress_percentage(self):
+        """Share of the course's graded exercise points earned so far"""
+        total = Exercise.objects.filter(
+            module__course_id=self.course_id, module__is_active=True, is_graded=True
+        ).aggregate(total=models.Sum('points'))['total']
+        if total:
+            return min(100, int(self.exercise_points * 100 / total))
+        return 0
+    
     def get_next_installment_amount(self):
         """Get the amount for the next installment"""
         if self.installments == 1:
             return self.total_amount
         
-        paid_installments = self.payment_installments.filter(status='verified').count()
+        # Use the count annotated by LearnerDashboardService when available
+        paid_installments = getattr(self, 'verified_installments_count', None)
+        if paid_installments is None:
+            paid_installments = self.payment_installments.filter(status='verified').count()
         if paid_installments >= self.installments:
             return 0
         
@@ -411,6 +489,10 @@ class PaymentInstallment(models.Model):
         db_table = 'core_paymentinstallment'
         ordering = ['enrollment', 'installment_number']
         unique_together = ['enrollment', 'installment_number']
+        indexes = [
+            models.Index(fields=['due_date'], name='installment_due_date_idx'),
+            models.Index(fields=['status', 'due_date'], name='installment_status_due_idx'),
+        ]
     
     def is_overdue(self):
         """Check if payment is overdue"""
@@ -431,11 +513,51 @@ class ModuleCompletion(models.Model):
         db_table = 'core_modulecompletion'
         unique_together = ['enrollment', 'module']
         ordering = ['-completed_at']
+        indexes = [
+            models.Index(fields=['completed_at'], name='modcompletion_completed_idx'),
+        ]
     
     def __str__(self):
         return f"{self.enrollment.user.get_full_name()} - {self.module.title}"
 
 
+class ExerciseSubmission(models.Model):
+    """A learner's answer to a graded exercise, scored against its hidden tests"""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('graded', 'Graded'),
+        ('failed', 'Grading Failed'),
+    ]
+    
+    enrollment = models.ForeignKey(Enrollment, on_delete=models.CASCADE, related_name='exercise_submissions')
+    exercise = models.ForeignKey(Exercise, on_delete=models.CASCADE, related_name='submissions')
+    code = models.TextField()
+    # SHA-256 of the code and the tests it was graded against: equal hashes get equal results
+    content_hash = models.CharField(max_length=64)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    score = models.PositiveIntegerField(default=0)
+    tests_passed = models.PositiveIntegerField(default=0)
+    tests_total = models.PositiveIntegerField(default=0)
+    # One {"name", "passed", "message", "duration_ms"} dict per test
+    test_results = models.JSONField(default=list, blank=True)
+    output = models.TextField(blank=True, help_text="Output and errors of the submitted code")
+    submitted_at = models.DateTimeField(auto_now_add=True)
+    graded_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        db_table = 'core_exercisesubmission'
+        ordering = ['-submitted_at']
+        indexes = [
+            models.Index(fields=['exercise', 'content_hash', 'status'], name='exsub_exercise_hash_idx'),
+            models.Index(fields=['enrollment', 'exercise', 'score'], name='exsub_enrollment_score_idx'),
+            models.Index(fields=['status', 'submitted_at'], name='exsub_status_submitted_idx'),
+            models.Index(fields=['submitted_at'], name='exsub_submitted_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.enrollment} - {self.exercise.title} ({self.get_status_display()})"
+
+
 class ProjectEnrollment(models.Model):
     """Track capstone project enrollment and progress"""
     STATUS_CHOICES = [
@@ -474,6 +596,34 @@ class ProjectEnrollment(models.Model):
         db_table = 'core_projectenrollment'
         unique_together = ['enrollment', 'project']
         ordering = ['-started_at']
+        indexes = [
+            models.Index(fields=['status', 'submitted_at'], name='projenroll_status_submit_idx'),
+            models.Index(fields=['started_at'], name='projenroll_started_idx'),
+            models.Index(fields=['project', 'status', 'submitted_at'], name='projenroll_project_status_idx'),
+        ]
+    
+    # Fields read by get_stats_snapshot()
+    STATS_FIELDS = ('project_id', 'status', 'grade', 'submitted_at', 'reviewed_at')
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the values CourseProjectStats was last updated with
+        if all(name in field_names for name in cls.STATS_FIELDS):
+            instance._stats_snapshot = instance.get_stats_snapshot()
+        return instance
+    
+    def get_stats_snapshot(self):
+        """Values that contribute to the per-course project statistics"""
+        review_seconds = None
+        if self.status == 'completed' and self.submitted_at and self.reviewed_at:
+            review_seconds = max(0, int((self.reviewed_at - self.submitted_at).total_seconds()))
+        return {
+            'project_id': self.project_id,
+            'status': self.status,
+            'grade': self.grade if self.status == 'completed' else None,
+            'review_seconds': review_seconds,
+        }
     
     def start_project(self):
         """Start the project"""
@@ -549,4 +699,117 @@ class ProjectEnrollment(models.Model):
         return self.status == 'completed' and self.certificate_file
     
     def __str__(self):
-        return f"{self.enrollment.user.get_full_name()} - {self.project.title}"
\ No newline at end of file
+        return f"{self.enrollment.user.get_full_name()} - {self.project.title}"
+
+
+class CourseProjectStats(models.Model):
+    """Per-course capstone project counters, maintained incrementally on save"""
+    course = models.OneToOneField(Course, on_delete=models.CASCADE, related_name='project_stats')
+    in_progress_count = models.PositiveIntegerField(default=0)
+    submitted_count = models.PositiveIntegerField(default=0)
+    completed_count = models.PositiveIntegerField(default=0)
+    graded_count = models.PositiveIntegerField(default=0)
+    grade_total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    reviewed_count = models.PositiveIntegerField(default=0)
+    review_seconds_total = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'core_courseprojectstats'
+        verbose_name = 'Course Project Statistics'
+        verbose_name_plural = 'Course Project Statistics'
+    
+    def get_average_grade(self):
+        """Average grade of completed, graded projects"""
+        if self.graded_count > 0:
+            return self.grade_total / self.graded_count
+        return None
+    
+    def get_average_review_hours(self):
+        """Average hours between submission and instructor review"""
+        if self.reviewed_count > 0:
+            return self.review_seconds_total / self.reviewed_count / 3600
+        return None
+    
+    def __str__(self):
+        return f"{self.course.title} - Project Statistics"
+
+
+@receiver(post_save, sender=Enrollment)
+@receiver(post_delete, sender=Enrollment)
+def invalidate_enrollment_dashboard(sender, instance, **kwargs):
+    """Refresh the learner dashboard summary when an enrollment changes"""
+    from .services import LearnerDashboardService
+    LearnerDashboardService.invalidate(instance.user_id)
+
+
+@receiver(post_save, sender=PaymentInstallment)
+@receiver(post_delete, sender=PaymentInstallment)
+@receiver(post_save, sender=ModuleCompletion)
+@receiver(post_delete, sender=ModuleCompletion)
+def invalidate_enrollment_child_dashboard(sender, instance, **kwargs):
+    """Refresh the learner dashboard summary when installments or completions change"""
+    from .services import LearnerDashboardService
+    LearnerDashboardService.invalidate_for_enrollment(instance.enrollment_id)
+
+
+@receiver(pre_save, sender=ProjectEnrollment)
+def capture_project_stats_snapshot(sender, instance, **kwargs):
+    """Load the previous statistics snapshot for instances not read through the ORM"""
+    if instance._state.adding:
+        instance._stats_snapshot = None
+    elif not hasattr(instance, '_stats_snapshot'):
+        previous = ProjectEnrollment.objects.filter(pk=instance.pk).first()
+        instance._stats_snapshot = previous.get_stats_snapshot() if previous else None
+
+
+@receiver(post_save, sender=ProjectEnrollment)
+def update_project_stats_on_save(sender, instance, **kwargs):
+    """Apply the change in this project enrollment to its course statistics"""
+    from .services import ProjectStatsService
+    snapshot = instance.get_stats_snapshot()
+    ProjectStatsService.apply_change(getattr(instance, '_stats_snapshot', None), snapshot)
+    instance._stats_snapshot = snapshot
+
+
+@receiver(post_delete, sender=ProjectEnrollment)
+def update_project_stats_on_delete(sender, instance, **kwargs):
+    """Remove a deleted project enrollment from its course statistics"""
+    from .services import ProjectStatsService
+    snapshot = getattr(instance, '_stats_snapshot', None) or instance.get_stats_snapshot()
+    ProjectStatsService.apply_change(snapshot, None)
+
+
+@receiver(post_save, sender=Course)
+@receiver(post_save, sender=CourseModule)
+@receiver(post_delete, sender=CourseModule)
+def queue_syllabus(sender, instance, raw=False, **kwargs):
+    """Render the course syllabus again in the background; skipped there when its content did not change"""
+    if raw:
+        return
+    from .services import SyllabusService
+    SyllabusService.queue(instance.pk if sender is Course else instance.course_id)
+
+
+@receiver(post_save, sender=Course)
+@receiver(post_save, sender=CourseModule)
+@receiver(post_delete, sender=CourseModule)
+@receiver(post_save, sender=CodeExample)
+@receiver(post_delete, sender=CodeExample)
+@receiver(post_save, sender=Exercise)
+@receiver(post_delete, sender=Exercise)
+@receiver(post_save, sender=CapstoneProject)
+@receiver(post_delete, sender=CapstoneProject)
+def queue_offline_archive(sender, instance, raw=False, **kwargs):
+    """Rebuild the course's offline copy in the background; skipped there when its content did not change"""
+    if raw:
+        return
+    from .services import OfflineCopyService
+    if sender is Course:
+        course_id = instance.pk
+    elif sender in (CodeExample, Exercise):
+        course_id = CourseModule.objects.filter(pk=instance.module_id).values_list('course_id', flat=True).first()
+    else:
+        course_id = instance.course_id
+    if course_id:
+        OfflineCopyService.queue(course_id)
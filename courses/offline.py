@@ -0,0 +1,307 @@
+"""
+Offline copies of course materials: a static HTML site in a ZIP
+
+build_archive() renders a course's modules, code examples, exercises and
+capstone projects with the templates in courses/templates/courses/offline/
+into one page per module plus an index, and writes them to a ZIP together
+with the stylesheets and every uploaded image the content embeds. Links
+are relative, so the site opens from the unpacked folder without a network
+connection. Solutions, test code and anything learner-specific are left out,
+so one archive serves every learner of a course; content_hash() covers
+exactly what is rendered, and the archive is rebuilt only when it changes.
+
+Each download is tied to its enrollment by two small files that
+WatermarkedArchive appends to the cached archive while streaming it:
+manifest.json (who, which course, which build, signed with SECRET_KEY) and
+assets/watermark.js, which prints the learner's name in every page footer.
+They are added by writing new entries after the cached ones and a new
+central directory, so the cached bytes are sent as they are and nothing is
+recompressed per learner. The extra files depend only on the enrollment
+and the build, so the response is byte-identical across requests and an
+interrupted download can resume with a Range request.
+"""
+import hashlib
+import html
+import json
+import logging
+import posixpath
+import re
+import struct
+import zipfile
+import zlib
+from urllib.parse import unquote
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.template.loader import render_to_string
+from django.utils.crypto import constant_time_compare, salted_hmac
+
+from core.images import IMG_TAG_RE, parse_attributes
+
+from .highlighting import stylesheet
+
+logger = logging.getLogger(__name__)
+
+# Part of the content hash: bump when the templates or layout change to rebuild every archive
+OFFLINE_VERSION = 1
+# Fields shown offline, by model; HTML fields have their uploaded images bundled
+RENDERED_FIELDS = {
+    'course': ['title', 'slug', 'overview', 'description', 'duration', 'learning_outcomes', 'tools_software',
+               'prerequisites', 'course_syllabus'],
+    'module': ['order', 'title', 'description', 'content', 'duration_hours', 'learning_objectives', 'resources',
+               'video_url'],
+    'example': ['order', 'title', 'description', 'code', 'language', 'explanation', 'expected_output',
+                'highlighted_code'],
+    'exercise': ['order', 'title', 'description', 'difficulty_level', 'estimated_time_minutes', 'hints',
+                 'dataset_url', 'points'],
+    'project': ['order', 'title', 'description', 'requirements', 'evaluation_criteria', 'estimated_hours',
+                'difficulty_level', 'sample_datasets', 'deliverables', 'resources', 'is_group_project'],
+}
+MEDIA_DIR = 'media'
+MANIFEST_NAME = 'manifest.json'
+WATERMARK_NAME = 'assets/watermark.js'
+# Fixed entry timestamps (1980-01-01): the archive's bytes depend only on its content
+ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+# Already compressed; deflating them again only costs time
+STORED_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.webp', '.avif', '.zip', '.gz', '.pdf'}
+
+
+class OfflineArchiveError(ValueError):
+    """The cached file is not an archive WatermarkedArchive can extend"""
+
+
+def load_course_tree(course):
+    """The active modules of ``course`` with their examples and exercises, and its capstone projects"""
+    modules = list(course.modules.filter(is_active=True).prefetch_related('code_examples', 'exercises')
+                   .order_by('order', 'id'))
+    projects = list(course.capstone_projects.order_by('order', 'id'))
+    return modules, projects
+
+
+def tree_rows(course, modules, projects):
+    """(kind, instance) for every rendered row"""
+    yield 'course', course
+    for module in modules:
+        yield 'module', module
+        yield from (('example', example) for example in module.code_examples.all())
+        yield from (('exercise', exercise) for exercise in module.exercises.all())
+    yield from (('project', project) for project in projects)
+
+
+def content_hash(course, modules, projects):
+    content = [OFFLINE_VERSION, settings.CODE_HIGHLIGHT_STYLE]
+    for kind, row in tree_rows(course, modules, projects):
+        content.append([kind, *(getattr(row, field) for field in RENDERED_FIELDS[kind])])
+    return hashlib.sha256(json.dumps(content, cls=DjangoJSONEncoder).encode()).hexdigest()
+
+
+def localize_media(content, media):
+    """
+    Point the uploaded images and files in stored HTML at their copies in the
+    archive, adding their storage names to ``media``
+
+    Responsive variants are dropped: the archive carries each original once.
+    """
+    media_url_re = re.compile(r'''(["'])''' + re.escape(settings.MEDIA_URL) + r'''([^"'\s<>?#]+)\1''')
+
+    def strip_variants(match):
+        attributes = parse_attributes(match.group(0))
+        attributes.pop('srcset', None)
+        attributes.pop('sizes', None)
+        return '<img ' + ' '.join(
+            name if value is None else f'{name}="{value}"' for name, value in attributes.items()
+        ) + '>'
+
+    def localize(match):
+        quote, path = match.groups()
+        media.add(unquote(html.unescape(path)))
+        return f'{quote}{MEDIA_DIR}/{path}{quote}'
+
+    return media_url_re.sub(localize, IMG_TAG_RE.sub(strip_variants, content))
+
+
+def render_site(course, modules, projects):
+    """
+    The pages and stylesheets as [(archive name, bytes)], and the storage
+    names of the media they embed
+    """
+    media = set()
+    for kind, row in tree_rows(course, modules, projects):
+        for field in RENDERED_FIELDS[kind]:
+            value = getattr(row, field)
+            if isinstance(value, str) and settings.MEDIA_URL in value:
+                setattr(row, field, localize_media(value, media))
+
+    pages = [(f'module-{module.order:02d}.html', module) for module in modules]
+    context = {'course': course, 'modules': modules, 'projects': projects, 'pages': pages}
+    files = [('index.html', render_to_string('courses/offline/index.html', context).encode())]
+    for index, (name, module) in enumerate(pages):
+        files.append((name, render_to_string('courses/offline/module.html', {
+            **context,
+            'module': module,
+            'previous_page': pages[index - 1][0] if index else None,
+            'next_page': pages[index + 1][0] if index + 1 < len(pages) else None,
+        }).encode()))
+    files.append(('assets/site.css', render_to_string('courses/offline/site.css').encode()))
+    files.append(('assets/highlight.css', stylesheet(settings.CODE_HIGHLIGHT_STYLE).encode()))
+    return files, media
+
+
+def build_archive(course, modules, projects, file, storage=default_storage):
+    """Write the offline site of ``course`` (see load_course_tree()) to the binary ``file`` as a ZIP"""
+    with zipfile.ZipFile(file, 'w', zipfile.ZIP_DEFLATED, allowZip64=False) as archive:
+        def write(name, data):
+            info = zipfile.ZipInfo(f'{course.slug}/{name}', date_time=ZIP_DATE_TIME)
+            extension = posixpath.splitext(name)[1].lower()
+            info.compress_type = zipfile.ZIP_STORED if extension in STORED_EXTENSIONS else zipfile.ZIP_DEFLATED
+            info.external_attr = 0o644 << 16
+            archive.writestr(info, data)
+
+        files, media = render_site(course, modules, projects)
+        for name, data in files:
+            write(name, data)
+        for name in sorted(media):
+            if not storage.exists(name):
+                logger.warning(f"Offline copy of {course.slug}: missing media file {name}")
+                continue
+            with storage.open(name, 'rb') as source:
+                write(f'{MEDIA_DIR}/{name}', source.read())
+
+
+# Watermarking
+
+def manifest_signature(manifest):
+    payload = json.dumps({key: value for key, value in manifest.items() if key != 'signature'}, sort_keys=True)
+    return salted_hmac('courses.offline.manifest', payload).hexdigest()
+
+
+def verify_manifest(manifest):
+    """True when a manifest.json from an offline copy was issued by this site and not edited"""
+    return constant_time_compare(manifest.get('signature', ''), manifest_signature(manifest))
+
+
+def watermark_files(enrollment, built_hash):
+    """The per-enrollment files appended to a cached archive: [(archive name, bytes)]"""
+    user = enrollment.user
+    name = user.get_full_name() or user.username
+    manifest = {
+        'enrollment': str(enrollment.pk),
+        'learner': name,
+        'email': user.email,
+        'course': enrollment.course.slug,
+        'content_hash': built_hash,
+        'activated_at': enrollment.activated_at.isoformat() if enrollment.activated_at else None,
+    }
+    manifest['signature'] = manifest_signature(manifest)
+    notice = f'Licensed to {name} ({user.email}) - enrollment {enrollment.pk}'
+    script = (
+        'document.querySelectorAll("[data-watermark]").forEach(function (element) '
+        f'{{ element.textContent = {json.dumps(notice)}; }});\n'
+    )
+    prefix = enrollment.course.slug
+    return [
+        (f'{prefix}/{MANIFEST_NAME}', json.dumps(manifest, indent=2).encode()),
+        (f'{prefix}/{WATERMARK_NAME}', script.encode()),
+    ]
+
+
+LOCAL_HEADER = struct.Struct('<4sHHHHHLLLHH')
+CENTRAL_HEADER = struct.Struct('<4sHHHHHHLLLHHHHHLL')
+END_RECORD = struct.Struct('<4sHHHHLLH')
+DOS_DATE = (ZIP_DATE_TIME[0] - 1980) << 9 | ZIP_DATE_TIME[1] << 5 | ZIP_DATE_TIME[2]
+UTF8_NAMES = 0x800
+
+
+class WatermarkedArchive:
+    """
+    A cached archive with extra files appended, readable by byte range
+
+    The cached archive is [entries][central directory][end record]. The
+    response is the cached entries, then the extra entries, then the cached
+    central directory followed by records for the extra entries, then a new
+    end record. Only the part after the cached entries is built in memory;
+    ``tail_hash`` identifies it, and with the cached archive's hash the whole
+    response.
+    """
+
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, field_file, extra_files):
+        self.field_file = field_file
+        with field_file.open('rb') as archive:
+            archive.seek(-END_RECORD.size, 2)
+            (signature, _, _, _, count, directory_size, directory_offset,
+             comment_length) = END_RECORD.unpack(archive.read(END_RECORD.size))
+            if signature != b'PK\x05\x06' or comment_length or 0xFFFFFFFF in (directory_size, directory_offset):
+                raise OfflineArchiveError(f'{field_file.name} is not a plain ZIP without comment')
+            archive.seek(directory_offset)
+            directory = archive.read(directory_size)
+
+        entries = bytearray()
+        records = bytearray()
+        offset = directory_offset
+        for name, data in extra_files:
+            encoded_name = name.encode()
+            crc = zlib.crc32(data)
+            header = LOCAL_HEADER.pack(
+                b'PK\x03\x04', 20, UTF8_NAMES, zipfile.ZIP_STORED, 0, DOS_DATE, crc, len(data), len(data),
+                len(encoded_name), 0,
+            )
+            records += CENTRAL_HEADER.pack(
+                b'PK\x01\x02', 0x0314, 20, UTF8_NAMES, zipfile.ZIP_STORED, 0, DOS_DATE, crc, len(data), len(data),
+                len(encoded_name), 0, 0, 0, 0, 0o644 << 16, offset,
+            ) + encoded_name
+            entries += header + encoded_name + data
+            offset += len(header) + len(encoded_name) + len(data)
+        count += len(extra_files)
+        if offset > 0xFFFFFFFF or count > 0xFFFF:
+            raise OfflineArchiveError(f'{field_file.name} is too large to extend without ZIP64')
+        end = END_RECORD.pack(b'PK\x05\x06', 0, 0, count, count, len(directory) + len(records), offset, 0)
+
+        self.prefix_size = directory_offset
+        self.tail = bytes(entries + directory + records + end)
+        self.tail_hash = hashlib.sha256(self.tail).hexdigest()
+        self.size = self.prefix_size + len(self.tail)
+
+    def iter_range(self, start=0, end=None):
+        """Yield the bytes from ``start`` up to and including ``end``"""
+        stop = self.size if end is None else end + 1
+        if start < self.prefix_size:
+            with self.field_file.open('rb') as archive:
+                archive.seek(start)
+                remaining = min(stop, self.prefix_size) - start
+                while remaining > 0:
+                    chunk = archive.read(min(self.CHUNK_SIZE, remaining))
+                    if not chunk:
+                        raise OfflineArchiveError(f'{self.field_file.name} is shorter than its central directory says')
+                    remaining -= len(chunk)
+                    yield chunk
+        if stop > self.prefix_size:
+            yield self.tail[max(start - self.prefix_size, 0):stop - self.prefix_size]
+
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def parse_range(header, size):
+    """
+    (start, end) of a single-range ``Range`` header, end inclusive; None to
+    send the whole file (no header, or one this does not handle such as
+    several ranges); raises ValueError when the range is unsatisfiable
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if not length:
+            raise ValueError(header)
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        raise ValueError(header)
+    return start, end
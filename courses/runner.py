@@ -0,0 +1,222 @@
+"""
+Pool of pre-started sandbox workers for running learners' code
+
+Each web process keeps CODE_RUNNER_WORKERS warm workers (see
+courses/sandbox_worker.py for what a worker does and how a run is
+contained). A run borrows an idle worker for its duration, so a process
+runs at most that many examples at once; further requests wait up to
+CODE_RUNNER_QUEUE_SECONDS and then get RunnerUnavailable. A worker that
+stops answering is killed and replaced.
+
+Exercise grading has a pool of its own (GRADING_WORKERS), so a deadline
+burst of submissions cannot hold up learners running examples.
+
+CodeRunnerService and ExerciseGradingService (courses/services.py) build
+on these pools.
+"""
+import json
+import logging
+import os
+import queue
+import selectors
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+WORKER_SCRIPT = Path(__file__).with_name('sandbox_worker.py')
+# Time for a worker to import the preloaded libraries
+STARTUP_SECONDS = 60
+# Added to the run's own wall-clock limit before a worker counts as hung
+RESPONSE_GRACE_SECONDS = 5
+
+
+class RunnerUnavailable(Exception):
+    """No sandbox worker could take the run"""
+
+
+def private_paths():
+    """Directories of the site that workers hide even where a system directory they see contains them"""
+    files = [settings.SQLITE_REPLICA_PATH, settings.METRICS_DB_PATH]
+    for database in settings.DATABASES.values():
+        if database['ENGINE'].endswith('sqlite3'):
+            # The replica's name is a URI: file:<path>?mode=ro
+            files.append(database['NAME'].removeprefix('file:').split('?')[0])
+    files += [cache['LOCATION'] for cache in settings.CACHES.values() if cache['BACKEND'] == 'core.cache.SQLiteCache']
+    directories = {settings.BASE_DIR, settings.MEDIA_ROOT, settings.STATIC_ROOT}
+    directories.update(Path(name).parent for name in files)
+    return sorted(str(directory) for directory in directories)
+
+
+def worker_config():
+    return {
+        'preload': settings.CODE_RUNNER_PRELOAD,
+        'isolate_network': not settings.CODE_RUNNER_ALLOW_NETWORK,
+        'isolate_filesystem': not settings.CODE_RUNNER_ALLOW_FILESYSTEM,
+        'private_paths': private_paths(),
+        'scratch_mb': settings.CODE_RUNNER_SCRATCH_MB,
+        'cpu_seconds': settings.CODE_RUNNER_CPU_SECONDS,
+        'wall_seconds': settings.CODE_RUNNER_WALL_SECONDS,
+        'memory_mb': settings.CODE_RUNNER_MEMORY_MB,
+        'file_bytes': settings.CODE_RUNNER_FILE_BYTES,
+        'output_bytes': settings.CODE_RUNNER_OUTPUT_BYTES,
+    }
+
+
+def worker_environment(home):
+    """A minimal environment: nothing from the site's own (secret keys, database URLs) reaches learners"""
+    return {
+        'PATH': '/usr/bin:/bin',
+        'HOME': home,
+        'TMPDIR': home,
+        'LANG': 'C.UTF-8',
+        'PYTHONIOENCODING': 'utf-8',
+        'MPLBACKEND': 'Agg',
+        'MPLCONFIGDIR': home,
+        # One thread per BLAS library: the memory limit counts every thread's stack
+        'OPENBLAS_NUM_THREADS': '1',
+        'OMP_NUM_THREADS': '1',
+        'MKL_NUM_THREADS': '1',
+    }
+
+
+class SandboxWorker:
+    """One worker process and its request/response pipes"""
+
+    def __init__(self, config):
+        self.home = tempfile.mkdtemp(prefix='sandbox-')
+        self.config = config
+        self.process = subprocess.Popen(
+            [sys.executable, '-I', str(WORKER_SCRIPT), json.dumps(config)],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            cwd=self.home, env=worker_environment(self.home), start_new_session=True,
+        )
+        self.buffer = b''
+        try:
+            hello = self.receive(STARTUP_SECONDS)
+        except Exception:
+            self.close()
+            raise
+        self.runtime = hello['runtime']
+        if not hello['network_isolated'] and config['isolate_network']:
+            self.close()
+            raise RunnerUnavailable(
+                'Sandbox workers cannot be cut off from the network here; set CODE_RUNNER_ALLOW_NETWORK to run anyway'
+            )
+        if not hello['filesystem_isolated'] and config['isolate_filesystem']:
+            self.close()
+            raise RunnerUnavailable(
+                "Sandbox workers cannot be given a root filesystem of their own here, so learners' code could read "
+                "the site's files; set CODE_RUNNER_ALLOW_FILESYSTEM to run anyway"
+            )
+
+    def receive(self, timeout):
+        """Read one JSON line from the worker, waiting at most timeout seconds"""
+        deadline = time.monotonic() + timeout
+        with selectors.DefaultSelector() as selector:
+            selector.register(self.process.stdout, selectors.EVENT_READ)
+            while b'\n' not in self.buffer:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not selector.select(remaining):
+                    raise TimeoutError('Sandbox worker did not answer in time')
+                chunk = os.read(self.process.stdout.fileno(), 65536)
+                if not chunk:
+                    raise EOFError('Sandbox worker exited')
+                self.buffer += chunk
+        line, self.buffer = self.buffer.split(b'\n', 1)
+        return json.loads(line)
+
+    def run(self, code, **options):
+        self.process.stdin.write(json.dumps({'code': code, **options}).encode() + b'\n')
+        self.process.stdin.flush()
+        wall_seconds = options.get('wall_seconds') or self.config['wall_seconds']
+        return self.receive(wall_seconds + RESPONSE_GRACE_SECONDS)
+
+    def close(self):
+        if self.process.poll() is None:
+            self.process.kill()
+            self.process.wait()
+        for pipe in (self.process.stdin, self.process.stdout):
+            pipe.close()
+        shutil.rmtree(self.home, ignore_errors=True)
+
+
+class SandboxPool:
+    """Idle workers of this process; started on first use and again after a fork"""
+
+    def __init__(self, size_setting):
+        # Read when the pool starts, so tests can override it
+        self.size_setting = size_setting
+        self.lock = threading.Lock()
+        self.pid = None
+        self.idle = None
+        self.runtime = None
+
+    def start(self, size=None):
+        """Start size workers, by default as many as the pool's setting says; no-op when running"""
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            config = worker_config()
+            workers = []
+            try:
+                for _ in range(size or getattr(settings, self.size_setting)):
+                    workers.append(SandboxWorker(config))
+            except Exception:
+                for worker in workers:
+                    worker.close()
+                raise
+            self.idle = queue.Queue()
+            for worker in workers:
+                self.idle.put(worker)
+            self.runtime = workers[0].runtime
+            self.pid = os.getpid()
+            logger.info(f'Started {len(workers)} sandbox workers ({self.runtime})')
+
+    def run(self, code, queue_seconds=None, **options):
+        """
+        Run Python code in a sandbox and return its result dict
+
+        Options are passed on to the worker: ``tests`` and ``test_seconds``
+        to grade the code, ``wall_seconds`` to override the time limit.
+        """
+        self.start()
+        try:
+            worker = self.idle.get(timeout=queue_seconds or settings.CODE_RUNNER_QUEUE_SECONDS)
+        except queue.Empty:
+            raise RunnerUnavailable('All sandbox workers are busy') from None
+        try:
+            return worker.run(code, **options)
+        except (OSError, EOFError, TimeoutError, ValueError) as error:
+            logger.warning(f'Replacing sandbox worker: {error}')
+            worker.close()
+            worker = None
+            raise RunnerUnavailable('The sandbox worker failed') from error
+        finally:
+            if worker is None:
+                # Keep the pool at full size for the next request
+                try:
+                    worker = SandboxWorker(worker_config())
+                except Exception:
+                    logger.exception('Could not restart a sandbox worker')
+            if worker is not None:
+                self.idle.put(worker)
+
+    def stop(self):
+        with self.lock:
+            if self.pid != os.getpid():
+                return
+            while not self.idle.empty():
+                self.idle.get_nowait().close()
+            self.pid = None
+
+
+pool = SandboxPool('CODE_RUNNER_WORKERS')
+grading_pool = SandboxPool('GRADING_WORKERS')
@@ -0,0 +1,938 @@
+"""
+Sandboxed Python worker for interactive code examples
+
+Started by courses.runner as ``python -I sandbox_worker.py '<config json>'``
+and deliberately independent of Django: it never sees settings, secrets or
+database connections.
+
+At startup the worker leaves the network (a new, empty network namespace),
+imports the configured libraries (pandas, numpy, ...), moves into a root
+filesystem of its own and reports that it is ready. It then reads one JSON
+request per line on stdin and answers each with one JSON line on stdout.
+Every run happens in a child forked from this warm process, so the imports
+are already paid for, and nothing a learner's code does to modules or
+globals survives into the next run. The child runs in its own session and
+temporary directory, with CPU time, address space and file size limits;
+the worker kills its whole process group once the wall-clock limit passes.
+
+A grading request also carries hidden tests. Once the child has run the
+submission cleanly, each ``test_*`` function of the tests runs in a tester
+process forked from the worker, killed when it passes the per-test time
+limit, so one hanging test costs only its own points. A tester never runs
+the submission itself: it forks a process that does, and talks to it over
+a socket. The submission's process holds neither the pipe the tester
+reports on nor anything else of the tester's, so whatever it patches
+(json, builtins, os._exit) cannot change a result. The tests see the
+submission's globals through TestGlobals: plain data (numbers, strings,
+containers, numpy arrays, pandas objects, dates, ...) is copied into the
+tester, anything else (functions, classes, instances) is a Remote whose
+calls, attributes and operators run in the submission's process.
+
+The root filesystem is a small tmpfs holding read-only binds of the system
+directories (/usr, /lib, ...), the Python installation and the few device
+and /etc files programs expect, plus a size-limited writable tmpfs at
+/tmp. There is no /proc. The site's own directories (the project, media,
+database files) are masked even where they lie inside a bound directory,
+so learners' code sees neither code, secrets nor data of the site. Each
+process that runs learners' code first gives up every capability, so it
+cannot unmount or remount its way back out.
+"""
+import ast
+import base64
+import builtins
+import collections
+import ctypes
+import datetime
+import decimal
+import errno
+import fractions
+import io
+import json
+import linecache
+import operator
+import os
+import resource
+import select
+import shutil
+import signal
+import socket
+import struct
+import sys
+import tempfile
+import time
+import traceback
+
+CLONE_NEWUSER = 0x10000000
+CLONE_NEWNET = 0x40000000
+CLONE_NEWNS = 0x00020000
+MS_NOSUID = 0x2
+MS_NODEV = 0x4
+MS_BIND = 0x1000
+MS_REC = 0x4000
+MS_PRIVATE = 0x40000
+MNT_DETACH = 0x2
+AT_FDCWD = -100
+AT_RECURSIVE = 0x8000
+MOUNT_ATTR_RDONLY = 0x1
+SYS_MOUNT_SETATTR = 442  # the same on every architecture
+SYS_PIVOT_ROOT = {'x86_64': 155, 'aarch64': 41}
+PR_SET_PDEATHSIG = 1
+PR_SET_DUMPABLE = 4
+PR_CAPBSET_DROP = 24
+PR_SET_NO_NEW_PRIVS = 38
+PR_CAP_AMBIENT = 47
+PR_CAP_AMBIENT_CLEAR_ALL = 4
+LINUX_CAPABILITY_VERSION_3 = 0x20080522
+# Bound read-only into the worker's root where they exist; symlinks (merged /usr) are copied
+SYSTEM_PATHS = [
+    '/usr', '/bin', '/sbin', '/lib', '/lib32', '/lib64',
+    '/etc/ld.so.cache', '/etc/localtime', '/etc/mime.types',
+]
+DEVICES = ['/dev/null', '/dev/zero', '/dev/random', '/dev/urandom']
+MAX_PLOTS = 5
+PLOT_PREFIX = 'data:image/png;base64,'
+# Largest value a test can receive from the submission's process
+MAX_MESSAGE_BYTES = 64 * 1024 * 1024
+# Room for the worker's own open files on top of the learner's
+FILE_DESCRIPTORS = 64
+
+
+libc = ctypes.CDLL(None, use_errno=True)
+
+
+def check(result, action):
+    if result != 0:
+        error = ctypes.get_errno()
+        raise OSError(error, f'{action}: {os.strerror(error)}')
+
+
+def unshare(flags):
+    """
+    Move this process into new namespaces: CLONE_NEWNET for a network with
+    no interfaces, CLONE_NEWNS for mounts of its own; False where unsupported
+    """
+    uid, gid = os.getuid(), os.getgid()
+    if libc.unshare(CLONE_NEWUSER | flags) != 0:
+        return False
+    # Keep the same ids inside the new user namespace so files stay accessible
+    for path, content in (('/proc/self/setgroups', 'deny'),
+                          ('/proc/self/uid_map', f'{uid} {uid} 1'),
+                          ('/proc/self/gid_map', f'{gid} {gid} 1')):
+        with open(path, 'w') as file:
+            file.write(content)
+    return True
+
+
+def encode(value):
+    return value.encode() if value is not None else None
+
+
+def mount(source, target, fstype=None, flags=0, data=None):
+    check(libc.mount(encode(source), encode(target), encode(fstype), ctypes.c_ulong(flags), encode(data)),
+          f'mount {target}')
+
+
+class MountAttr(ctypes.Structure):
+    _fields_ = [('attr_set', ctypes.c_uint64), ('attr_clr', ctypes.c_uint64),
+                ('propagation', ctypes.c_uint64), ('userns_fd', ctypes.c_uint64)]
+
+
+def make_read_only(path):
+    """Make the mount at path and every mount below it read-only"""
+    attr = MountAttr(attr_set=MOUNT_ATTR_RDONLY)
+    check(libc.syscall(SYS_MOUNT_SETATTR, AT_FDCWD, path.encode(), AT_RECURSIVE, ctypes.byref(attr),
+                       ctypes.sizeof(attr)), f'mount_setattr {path}')
+
+
+def is_within(path, directory):
+    return path == directory or path.startswith(directory.rstrip('/') + '/')
+
+
+def bind(root, path):
+    """Make host path visible at the same place below root: a copied symlink, or a directory or file bind"""
+    target = root + path
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    if os.path.islink(path):
+        os.symlink(os.readlink(path), target)
+        return
+    if os.path.isdir(path):
+        os.makedirs(target, exist_ok=True)
+    elif not os.path.exists(target):
+        open(target, 'w').close()
+    mount(path, target, flags=MS_BIND | MS_REC)
+
+
+def mask(root, path):
+    """Hide what lies below path under an empty tmpfs"""
+    mount('tmpfs', root + path, 'tmpfs', MS_NOSUID | MS_NODEV, 'size=1m,mode=0755')
+
+
+def isolate_filesystem(config):
+    """
+    Replace this process's root with a minimal read-only one (see the
+    module docstring) whose only writable place is /tmp, and chdir there;
+    False where unsupported. Needs a mount namespace of its own.
+    """
+    pivot_root = SYS_PIVOT_ROOT.get(os.uname().machine)
+    if pivot_root is None:
+        return False
+    # Mounts made here must not propagate back to the host
+    mount(None, '/', flags=MS_REC | MS_PRIVATE)
+    root = os.path.join(os.getcwd(), 'root')
+    os.mkdir(root)
+    mount('tmpfs', root, 'tmpfs', MS_NOSUID | MS_NODEV, 'size=1m,mode=0755')
+
+    for path in SYSTEM_PATHS:
+        if os.path.lexists(path):
+            bind(root, path)
+    # Site directories a system bind exposes, e.g. a project in /usr/src; masked before the
+    # Python binds so that a virtualenv inside the project can still be bound into the mask
+    private = [path for path in map(os.path.realpath, config['private_paths']) if path != '/']
+    for path in private:
+        if os.path.isdir(root + path):
+            mask(root, path)
+    # The interpreter and its libraries, but not the project should a .pth file put it on sys.path
+    script_dir = os.path.dirname(os.path.realpath(__file__))
+    python = {os.path.realpath(sys.base_prefix), os.path.realpath(sys.prefix)}
+    for entry in map(os.path.realpath, sys.path):
+        if os.path.isdir(entry) and entry != script_dir and not any(is_within(entry, path) for path in private):
+            python.add(entry)
+    python = [path for path in sorted(python) if not any(is_within(path, other) for other in python if other != path)]
+    for path in python:
+        bind(root, path)
+    for path in private:
+        if any(is_within(path, directory) and path != directory for directory in python):
+            mask(root, path)
+    devices = [path for path in DEVICES if os.path.exists(path)]
+    os.makedirs(root + '/dev', exist_ok=True)
+    for path in devices:
+        open(root + path, 'w').close()
+    os.mkdir(root + '/tmp')
+    make_read_only(root)
+
+    # Bound after the rest turned read-only, so /dev/null stays writable
+    for path in devices:
+        mount(path, root + path, flags=MS_BIND)
+    mount('tmpfs', root + '/tmp', 'tmpfs', MS_NOSUID | MS_NODEV, f"size={config['scratch_mb']}m,mode=0700")
+    os.chdir(root)
+    check(libc.syscall(pivot_root, b'.', b'.'), 'pivot_root')
+    # The host's root, now stacked under the new one
+    check(libc.umount2(b'.', MNT_DETACH), 'umount old root')
+    os.chdir('/tmp')
+    for name in ('HOME', 'TMPDIR', 'MPLCONFIGDIR'):
+        os.environ[name] = '/tmp'
+    tempfile.tempdir = '/tmp'
+    return True
+
+
+class CapHeader(ctypes.Structure):
+    _fields_ = [('version', ctypes.c_uint32), ('pid', ctypes.c_int)]
+
+
+class CapData(ctypes.Structure):
+    _fields_ = [('effective', ctypes.c_uint32), ('permitted', ctypes.c_uint32), ('inheritable', ctypes.c_uint32)]
+
+
+def drop_privileges():
+    """
+    Give up every capability for good, the ones the user namespace grants
+    included: nothing this process or a program it runs does can mount,
+    unmount or otherwise leave the sandbox
+    """
+    check(libc.prctl(PR_SET_NO_NEW_PRIVS, 1, 0, 0, 0), 'PR_SET_NO_NEW_PRIVS')
+    # Outside a user namespace an unprivileged process has none to drop here
+    for capability in range(64):
+        if libc.prctl(PR_CAPBSET_DROP, capability, 0, 0, 0) != 0:
+            if ctypes.get_errno() == errno.EINVAL:
+                break
+    libc.prctl(PR_CAP_AMBIENT, PR_CAP_AMBIENT_CLEAR_ALL, 0, 0, 0)
+    check(libc.capset(ctypes.byref(CapHeader(LINUX_CAPABILITY_VERSION_3, 0)), (CapData * 2)()), 'capset')
+
+
+def preload(modules):
+    """Import what learners' code usually needs; returns {module: version} for the ones installed"""
+    loaded = {}
+    for name in modules:
+        try:
+            module = __import__(name)
+        except ImportError:
+            continue
+        loaded[name] = getattr(module, '__version__', '')
+    return loaded
+
+
+def virtual_memory_size():
+    with open('/proc/self/statm') as statm:
+        return int(statm.read().split()[0]) * resource.getpagesize()
+
+
+def limit_resources(config):
+    cpu = config['cpu_seconds']
+    resource.setrlimit(resource.RLIMIT_CPU, (cpu, cpu + 1))
+    # Relative to what the preloaded libraries already map
+    memory = config['mapped_bytes'] + config['memory_mb'] * 1024 * 1024
+    resource.setrlimit(resource.RLIMIT_AS, (memory, memory))
+    resource.setrlimit(resource.RLIMIT_FSIZE, (config['file_bytes'], config['file_bytes']))
+    resource.setrlimit(resource.RLIMIT_NOFILE, (FILE_DESCRIPTORS, FILE_DESCRIPTORS))
+    resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+    # Oversized writes then fail with an OSError the learner can see instead of killing the run
+    signal.signal(signal.SIGXFSZ, signal.SIG_IGN)
+
+
+def execute(code):
+    """Run code like a notebook cell, printing the value of a final expression; returns its globals"""
+    # Lets tracebacks quote the learner's lines
+    linecache.cache['<example>'] = (len(code), None, code.splitlines(keepends=True), '<example>')
+    tree = ast.parse(code, '<example>')
+    last = tree.body.pop() if tree.body and isinstance(tree.body[-1], ast.Expr) else None
+    namespace = {'__name__': '__main__', '__builtins__': __builtins__}
+    exec(compile(tree, '<example>', 'exec'), namespace)
+    if last is not None:
+        value = eval(compile(ast.Expression(last.value), '<example>', 'eval'), namespace)
+        if value is not None:
+            print(repr(value))
+    return namespace
+
+
+def collect_plots():
+    """Open matplotlib figures as PNG data URIs"""
+    pyplot = sys.modules.get('matplotlib.pyplot')
+    if pyplot is None:
+        return []
+    plots = []
+    for number in pyplot.get_fignums()[:MAX_PLOTS]:
+        buffer = io.BytesIO()
+        pyplot.figure(number).savefig(buffer, format='png', dpi=80, bbox_inches='tight')
+        plots.append(PLOT_PREFIX + base64.b64encode(buffer.getvalue()).decode())
+    pyplot.close('all')
+    return plots
+
+
+def read_pipe(fd, deadline):
+    """Read fd until EOF; returns (data, timed_out)"""
+    chunks = []
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0 or not select.select([fd], [], [], remaining)[0]:
+            return b''.join(chunks), True
+        chunk = os.read(fd, 65536)
+        if not chunk:
+            return b''.join(chunks), False
+        chunks.append(chunk)
+
+
+def error_message(error):
+    return ''.join(traceback.format_exception_only(error)).strip()
+
+
+# Hidden tests: see the module docstring
+
+class Codec:
+    """
+    Tagged JSON for values crossing between a tester and a submission
+
+    Plain data is rebuilt from its contents on the other side, never
+    unpickled, so the receiver only ever constructs the types listed here;
+    anything else travels as a reference to an object the sending side
+    keeps.
+    """
+
+    SCALARS = (type(None), bool, int, float, str)
+    SEQUENCES = {list: 'list', tuple: 'tuple', set: 'set', frozenset: 'frozenset'}
+    ARRAY_KINDS = 'biufcmMSU'
+
+    def reference(self, value):
+        raise NotImplementedError
+
+    def dereference(self, ref):
+        raise NotImplementedError
+
+    def encode(self, value):
+        kind = type(value)
+        if kind in self.SCALARS:
+            return value
+        if isinstance(value, Remote):
+            return {'t': 'ref', 'id': value._id}
+        numpy = sys.modules.get('numpy')
+        pandas = sys.modules.get('pandas')
+        if pandas is not None:
+            data = self.encode_pandas(value, pandas)
+            if data is not None:
+                return data
+        if numpy is not None:
+            if kind is numpy.ndarray:
+                return self.encode_array(value)
+            if isinstance(value, numpy.generic):
+                return {'t': 'scalar', 'array': self.encode_array(numpy.asarray(value))}
+        for base, tag in self.SEQUENCES.items():
+            # Named tuples and other subclasses compare equal to the plain type
+            if isinstance(value, base):
+                return {'t': tag, 'items': [self.encode(item) for item in value]}
+        if isinstance(value, dict):
+            dict_kind = kind.__name__ if kind in (collections.Counter, collections.OrderedDict) else 'dict'
+            return {'t': 'dict', 'kind': dict_kind,
+                    'items': [[self.encode(key), self.encode(item)] for key, item in value.items()]}
+        if kind in (bytes, bytearray):
+            return {'t': kind.__name__, 'data': base64.b64encode(value).decode()}
+        if kind is complex:
+            return {'t': 'complex', 'real': value.real, 'imag': value.imag}
+        if kind in (datetime.datetime, datetime.date, datetime.time):
+            return {'t': kind.__name__, 'value': value.isoformat()}
+        if kind is datetime.timedelta:
+            return {'t': 'timedelta', 'value': [value.days, value.seconds, value.microseconds]}
+        if kind in (decimal.Decimal, fractions.Fraction):
+            return {'t': kind.__name__, 'value': str(value)}
+        if kind is range:
+            return {'t': 'range', 'value': [value.start, value.stop, value.step]}
+        return {'t': 'ref', 'id': self.reference(value)}
+
+    def encode_array(self, array):
+        if array.dtype.kind == 'O':
+            return {'t': 'ndarray', 'dtype': 'O', 'shape': list(array.shape),
+                    'items': [self.encode(item) for item in array.ravel()]}
+        if array.dtype.kind not in self.ARRAY_KINDS or array.dtype.fields:
+            return {'t': 'ref', 'id': self.reference(array)}
+        return {'t': 'ndarray', 'dtype': array.dtype.str, 'shape': list(array.shape),
+                'data': base64.b64encode(array.tobytes()).decode()}
+
+    def encode_values(self, values, numpy, pandas):
+        """The values of a Series or Index, keeping their dtype"""
+        if isinstance(values.dtype, numpy.dtype):
+            return self.encode_array(numpy.asarray(values))
+        if isinstance(values.dtype, pandas.CategoricalDtype):
+            values = pandas.Categorical(values)
+            return {'t': 'categorical', 'codes': self.encode_array(values.codes),
+                    'categories': self.encode(values.categories), 'ordered': bool(values.ordered)}
+        return {'t': 'extension', 'dtype': str(values.dtype),
+                'items': self.encode_array(numpy.asarray(values, dtype=object))}
+
+    def encode_pandas(self, value, pandas):
+        numpy = sys.modules['numpy']
+        kind = type(value)
+        if value is pandas.NaT:
+            return {'t': 'nat'}
+        if value is pandas.NA:
+            return {'t': 'na'}
+        if kind is pandas.Timestamp:
+            return {'t': 'timestamp', 'value': value.value, 'tz': str(value.tz) if value.tz else None}
+        if kind is pandas.Timedelta:
+            return {'t': 'pd.timedelta', 'value': value.value}
+        if kind is pandas.Period:
+            return {'t': 'period', 'value': str(value), 'freq': value.freqstr}
+        if kind is pandas.DataFrame:
+            return {'t': 'dataframe', 'columns': self.encode(value.columns), 'index': self.encode(value.index),
+                    'data': [self.encode_values(value.iloc[:, i], numpy, pandas) for i in range(value.shape[1])]}
+        if kind is pandas.Series:
+            return {'t': 'series', 'values': self.encode_values(value, numpy, pandas),
+                    'index': self.encode(value.index), 'name': self.encode(value.name)}
+        if kind is pandas.RangeIndex:
+            return {'t': 'rangeindex', 'value': [value.start, value.stop, value.step], 'name': self.encode(value.name)}
+        if kind is pandas.MultiIndex:
+            return {'t': 'multiindex', 'levels': [self.encode(level) for level in value.levels],
+                    'codes': [self.encode_array(codes) for codes in value.codes],
+                    'names': self.encode(list(value.names))}
+        if isinstance(value, pandas.Index):
+            freq = value.freqstr if isinstance(value, (pandas.DatetimeIndex, pandas.TimedeltaIndex)) else None
+            return {'t': 'index', 'values': self.encode_values(value, numpy, pandas),
+                    'name': self.encode(value.name), 'freq': freq}
+        if kind is pandas.Categorical:
+            return self.encode_values(pandas.Series(value), numpy, pandas)
+        return None
+
+    def decode(self, data):
+        if not isinstance(data, dict):
+            return data
+        tag = data['t']
+        if tag == 'ref':
+            return self.dereference(data['id'])
+        if tag in ('list', 'tuple', 'set', 'frozenset'):
+            return {'list': list, 'tuple': tuple, 'set': set, 'frozenset': frozenset}[tag](
+                self.decode(item) for item in data['items'])
+        if tag == 'dict':
+            items = {self.decode(key): self.decode(item) for key, item in data['items']}
+            kind = {'Counter': collections.Counter, 'OrderedDict': collections.OrderedDict}.get(data['kind'], dict)
+            return kind(items)
+        if tag in ('bytes', 'bytearray'):
+            return {'bytes': bytes, 'bytearray': bytearray}[tag](base64.b64decode(data['data']))
+        if tag == 'complex':
+            return complex(data['real'], data['imag'])
+        if tag in ('datetime', 'date', 'time'):
+            return getattr(datetime, tag).fromisoformat(data['value'])
+        if tag == 'timedelta':
+            return datetime.timedelta(*data['value'])
+        if tag == 'Decimal':
+            return decimal.Decimal(data['value'])
+        if tag == 'Fraction':
+            return fractions.Fraction(data['value'])
+        if tag == 'range':
+            return range(*data['value'])
+        import numpy
+        if tag == 'ndarray':
+            return self.decode_array(data, numpy)
+        if tag == 'scalar':
+            return self.decode_array(data['array'], numpy)[()]
+        import pandas
+        if tag == 'nat':
+            return pandas.NaT
+        if tag == 'na':
+            return pandas.NA
+        if tag == 'timestamp':
+            return pandas.Timestamp(data['value'], tz=data['tz'])
+        if tag == 'pd.timedelta':
+            return pandas.Timedelta(data['value'])
+        if tag == 'period':
+            return pandas.Period(data['value'], freq=data['freq'])
+        if tag == 'dataframe':
+            columns = self.decode(data['columns'])
+            frame = pandas.DataFrame(
+                {i: self.decode_values(values, numpy, pandas) for i, values in enumerate(data['data'])},
+                index=self.decode(data['index']),
+            )
+            frame.columns = columns
+            return frame
+        if tag == 'series':
+            return pandas.Series(self.decode_values(data['values'], numpy, pandas),
+                                 index=self.decode(data['index']), name=self.decode(data['name']))
+        if tag == 'rangeindex':
+            return pandas.RangeIndex(*data['value'], name=self.decode(data['name']))
+        if tag == 'multiindex':
+            return pandas.MultiIndex(
+                levels=[self.decode(level) for level in data['levels']],
+                codes=[self.decode_array(codes, numpy) for codes in data['codes']], names=self.decode(data['names']),
+            )
+        if tag == 'index':
+            index = pandas.Index(self.decode_values(data['values'], numpy, pandas), name=self.decode(data['name']))
+            return type(index)(index, freq=data['freq']) if data['freq'] else index
+        if tag in ('categorical', 'extension'):
+            return self.decode_values(data, numpy, pandas)
+        raise ValueError(f'Unknown value type {tag!r}')
+
+    def decode_array(self, data, numpy):
+        shape = data['shape']
+        if data['dtype'] == 'O':
+            array = numpy.empty(len(data['items']), dtype=object)
+            for i, item in enumerate(data['items']):
+                array[i] = self.decode(item)
+            return array.reshape(shape)
+        dtype = numpy.dtype(data['dtype'])
+        if dtype.kind not in self.ARRAY_KINDS or dtype.fields:
+            raise ValueError(f'Unsupported dtype {dtype}')
+        return numpy.frombuffer(base64.b64decode(data['data']), dtype=dtype).reshape(shape).copy()
+
+    def decode_values(self, data, numpy, pandas):
+        if data['t'] == 'categorical':
+            return pandas.Categorical.from_codes(
+                self.decode_array(data['codes'], numpy), categories=self.decode(data['categories']),
+                ordered=data['ordered'],
+            )
+        if data['t'] == 'extension':
+            return pandas.array(self.decode_array(data['items'], numpy), dtype=data['dtype'])
+        return self.decode_array(data, numpy)
+
+
+class SubmissionCodec(Codec):
+    """The submission's side: objects the tester cannot rebuild stay here, numbered"""
+
+    def __init__(self):
+        self.objects = {}
+
+    def reference(self, value):
+        ref = len(self.objects)
+        self.objects[ref] = value
+        return ref
+
+    def dereference(self, ref):
+        return self.objects[ref]
+
+
+class TesterCodec(Codec):
+    """The tester's side: references are Remotes, and the tests' own objects cannot be passed"""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def reference(self, value):
+        raise TypeError(f'{type(value).__name__} values cannot be passed to the submission')
+
+    def dereference(self, ref):
+        return Remote(self.connection, ref)
+
+
+def send_message(sock, message):
+    data = json.dumps(message).encode()
+    sock.sendall(struct.pack('>I', len(data)) + data)
+
+
+def receive_exactly(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            raise EOFError('The submission stopped answering')
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def receive_message(sock):
+    size, = struct.unpack('>I', receive_exactly(sock, 4))
+    if size > MAX_MESSAGE_BYTES:
+        raise ValueError('The submission sent a value too large to check')
+    return json.loads(receive_exactly(sock, size))
+
+
+# What a tester can ask of the submission's objects
+OPERATIONS = {
+    'call': lambda function, *args, **kwargs: function(*args, **kwargs),
+    'getattr': getattr, 'setattr': setattr, 'isinstance': isinstance,
+    'repr': repr, 'str': str, 'hash': hash, 'bool': bool, 'len': len, 'iter': iter, 'next': next,
+    'int': int, 'float': float, 'index': operator.index, 'abs': abs,
+    'neg': operator.neg, 'pos': operator.pos, 'invert': operator.invert,
+    'getitem': operator.getitem, 'setitem': operator.setitem, 'delitem': operator.delitem,
+    'contains': operator.contains,
+}
+COMPARISONS = ['eq', 'ne', 'lt', 'le', 'gt', 'ge']
+BINARY_OPERATORS = ['add', 'sub', 'mul', 'truediv', 'floordiv', 'mod', 'pow', 'matmul',
+                    'and', 'or', 'xor', 'lshift', 'rshift']
+for name in COMPARISONS + BINARY_OPERATORS:
+    OPERATIONS[name] = getattr(operator, f'{name}_' if name in ('and', 'or') else name)
+
+
+class Connection:
+    """The tester's end of the socket to the submission's process"""
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.codec = TesterCodec(self)
+
+    def request(self, operation, *args, **kwargs):
+        send_message(self.sock, {
+            'op': operation,
+            'args': [self.codec.encode(arg) for arg in args],
+            'kwargs': {key: self.codec.encode(value) for key, value in kwargs.items()},
+        })
+        response = receive_message(self.sock)
+        if 'error' in response:
+            raise submission_error(**response['error'])
+        if response.get('missing'):
+            raise KeyError(args[0])
+        return self.codec.decode(response['value'])
+
+
+def submission_error(type, message):
+    """An exception raised in the submission, as the built-in class of that name or a stand-in"""
+    exception_class = getattr(builtins, type, None)
+    if isinstance(exception_class, builtins.type) and issubclass(exception_class, Exception):
+        try:
+            return exception_class(message)
+        except Exception:
+            pass
+    return builtins.type(type, (Exception,), {})(message)
+
+
+class Remote:
+    """An object of the submission's: what the tests do with it happens in the submission's process"""
+
+    __slots__ = ('_connection', '_id')
+
+    def __init__(self, connection, ref):
+        object.__setattr__(self, '_connection', connection)
+        object.__setattr__(self, '_id', ref)
+
+    def _request(self, operation, *args, **kwargs):
+        return self._connection.request(operation, *args, **kwargs)
+
+    def __getattr__(self, name):
+        return self._request('getattr', self, name)
+
+    def __setattr__(self, name, value):
+        self._request('setattr', self, name, value)
+
+    def __call__(self, *args, **kwargs):
+        return self._request('call', self, *args, **kwargs)
+
+    def __instancecheck__(self, instance):
+        return self._request('isinstance', instance, self)
+
+    def __contains__(self, item):
+        return self._request('contains', self, item)
+
+    def __setitem__(self, key, value):
+        self._request('setitem', self, key, value)
+
+
+for name in ['repr', 'str', 'hash', 'bool', 'len', 'iter', 'next', 'int', 'float', 'index', 'abs',
+             'neg', 'pos', 'invert', 'getitem', 'delitem'] + COMPARISONS:
+    setattr(Remote, f'__{name}__', lambda self, *args, operation=name: self._request(operation, self, *args))
+for name in BINARY_OPERATORS:
+    setattr(Remote, f'__{name}__', lambda self, other, operation=name: self._request(operation, self, other))
+    setattr(Remote, f'__r{name}__', lambda self, other, operation=name: self._request(operation, other, self))
+
+
+class TestGlobals(dict):
+    """
+    Globals of the tests' source: names it does not define itself come from
+    the submission, looked up again on every use, except built-in names,
+    which a submission cannot redefine for the tests
+    """
+
+    def __init__(self, connection):
+        super().__init__(__name__='__tests__')
+        self.connection = connection
+
+    def __missing__(self, name):
+        if hasattr(builtins, name):
+            raise KeyError(name)
+        return self.connection.request('get', name)
+
+
+def redirect_output(paths):
+    """Point stdin, stdout and stderr away from the worker's request and response pipes"""
+    for fd, path, flags in ((0, os.devnull, os.O_RDONLY), (1, paths[0], os.O_WRONLY | os.O_CREAT | os.O_TRUNC),
+                            (2, paths[1], os.O_WRONLY | os.O_CREAT | os.O_TRUNC)):
+        opened = os.open(path, flags, 0o600)
+        os.dup2(opened, fd)
+        os.close(opened)
+    sys.stdout = open(1, 'w', buffering=1, closefd=False)
+    sys.stderr = open(2, 'w', buffering=1, closefd=False)
+
+
+def serve_submission(code, config, sock):
+    """Body of the submission's process in a test: runs the code, then answers the tester; never returns"""
+    try:
+        # Nothing but the socket: not the tester's result pipe, nor the worker's
+        keep = sock.fileno()
+        os.closerange(3, keep)
+        os.closerange(keep + 1, os.sysconf('SC_OPEN_MAX'))
+        libc.prctl(PR_SET_PDEATHSIG, signal.SIGKILL, 0, 0, 0)
+        limit_resources(config)
+        drop_privileges()
+        namespace = execute(code)
+        codec = SubmissionCodec()
+        while True:
+            request = receive_message(sock)
+            try:
+                if request['op'] == 'get':
+                    name = request['args'][0]
+                    if name not in namespace:
+                        send_message(sock, {'missing': True})
+                        continue
+                    value = namespace[name]
+                else:
+                    args = [codec.decode(arg) for arg in request['args']]
+                    kwargs = {key: codec.decode(value) for key, value in request['kwargs'].items()}
+                    value = OPERATIONS[request['op']](*args, **kwargs)
+                response = {'value': codec.encode(value)}
+            except BaseException as error:
+                try:
+                    message = str(error)
+                except Exception:
+                    message = ''
+                response = {'error': {'type': type(error).__name__, 'message': message}}
+            send_message(sock, response)
+    finally:
+        os._exit(0)
+
+
+def tester(code, tests, name, config, result_fd):
+    """Body of the forked process that runs one test function: never returns"""
+    result = {'passed': False, 'message': ''}
+    try:
+        os.setsid()
+        # The hidden tests' own output is not shown
+        redirect_output([os.devnull, os.devnull])
+        tester_socket, submission_socket = socket.socketpair()
+        if os.fork() == 0:
+            os.close(result_fd)
+            tester_socket.close()
+            serve_submission(code, config, submission_socket)
+        submission_socket.close()
+        limit_resources(config)
+        drop_privileges()
+        namespace = TestGlobals(Connection(tester_socket))
+        exec(compile(tests, '<tests>', 'exec'), namespace)
+        namespace[name]()
+        result['passed'] = True
+    except BaseException as error:
+        # Only the message: a traceback would reveal the hidden test
+        result['message'] = error_message(error)
+    finally:
+        try:
+            with open(result_fd, 'wb') as output:
+                output.write(json.dumps(result).encode())
+        finally:
+            os._exit(0)
+
+
+def run_test(code, tests, name, config, seconds, workdir):
+    """Run one test function in a tester process; returns its result dict"""
+    started = time.monotonic()
+    result_r, result_w = os.pipe()
+    sys.stdout.flush()
+    pid = os.fork()
+    if pid == 0:
+        os.close(result_r)
+        os.chdir(workdir)
+        tester(code, tests, name, config, result_w)
+    os.close(result_w)
+    data, timed_out = read_pipe(result_r, started + seconds)
+    os.close(result_r)
+    stop(pid)
+    if timed_out:
+        result = {'passed': False, 'message': f'Timed out after {round(seconds, 1):g} seconds'}
+    else:
+        try:
+            result = json.loads(data)
+        except ValueError:
+            result = {'passed': False, 'message': 'The test crashed'}
+    result['duration_ms'] = round((time.monotonic() - started) * 1000)
+    return result
+
+
+def run_tests(code, tests, config, seconds, deadline, workdir):
+    """Run each test_* function defined by the tests source, in order, each within seconds and all by deadline"""
+    names = [node.name for node in ast.parse(tests, '<tests>').body
+             if isinstance(node, ast.FunctionDef) and node.name.startswith('test')]
+    results = []
+    for name in names:
+        limit = max(0, min(seconds, deadline - time.monotonic()))
+        results.append({'name': name, **run_test(code, tests, name, config, limit, workdir)})
+    return results
+
+
+def stop(pid):
+    """Kill a forked process with its process group and reap it; returns its wait status"""
+    try:
+        # The child leads its own process group, which takes anything it started with it
+        os.killpg(pid, signal.SIGKILL)
+    except ProcessLookupError:
+        # Stopped before its setsid()
+        os.kill(pid, signal.SIGKILL)
+    return os.waitpid(pid, 0)[1]
+
+
+def child(code, config, result_fd):
+    """Body of the forked run: never returns"""
+    status = 'error'
+    plots = []
+    try:
+        os.setsid()
+        redirect_output(['stdout', 'stderr'])
+        limit_resources(config)
+        drop_privileges()
+        try:
+            execute(code)
+            status = 'ok'
+        except SystemExit as error:
+            status = 'ok' if error.code in (None, 0) else 'error'
+        except BaseException as error:
+            # Hide this file's frames: learners only need the ones in their code
+            frames = [frame for frame in traceback.extract_tb(error.__traceback__) if frame.filename == '<example>']
+            if frames:
+                sys.stderr.write('Traceback (most recent call last):\n' + ''.join(traceback.format_list(frames)))
+            sys.stderr.write(''.join(traceback.format_exception_only(error)))
+        plots = collect_plots()
+    except BaseException:
+        traceback.print_exc()
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            with open(result_fd, 'wb') as result:
+                result.write(json.dumps({'status': status, 'plots': plots}).encode())
+        finally:
+            os._exit(0)
+
+
+def read_output(path, limit):
+    try:
+        with open(path, 'rb') as file:
+            data = file.read(limit + 1)
+    except FileNotFoundError:
+        return ''
+    text = data[:limit].decode('utf-8', 'replace')
+    return text + '\n[output truncated]' if len(data) > limit else text
+
+
+def run(config, code, tests=None, test_seconds=None, wall_seconds=None):
+    started = time.monotonic()
+    wall_seconds = wall_seconds or config['wall_seconds']
+    workdir = tempfile.mkdtemp(prefix='run-')
+    result_r, result_w = os.pipe()
+    sys.stdout.flush()
+    pid = os.fork()
+    if pid == 0:
+        os.close(result_r)
+        os.chdir(workdir)
+        child(code, config, result_w)
+    os.close(result_w)
+    data, timed_out = read_pipe(result_r, started + wall_seconds)
+    os.close(result_r)
+    wait_status = stop(pid)
+
+    # Written by the learner's process, so only trusted as far as it can be checked
+    try:
+        reported = json.loads(data)
+        result = {
+            'status': 'ok' if reported['status'] == 'ok' else 'error',
+            'plots': [plot for plot in reported['plots'] if str(plot).startswith(PLOT_PREFIX)][:MAX_PLOTS],
+        }
+    except (ValueError, TypeError, KeyError):
+        result = {'status': 'error', 'plots': []}
+    stderr = read_output(os.path.join(workdir, 'stderr'), config['output_bytes'])
+    if timed_out:
+        result['status'] = 'timeout'
+        stderr += f"\nStopped after {wall_seconds} seconds"
+    elif not data and os.WIFSIGNALED(wait_status):
+        # SIGXCPU for the CPU limit, SIGKILL when memory ran out mid-allocation
+        signal_number = os.WTERMSIG(wait_status)
+        result['status'] = 'timeout' if signal_number == signal.SIGXCPU else 'error'
+        stderr += f'\nStopped by {signal.Signals(signal_number).name}'
+    result['tests'] = []
+    if tests is not None and result['status'] == 'ok':
+        try:
+            result['tests'] = run_tests(code, tests, config, test_seconds, started + wall_seconds, workdir)
+        except SyntaxError:
+            result['status'] = 'error'
+            stderr += "\nThe exercise's tests have a syntax error"
+    result.update(
+        stdout=read_output(os.path.join(workdir, 'stdout'), config['output_bytes']),
+        stderr=stderr.lstrip('\n'),
+        duration_ms=round((time.monotonic() - started) * 1000),
+    )
+    shutil.rmtree(workdir, ignore_errors=True)
+    return result
+
+
+def send(message):
+    sys.stdout.write(json.dumps(message) + '\n')
+    sys.stdout.flush()
+
+
+def main():
+    config = json.loads(sys.argv[1])
+    flags = (CLONE_NEWNET if config['isolate_network'] else 0) | (CLONE_NEWNS if config['isolate_filesystem'] else 0)
+    # Before any import can start threads: unshare() refuses multithreaded processes
+    unshared = bool(flags) and unshare(flags)
+    # Learners' code, which runs as the same user, cannot ptrace the worker into undoing the isolation
+    libc.prctl(PR_SET_DUMPABLE, 0, 0, 0, 0)
+    loaded = preload(config['preload'])
+    runtime = ' '.join([f'python-{sys.version.split()[0]}'] + [f'{name}-{version}' for name, version in loaded.items()])
+    # Measured while /proc is still there
+    config['mapped_bytes'] = virtual_memory_size()
+    try:
+        filesystem_isolated = unshared and config['isolate_filesystem'] and isolate_filesystem(config)
+    except OSError:
+        filesystem_isolated = False
+    send({
+        'ready': True,
+        'runtime': runtime,
+        'network_isolated': unshared and config['isolate_network'],
+        'filesystem_isolated': filesystem_isolated,
+    })
+    for line in sys.stdin:
+        send(run(config, **json.loads(line)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,959 @@
+"""
+Service classes for the courses app
+"""
+import difflib
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections, router, transaction
+from django.db.models import Count, DecimalField, Exists, F, IntegerField, Max, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.utils.functional import cached_property
+from django.utils.text import slugify
+
+from core.db import retry_on_locked
+from core.tasks import enqueue_on_commit
+
+from . import offline
+from .bundles import data_fields
+from .models import (
+    CapstoneProject, CodeExample, Course, CourseModule, CourseProjectStats, Enrollment, Exercise,
+    ExerciseSubmission, ModuleCompletion, PaymentInstallment, ProjectEnrollment
+)
+from .runner import RunnerUnavailable, grading_pool, pool
+
+logger = logging.getLogger(__name__)
+
+
+class LearnerDashboardService:
+    """
+    Builds and caches the per-user enrollment summary shown on the learner
+    dashboard and the My Enrollments page
+    """
+
+    CACHE_TIMEOUT = 60 * 5
+    CACHE_KEY = 'learner_dashboard:{user_id}'
+
+    @staticmethod
+    def _count_subquery(queryset, group_by):
+        """Correlated COUNT(*) subquery grouped on ``group_by``"""
+        return Coalesce(
+            Subquery(
+                queryset.order_by().values(group_by).annotate(total=Count('pk')).values('total')[:1],
+                output_field=IntegerField()
+            ),
+            Value(0)
+        )
+
+    @classmethod
+    def get_enrollments_queryset(cls, user):
+        """
+        All enrollments for ``user`` with course/category joined and installment
+        and progress totals annotated, in a single query
+        """
+        verified_installments = PaymentInstallment.objects.filter(
+            enrollment=OuterRef('pk'),
+            status='verified'
+        )
+        completed_modules = ModuleCompletion.objects.filter(
+            enrollment=OuterRef('pk'),
+            module__is_active=True
+        )
+        active_modules = CourseModule.objects.filter(
+            course=OuterRef('course'),
+            is_active=True
+        )
+
+        return Enrollment.objects.filter(user=user).select_related(
+            'user', 'course__category'
+        ).annotate(
+            verified_installments_count=cls._count_subquery(verified_installments, 'enrollment'),
+            verified_amount=Coalesce(
+                Subquery(
+                    verified_installments.order_by().values('enrollment').annotate(
+                        total=Sum('amount')
+                    ).values('total')[:1],
+                    output_field=DecimalField(max_digits=10, decimal_places=2)
+                ),
+                Value(0),
+                output_field=DecimalField(max_digits=10, decimal_places=2)
+            ),
+            completed_modules_count=cls._count_subquery(completed_modules, 'enrollment'),
+            active_modules_count=cls._count_subquery(active_modules, 'course'),
+        ).order_by('-created_at')
+
+    @classmethod
+    def get_summary(cls, user):
+        """
+        Return the cached dashboard summary for ``user``, building it on a miss
+
+        The summary is a dict with the annotated ``enrollments`` list and the
+        aggregate counters the dashboards display.
+        """
+        cache_key = cls.CACHE_KEY.format(user_id=user.pk)
+        summary = cache.get(cache_key)
+        if summary is None:
+            enrollments = list(cls.get_enrollments_queryset(user))
+            summary = {
+                'enrollments': enrollments,
+                'total_enrollments': len(enrollments),
+                'active_enrollments': sum(1 for e in enrollments if e.is_activated),
+                'completed_payments': sum(1 for e in enrollments if e.payment_status == 'completed'),
+                'learning_hours': sum(e.course.estimated_hours for e in enrollments if e.is_activated),
+            }
+            cache.set(cache_key, summary, cls.CACHE_TIMEOUT)
+        return summary
+
+    @classmethod
+    def invalidate(cls, user_id):
+        """Drop the cached summary for a user"""
+        if user_id:
+            cache.delete(cls.CACHE_KEY.format(user_id=user_id))
+
+    @classmethod
+    def invalidate_for_enrollment(cls, enrollment_id):
+        """Drop the cached summary for the owner of an enrollment"""
+        user_id = Enrollment.objects.filter(pk=enrollment_id).values_list('user_id', flat=True).first()
+        cls.invalidate(user_id)
+
+
+class ProjectStatsService:
+    """
+    Keeps CourseProjectStats in step with ProjectEnrollment changes by applying
+    the difference between the old and new statistics snapshot of a row
+    """
+
+    STATUS_COUNTERS = {
+        'in_progress': 'in_progress_count',
+        'submitted': 'submitted_count',
+        'completed': 'completed_count',
+    }
+
+    @classmethod
+    def _contribution(cls, snapshot):
+        """Counter values a single project enrollment adds to its course"""
+        if not snapshot:
+            return {}
+        contribution = {}
+        counter = cls.STATUS_COUNTERS.get(snapshot['status'])
+        if counter:
+            contribution[counter] = 1
+        if snapshot['grade'] is not None:
+            contribution['graded_count'] = 1
+            contribution['grade_total'] = Decimal(snapshot['grade'])
+        if snapshot['review_seconds'] is not None:
+            contribution['reviewed_count'] = 1
+            contribution['review_seconds_total'] = snapshot['review_seconds']
+        return contribution
+
+    @classmethod
+    def apply_changes(cls, changes):
+        """
+        Apply a batch of ``(old_snapshot, new_snapshot)`` pairs
+
+        Deltas are summed per course first so bulk updates cost one UPDATE per
+        affected course rather than one per row.
+        """
+        deltas_by_project = {}
+        for old, new in changes:
+            for snapshot, sign in ((old, -1), (new, 1)):
+                if not snapshot:
+                    continue
+                deltas = deltas_by_project.setdefault(snapshot['project_id'], {})
+                for counter, value in cls._contribution(snapshot).items():
+                    deltas[counter] = deltas.get(counter, 0) + sign * value
+
+        deltas_by_project = {
+            project_id: deltas
+            for project_id, deltas in deltas_by_project.items()
+            if any(deltas.values())
+        }
+        if not deltas_by_project:
+            return
+
+        project_courses = dict(
+            CapstoneProject.objects.filter(pk__in=deltas_by_project).values_list('id', 'course_id')
+        )
+        deltas_by_course = {}
+        for project_id, deltas in deltas_by_project.items():
+            course_deltas = deltas_by_course.setdefault(project_courses.get(project_id), {})
+            for counter, value in deltas.items():
+                course_deltas[counter] = course_deltas.get(counter, 0) + value
+
+        for course_id, deltas in deltas_by_course.items():
+            if course_id is None:
+                continue
+            updates = {counter: F(counter) + value for counter, value in deltas.items() if value}
+            if not updates:
+                continue
+            if not CourseProjectStats.objects.filter(course_id=course_id).update(**updates):
+                CourseProjectStats.objects.get_or_create(course_id=course_id)
+                CourseProjectStats.objects.filter(course_id=course_id).update(**updates)
+
+    @classmethod
+    def apply_change(cls, old_snapshot, new_snapshot):
+        """Apply the change of a single project enrollment"""
+        cls.apply_changes([(old_snapshot, new_snapshot)])
+
+    @classmethod
+    def rebuild(cls, course_ids=None):
+        """Recompute statistics from scratch, e.g. after raw SQL or queryset.update()"""
+        queryset = ProjectEnrollment.objects.all()
+        stats = CourseProjectStats.objects.all()
+        if course_ids is not None:
+            queryset = queryset.filter(project__course_id__in=course_ids)
+            stats = stats.filter(course_id__in=course_ids)
+        stats.delete()
+        cls.apply_changes(
+            (None, project_enrollment.get_stats_snapshot())
+            for project_enrollment in queryset.only(*ProjectEnrollment.STATS_FIELDS).iterator()
+        )
+
+
+class PrecountedPaginator(Paginator):
+    """
+    Paginator that takes the total from maintained counters instead of COUNT(*)
+
+    Each page checks the counter against the rows it fetched: the last page
+    asks for one row more than fits, so a counter that drifted low cannot
+    hide the rows past it, and a page that comes back short shows where a
+    counter that drifted high really ends. The total is then corrected for
+    this paginator; a correct counter costs no extra query.
+    """
+
+    def __init__(self, object_list, per_page, count, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self._count = count
+
+    @cached_property
+    def count(self):
+        return self._count
+
+    def page(self, number):
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        last = number == self.num_pages
+        size = self.per_page + (self.orphans + 1 if last else 0)
+        rows = list(self.object_list[bottom:bottom + size])
+        if len(rows) == (self.count - bottom if last else self.per_page):
+            return self._get_page(rows, number, self)
+
+        if len(rows) < size and (rows or not bottom):
+            exact = bottom + len(rows)
+        else:
+            exact = self.object_list.count()
+        logger.warning('Precounted total %s is out of step with the %s rows paginated', self._count, exact)
+        self._count = exact
+        for cached in ('count', 'num_pages'):
+            self.__dict__.pop(cached, None)
+        # A page the counter promised but that does not exist becomes the real last page
+        return super().page(min(number, self.num_pages))
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that reads the planner's row estimate for unfiltered tables
+
+    An exact COUNT(*) over millions of rows dominates admin changelist time.
+    When the queryset has no filters and the database reports at least
+    ESTIMATE_THRESHOLD rows, that estimate is used instead. Filtered querysets
+    and small tables are counted exactly.
+    """
+
+    ESTIMATE_THRESHOLD = 100000
+
+    @staticmethod
+    def estimate_table_rows(model):
+        """Row estimate from database statistics, or None when unavailable"""
+        table = model._meta.db_table
+        queries = {
+            'postgresql': ("SELECT reltuples::bigint FROM pg_class WHERE relname = %s", [table]),
+            'mysql': ("SELECT table_rows FROM information_schema.tables "
+                      "WHERE table_schema = DATABASE() AND table_name = %s", [table]),
+            # Populated by ANALYZE; the first number of each row is the table size
+            'sqlite': ("SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1", [table]),
+        }
+        connection = connections[router.db_for_read(model)]
+        if connection.vendor not in queries:
+            return None
+        sql, params = queries[connection.vendor]
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(sql, params)
+                row = cursor.fetchone()
+        except DatabaseError:
+            return None
+        if not row or row[0] is None:
+            return None
+        try:
+            return int(str(row[0]).split()[0])
+        except ValueError:
+            return None
+
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, 'query', None)
+        if query is not None and not query.where:
+            estimate = self.estimate_table_rows(self.object_list.model)
+            if estimate is not None and estimate >= self.ESTIMATE_THRESHOLD:
+                return estimate
+        return super().count
+
+
+class InstructorQueueService:
+    """Course lists, statistics and the paginated review queue for instructors"""
+
+    PAGE_SIZE = 20
+
+    @staticmethod
+    def get_course_queryset(user, profile=None):
+        """
+        Active courses whose projects ``user`` may review
+
+        Staff see every course. Instructors see the courses assigned to them,
+        or every course while none are assigned yet; anyone else only the
+        courses assigned to them. A single query, usable as a subquery.
+        """
+        courses = Course.objects.filter(is_active=True)
+        if user.is_staff:
+            return courses
+        if profile is None:
+            profile = getattr(user, 'userprofile', None)
+        if profile is not None and profile.is_instructor:
+            assigned = Course.objects.filter(is_active=True, instructor=user)
+            return courses.filter(Q(instructor=user) | ~Exists(assigned))
+        return courses.filter(instructor=user)
+
+    @classmethod
+    def get_instructor_courses(cls, user, profile=None):
+        """Active courses an instructor can review, evaluated once"""
+        return list(
+            cls.get_course_queryset(user, profile).select_related('category').order_by('-created_at')
+        )
+
+    @classmethod
+    def get_course_stats(cls, courses):
+        """
+        Attach ``project_stats_summary`` to each course and return the totals
+
+        Reads one CourseProjectStats row per course, so the cost does not
+        depend on the number of submissions.
+        """
+        stats_by_course = {
+            stats.course_id: stats
+            for stats in CourseProjectStats.objects.filter(course__in=[course.id for course in courses])
+        }
+        totals = CourseProjectStats()
+        for course in courses:
+            stats = stats_by_course.get(course.id) or CourseProjectStats(course_id=course.id)
+            course.project_stats_summary = stats
+            for counter in ('in_progress_count', 'submitted_count', 'completed_count', 'graded_count',
+                            'grade_total', 'reviewed_count', 'review_seconds_total'):
+                setattr(totals, counter, getattr(totals, counter) + getattr(stats, counter))
+        return totals
+
+    @classmethod
+    def get_queue_page(cls, courses, page_number, submitted_total, per_page=None):
+        """Page of submitted projects awaiting review, newest submission first"""
+        queryset = ProjectEnrollment.objects.filter(
+            status='submitted',
+            project__course__in=[course.id for course in courses]
+        ).select_related(
+            'enrollment__user',
+            'enrollment__course',
+            'project'
+        ).order_by('-submitted_at')
+        paginator = PrecountedPaginator(queryset, per_page or cls.PAGE_SIZE, count=submitted_total)
+        return paginator.get_page(page_number)
+
+
+class ProjectReviewService:
+    """
+    Applies instructor reviews to many project enrollments at once
+
+    Review fields are written with a single bulk_update inside one
+    transaction. Certificates and completion emails are produced afterwards
+    on the background queue.
+    """
+
+    BULK_PAGE_SIZE = 60
+    REVIEW_FIELDS = ['status', 'grade', 'instructor_feedback', 'completed_at', 'reviewed_at', 'reviewed_by']
+
+    @classmethod
+    def get_reviewable_courses(cls, user):
+        """Active courses whose projects ``user`` may grade, as on the instructor dashboard"""
+        return InstructorQueueService.get_instructor_courses(user)
+
+    @classmethod
+    def get_reviewable_queryset(cls, user):
+        """Project enrollments ``user`` may grade or return for changes"""
+        return ProjectEnrollment.objects.filter(
+            status__in=['submitted', 'completed', 'in_progress'],
+            project__course__in=InstructorQueueService.get_course_queryset(user)
+        )
+
+    @classmethod
+    def apply_reviews(cls, instructor, reviews):
+        """
+        Apply ``(project_enrollment, action, grade, feedback)`` reviews
+
+        ``action`` is ``'complete'`` or ``'request_changes'``; any other value
+        leaves the row untouched. Returns the list of updated enrollments.
+        """
+        now = timezone.now()
+        updated = []
+        stats_changes = []
+        completed_ids = []
+
+        for project_enrollment, action, grade, feedback in reviews:
+            if action not in ('complete', 'request_changes'):
+                continue
+            # Prefer the values as loaded, in case a form already changed the instance
+            old_snapshot = getattr(project_enrollment, '_stats_snapshot', None) or project_enrollment.get_stats_snapshot()
+
+            if feedback is not None:
+                project_enrollment.instructor_feedback = feedback
+            if action == 'complete':
+                project_enrollment.status = 'completed'
+                project_enrollment.completed_at = now
+                project_enrollment.reviewed_at = now
+                project_enrollment.reviewed_by = instructor
+                if grade is not None:
+                    project_enrollment.grade = grade
+                completed_ids.append(project_enrollment.pk)
+            else:
+                project_enrollment.status = 'in_progress'
+
+            new_snapshot = project_enrollment.get_stats_snapshot()
+            stats_changes.append((old_snapshot, new_snapshot))
+            project_enrollment._stats_snapshot = new_snapshot
+            updated.append(project_enrollment)
+
+        if not updated:
+            return updated
+
+        with transaction.atomic():
+            # bulk_update bypasses save() signals, so statistics are applied here
+            ProjectEnrollment.objects.bulk_update(updated, cls.REVIEW_FIELDS)
+            ProjectStatsService.apply_changes(stats_changes)
+            if completed_ids:
+                enqueue_on_commit(cls.finalize_completed_projects, completed_ids)
+
+        return updated
+
+    @classmethod
+    def finalize_completed_projects(cls, project_enrollment_ids):
+        """
+        Background task: render missing certificates and notify students
+
+        Safe to re-run; projects that already have a certificate keep it.
+        """
+        from emails.services import EmailService
+        from .utils import CertificateGenerator
+
+        project_enrollments = list(
+            ProjectEnrollment.objects.filter(
+                pk__in=project_enrollment_ids,
+                status='completed'
+            ).select_related(
+                'enrollment__user',
+                'enrollment__course__instructor',
+                'project',
+                'reviewed_by'
+            )
+        )
+
+        generated = []
+        for project_enrollment in project_enrollments:
+            if project_enrollment.certificate_file:
+                continue
+            certificate = CertificateGenerator.generate_project_certificate(project_enrollment)
+            if certificate:
+                project_enrollment.certificate_file.save(certificate.name, certificate, save=False)
+                project_enrollment.certificate_generated_at = timezone.now()
+                generated.append(project_enrollment)
+
+        if generated:
+            ProjectEnrollment.objects.bulk_update(generated, ['certificate_file', 'certificate_generated_at'])
+
+        for project_enrollment in project_enrollments:
+            EmailService.send_project_completion_notification(project_enrollment)
+
+
+class LearnerActivityService:
+    """
+    Small writes made on every learner click
+
+    These are the busiest write paths, so each runs as its own short
+    transaction that is retried when SQLite reports the database as locked.
+    """
+
+    @classmethod
+    @retry_on_locked
+    def toggle_module_completion(cls, enrollment, module):
+        """Mark ``module`` complete, or incomplete again if it was; returns whether it is now complete"""
+        completion, created = ModuleCompletion.objects.get_or_create(
+            enrollment=enrollment,
+            module=module,
+            defaults={'completed_at': timezone.now()}
+        )
+        if not created:
+            completion.delete()
+        return created
+
+    @classmethod
+    @retry_on_locked
+    def record_certificate_download(cls, project_enrollment):
+        # Incremented in SQL so concurrent downloads are not lost
+        ProjectEnrollment.objects.filter(pk=project_enrollment.pk).update(
+            certificate_download_count=F('certificate_download_count') + 1
+        )
+
+
+class CodeRunnerService:
+    """
+    Runs learners' edits of interactive code examples in the sandbox pool
+
+    Results are cached by (code, language, runtime), so running an example
+    as written, or an edit someone already tried, costs one cache lookup.
+    The runtime string carries the Python and preloaded library versions,
+    so upgrading pandas starts a fresh cache. Timeouts are not cached: a
+    busy host can make them happen to code that normally finishes.
+    """
+
+    CACHE_KEY = 'code_run:{digest}'
+    # Accepted CodeExample.language values
+    LANGUAGES = {'python', 'python3', 'py'}
+
+    @classmethod
+    def supports(cls, language):
+        return language.strip().lower() in cls.LANGUAGES
+
+    @classmethod
+    def cache_key(cls, code, language, runtime):
+        digest = hashlib.sha256(json.dumps([code, language.strip().lower(), runtime]).encode()).hexdigest()
+        return cls.CACHE_KEY.format(digest=digest)
+
+    @classmethod
+    def run(cls, code, language='python'):
+        """
+        Return the result of running ``code``: a dict with ``status`` (ok,
+        error or timeout), ``stdout``, ``stderr``, ``plots`` (PNG data URIs),
+        ``duration_ms`` and ``cached``
+
+        Raises RunnerUnavailable when no sandbox worker can take the run.
+        """
+        pool.start()
+        cache_key = cls.cache_key(code, language, pool.runtime)
+        result = cache.get(cache_key)
+        if result is not None:
+            return {**result, 'cached': True}
+        result = pool.run(code)
+        if result['status'] != 'timeout':
+            cache.set(cache_key, result, settings.CODE_RUNNER_CACHE_SECONDS)
+        return {**result, 'cached': False}
+
+
+class CodeExampleVerificationService:
+    """
+    Checks that running a code example still prints its expected_output
+
+    Outputs are compared after normalisation (line endings, trailing
+    whitespace, surrounding blank lines and object addresses), so only real
+    changes, such as a new pandas version formatting a frame differently,
+    count as failures. A passing example remembers the hash of its code,
+    expected output and runtime in ``verified_hash``; it is verified again
+    only when one of them changes.
+    """
+
+    ADDRESS_RE = re.compile(r'\bat 0x[0-9a-fA-F]+')
+
+    @classmethod
+    def normalize_output(cls, text):
+        lines = [line.rstrip() for line in text.replace('\r\n', '\n').replace('\r', '\n').split('\n')]
+        return cls.ADDRESS_RE.sub('at 0x...', '\n'.join(lines).strip('\n'))
+
+    @classmethod
+    def verification_hash(cls, code, expected_output, runtime):
+        key = [code, cls.normalize_output(expected_output), runtime]
+        return hashlib.sha256(json.dumps(key).encode()).hexdigest()
+
+    @classmethod
+    def verify(cls, code, expected_output):
+        """
+        Run code in the sandbox pool and compare its stdout with expected_output
+
+        Returns a dict with ``status`` (passed, failed, error or timeout),
+        ``stdout``, ``stderr``, ``diff`` (unified, empty unless failed) and
+        ``duration_ms``. Raises RunnerUnavailable like CodeRunnerService.
+        """
+        result = pool.run(code)
+        expected = cls.normalize_output(expected_output)
+        actual = cls.normalize_output(result['stdout'])
+        status = result['status']
+        diff = ''
+        if status == 'ok':
+            status = 'passed' if actual == expected else 'failed'
+            if status == 'failed':
+                diff = '\n'.join(difflib.unified_diff(
+                    expected.split('\n'), actual.split('\n'), 'expected_output', 'actual', lineterm=''
+                ))
+        return {
+            'status': status,
+            'stdout': result['stdout'],
+            'stderr': result['stderr'],
+            'diff': diff,
+            'duration_ms': result['duration_ms'],
+        }
+
+
+class ExerciseGradingService:
+    """
+    Scores exercise submissions against the exercise's hidden tests
+
+    Grading runs on GRADING_WORKERS threads in this process, each driving
+    one worker of the grading sandbox pool, so a deadline burst is graded
+    in parallel. A submission whose code and tests hash the same as one
+    already graded copies that result instead of running again. The queue
+    lives in memory: submissions still pending after a restart are graded
+    by the grade_submissions command.
+    """
+
+    _executor = None
+    _executor_pid = None
+    _executor_lock = threading.Lock()
+
+    @staticmethod
+    def content_hash(code, test_code):
+        # Line endings and trailing blank lines vary between browsers and editors
+        code = '\n'.join(code.replace('\r\n', '\n').rstrip().split('\n'))
+        return hashlib.sha256(json.dumps([code, test_code]).encode()).hexdigest()
+
+    @classmethod
+    def submit(cls, enrollment, exercise, code):
+        """Record a submission and grade it, at once from the cache or else in the background"""
+        submission = ExerciseSubmission.objects.create(
+            enrollment=enrollment, exercise=exercise, code=code,
+            content_hash=cls.content_hash(code, exercise.test_code),
+        )
+        if not cls.grade_from_cache(submission):
+            transaction.on_commit(lambda: cls.queue([submission.pk]))
+        return submission
+
+    @classmethod
+    def queue(cls, submission_ids):
+        """Grade submissions on the background grading threads"""
+        if getattr(settings, 'BACKGROUND_TASKS_EAGER', False):
+            for submission_id in submission_ids:
+                cls.grade(submission_id)
+            return
+        with cls._executor_lock:
+            if cls._executor is None or cls._executor_pid != os.getpid():
+                cls._executor = ThreadPoolExecutor(settings.GRADING_WORKERS, thread_name_prefix='grading')
+                cls._executor_pid = os.getpid()
+        for submission_id in submission_ids:
+            cls._executor.submit(cls._grade_in_thread, submission_id)
+
+    @classmethod
+    def _grade_in_thread(cls, submission_id):
+        try:
+            cls.grade(submission_id)
+        except Exception:
+            logger.exception(f'Grading submission {submission_id} failed')
+        finally:
+            connections.close_all()
+
+    @classmethod
+    def grade_from_cache(cls, submission):
+        """Copy the result of an identical graded submission; returns whether there was one"""
+        previous = ExerciseSubmission.objects.filter(
+            exercise_id=submission.exercise_id, content_hash=submission.content_hash, status='graded'
+        ).exclude(pk=submission.pk).order_by('-graded_at').first()
+        if previous is None:
+            return False
+        cls._save_result(submission, {
+            field: getattr(previous, field)
+            for field in ('score', 'tests_passed', 'tests_total', 'test_results', 'output')
+        })
+        return True
+
+    @classmethod
+    def grade(cls, submission_id):
+        """Run one pending submission against its exercise's tests and record the score"""
+        submission = ExerciseSubmission.objects.select_related('exercise').filter(
+            pk=submission_id, status__in=('pending', 'failed')
+        ).first()
+        if submission is None:
+            return
+        exercise = submission.exercise
+        # The tests may have been edited since the submission was made
+        submission.content_hash = cls.content_hash(submission.code, exercise.test_code)
+        if cls.grade_from_cache(submission):
+            return
+
+        try:
+            result = grading_pool.run(
+                submission.code, tests=exercise.test_code, test_seconds=settings.GRADING_TEST_SECONDS,
+                wall_seconds=settings.GRADING_WALL_SECONDS, queue_seconds=settings.GRADING_QUEUE_SECONDS,
+            )
+        except RunnerUnavailable:
+            logger.exception(f'Could not grade submission {submission_id}')
+            ExerciseSubmission.objects.filter(pk=submission_id, status='pending').update(status='failed')
+            return
+
+        tests = result['tests']
+        passed = sum(1 for test in tests if test['passed'])
+        cls._save_result(submission, {
+            'score': exercise.points * passed // len(tests) if tests else 0,
+            'tests_passed': passed,
+            'tests_total': len(tests),
+            'test_results': tests,
+            'output': (result['stdout'] + result['stderr']).strip(),
+        })
+
+    @classmethod
+    @retry_on_locked
+    def _save_result(cls, submission, fields):
+        # Only the first grading of a submission counts, should two threads race on it
+        updated = ExerciseSubmission.objects.filter(
+            pk=submission.pk, status__in=('pending', 'failed')
+        ).update(status='graded', graded_at=timezone.now(), content_hash=submission.content_hash, **fields)
+        if updated:
+            cls.update_enrollment_points(submission.enrollment_id)
+
+    @classmethod
+    def update_enrollment_points(cls, enrollment_id):
+        """Store the sum of the enrollment's best score on each exercise"""
+        best_scores = ExerciseSubmission.objects.filter(
+            enrollment_id=enrollment_id, status='graded'
+        ).values('exercise').annotate(best=Max('score')).values_list('best', flat=True)
+        Enrollment.objects.filter(pk=enrollment_id).update(exercise_points=sum(best_scores))
+        transaction.on_commit(lambda: LearnerDashboardService.invalidate_for_enrollment(enrollment_id))
+
+
+class CourseCloneService:
+    """
+    Copies a course with its modules, code examples, exercises and capstone
+    projects, e.g. to run a new intake without editing the course enrolled
+    learners are taking
+
+    Each child table is copied with one bulk_create(), so the cost does not
+    grow with the number of queries a tree of that size would need row by
+    row. The copy starts unpublished. With ``share_media`` its PDF and
+    image point at the original's files (and image variants); otherwise
+    they are copied under new names, which ContentHashedStorage stores as
+    links to the same blobs. Images embedded in the HTML are always shared:
+    editor uploads are never changed in place.
+    """
+
+    @staticmethod
+    def unique_slug(title):
+        max_length = Course._meta.get_field('slug').max_length
+        base = slugify(title)[:max_length].strip('-') or 'course'
+        taken = set(Course.objects.filter(slug__startswith=base[:max_length - 4]).values_list('slug', flat=True))
+        slug = base
+        number = 1
+        while slug in taken:
+            number += 1
+            suffix = f'-{number}'
+            slug = base[:max_length - len(suffix)].rstrip('-') + suffix
+        return slug
+
+    @staticmethod
+    def copy_rows(rows, **overrides):
+        """Unsaved copies of model instances, with the given fields replaced by ``overrides[name](row)``"""
+        copies = []
+        for row in rows:
+            model = type(row)
+            values = {field.attname: getattr(row, field.attname) for field in data_fields(model)}
+            copies.append(model(**values, **{name: value(row) for name, value in overrides.items()}))
+        return copies
+
+    @classmethod
+    @transaction.atomic
+    def clone(cls, course, title=None, share_media=True):
+        """Return a saved copy of ``course`` and its content"""
+        title = (title or f'{course.title} (copy)')[:Course._meta.get_field('title').max_length]
+        clone = cls.copy_rows(
+            [course], category_id=lambda row: row.category_id, instructor_id=lambda row: row.instructor_id,
+        )[0]
+        clone.title = title
+        clone.slug = cls.unique_slug(title)
+        clone.is_published = False
+        clone.is_featured = False
+        for field_name in ('course_pdf', 'image'):
+            field_file = getattr(course, field_name)
+            if not field_file:
+                continue
+            if share_media:
+                if field_name == 'image':
+                    clone.image_variants = course.image_variants
+            else:
+                with field_file.open('rb') as content:
+                    setattr(clone, field_name, field_file.storage.save(field_file.name, File(content)))
+        clone.save()
+
+        modules = list(course.modules.all())
+        CourseModule.objects.bulk_create(cls.copy_rows(modules, course_id=lambda row: clone.pk))
+        # Matched up by order, which is unique per course
+        module_ids = dict(clone.modules.values_list('order', 'pk'))
+        module_orders = {module.pk: module.order for module in modules}
+
+        def new_module_id(row):
+            return module_ids[module_orders[row.module_id]]
+
+        CodeExample.objects.bulk_create(cls.copy_rows(
+            CodeExample.objects.filter(module__course=course), module_id=new_module_id,
+        ))
+        Exercise.objects.bulk_create(cls.copy_rows(
+            Exercise.objects.filter(module__course=course), module_id=new_module_id,
+        ))
+        CapstoneProject.objects.bulk_create(cls.copy_rows(
+            course.capstone_projects.all(), course_id=lambda row: clone.pk,
+        ))
+        return clone
+
+
+class SyllabusService:
+    """
+    Keeps each course's generated syllabus PDF in step with its content
+
+    The PDF is rendered in the background after a course or one of its
+    modules is saved, and stored under a name derived from a hash of
+    everything it shows. Saves that change nothing it shows (pricing, a
+    module's video) hash the same and render nothing; downloads are
+    streamed from storage and revalidate against the hash as their ETag.
+    """
+
+    COURSE_FIELDS = [
+        'title', 'overview', 'duration', 'schedule', 'estimated_hours', 'tools_software',
+        'learning_outcomes', 'prerequisites',
+    ]
+    MODULE_FIELDS = ['order', 'title', 'description', 'duration_hours', 'learning_objectives']
+
+    @classmethod
+    def get_modules(cls, course):
+        return list(course.modules.filter(is_active=True).only(*cls.MODULE_FIELDS).order_by('order', 'id'))
+
+    @classmethod
+    def content_hash(cls, course, modules):
+        from .utils import SyllabusGenerator
+        content = {
+            'version': SyllabusGenerator.VERSION,
+            'course': [getattr(course, field) for field in cls.COURSE_FIELDS],
+            'modules': [[getattr(module, field) for field in cls.MODULE_FIELDS] for module in modules],
+        }
+        return hashlib.sha256(json.dumps(content, sort_keys=True).encode()).hexdigest()
+
+    @classmethod
+    def update_syllabus(cls, course_id):
+        """
+        Background task: render the syllabus of a course whose content changed
+
+        Returns the course with its syllabus fields current, or None when it was deleted.
+        """
+        from .utils import SyllabusGenerator
+
+        course = Course.objects.filter(pk=course_id).first()
+        if course is None:
+            return None
+        modules = cls.get_modules(course)
+        content_hash = cls.content_hash(course, modules)
+        if course.syllabus_hash == content_hash and course.syllabus_pdf and course.syllabus_pdf.storage.exists(
+            course.syllabus_pdf.name
+        ):
+            return course
+
+        pdf = SyllabusGenerator.generate_course_syllabus(course, modules)
+        field = Course._meta.get_field('syllabus_pdf')
+        name = field.storage.save(
+            field.generate_filename(course, f'{course.slug}-syllabus-{content_hash[:12]}.pdf'), ContentFile(pdf)
+        )
+        # update() rather than save(): saving the course would queue this task again
+        Course.objects.filter(pk=course_id).update(
+            syllabus_pdf=name, syllabus_hash=content_hash
+        )
+        course.syllabus_pdf = name
+        course.syllabus_hash = content_hash
+        logger.info(f"Rendered syllabus for course {course_id} ({len(pdf)} bytes)")
+        return course
+
+    @classmethod
+    def queue(cls, course_id):
+        enqueue_on_commit(cls.update_syllabus, course_id)
+
+    @classmethod
+    def get_syllabus(cls, course):
+        """
+        The course's syllabus file, rendered now if the background render has
+        not run yet; a render that is merely out of date is served until it has
+        """
+        if not course.syllabus_pdf or not course.syllabus_pdf.storage.exists(course.syllabus_pdf.name):
+            course = cls.update_syllabus(course.pk)
+        return course.syllabus_pdf
+
+
+class OfflineCopyService:
+    """
+    Keeps a downloadable offline copy of each course's materials (see
+    courses.offline) in step with its content
+
+    Like the syllabus, the archive is rebuilt in the background after the
+    course or its content is saved, only when what it shows changed. Courses
+    without activated enrollments get no archive until they have one: only
+    those learners may download it.
+    """
+
+    @classmethod
+    def update_archive(cls, course_id):
+        """Background task: rebuild the offline copy of a course whose content changed"""
+        course = Course.objects.filter(pk=course_id).first()
+        if course is None or not Enrollment.objects.filter(course_id=course_id, is_activated=True).exists():
+            return
+        modules, projects = offline.load_course_tree(course)
+        content_hash = offline.content_hash(course, modules, projects)
+        archive = course.offline_archive
+        if course.offline_archive_hash == content_hash and archive and archive.storage.exists(archive.name):
+            return
+
+        started = time.perf_counter()
+        field = Course._meta.get_field('offline_archive')
+        with tempfile.TemporaryFile() as file:
+            offline.build_archive(course, modules, projects, file)
+            name = field.storage.save(
+                field.generate_filename(course, f'{course.slug}-offline-{content_hash[:12]}.zip'), File(file)
+            )
+        # update() rather than save(): saving the course would queue this task again
+        Course.objects.filter(pk=course_id).update(offline_archive=name, offline_archive_hash=content_hash)
+        logger.info(f"Built offline copy of course {course_id} in {time.perf_counter() - started:.1f}s ({name})")
+
+    @classmethod
+    def queue(cls, course_id):
+        enqueue_on_commit(cls.update_archive, course_id)
+
+    @classmethod
+    def get_download(cls, enrollment):
+        """
+        The enrollment's watermarked copy of its course's offline archive, or
+        None when no archive is built yet; building one is then queued
+        """
+        course = enrollment.course
+        archive = course.offline_archive
+        if not archive or not archive.storage.exists(archive.name):
+            cls.queue(course.pk)
+            return None
+        return offline.WatermarkedArchive(archive, offline.watermark_files(enrollment, course.offline_archive_hash))
@@ -1,3 +1,1129 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+import zipfile
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import SkipTest, mock
+from xml.etree import ElementTree
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.models import Max, Min
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from core.testing import QueryBudgetAssertionsMixin, QueryPlanAssertionsMixin
+from .admin import IndexedDateHierarchyQuerySet
+from .bundles import diff_bundle, load_bundle
+from .curriculum import markdown_to_html
+from .models import (
+    CapstoneProject, CodeExample, Course, CourseCategory, CourseModule, CourseProjectStats, Enrollment,
+    Exercise, ExerciseSubmission, ModuleCompletion, PaymentInstallment, ProjectEnrollment
+)
+from .runner import RunnerUnavailable, grading_pool, pool
+from .services import (
+    CodeRunnerService, CourseCloneService, EstimatedCountPaginator, ExerciseGradingService, PrecountedPaginator,
+    ProjectReviewService, ProjectStatsService
+)
+
+
+class HotViewQueryPlanTests(QueryPlanAssertionsMixin, TestCase):
+    """Enrollment, materials and review views must be served from indexes"""
+
+    guarded_models = (Course, Enrollment, ModuleCompletion, PaymentInstallment, ProjectEnrollment)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.instructor = User.objects.create_user('instructor', 'instructor@example.com', 'password')
+        cls.instructor.userprofile.role = 'instructor'
+        cls.instructor.userprofile.save()
+        cls.learner = User.objects.create_user('learner', 'learner@example.com', 'password')
+
+        cls.category = CourseCategory.objects.create(name='data_analytics', display_name='Data Analytics')
+        cls.course = Course.objects.create(
+            title='Python for Data', category=cls.category, instructor=cls.instructor, price=100
+        )
+        other_course = Course.objects.create(title='SQL Basics', category=cls.category, price=50)
+        cls.module = CourseModule.objects.create(course=cls.course, title='Intro', order=1)
+        cls.project = CapstoneProject.objects.create(course=cls.course, title='Capstone', order=1)
+
+        cls.enrollment = Enrollment.objects.create(
+            user=cls.learner, course=cls.course, total_amount=100, installments=2
+        )
+        cls.enrollment.activate_enrollment()
+        PaymentInstallment.objects.create(
+            enrollment=cls.enrollment, installment_number=1, amount=50,
+            due_date=timezone.now().date(), status='verified'
+        )
+        ModuleCompletion.objects.create(enrollment=cls.enrollment, module=cls.module)
+        ProjectEnrollment.objects.create(
+            enrollment=cls.enrollment, project=cls.project, status='submitted', submitted_at=timezone.now()
+        )
+        cls.pending_enrollment = Enrollment.objects.create(
+            user=cls.learner, course=other_course, total_amount=50, payment_status='completed'
+        )
+
+    def test_course_catalogue(self):
+        self.client.force_login(self.learner)
+        with self.assertNoFullTableScans():
+            response = self.client.get(reverse('courses:courses'), {'category': self.category.name})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(self.client.get(self.course.get_absolute_url()).status_code, 200)
+
+    def test_learner_pages(self):
+        self.client.force_login(self.learner)
+        with self.assertNoFullTableScans():
+            self.assertEqual(self.client.get(reverse('courses:my_enrollments')).status_code, 200)
+            self.assertEqual(self.client.get(reverse('accounts:learner_dashboard')).status_code, 200)
+
+    def test_course_materials(self):
+        self.client.force_login(self.learner)
+        url = reverse('courses:course_materials', kwargs={'slug': self.course.slug})
+        with self.assertNoFullTableScans():
+            self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_activate_enrollment(self):
+        self.client.force_login(self.learner)
+        with self.assertNoFullTableScans():
+            response = self.client.post(
+                reverse('courses:activate_enrollment'),
+                {'activation_code': self.pending_enrollment.activation_code}
+            )
+        self.assertRedirects(response, reverse('courses:my_enrollments'), fetch_redirect_response=False)
+
+    def test_instructor_review_queue(self):
+        self.client.force_login(self.instructor)
+        with self.assertNoFullTableScans():
+            self.assertEqual(self.client.get(reverse('courses:instructor_dashboard')).status_code, 200)
+            self.assertEqual(self.client.get(reverse('courses:instructor_bulk_review')).status_code, 200)
+            self.assertEqual(self.client.get(reverse('accounts:instructor_dashboard')).status_code, 200)
+
+
+class HotViewQueryBudgetTests(QueryBudgetAssertionsMixin, TestCase):
+    """Query counts of the hot views must not grow with the number of rows shown"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.instructor = User.objects.create_user('instructor', 'instructor@example.com', 'password')
+        cls.instructor.userprofile.role = 'instructor'
+        cls.instructor.userprofile.save()
+        cls.learner = User.objects.create_user('learner', 'learner@example.com', 'password')
+
+        category = CourseCategory.objects.create(name='data_analytics', display_name='Data Analytics')
+        cls.courses = [
+            Course.objects.create(
+                title=f'Course {number}', category=category, instructor=cls.instructor,
+                price=100, is_featured=True
+            )
+            for number in range(3)
+        ]
+        cls.course = cls.courses[0]
+        for order in range(1, 4):
+            module = CourseModule.objects.create(course=cls.course, title=f'Module {order}', order=order)
+            for index in range(2):
+                CodeExample.objects.create(module=module, title=f'Example {index}', code='print(1)', order=index)
+                Exercise.objects.create(module=module, title=f'Exercise {index}', description='-', order=index)
+        projects = [
+            CapstoneProject.objects.create(course=cls.course, title=f'Project {order}', order=order)
+            for order in range(1, 4)
+        ]
+
+        for course in cls.courses:
+            enrollment = Enrollment.objects.create(
+                user=cls.learner, course=course, total_amount=100, installments=2
+            )
+            enrollment.activate_enrollment()
+            PaymentInstallment.objects.create(
+                enrollment=enrollment, installment_number=1, amount=50,
+                due_date=timezone.now().date(), status='verified'
+            )
+        enrollment = Enrollment.objects.get(user=cls.learner, course=cls.course)
+        for module in cls.course.modules.all():
+            ModuleCompletion.objects.create(enrollment=enrollment, module=module)
+        for project in projects:
+            ProjectEnrollment.objects.create(
+                enrollment=enrollment, project=project, status='submitted',
+                submitted_at=timezone.now(), reviewed_by=cls.instructor
+            )
+
+    def test_public_course_pages(self):
+        self.assertMaxQueries('courses:courses', 3)
+        self.assertMaxQueries('courses:course_detail', 6, kwargs={'slug': self.course.slug})
+
+    def test_learner_pages(self):
+        self.client.force_login(self.learner)
+        self.assertMaxQueries('courses:course_detail', 9, kwargs={'slug': self.course.slug})
+        self.assertMaxQueries('courses:course_materials', 11, kwargs={'slug': self.course.slug})
+        self.assertMaxQueries('courses:my_enrollments', 3)
+
+    def test_instructor_dashboards(self):
+        self.client.force_login(self.instructor)
+        self.assertMaxQueries('courses:instructor_dashboard', 6)
+        self.assertMaxQueries('accounts:instructor_dashboard', 6)
+
+
+def project_stats(course):
+    """Counters of ``course`` as maintained, or zeros when it has no statistics row"""
+    stats = CourseProjectStats.objects.filter(course=course).first() or CourseProjectStats()
+    counters = ('in_progress_count', 'submitted_count', 'completed_count', 'graded_count', 'grade_total',
+                'reviewed_count', 'review_seconds_total')
+    return {counter: getattr(stats, counter) for counter in counters}
+
+
+@override_settings(BACKGROUND_TASKS_EAGER=True)
+class ProjectReviewTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.instructor = User.objects.create_user('instructor', 'instructor@example.com', 'password')
+        cls.instructor.userprofile.role = 'instructor'
+        cls.instructor.userprofile.save()
+        category = CourseCategory.objects.create(name='data_analytics', display_name='Data Analytics')
+        cls.course = Course.objects.create(
+            title='Python for Data', category=category, instructor=cls.instructor, price=100
+        )
+        cls.other_course = Course.objects.create(title='SQL Basics', category=category, price=50)
+
+        cls.project_enrollments = []
+        for course in (cls.course, cls.course, cls.course, cls.other_course):
+            learner = User.objects.create_user(
+                f'learner{len(cls.project_enrollments)}', f'learner{len(cls.project_enrollments)}@example.com'
+            )
+            enrollment = Enrollment.objects.create(user=learner, course=course, total_amount=100)
+            enrollment.activate_enrollment()
+            project, _ = CapstoneProject.objects.get_or_create(course=course, title='Capstone', order=1)
+            cls.project_enrollments.append(ProjectEnrollment.objects.create(
+                enrollment=enrollment, project=project, status='submitted',
+                submitted_at=timezone.now() - timedelta(hours=2)
+            ))
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        media = override_settings(MEDIA_ROOT=directory.name)
+        media.enable()
+        self.addCleanup(media.disable)
+
+    def test_apply_reviews_saves_in_one_bulk_update(self):
+        completed, returned, untouched, _ = ProjectEnrollment.objects.order_by('id')
+        with mock.patch.object(
+            ProjectEnrollment.objects, 'bulk_update', wraps=ProjectEnrollment.objects.bulk_update
+        ) as bulk_update, CaptureQueriesContext(connection) as context:
+            updated = ProjectReviewService.apply_reviews(self.instructor, [
+                (completed, 'complete', Decimal('90'), 'Great work'),
+                (returned, 'request_changes', None, 'Add a chart'),
+                (untouched, '', Decimal('10'), 'Ignored'),
+            ])
+
+        self.assertEqual(updated, [completed, returned])
+        bulk_update.assert_called_once_with([completed, returned], ProjectReviewService.REVIEW_FIELDS)
+        updates = [query['sql'] for query in context.captured_queries
+                   if query['sql'].startswith(f'UPDATE "{ProjectEnrollment._meta.db_table}"')]
+        self.assertEqual(len(updates), 1)
+
+        completed.refresh_from_db()
+        self.assertEqual((completed.status, completed.grade, completed.reviewed_by), ('completed', 90, self.instructor))
+        returned.refresh_from_db()
+        self.assertEqual((returned.status, returned.instructor_feedback), ('in_progress', 'Add a chart'))
+        untouched.refresh_from_db()
+        self.assertEqual((untouched.status, untouched.grade), ('submitted', None))
+
+    def test_apply_reviews_updates_course_stats(self):
+        completed, returned, _, other = ProjectEnrollment.objects.order_by('id')
+        ProjectReviewService.apply_reviews(self.instructor, [
+            (completed, 'complete', Decimal('90'), ''),
+            (returned, 'request_changes', None, ''),
+            (other, 'complete', None, ''),
+        ])
+
+        stats = project_stats(self.course)
+        self.assertEqual(
+            {counter: stats[counter] for counter in ('in_progress_count', 'submitted_count', 'completed_count',
+                                                     'graded_count', 'grade_total', 'reviewed_count')},
+            {'in_progress_count': 1, 'submitted_count': 1, 'completed_count': 1,
+             'graded_count': 1, 'grade_total': 90, 'reviewed_count': 1}
+        )
+        self.assertGreaterEqual(stats['review_seconds_total'], 2 * 60 * 60)
+        self.assertEqual(project_stats(self.other_course)['completed_count'], 1)
+
+        maintained = [project_stats(self.course), project_stats(self.other_course)]
+        ProjectStatsService.rebuild()
+        self.assertEqual([project_stats(self.course), project_stats(self.other_course)], maintained)
+
+    @mock.patch('emails.services.EmailService.send_project_completion_notification')
+    def test_certificates_and_emails_follow_the_commit(self, send_notification):
+        completed = ProjectEnrollment.objects.order_by('id').first()
+        with self.captureOnCommitCallbacks() as callbacks:
+            ProjectReviewService.apply_reviews(self.instructor, [(completed, 'complete', Decimal('85'), '')])
+        completed.refresh_from_db()
+        self.assertFalse(completed.certificate_file)
+        send_notification.assert_not_called()
+
+        for callback in callbacks:
+            callback()
+        completed.refresh_from_db()
+        self.assertTrue(completed.certificate_file.read().startswith(b'%PDF'))
+        self.assertIsNotNone(completed.certificate_generated_at)
+        send_notification.assert_called_once_with(completed)
+
+        # Re-running the task keeps the certificate it made
+        ProjectReviewService.finalize_completed_projects([completed.pk])
+        self.assertEqual(ProjectEnrollment.objects.get(pk=completed.pk).certificate_file, completed.certificate_file)
+
+    @mock.patch('emails.services.EmailService.send_project_completion_notification')
+    def test_bulk_review_view_applies_mixed_actions(self, send_notification):
+        completed, returned, untouched, _ = ProjectEnrollment.objects.order_by('id')
+        rows = [
+            (completed, 'complete', '95', 'Well done'),
+            (returned, 'request_changes', '', 'Missing the report'),
+            (untouched, '', '', ''),
+        ]
+        data = {'form-TOTAL_FORMS': len(rows), 'form-INITIAL_FORMS': len(rows)}
+        for index, (project_enrollment, action, grade, feedback) in enumerate(rows):
+            data.update({
+                f'form-{index}-project_enrollment_id': project_enrollment.id,
+                f'form-{index}-action': action,
+                f'form-{index}-grade': grade,
+                f'form-{index}-instructor_feedback': feedback,
+            })
+
+        self.client.force_login(self.instructor)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('courses:instructor_bulk_review'), data)
+        self.assertRedirects(response, reverse('courses:instructor_bulk_review'), fetch_redirect_response=False)
+
+        statuses = dict(ProjectEnrollment.objects.values_list('id', 'status'))
+        self.assertEqual(
+            [statuses[completed.id], statuses[returned.id], statuses[untouched.id]],
+            ['completed', 'in_progress', 'submitted']
+        )
+        self.assertEqual(ProjectEnrollment.objects.get(pk=completed.pk).grade, 95)
+        self.assertEqual(ProjectEnrollment.objects.get(pk=returned.pk).instructor_feedback, 'Missing the report')
+        send_notification.assert_called_once_with(completed)
+        self.assertEqual(project_stats(self.course)['submitted_count'], 1)
+
+    def test_bulk_review_lists_the_dashboard_queue(self):
+        unassigned = User.objects.create_user('new-instructor', 'new@example.com', 'password')
+        unassigned.userprofile.role = 'instructor'
+        unassigned.userprofile.save()
+
+        for user, expected in ((self.instructor, 3), (unassigned, 4)):
+            self.client.force_login(user)
+            dashboard = self.client.get(reverse('courses:instructor_dashboard'))
+            bulk_review = self.client.get(reverse('courses:instructor_bulk_review'))
+            self.assertEqual(len(dashboard.context['submitted_projects']), expected)
+            self.assertEqual(len(bulk_review.context['review_rows']), expected)
+            self.assertEqual(
+                ProjectReviewService.get_reviewable_queryset(user).filter(status='submitted').count(), expected
+            )
+
+
+class ProjectStatsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.instructor = User.objects.create_user('instructor', 'instructor@example.com', 'password')
+        category = CourseCategory.objects.create(name='data_analytics', display_name='Data Analytics')
+        cls.course = Course.objects.create(
+            title='Python for Data', category=category, instructor=cls.instructor, price=100
+        )
+        cls.project = CapstoneProject.objects.create(course=cls.course, title='Capstone', order=1)
+        cls.enrollments = []
+        for number in range(2):
+            learner = User.objects.create_user(f'learner{number}', f'learner{number}@example.com')
+            enrollment = Enrollment.objects.create(user=learner, course=cls.course, total_amount=100)
+            enrollment.activate_enrollment()
+            cls.enrollments.append(enrollment)
+
+    def assertStatsMatchRebuild(self):
+        maintained = project_stats(self.course)
+        ProjectStatsService.rebuild([self.course.id])
+        self.assertEqual(project_stats(self.course), maintained)
+        return maintained
+
+    def test_counters_match_rebuild_through_project_lifecycle(self):
+        first, second = [
+            ProjectEnrollment.objects.create(enrollment=enrollment, project=self.project)
+            for enrollment in self.enrollments
+        ]
+        self.assertStatsMatchRebuild()
+
+        for project_enrollment in (first, second):
+            project_enrollment.start_project()
+        self.assertEqual(self.assertStatsMatchRebuild()['in_progress_count'], 2)
+
+        for project_enrollment in (first, second):
+            project_enrollment.submit_project({'github_repo_url': 'https://github.com/learner/capstone'})
+        self.assertEqual(self.assertStatsMatchRebuild()['submitted_count'], 2)
+
+        reviewable = ProjectReviewService.get_reviewable_queryset(self.instructor).in_bulk([first.pk, second.pk])
+        ProjectReviewService.apply_reviews(self.instructor, [
+            (reviewable[first.pk], 'complete', Decimal('70'), ''),
+            (reviewable[second.pk], 'request_changes', None, 'Add tests'),
+        ])
+        stats = self.assertStatsMatchRebuild()
+        self.assertEqual(
+            (stats['completed_count'], stats['in_progress_count'], stats['graded_count'], stats['grade_total']),
+            (1, 1, 1, 70)
+        )
+
+        # Re-grading replaces the grade instead of adding another one
+        ProjectReviewService.apply_reviews(self.instructor, [
+            (ProjectEnrollment.objects.get(pk=first.pk), 'complete', Decimal('88'), 'Regraded')
+        ])
+        stats = self.assertStatsMatchRebuild()
+        self.assertEqual((stats['graded_count'], stats['grade_total'], stats['reviewed_count']), (1, 88, 1))
+
+        ProjectEnrollment.objects.get(pk=second.pk).submit_project()
+        self.assertEqual(self.assertStatsMatchRebuild()['submitted_count'], 1)
+
+        self.enrollments[0].delete()
+        stats = self.assertStatsMatchRebuild()
+        self.assertEqual(
+            (stats['completed_count'], stats['graded_count'], stats['grade_total'], stats['submitted_count']),
+            (0, 0, 0, 1)
+        )
+
+    def test_paginator_corrects_a_drifted_counter(self):
+        for number in range(2, 5):
+            User.objects.create_user(f'learner{number}', f'learner{number}@example.com')
+        learners = User.objects.filter(username__startswith='learner').order_by('id')
+
+        exact = PrecountedPaginator(learners, 2, count=5)
+        with self.assertNumQueries(1):
+            self.assertEqual(len(exact.get_page(3)), 1)
+
+        low = PrecountedPaginator(learners, 2, count=1)
+        with self.assertLogs('courses.services', 'WARNING'):
+            low.get_page(1)
+        self.assertEqual((low.count, low.num_pages), (5, 3))
+        self.assertEqual([user.username for user in low.get_page(3)], ['learner4'])
+
+        high = PrecountedPaginator(learners, 2, count=9)
+        with self.assertLogs('courses.services', 'WARNING'):
+            page = high.get_page(5)
+        self.assertEqual((page.number, len(page), high.count), (3, 1, 5))
+        with self.assertLogs('courses.services', 'WARNING'):
+            page = PrecountedPaginator(learners, 2, count=8).get_page(3)
+        self.assertEqual((page.number, len(page), page.paginator.count), (3, 1, 5))
+
+
+class LargeTableAdminTests(QueryPlanAssertionsMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        category = CourseCategory.objects.create(name='data_analytics', display_name='Data Analytics')
+        course = Course.objects.create(title='Python for Data', category=category, price=100)
+        cls.enrollments = []
+        for number, created_at in enumerate(['2024-11-30 23:30', '2025-01-05 08:00', '2025-01-20 12:00']):
+            learner = User.objects.create_user(f'learner{number}', f'Learner.{number}@Example.com')
+            enrollment = Enrollment.objects.create(user=learner, course=course, total_amount=100, installments=2)
+            Enrollment.objects.filter(pk=enrollment.pk).update(
+                created_at=timezone.make_aware(datetime.fromisoformat(created_at))
+            )
+            PaymentInstallment.objects.create(
+                enrollment=enrollment, installment_number=1, amount=50,
+                due_date=date(2025, 3 + number, 1)
+            )
+            cls.enrollments.append(enrollment)
+
+    def search(self, model, term):
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse(f'admin:courses_{model._meta.model_name}_changelist'), {'q': term})
+        self.assertEqual(response.status_code, 200)
+        return list(response.context['cl'].result_list)
+
+    def test_email_search_ignores_case_on_an_index(self):
+        enrollment = self.enrollments[1]
+        self.assertEqual(self.search(Enrollment, 'learner.1@example.COM'), [enrollment])
+        self.assertEqual(
+            [installment.enrollment_id for installment in self.search(PaymentInstallment, 'LEARNER.1@example.com')],
+            [enrollment.pk]
+        )
+        with self.assertNoFullTableScans([User, Enrollment]):
+            list(Enrollment.objects.filter(user__email__iexact='learner.1@example.com'))
+
+    def test_email_search_falls_back_to_partial_matches(self):
+        self.assertEqual(self.search(Enrollment, 'r.2@example.com'), [self.enrollments[2]])
+        self.assertEqual(self.search(Enrollment, 'nobody@example.com'), [])
+
+    def test_estimated_count_only_for_large_unfiltered_tables(self):
+        enrollments = Enrollment.objects.order_by('pk')
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        self.assertEqual(EstimatedCountPaginator.estimate_table_rows(Enrollment), 3)
+        self.assertEqual(EstimatedCountPaginator(enrollments, 20).count, 3)
+
+        with mock.patch.object(EstimatedCountPaginator, 'estimate_table_rows', return_value=2000000) as estimate:
+            self.assertEqual(EstimatedCountPaginator(enrollments, 20).count, 2000000)
+            self.assertEqual(EstimatedCountPaginator(enrollments.filter(installments=2), 20).count, 3)
+        estimate.assert_called_once_with(Enrollment)
+
+    def test_date_hierarchy_matches_distinct_dates(self):
+        indexed = IndexedDateHierarchyQuerySet(Enrollment)
+        for kind in ('year', 'month', 'day'):
+            for order in ('ASC', 'DESC'):
+                self.assertEqual(
+                    indexed.datetimes('created_at', kind, order),
+                    list(Enrollment.objects.datetimes('created_at', kind, order))
+                )
+        january = indexed.filter(created_at__year=2025, created_at__month=1)
+        self.assertEqual(january.datetimes('created_at', 'day'),
+                         list(Enrollment.objects.filter(pk__in=january).datetimes('created_at', 'day')))
+
+        installments = IndexedDateHierarchyQuerySet(PaymentInstallment)
+        for kind in ('year', 'month', 'day'):
+            self.assertEqual(
+                installments.dates('due_date', kind), list(PaymentInstallment.objects.dates('due_date', kind))
+            )
+        self.assertEqual(
+            indexed.aggregate(first=Min('created_at'), last=Max('created_at')),
+            Enrollment.objects.aggregate(first=Min('created_at'), last=Max('created_at'))
+        )
+        with self.assertNumQueries(2):
+            indexed.aggregate(first=Min('created_at'), last=Max('created_at'))
+
+    def test_changelist_date_hierarchy(self):
+        self.client.force_login(self.admin)
+        url = reverse('admin:courses_enrollment_changelist')
+        response = self.client.get(url, {'created_at__year': 2025})
+        self.assertEqual(len(response.context['cl'].result_list), 2)
+        self.assertContains(response, 'January 2025')
+
+
+class SeedScaleDataTests(TestCase):
+
+    def test_seeds_reproducible_dataset(self):
+        call_command(
+            'seed_scale_data', users=30, courses=5, enrollments=60, completions=100, posts=3, events=2,
+            modules_per_course=4, force=True, stdout=StringIO()
+        )
+        learners = User.objects.filter(username__startswith='scale_learner_', userprofile__isnull=False)
+        self.assertEqual(learners.count(), 30)
+        self.assertEqual(Enrollment.objects.count(), 60)
+        self.assertEqual(ModuleCompletion.objects.count(), 100)
+        self.assertEqual(
+            PaymentInstallment.objects.count(),
+            sum(Enrollment.objects.values_list('installments', flat=True))
+        )
+        # Generated timestamps are kept and auto_now_add is restored afterwards
+        oldest = Enrollment.objects.order_by('created_at').first()
+        self.assertLess(oldest.created_at, timezone.now() - timedelta(days=1))
+        self.assertTrue(ModuleCompletion._meta.get_field('completed_at').auto_now_add)
+
+
+class SandboxTestMixin:
+    """Runs real sandbox workers; skips the test case on hosts where they cannot start"""
+
+    sandbox_pool = pool
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        try:
+            cls.sandbox_pool.start()
+        except RunnerUnavailable as error:
+            raise SkipTest(str(error))
+        cls.addClassCleanup(cls.sandbox_pool.stop)
+
+
+@override_settings(CODE_RUNNER_WORKERS=1)
+class CodeRunnerTests(SandboxTestMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.learner = User.objects.create_user('learner', 'learner@example.com', 'password')
+        category = CourseCategory.objects.create(name='data_analytics', display_name='Data Analytics')
+        cls.course = Course.objects.create(title='Python for Data', category=category, price=100)
+        module = CourseModule.objects.create(course=cls.course, title='Intro', order=1)
+        cls.example = CodeExample.objects.create(
+            module=module, title='Sum', code='total = sum(range(5))\ntotal', is_interactive=True
+        )
+        Enrollment.objects.create(
+            user=cls.learner, course=cls.course, total_amount=100, installments=1
+        ).activate_enrollment()
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.learner)
+        self.url = reverse('courses:run_code_example', args=[self.course.slug, self.example.id])
+
+    def test_runs_example_and_caches_result(self):
+        first = self.client.post(self.url).json()
+        self.assertEqual((first['status'], first['stdout'], first['cached']), ('ok', '10\n', False))
+        self.assertTrue(self.client.post(self.url).json()['cached'])
+
+        edited = self.client.post(self.url, {'code': 'print("hi")\n[][1]'}, content_type='application/json').json()
+        self.assertEqual((edited['status'], edited['stdout']), ('error', 'hi\n'))
+        self.assertIn('File "<example>", line 2', edited['stderr'])
+        self.assertTrue(edited['stderr'].endswith('IndexError: list index out of range\n'))
+
+    def test_sandbox_limits(self):
+        blocked = CodeRunnerService.run("import socket\nsocket.create_connection(('192.0.2.1', 80), timeout=1)")
+        self.assertIn('Network is unreachable', blocked['stderr'])
+        with override_settings(CODE_RUNNER_WALL_SECONDS=1):
+            pool.stop()
+            self.assertEqual(CodeRunnerService.run('import time\ntime.sleep(5)')['status'], 'timeout')
+        pool.stop()
+
+    def test_sandbox_cannot_read_site_files(self):
+        paths = [settings.BASE_DIR / 'manage.py', settings.BASE_DIR / 'db.sqlite3', '/proc/self/environ']
+        code = (
+            f'for path in {[str(path) for path in paths]!r}:\n'
+            '    try:\n'
+            '        open(path).close()\n'
+            '        print("read", path)\n'
+            '    except OSError as error:\n'
+            '        print(type(error).__name__)\n'
+            'open("/tmp/notes.txt", "w").write("scratch")\n'
+            'import ctypes\n'
+            'print(ctypes.CDLL(None).umount2(b"/usr", 2))\n'
+        )
+        result = CodeRunnerService.run(code)
+        self.assertEqual(result['stdout'], 'FileNotFoundError\n' * 3 + '-1\n', result['stderr'])
+
+    def test_requires_activated_enrollment_and_interactive_example(self):
+        self.client.force_login(User.objects.create_user('visitor'))
+        self.assertEqual(self.client.post(self.url).status_code, 403)
+        self.client.force_login(self.learner)
+        CodeExample.objects.filter(pk=self.example.pk).update(is_interactive=False)
+        self.assertEqual(self.client.post(self.url).status_code, 404)
+
+
+ADD_TESTS = '''
+def test_add():
+    assert add(2, 3) == 5
+
+def test_negative():
+    assert add(-1, -1) == -2, 'negative numbers'
+'''
+
+
+@override_settings(GRADING_WORKERS=1, BACKGROUND_TASKS_EAGER=True)
+class ExerciseGradingTests(SandboxTestMixin, TestCase):
+    sandbox_pool = grading_pool
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.learner = User.objects.create_user('learner', 'learner@example.com', 'password')
+        category = CourseCategory.objects.create(name='data_analytics', display_name='Data Analytics')
+        cls.course = Course.objects.create(title='Python for Data', category=category, price=100)
+        module = CourseModule.objects.create(course=cls.course, title='Intro', order=1)
+        cls.exercise = Exercise.objects.create(
+            module=module, title='Add', is_graded=True, points=10, test_code=ADD_TESTS
+        )
+        cls.enrollment = Enrollment.objects.create(
+            user=cls.learner, course=cls.course, total_amount=100, installments=1
+        )
+        cls.enrollment.activate_enrollment()
+
+    def submit(self, code):
+        self.client.force_login(self.learner)
+        url = reverse('courses:submit_exercise', args=[self.course.slug, self.exercise.id])
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url, {'code': code}, content_type='application/json')
+        return response.json()
+
+    def test_scores_submission_and_rolls_up_best_score(self):
+        partial = self.submit('def add(a, b):\n    return abs(a) + b\n')
+        self.assertEqual(partial['status'], 'pending')
+        partial = self.client.get(partial['status_url']).json()
+        self.assertEqual((partial['status'], partial['score'], partial['tests_passed']), ('graded', 5, 1))
+        self.assertEqual(partial['test_results'][1]['message'], 'AssertionError: negative numbers')
+
+        self.submit('def add(a, b):\n    return a + b\n')
+        self.enrollment.refresh_from_db()
+        self.assertEqual(self.enrollment.exercise_points, 10)
+        self.assertEqual(self.enrollment.get_exercise_progress_percentage(), 100)
+
+        # Identical code, give or take line endings, is scored from the earlier result
+        with mock.patch.object(grading_pool, 'run') as run:
+            again = self.submit('def add(a, b):\r\n    return abs(a) + b')
+        run.assert_not_called()
+        self.assertEqual((again['status'], again['score']), ('graded', 5))
+        self.enrollment.refresh_from_db()
+        self.assertEqual(self.enrollment.exercise_points, 10)
+
+    def test_submission_cannot_forge_test_results(self):
+        # Would have rewritten the result each test's fork reported from the submission's own process
+        cheat = self.submit(
+            'import builtins, json, os\n'
+            'dumps, exit = json.dumps, os._exit\n'
+            "json.dumps = lambda obj, *args, **kwargs: dumps({**obj, 'passed': True, 'message': ''}, *args, **kwargs)\n"
+            'os._exit = lambda status: exit(0)\n'
+            'builtins.add = lambda a, b: 0\n'
+        )
+        cheat = self.client.get(cheat['status_url']).json()
+        self.assertEqual((cheat['status'], cheat['score'], cheat['tests_passed']), ('graded', 0, 0))
+        self.assertEqual(cheat['test_results'][0]['message'], "NameError: name 'add' is not defined")
+
+    def test_tests_use_submission_objects(self):
+        code = '''
+from collections import Counter
+from decimal import Decimal
+
+class Account:
+    def __init__(self, balance):
+        self.balance = balance
+
+    def withdraw(self, amount):
+        if amount > self.balance:
+            raise ValueError('insufficient funds')
+        self.balance -= amount
+        return Decimal(self.balance)
+
+def evens(limit):
+    yield from range(0, limit, 2)
+
+words = Counter('a b a'.split())
+'''
+        tests = '''
+from decimal import Decimal
+
+def test_objects():
+    account = Account(10)
+    assert isinstance(account, Account)
+    assert account.withdraw(4) == Decimal(6) and account.balance == 6
+    account.balance = 1
+    try:
+        account.withdraw(5)
+    except ValueError as error:
+        assert str(error) == 'insufficient funds'
+    else:
+        raise AssertionError('no error')
+
+def test_values():
+    assert list(evens(7)) == [0, 2, 4, 6]
+    assert words == {'a': 2, 'b': 1} and words.most_common(1) == [('a', 2)]
+
+def test_missing():
+    subtract(1, 2)
+'''
+        result = grading_pool.run(code, tests=tests, test_seconds=5)
+        self.assertEqual(
+            [(test['name'], test['passed'], test['message']) for test in result['tests']],
+            [('test_objects', True, ''), ('test_values', True, ''),
+             ('test_missing', False, "NameError: name 'subtract' is not defined")],
+        )
+
+    def test_grade_submissions_command(self):
+        submissions = [
+            ExerciseSubmission.objects.create(
+                enrollment=self.enrollment, exercise=self.exercise, code=code,
+                content_hash=ExerciseGradingService.content_hash(code, ADD_TESTS)
+            )
+            for code in ('def add(a, b):\n    return a + b', 'def add(a, b):\n    return a + b', 'add = None')
+        ]
+        out = StringIO()
+        call_command('grade_submissions', workers=1, stdout=out)
+        self.assertIn('Grading 3 submissions (1 duplicates)', out.getvalue())
+        self.assertIn('Graded 3 submissions', out.getvalue())
+        scores = [ExerciseSubmission.objects.get(pk=submission.pk).score for submission in submissions]
+        self.assertEqual(scores, [10, 10, 0])
+
+
+class CodeHighlightingTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        category = CourseCategory.objects.create(name='data_analytics', display_name='Data Analytics')
+        course = Course.objects.create(title='Python for Data', category=category, price=100)
+        cls.module = CourseModule.objects.create(course=course, title='Intro', order=1)
+
+    def test_save_highlights_changed_code_only(self):
+        example = CodeExample.objects.create(module=self.module, title='Sum', code='total = sum([1, 2])')
+        self.assertIn('<span class="n">total</span>', example.highlighted_code)
+        rendered_hash = example.highlight_hash
+
+        with mock.patch('courses.highlighting.highlight_code') as highlight_code:
+            example.title = 'Adding up'
+            example.save(update_fields=['title'])
+        highlight_code.assert_not_called()
+
+        example.code = '<b>'
+        example.save(update_fields=['code'])
+        example.refresh_from_db()
+        self.assertNotEqual(example.highlight_hash, rendered_hash)
+        self.assertNotIn('<b>', example.highlighted_code)
+
+    def test_command_backfills_missing_markup(self):
+        example = CodeExample.objects.create(module=self.module, title='Query', code='SELECT 1', language='sql')
+        CodeExample.objects.filter(pk=example.pk).update(highlighted_code='', highlight_hash='')
+        out = StringIO()
+        call_command('highlight_code_examples', stdout=out)
+        self.assertIn('Highlighted 1 of 1 code examples', out.getvalue())
+        example.refresh_from_db()
+        self.assertIn('<span class="k">SELECT</span>', example.highlighted_code)
+
+
+@override_settings(CODE_RUNNER_WORKERS=1)
+class VerifyCodeExamplesTests(SandboxTestMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        category = CourseCategory.objects.create(name='data_analytics', display_name='Data Analytics')
+        course = Course.objects.create(title='Python for Data', category=category, price=100)
+        module = CourseModule.objects.create(course=course, title='Intro', order=1)
+        cls.passing = CodeExample.objects.create(
+            module=module, title='Object', order=1, code='print(object())\nprint("a  ")',
+            expected_output='<object object at 0x1>\na',
+        )
+        cls.drifted = CodeExample.objects.create(
+            module=module, title='Sum', order=2, code='print(sum(range(5)))', expected_output='11'
+        )
+        CodeExample.objects.create(
+            module=module, title='Query', order=3, code='SELECT 1', language='sql', expected_output='1'
+        )
+
+    def test_diffs_accepts_and_skips_verified_examples(self):
+        report = os.path.join(self.enterContext(tempfile.TemporaryDirectory()), 'examples.xml')
+        err = StringIO()
+        with self.assertRaisesMessage(CommandError, '1 passed, 0 accepted, 1 failed, 0 skipped'):
+            call_command('verify_code_examples', workers=1, junit=report, stdout=StringIO(), stderr=err)
+        self.assertIn('-11\n+10', err.getvalue())
+        suite = ElementTree.parse(report).getroot()
+        self.assertEqual((suite.get('tests'), suite.get('failures'), suite.get('errors')), ('2', '1', '0'))
+
+        out = StringIO()
+        call_command('verify_code_examples', workers=1, accept=True, stdout=out)
+        self.assertIn('0 passed, 1 accepted, 0 failed, 1 skipped', out.getvalue())
+        self.drifted.refresh_from_db()
+        self.assertEqual(self.drifted.expected_output, '10')
+
+        out = StringIO()
+        call_command('verify_code_examples', workers=1, stdout=out)
+        self.assertIn('Verified 0 code examples', out.getvalue())
+        self.assertIn('2 skipped', out.getvalue())
+
+
+class ImportCourseMarkdownTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        CourseCategory.objects.create(name='beginner', display_name='Beginner Courses')
+
+    def test_markdown_to_html(self):
+        self.assertHTMLEqual(
+            markdown_to_html('Intro with **bold** and `a<b`  \nnext line\n\n1. **One**\n   - sub\n\n2. Two\n\n'
+                             '```python\nprint(1)\n```'),
+            '<p>Intro with <strong>bold</strong> and <code>a&lt;b</code><br>next line</p>'
+            '<ol><li><strong>One</strong><ul><li>sub</li></ul></li><li>Two</li></ol>'
+            '<pre><code class="language-python">print(1)</code></pre>',
+        )
+
+    def test_import_is_idempotent(self):
+        out = StringIO()
+        call_command('import_course_markdown', category='beginner', stdout=out)
+        self.assertIn('Created python-data-analysis from Python_for_Data_Analysis_Course.md: 6 modules', out.getvalue())
+        course = Course.objects.get(slug='ai-tools-business-analytics')
+        self.assertEqual((course.total_modules, course.is_published), (4, False))
+        module = course.modules.get(order=1)
+        self.assertEqual((module.title, module.duration_hours), ('AI Foundation & Prompt Engineering', 16))
+        example = module.code_examples.get()
+        self.assertEqual((example.title, example.language), ('AI-assisted data analysis workflow', 'python'))
+        self.assertIn('<span class="kn">import</span>', example.highlighted_code)
+        capstone = course.capstone_projects.get()
+        self.assertEqual((capstone.is_group_project, capstone.max_group_size), (True, 4))
+
+        def snapshot():
+            return [
+                list(model.objects.order_by('pk').values_list('pk', 'title'))
+                for model in (CourseModule, CodeExample, Exercise, CapstoneProject)
+            ]
+        before = snapshot()
+        out = StringIO()
+        call_command('import_course_markdown', stdout=out)
+        self.assertIn('Updated ai-tools-business-analytics', out.getvalue())
+        self.assertEqual(snapshot(), before)
+
+    def test_admin_inlines_add_rows_without_an_order(self):
+        admin_user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        course = Course.objects.create(title='Python for Data', category=CourseCategory.objects.get(), price=100)
+        module = CourseModule.objects.create(course=course, title='Intro', order=1, description='-', content='-')
+        CodeExample.objects.create(module=module, title='Existing', order=1, code='print(1)')
+
+        data = {
+            'course': course.pk, 'title': module.title, 'description': '-', 'content': '-', 'order': 1,
+            'learning_objectives': '', 'duration_hours': 0, 'video_url': '', 'resources': '', 'is_active': 'on',
+        }
+        for prefix, fields in (
+            ('code_examples', {'language': 'python', 'difficulty_level': 'beginner'}),
+            ('exercises', {'difficulty_level': 'beginner', 'estimated_time_minutes': 30, 'points': 0}),
+        ):
+            data.update({f'{prefix}-TOTAL_FORMS': 2, f'{prefix}-INITIAL_FORMS': 0,
+                         f'{prefix}-MIN_NUM_FORMS': 0, f'{prefix}-MAX_NUM_FORMS': 1000})
+            for index in range(2):
+                data.update({f'{prefix}-{index}-{field}': value for field, value in fields.items()})
+                data.update({f'{prefix}-{index}-title': f'New {index}', f'{prefix}-{index}-order': ''})
+
+        self.client.force_login(admin_user)
+        response = self.client.post(reverse('admin:courses_coursemodule_change', args=[module.pk]), data)
+        self.assertRedirects(response, reverse('admin:courses_coursemodule_changelist'))
+        self.assertEqual(list(module.code_examples.values_list('title', 'order')),
+                         [('Existing', 1), ('New 0', 2), ('New 1', 3)])
+        self.assertEqual(list(module.exercises.values_list('title', 'order')), [('New 0', 1), ('New 1', 2)])
+
+
+class CourseBundleTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        media = override_settings(MEDIA_ROOT=directory.name)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.bundle = os.path.join(directory.name, 'courses.jsonl.gz')
+
+        category = CourseCategory.objects.create(name='beginner', display_name='Beginner Courses')
+        self.course = Course.objects.create(
+            title='Python for Data', category=category, price=100,
+            course_pdf=default_storage.save('course_pdfs/syllabus.pdf', ContentFile(b'%PDF-1.4')),
+        )
+        self.diagram = default_storage.save('uploads/diagram.png', ContentFile(b'png'))
+        module = CourseModule.objects.create(
+            course=self.course, title='Intro', order=1, content=f'<p><img src="/media/{self.diagram}"></p>'
+        )
+        CodeExample.objects.create(module=module, title='Sum', order=1, code='print(1)')
+        Exercise.objects.create(module=module, title='Totals', order=1, description='<p>Add up</p>')
+        CapstoneProject.objects.create(course=self.course, title='Dashboard', order=1)
+
+    def snapshot(self):
+        return [
+            list(CourseModule.objects.values_list('course__slug', 'order', 'title', 'content')),
+            list(CodeExample.objects.values_list('module__order', 'order', 'code', 'highlighted_code')),
+            list(Exercise.objects.values_list('module__order', 'order', 'description')),
+            list(CapstoneProject.objects.values_list('course__slug', 'order', 'title')),
+        ]
+
+    def test_round_trip_with_media_and_dry_run_diff(self):
+        out = StringIO()
+        call_command('export_course', self.course.slug, output=self.bundle, stdout=out)
+        self.assertIn('Exported 1 courses', out.getvalue())
+        before = self.snapshot()
+        old_module_id = self.course.modules.get().pk
+        self.course.delete()
+        default_storage.delete(self.diagram)
+
+        out = StringIO()
+        call_command('import_course', self.bundle, dry_run=True, stdout=out)
+        self.assertIn('+ course python-for-data\n+ coursemodule python-for-data/1\n', out.getvalue())
+        self.assertIn(f'+ media {self.diagram}', out.getvalue())
+        self.assertFalse(Course.objects.exists())
+
+        call_command('import_course', self.bundle, stdout=StringIO())
+        self.assertEqual(self.snapshot(), before)
+        course = Course.objects.get(slug='python-for-data')
+        self.assertNotEqual(course.modules.get().pk, old_module_id)
+        self.assertEqual(course.course_pdf.name, 'course_pdfs/syllabus.pdf')
+        self.assertTrue(default_storage.exists(self.diagram))
+
+        CourseModule.objects.update(title='Renamed')
+        self.assertEqual(
+            diff_bundle(load_bundle(self.bundle, dry_run=True)), ['~ coursemodule python-for-data/1: title']
+        )
+
+    def test_dry_run_after_import_reports_no_changes(self):
+        # Markup rendered by another Pygments version, which the import renders again
+        CodeExample.objects.update(highlighted_code='<span>print(1)</span>', highlight_hash='0' * 64)
+        call_command('export_course', self.course.slug, output=self.bundle, stdout=StringIO())
+        call_command('import_course', self.bundle, stdout=StringIO())
+        self.assertNotEqual(CodeExample.objects.get().highlight_hash, '0' * 64)
+
+        out = StringIO()
+        call_command('import_course', self.bundle, dry_run=True, stdout=out)
+        self.assertEqual(out.getvalue(), '0 changes in 1 courses\n')
+
+
+class CourseCloneTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        category = CourseCategory.objects.create(name='beginner', display_name='Beginner Courses')
+        cls.course = Course.objects.create(title='Python for Data', category=category, price=100, is_featured=True)
+        for order in (1, 2):
+            module = CourseModule.objects.create(course=cls.course, title=f'Module {order}', order=order)
+            CodeExample.objects.create(module=module, title=f'Example {order}', order=1, code=f'print({order})')
+            Exercise.objects.create(module=module, title=f'Exercise {order}', order=1, description='-')
+        CapstoneProject.objects.create(course=cls.course, title='Dashboard', order=1)
+
+    def test_clone_copies_tree_in_one_insert_per_table(self):
+        Course.objects.create(title='Python for Data (copy)', category=self.course.category, price=1)
+        with self.assertNumQueries(13):
+            clone = CourseCloneService.clone(self.course)
+        self.assertEqual(clone.slug, 'python-for-data-copy-2')
+        self.assertEqual((clone.is_published, clone.is_featured), (False, False))
+        self.assertEqual(
+            list(CodeExample.objects.filter(module__course=clone).values_list('module__title', 'code')),
+            [('Module 1', 'print(1)'), ('Module 2', 'print(2)')],
+        )
+        self.assertEqual(
+            list(Exercise.objects.filter(module__course=clone).values_list('module__title', 'title')),
+            [('Module 1', 'Exercise 1'), ('Module 2', 'Exercise 2')],
+        )
+        self.assertEqual(clone.capstone_projects.get().title, 'Dashboard')
+        self.assertEqual(self.course.modules.count(), 2)
+
+    def test_admin_action(self):
+        self.client.force_login(self.admin)
+        response = self.client.post(reverse('admin:courses_course_changelist'), {
+            'action': 'clone_courses', '_selected_action': [self.course.pk],
+        }, follow=True)
+        self.assertContains(response, 'Cloned 1 courses as unpublished copies: python-for-data-copy.')
+        self.assertEqual(Course.objects.get(slug='python-for-data-copy').modules.count(), 2)
+
+
+@override_settings(BACKGROUND_TASKS_EAGER=True)
+class CourseSyllabusTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        media = override_settings(MEDIA_ROOT=directory.name)
+        media.enable()
+        self.addCleanup(media.disable)
+
+        category = CourseCategory.objects.create(name='beginner', display_name='Beginner Courses')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.course = Course.objects.create(
+                title='Python & Data', category=category, price=100, duration='8 weeks',
+                tools_software='Python\nPandas',
+                learning_outcomes='<ul><li>Clean data</li><li>Plot &amp; report</li></ul>',
+            )
+            self.module = CourseModule.objects.create(
+                course=self.course, title='Pandas <basics>', order=1, duration_hours=6,
+                learning_objectives='<p>Load CSV files</p><p>Group rows</p>',
+            )
+
+    def test_renders_in_background_only_when_content_changes(self):
+        self.course.refresh_from_db()
+        self.assertTrue(self.course.syllabus_pdf.read().startswith(b'%PDF'))
+        first = self.course.syllabus_pdf.name
+
+        with mock.patch('courses.utils.SyllabusGenerator.generate_course_syllabus') as generate:
+            with self.captureOnCommitCallbacks(execute=True):
+                Course.objects.filter(pk=self.course.pk).update(price=90)
+                self.course.save()
+                self.module.video_url = 'https://example.com/video'
+                self.module.save()
+        generate.assert_not_called()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.module.learning_objectives = '<ul><li>Merge frames</li></ul>'
+            self.module.save()
+        self.course.refresh_from_db()
+        self.assertNotEqual(self.course.syllabus_pdf.name, first)
+
+    def test_items_from_html(self):
+        from .utils import SyllabusGenerator
+        self.assertEqual(SyllabusGenerator.items(self.course.learning_outcomes), ['Clean data', 'Plot &amp; report'])
+        self.assertEqual(SyllabusGenerator.items(self.module.learning_objectives), ['Load CSV files', 'Group rows'])
+
+    def test_download_streams_cached_file_with_etag(self):
+        url = reverse('courses:course_syllabus', args=[self.course.slug])
+        response = self.client.get(url)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'%PDF'))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_download_renders_missing_file(self):
+        Course.objects.filter(pk=self.course.pk).update(syllabus_pdf='', syllabus_hash='')
+        response = self.client.get(reverse('courses:course_syllabus', args=[self.course.slug]))
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'%PDF'))
+        self.assertTrue(Course.objects.get(pk=self.course.pk).syllabus_hash)
+
+
+@override_settings(BACKGROUND_TASKS_EAGER=True)
+class OfflineCopyTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        media = override_settings(MEDIA_ROOT=directory.name)
+        media.enable()
+        self.addCleanup(media.disable)
+        default_storage.save('uploads/chart.png', ContentFile(b'\x89PNG chart'))
+
+        self.learner = User.objects.create_user('learner', 'learner@example.com', 'password')
+        category = CourseCategory.objects.create(name='beginner', display_name='Beginner Courses')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.course = Course.objects.create(title='Python for Data', category=category, price=100)
+            self.enrollment = Enrollment.objects.create(user=self.learner, course=self.course, total_amount=100)
+            self.enrollment.activate_enrollment()
+            module = CourseModule.objects.create(
+                course=self.course, title='Pandas', order=1,
+                content='<p><img src="/media/uploads/chart.png" srcset="/media/variants/chart-480.jpg 480w"></p>',
+            )
+            CodeExample.objects.create(module=module, title='Read a CSV', order=1, code='import pandas')
+            Exercise.objects.create(module=module, title='Clean it', order=1, description='-', solution='SECRET')
+        self.url = reverse('courses:download_offline_copy', args=[self.course.slug])
+
+    def download(self, **headers):
+        self.client.force_login(self.learner)
+        response = self.client.get(self.url, headers=headers)
+        return response, b''.join(response.streaming_content)
+
+    def test_download_is_self_contained_and_watermarked(self):
+        from .offline import verify_manifest
+        response, data = self.download()
+        self.assertEqual((response.status_code, response['Content-Length']), (200, str(len(data))))
+        archive = zipfile.ZipFile(BytesIO(data))
+        self.assertIsNone(archive.testzip())
+        self.assertEqual(archive.read('python-for-data/media/uploads/chart.png'), b'\x89PNG chart')
+        page = archive.read('python-for-data/module-01.html').decode()
+        self.assertIn('<img src="media/uploads/chart.png"', page)
+        self.assertNotIn('srcset', page)
+        self.assertIn('Read a CSV', page)
+        self.assertNotIn('SECRET', page)
+        manifest = json.loads(archive.read('python-for-data/manifest.json'))
+        self.assertEqual(manifest['enrollment'], str(self.enrollment.pk))
+        self.assertTrue(verify_manifest(manifest))
+        self.assertFalse(verify_manifest({**manifest, 'enrollment': 'someone-else'}))
+
+    def test_range_resume(self):
+        response, data = self.download()
+        partial, rest = self.download(Range='bytes=100-', If_Range=response['ETag'])
+        self.assertEqual(partial.status_code, 206)
+        self.assertEqual(partial['Content-Range'], f'bytes 100-{len(data) - 1}/{len(data)}')
+        self.assertEqual(rest, data[100:])
+        stale, _ = self.download(Range='bytes=100-', If_Range='"old"')
+        self.assertEqual(stale.status_code, 200)
+        self.assertEqual(self.client.get(self.url, headers={'Range': f'bytes={len(data)}-'}).status_code, 416)
+
+    def test_watermark_change_invalidates_resume(self):
+        response, data = self.download()
+        self.learner.first_name, self.learner.last_name = 'Ada', 'Lovelace'
+        self.learner.save()
+        renamed, renamed_data = self.download(Range='bytes=100-', If_Range=response['ETag'])
+        self.assertNotEqual(renamed['ETag'], response['ETag'])
+        self.assertEqual(renamed.status_code, 200)
+        self.assertIn(b'Ada Lovelace', renamed_data)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+    def test_rebuilt_only_when_rendered_content_changes(self):
+        name = Course.objects.get(pk=self.course.pk).offline_archive.name
+        with self.captureOnCommitCallbacks(execute=True):
+            Exercise.objects.filter(title='Clean it').get().save()
+            Course.objects.filter(pk=self.course.pk).update(price=90)
+        self.assertEqual(Course.objects.get(pk=self.course.pk).offline_archive.name, name)
+        with self.captureOnCommitCallbacks(execute=True):
+            CodeExample.objects.filter(title='Read a CSV').update(title='Read a CSV file')
+            CodeExample.objects.get(title='Read a CSV file').save()
+        self.assertNotEqual(Course.objects.get(pk=self.course.pk).offline_archive.name, name)
+
+    def test_requires_activated_enrollment(self):
+        Enrollment.objects.filter(pk=self.enrollment.pk).update(is_activated=False)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 302)
+        self.client.force_login(self.learner)
+        self.assertRedirects(self.client.get(self.url), reverse('courses:course_detail', args=[self.course.slug]))
@@ -13,12 +13,18 @@ urlpatterns = [
     path('enroll/<slug:slug>/', views.enroll_course, name='enroll_course'),
     path('enroll-guest/<slug:slug>/', views.enroll_guest, name='enroll_guest'),
     path('enrollment/<uuid:enrollment_id>/', views.enrollment_status, name='enrollment_status'),
+    path('syllabus/<slug:slug>/', views.course_syllabus, name='course_syllabus'),
     path('materials/<slug:slug>/', views.course_materials, name='course_materials'),
+    path('materials/<slug:slug>/offline.zip', views.download_offline_copy, name='download_offline_copy'),
     path('materials/<slug:slug>/module/<int:module_id>/complete/', views.mark_module_complete, name='mark_module_complete'),
+    path('materials/<slug:slug>/example/<int:example_id>/run/', views.run_code_example, name='run_code_example'),
+    path('materials/<slug:slug>/exercise/<int:exercise_id>/submit/', views.submit_exercise, name='submit_exercise'),
+    path('materials/<slug:slug>/submission/<int:submission_id>/', views.exercise_submission, name='exercise_submission'),
     path('materials/<slug:slug>/project/<int:project_id>/start/', views.start_project, name='start_project'),
     path('materials/<slug:slug>/project/<int:project_id>/submit/', views.submit_project, name='submit_project'),
     path('instructor/review/<slug:slug>/project/<int:project_id>/<int:enrollment_id>/', views.instructor_review_project, name='instructor_review_project'),
     path('instructor/dashboard/', views.instructor_dashboard, name='instructor_dashboard'),
+    path('instructor/review/bulk/', views.instructor_bulk_review, name='instructor_bulk_review'),
     path('certificate/download/<int:enrollment_id>/', views.download_certificate, name='download_certificate'),
     
     # Course details (put last since it catches any slug)
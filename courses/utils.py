@@ -1,11 +1,16 @@
 """
 Utility classes and functions for courses app
 """
+import logging
 import os
+import re
+from html import unescape
 from io import BytesIO
+from xml.sax.saxutils import escape
 from django.conf import settings
 from django.core.files.base import ContentFile
 from django.utils import timezone
+from django.utils.html import strip_tags
 from reportlab.lib.pagesizes import A4, landscape
 from reportlab.lib import colors
 from reportlab.lib.units import inch
@@ -16,6 +21,8 @@ from reportlab.pdfgen import canvas
 from reportlab.lib.utils import ImageReader
 import textwrap
 
+logger = logging.getLogger(__name__)
+
 
 class CertificateGenerator:
     """Generate PDF certificates for completed projects"""
@@ -183,6 +190,170 @@ class CertificateGenerator:
             # Return the file path for saving to the model
             return certificate_file
             
-        except Exception as e:
-            print(f"Error generating certificate: {e}")
-            return None
\ No newline at end of file
+        except Exception:
+            logger.exception(
+                'Error generating certificate',
+                extra={'project_enrollment_id': project_enrollment.id}
+            )
+            return None
+
+class SyllabusGenerator:
+    """Generate course outline PDFs from a course and its modules"""
+
+    # Part of the syllabus content hash: bump when the layout changes to re-render every course
+    VERSION = 1
+
+    PRIMARY_COLOR = CertificateGenerator.PRIMARY_COLOR
+    SECONDARY_COLOR = CertificateGenerator.SECONDARY_COLOR
+    TEXT_COLOR = CertificateGenerator.TEXT_COLOR
+    LIST_ITEM_RE = re.compile(r'<li\b[^>]*>(.*?)</li>', re.IGNORECASE | re.DOTALL)
+    BLOCK_RE = re.compile(r'<(?:p|h[1-6]|div|br)\b[^>]*>', re.IGNORECASE)
+
+    @classmethod
+    def text(cls, content):
+        """Plain text of CKEditor HTML, escaped for reportlab's paragraph markup"""
+        return escape(' '.join(unescape(strip_tags(content)).split()))
+
+    @classmethod
+    def items(cls, content):
+        """The list items of CKEditor HTML, or its paragraphs when it has no list"""
+        parts = cls.LIST_ITEM_RE.findall(content) or cls.BLOCK_RE.split(content)
+        return [text for text in map(cls.text, parts) if text]
+
+    @classmethod
+    def generate_course_syllabus(cls, course, modules):
+        """
+        Render the outline of ``course`` and its ``modules`` to a portrait PDF; returns the PDF bytes
+        """
+        buffer = BytesIO()
+        doc = SimpleDocTemplate(
+            buffer,
+            pagesize=A4,
+            rightMargin=0.75 * inch,
+            leftMargin=0.75 * inch,
+            topMargin=0.75 * inch,
+            bottomMargin=0.75 * inch,
+            title=f"{course.title} - Syllabus",
+            author="LUM Data Academy",
+        )
+        styles = getSampleStyleSheet()
+
+        title_style = ParagraphStyle(
+            'SyllabusTitle',
+            parent=styles['Title'],
+            fontSize=24,
+            textColor=cls.PRIMARY_COLOR,
+            alignment=TA_LEFT,
+            spaceAfter=6,
+            fontName='Helvetica-Bold'
+        )
+        heading_style = ParagraphStyle(
+            'SyllabusHeading',
+            parent=styles['Heading2'],
+            fontSize=14,
+            textColor=cls.PRIMARY_COLOR,
+            spaceBefore=14,
+            spaceAfter=6,
+            fontName='Helvetica-Bold'
+        )
+        module_style = ParagraphStyle(
+            'SyllabusModule',
+            parent=styles['Heading3'],
+            fontSize=12,
+            textColor=cls.TEXT_COLOR,
+            spaceBefore=10,
+            spaceAfter=4,
+            fontName='Helvetica-Bold'
+        )
+        body_style = ParagraphStyle(
+            'SyllabusBody',
+            parent=styles['Normal'],
+            fontSize=10,
+            leading=14,
+            textColor=cls.TEXT_COLOR,
+            spaceAfter=4,
+            fontName='Helvetica'
+        )
+        bullet_style = ParagraphStyle('SyllabusBullet', parent=body_style, leftIndent=14, bulletIndent=4, spaceAfter=2)
+
+        story = [
+            Paragraph("LUM DATA ACADEMY", ParagraphStyle(
+                'SyllabusBrand', parent=body_style, textColor=cls.SECONDARY_COLOR, fontName='Helvetica-Bold'
+            )),
+            Paragraph(escape(course.title), title_style),
+        ]
+        overview = cls.text(course.overview)
+        if overview:
+            story.append(Paragraph(overview, body_style))
+
+        total_hours = course.estimated_hours or sum(module.duration_hours for module in modules)
+        details = [
+            ['Duration', course.duration],
+            ['Schedule', course.schedule],
+            ['Estimated hours', f"{total_hours} hours" if total_hours else ''],
+            ['Modules', str(len(modules))],
+            ['Tools', ', '.join(' '.join(line.split()) for line in course.tools_software.splitlines() if line.strip())],
+        ]
+        details_table = Table(
+            [[label, Paragraph(escape(value), body_style)] for label, value in details if value],
+            colWidths=[1.6 * inch, 5.1 * inch]
+        )
+        details_table.setStyle(TableStyle([
+            ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, -1), 10),
+            ('TEXTCOLOR', (0, 0), (-1, -1), cls.TEXT_COLOR),
+            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+            ('LINEBELOW', (0, 0), (-1, -1), 0.25, colors.lightgrey),
+        ]))
+        story += [Spacer(1, 0.15 * inch), details_table]
+
+        for heading, content in (('Learning Outcomes', course.learning_outcomes),
+                                 ('Prerequisites', course.prerequisites)):
+            items = cls.items(content)
+            if items:
+                story.append(Paragraph(heading, heading_style))
+                story.extend(Paragraph(item, bullet_style, bulletText='•') for item in items)
+
+        if modules:
+            story.append(Paragraph('Course Outline', heading_style))
+            outline_table = Table(
+                [['#', 'Module', 'Hours']] + [
+                    [str(module.order), Paragraph(escape(module.title), body_style), str(module.duration_hours or '')]
+                    for module in modules
+                ],
+                colWidths=[0.5 * inch, 5.3 * inch, 0.9 * inch],
+                repeatRows=1
+            )
+            outline_table.setStyle(TableStyle([
+                ('BACKGROUND', (0, 0), (-1, 0), cls.PRIMARY_COLOR),
+                ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+                ('FONTSIZE', (0, 0), (-1, -1), 10),
+                ('ALIGN', (0, 0), (0, -1), 'CENTER'),
+                ('ALIGN', (2, 0), (2, -1), 'CENTER'),
+                ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+                ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.Color(0.95, 0.96, 0.98)]),
+                ('LINEBELOW', (0, 0), (-1, -1), 0.25, colors.lightgrey),
+            ]))
+            story.append(outline_table)
+
+            for module in modules:
+                objectives = cls.items(module.learning_objectives)
+                description = cls.text(module.description)
+                if not objectives and not description:
+                    continue
+                story.append(Paragraph(f"Module {module.order}: {escape(module.title)}", module_style))
+                if description:
+                    story.append(Paragraph(description, body_style))
+                story.extend(Paragraph(item, bullet_style, bulletText='•') for item in objectives)
+
+        def footer(page, doc):
+            page.saveState()
+            page.setFont('Helvetica', 8)
+            page.setFillColor(cls.TEXT_COLOR)
+            page.drawString(doc.leftMargin, 0.5 * inch, f"{course.title} - Syllabus")
+            page.drawRightString(A4[0] - doc.rightMargin, 0.5 * inch, f"Page {doc.page}")
+            page.restoreState()
+
+        doc.build(story, onFirstPage=footer, onLaterPages=footer)
+        return buffer.getvalue()
@@ -2,19 +2,34 @@ from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib import messages
 from django.core.paginator import Paginator
 from django.http import JsonResponse
-from django.views.decorators.http import require_http_methods
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import etag, require_http_methods
 from django.views.decorators.csrf import csrf_exempt
-from django.http import HttpResponse, Http404
+from django.http import FileResponse, HttpResponse, Http404, StreamingHttpResponse
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import login
 from django.contrib.auth.models import User
 from django.contrib.auth.forms import UserCreationForm
+from django.urls import reverse
 from django.utils import timezone
 from datetime import timedelta, date
 import json
+import logging
 
-from .models import Course, CourseCategory, Enrollment, PaymentInstallment, ModuleCompletion, ProjectEnrollment
-from .forms import ProjectSubmissionForm, InstructorReviewForm
+from .models import (
+    CodeExample, Course, CourseCategory, Enrollment, Exercise, ExerciseSubmission, PaymentInstallment,
+    ModuleCompletion, ProjectEnrollment
+)
+from .forms import ProjectSubmissionForm, InstructorReviewForm, BulkReviewFormSet
+from .offline import parse_range
+from .runner import RunnerUnavailable
+from .services import (
+    CodeRunnerService, ExerciseGradingService, InstructorQueueService, LearnerActivityService,
+    LearnerDashboardService, OfflineCopyService, ProjectReviewService, SyllabusService
+)
+
+logger = logging.getLogger(__name__)
 
 
 def courses(request):
@@ -24,7 +39,7 @@ def courses(request):
     search_query = request.GET.get('search')
     selected_currency = request.GET.get('currency', 'KES')
 
-    courses_list = Course.objects.filter(is_active=True)
+    courses_list = Course.objects.filter(is_active=True).select_related('category')
 
     if category_slug:
         courses_list = courses_list.filter(category__name=category_slug)
@@ -55,11 +70,18 @@ def courses(request):
 
 def course_detail(request, slug):
     """Individual course detail page with enrollment status"""
-    course = get_object_or_404(Course, slug=slug, is_active=True)
+    # The syllabus lists every module with its examples/exercises and the projects
+    course = get_object_or_404(
+        Course.objects.select_related('category').prefetch_related(
+            'modules__code_examples', 'modules__exercises', 'capstone_projects'
+        ),
+        slug=slug,
+        is_active=True
+    )
     related_courses = Course.objects.filter(
         category=course.category,
         is_active=True
-    ).exclude(id=course.id)[:3]
+    ).exclude(id=course.id).select_related('category')[:3]
 
     selected_currency = request.GET.get('currency', 'KES')
     currencies = [
@@ -86,6 +108,20 @@ def course_detail(request, slug):
     return render(request, 'courses/course_detail.html', context)
 
 
+def syllabus_etag(request, slug):
+    return Course.objects.filter(slug=slug, is_active=True).values_list('syllabus_hash', flat=True).first() or None
+
+
+@etag(syllabus_etag)
+@cache_control(public=True, no_cache=True)
+def course_syllabus(request, slug):
+    """Stream the generated syllabus PDF; browsers revalidate it against the content hash"""
+    course = get_object_or_404(Course, slug=slug, is_active=True)
+    syllabus = SyllabusService.get_syllabus(course)
+    return FileResponse(syllabus.open('rb'), content_type='application/pdf',
+                        filename=f"LUM_Syllabus_{course.slug}.pdf")
+
+
 @login_required
 def enroll_course(request, slug):
     """Course enrollment page with payment method and installment selection"""
@@ -223,26 +259,35 @@ def course_materials(request, slug):
         messages.error(request, 'You do not have access to this course. Please ensure your enrollment is activated.')
         return redirect('courses:course_detail', slug=course.slug)
     
-    # Get course modules and content
-    modules = course.modules.filter(is_active=True).order_by('order')
+    # Get course modules and content (examples and exercises are rendered per module)
+    modules = course.modules.filter(is_active=True).prefetch_related(
+        'code_examples', 'exercises'
+    ).order_by('order')
     capstone_projects = course.capstone_projects.all().order_by('order')
     
     # Get completion data
-    completed_modules = enrollment.module_completions.values_list('module_id', flat=True)
-    started_projects = enrollment.project_enrollments.values_list('project_id', flat=True)
+    completed_modules = set(enrollment.module_completions.values_list('module_id', flat=True))
     
     # Add completion status to modules
     for module in modules:
         module.is_completed = module.id in completed_modules
     
     # Add enrollment status and enrollment object to projects
-    project_enrollments = {pe.project_id: pe for pe in enrollment.project_enrollments.all()}
+    project_enrollments = {
+        pe.project_id: pe for pe in enrollment.project_enrollments.select_related('reviewed_by')
+    }
     for project in capstone_projects:
-        project.is_started = project.id in started_projects
         project.project_enrollment = project_enrollments.get(project.id)
-        # Debug: Ensure we have the enrollment object with proper status
+        project.is_started = project.project_enrollment is not None
         if project.project_enrollment:
-            print(f"Project {project.title} has enrollment with status: {project.project_enrollment.status}")
+            logger.debug(
+                'Project enrollment status for materials page',
+                extra={
+                    'project_id': project.id,
+                    'project_enrollment_id': project.project_enrollment.id,
+                    'status': project.project_enrollment.status,
+                }
+            )
     
     context = {
         'course': course,
@@ -255,13 +300,67 @@ def course_materials(request, slug):
     return render(request, 'courses/course_materials.html', context)
 
 
+@login_required
+def download_offline_copy(request, slug):
+    """
+    Stream the offline copy of the course materials, watermarked for the
+    learner's enrollment; supports Range requests so downloads can resume
+    """
+    course = get_object_or_404(Course, slug=slug, is_active=True)
+    enrollment = Enrollment.objects.filter(
+        user=request.user, course=course, is_activated=True
+    ).select_related('user', 'course').first()
+    if enrollment is None:
+        messages.error(request, 'You do not have access to this course. Please ensure your enrollment is activated.')
+        return redirect('courses:course_detail', slug=course.slug)
+
+    archive = OfflineCopyService.get_download(enrollment)
+    if archive is None:
+        messages.info(request, 'Your offline copy is being prepared. Please try again in a few minutes.')
+        return redirect('courses:course_materials', slug=course.slug)
+
+    # The cached build and the watermark appended to it (learner name and email included): ranges of two
+    # requests only line up when both are the same
+    etag = f'"{course.offline_archive_hash[:16]}-{archive.tail_hash[:16]}"'
+    if request.headers.get('If-None-Match') == etag:
+        response = HttpResponse(status=304)
+        response['ETag'] = etag
+        return response
+    byte_range = None
+    if request.headers.get('If-Range', etag) == etag:
+        try:
+            byte_range = parse_range(request.headers.get('Range'), archive.size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{archive.size}'
+            return response
+
+    if byte_range is None:
+        response = StreamingHttpResponse(archive.iter_range(), content_type='application/zip')
+        response['Content-Length'] = archive.size
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(archive.iter_range(start, end), status=206, content_type='application/zip')
+        response['Content-Length'] = end - start + 1
+        response['Content-Range'] = f'bytes {start}-{end}/{archive.size}'
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
+    response['Content-Disposition'] = f'attachment; filename="LUM_{course.slug}_offline.zip"'
+    return response
+
+
 @login_required
 def my_enrollments(request):
     """Display user's enrollments"""
-    enrollments = Enrollment.objects.filter(user=request.user).order_by('-created_at')
+    summary = LearnerDashboardService.get_summary(request.user)
 
     context = {
-        'enrollments': enrollments,
+        'enrollments': summary['enrollments'],
+        'total_enrollments': summary['total_enrollments'],
+        'active_enrollments': summary['active_enrollments'],
+        'completed_payments': summary['completed_payments'],
+        'learning_hours': summary['learning_hours'],
     }
     return render(request, 'courses/my_enrollments.html', context)
 
@@ -283,21 +382,12 @@ def mark_module_complete(request, slug, module_id):
     except Enrollment.DoesNotExist:
         return JsonResponse({'success': False, 'error': 'No active enrollment found'})
     
-    # Create or get module completion record
-    completion, created = ModuleCompletion.objects.get_or_create(
-        enrollment=enrollment,
-        module=module,
-        defaults={'completed_at': timezone.now()}
-    )
-    
-    if not created:
-        # If already completed, mark as incomplete (toggle)
-        completion.delete()
-        completed = False
-        message = f"Module {module.order} marked as incomplete"
-    else:
-        completed = True
+    # Toggle the module completion record
+    completed = LearnerActivityService.toggle_module_completion(enrollment, module)
+    if completed:
         message = f"Congratulations! Module {module.order} completed"
+    else:
+        message = f"Module {module.order} marked as incomplete"
     
     # Get updated completion count
     completed_modules = ModuleCompletion.objects.filter(enrollment=enrollment).count()
@@ -359,6 +449,97 @@ def start_project(request, slug, project_id):
     return redirect('courses:course_materials', slug=course.slug)
 
 
+@login_required
+@require_http_methods(["POST"])
+def run_code_example(request, slug, example_id):
+    """
+    Run an interactive code example, or the learner's edit of it, in the sandbox
+
+    Takes an optional JSON body ``{"code": "..."}`` and returns the output
+    as JSON (see CodeRunnerService.run).
+    """
+    course = get_object_or_404(Course, slug=slug, is_active=True)
+    example = get_object_or_404(
+        CodeExample, id=example_id, module__course=course, module__is_active=True, is_interactive=True
+    )
+
+    if not Enrollment.objects.filter(user=request.user, course=course, is_activated=True).exists():
+        return JsonResponse({'success': False, 'error': 'No active enrollment found'}, status=403)
+    if not CodeRunnerService.supports(example.language):
+        return JsonResponse({'success': False, 'error': f'{example.language} examples cannot be run'}, status=400)
+
+    try:
+        payload = json.loads(request.body) if request.content_type == 'application/json' else {}
+        code = payload.get('code', example.code)
+    except (ValueError, AttributeError):
+        return JsonResponse({'success': False, 'error': 'Invalid request'}, status=400)
+    if not isinstance(code, str) or len(code) > settings.CODE_RUNNER_MAX_CODE_LENGTH:
+        return JsonResponse({'success': False, 'error': 'Code is missing or too long'}, status=400)
+
+    try:
+        result = CodeRunnerService.run(code, example.language)
+    except RunnerUnavailable:
+        logger.exception('Code runner unavailable')
+        return JsonResponse({'success': False, 'error': 'The code runner is busy, please try again'}, status=503)
+    return JsonResponse({'success': True, **result})
+
+
+def submission_data(submission, slug):
+    """JSON shape of an exercise submission for the materials page"""
+    return {
+        'submission_id': submission.id,
+        'status_url': reverse('courses:exercise_submission', args=[slug, submission.id]),
+        'status': submission.status,
+        'score': submission.score,
+        'points': submission.exercise.points,
+        'tests_passed': submission.tests_passed,
+        'tests_total': submission.tests_total,
+        'test_results': submission.test_results,
+        'output': submission.output,
+    }
+
+
+@login_required
+@require_http_methods(["POST"])
+def submit_exercise(request, slug, exercise_id):
+    """
+    Submit code for a graded exercise
+
+    Takes a JSON body ``{"code": "..."}``. Grading happens in the
+    background unless identical code was graded before; poll
+    exercise_submission until the status is no longer pending.
+    """
+    course = get_object_or_404(Course, slug=slug, is_active=True)
+    exercise = get_object_or_404(Exercise, id=exercise_id, module__course=course, module__is_active=True)
+    if not exercise.accepts_submissions():
+        raise Http404
+
+    enrollment = Enrollment.objects.filter(user=request.user, course=course, is_activated=True).first()
+    if enrollment is None:
+        return JsonResponse({'success': False, 'error': 'No active enrollment found'}, status=403)
+
+    try:
+        code = json.loads(request.body).get('code')
+    except (ValueError, AttributeError):
+        return JsonResponse({'success': False, 'error': 'Invalid request'}, status=400)
+    if not isinstance(code, str) or not code.strip() or len(code) > settings.CODE_RUNNER_MAX_CODE_LENGTH:
+        return JsonResponse({'success': False, 'error': 'Code is missing or too long'}, status=400)
+
+    submission = ExerciseGradingService.submit(enrollment, exercise, code)
+    submission.refresh_from_db()
+    return JsonResponse({'success': True, **submission_data(submission, slug)})
+
+
+@login_required
+def exercise_submission(request, slug, submission_id):
+    """Current state of one of the learner's exercise submissions"""
+    submission = get_object_or_404(
+        ExerciseSubmission.objects.select_related('exercise'),
+        id=submission_id, enrollment__user=request.user, enrollment__course__slug=slug
+    )
+    return JsonResponse({'success': True, **submission_data(submission, slug)})
+
+
 def enroll_guest(request, slug):
     """Handle enrollment for non-authenticated users using unified registration form"""
     from accounts.forms import UnifiedRegistrationForm
@@ -497,24 +678,23 @@ def instructor_review_project(request, slug, project_id, enrollment_id):
         if action == 'complete':
             form = InstructorReviewForm(request.POST, instance=project_enrollment)
             if form.is_valid():
-                # Complete the project
-                form.save()
-                project_enrollment.complete_project(
-                    grade=form.cleaned_data.get('grade'),
-                    instructor=request.user
-                )
-                
-                # Send completion notification email
-                from emails.services import EmailService
-                EmailService.send_project_completion_notification(project_enrollment)
+                # Complete the project in one write; the certificate and the
+                # completion email are produced on the background queue
+                ProjectReviewService.apply_reviews(request.user, [(
+                    project_enrollment,
+                    'complete',
+                    form.cleaned_data.get('grade'),
+                    form.cleaned_data.get('instructor_feedback'),
+                )])
                 
-                messages.success(request, f'Project completed successfully. Certificate has been generated for {project_enrollment.enrollment.user.get_full_name()}.')
+                messages.success(request, f'Project completed successfully. A certificate is being generated for {project_enrollment.enrollment.user.get_full_name()}.')
                 return redirect('courses:instructor_dashboard')
         
         elif action == 'request_changes':
             # Set status back to in_progress for resubmission
-            project_enrollment.status = 'in_progress'
-            project_enrollment.save()
+            ProjectReviewService.apply_reviews(request.user, [
+                (project_enrollment, 'request_changes', None, None)
+            ])
             
             messages.success(request, 'Project returned for revisions. Student has been notified.')
             return redirect('courses:instructor_dashboard')
@@ -546,8 +726,7 @@ def download_certificate(request, enrollment_id):
         return redirect('courses:course_materials', slug=project_enrollment.enrollment.course.slug)
     
     # Increment download count
-    project_enrollment.certificate_download_count += 1
-    project_enrollment.save()
+    LearnerActivityService.record_certificate_download(project_enrollment)
     
     # Return the certificate file
     try:
@@ -578,33 +757,105 @@ def instructor_dashboard(request):
         messages.error(request, 'You do not have instructor permissions.')
         return redirect('courses:courses')
     
-    if request.user.is_staff:
-        # Staff can see all courses
-        instructor_courses = Course.objects.filter(is_active=True)
-    else:
-        # Get courses assigned to this instructor
-        instructor_courses = Course.objects.filter(instructor=request.user, is_active=True)
-        
-        # If no courses found with instructor field, check if user is marked as instructor in profile
-        if not instructor_courses.exists() and profile.is_instructor:
-            # For now, show all courses if user is marked as instructor but no courses assigned
-            instructor_courses = Course.objects.filter(is_active=True)
-    
-    # Get all submitted projects for instructor's courses
-    submitted_projects = ProjectEnrollment.objects.filter(
-        project__course__in=instructor_courses,
-        status='submitted'
-    ).select_related(
+    # Courses are evaluated once; statistics come from maintained counters
+    instructor_courses = InstructorQueueService.get_instructor_courses(request.user, profile)
+    project_stats = InstructorQueueService.get_course_stats(instructor_courses)
+    
+    # Paginated queue of submitted projects for instructor's courses
+    submitted_projects = InstructorQueueService.get_queue_page(
+        instructor_courses,
+        request.GET.get('page'),
+        project_stats.submitted_count
+    )
+    
+    context = {
+        'instructor_courses': instructor_courses,
+        'submitted_projects': submitted_projects,
+        'project_stats': project_stats,
+    }
+    return render(request, 'courses/instructor_dashboard.html', context)
+
+
+@login_required
+def instructor_bulk_review(request):
+    """Grade and complete or return many submitted projects from one table"""
+    profile = getattr(request.user, 'userprofile', None)
+    if not request.user.is_staff and not (profile and profile.is_instructor):
+        messages.error(request, 'You do not have instructor permissions.')
+        return redirect('courses:courses')
+    
+    reviewable_projects = ProjectReviewService.get_reviewable_queryset(request.user).select_related(
         'enrollment__user',
-        'enrollment__course', 
+        'enrollment__course',
         'project'
-    ).order_by('-submitted_at')
+    )
     
-    # Debug: Print submitted projects count
-    print(f"Found {submitted_projects.count()} submitted projects for instructor courses: {[c.title for c in instructor_courses]}")
+    if request.method == 'POST':
+        formset = BulkReviewFormSet(request.POST)
+        if formset.is_valid():
+            rows = [form.cleaned_data for form in formset if form.cleaned_data.get('action')]
+            project_enrollments = reviewable_projects.in_bulk(
+                [row['project_enrollment_id'] for row in rows]
+            )
+            updated = ProjectReviewService.apply_reviews(request.user, [
+                (
+                    project_enrollments[row['project_enrollment_id']],
+                    row['action'],
+                    row['grade'],
+                    row['instructor_feedback'],
+                )
+                for row in rows
+                if row['project_enrollment_id'] in project_enrollments
+            ])
+            
+            completed = sum(1 for project_enrollment in updated if project_enrollment.status == 'completed')
+            returned = len(updated) - completed
+            if updated:
+                messages.success(
+                    request,
+                    f'Completed {completed} and returned {returned} project{"s" if returned != 1 else ""} for changes. '
+                    'Certificates and notification emails are being sent in the background.'
+                )
+            else:
+                messages.info(request, 'No changes were selected.')
+            return redirect('courses:instructor_bulk_review')
+        
+        # Re-display the submitted rows with their errors
+        posted_ids = []
+        for form in formset:
+            try:
+                posted_ids.append(int(form['project_enrollment_id'].value()))
+            except (TypeError, ValueError):
+                posted_ids.append(None)
+        project_enrollments = reviewable_projects.in_bulk([pk for pk in posted_ids if pk])
+        review_rows = [
+            (project_enrollments[pk], form)
+            for pk, form in zip(posted_ids, formset)
+            if pk in project_enrollments
+        ]
+        submitted_projects = None
+    else:
+        courses = ProjectReviewService.get_reviewable_courses(request.user)
+        project_stats = InstructorQueueService.get_course_stats(courses)
+        submitted_projects = InstructorQueueService.get_queue_page(
+            courses,
+            request.GET.get('page'),
+            project_stats.submitted_count,
+            per_page=ProjectReviewService.BULK_PAGE_SIZE
+        )
+        formset = BulkReviewFormSet(initial=[
+            {
+                'project_enrollment_id': project_enrollment.id,
+                'grade': project_enrollment.grade,
+                'instructor_feedback': project_enrollment.instructor_feedback,
+            }
+            for project_enrollment in submitted_projects
+        ])
+        review_rows = list(zip(submitted_projects, formset))
     
     context = {
-        'instructor_courses': instructor_courses,
+        'formset': formset,
+        'review_rows': review_rows,
         'submitted_projects': submitted_projects,
     }
-    return render(request, 'courses/instructor_dashboard.html', context)
\ No newline at end of file
+    return render(request, 'courses/instructor_bulk_review.html', context)
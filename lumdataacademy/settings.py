@@ -58,19 +58,24 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    'core.middleware.RequestMetricsMiddleware',
+    'core.middleware.QueryInspectorMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.middleware.ReadReplicaMiddleware',
+    'core.middleware.RequestProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'lumdataacademy.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates plus render timing for the request metrics (core/metrics.py)
+        'BACKEND': 'core.metrics.InstrumentedDjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -90,13 +95,87 @@ WSGI_APPLICATION = 'lumdataacademy.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# SQLITE_TUNING=0 falls back to Django's defaults (used by bench_db_writes for comparison)
+SQLITE_TUNING = os.environ.get('SQLITE_TUNING', '1') == '1'
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': os.environ.get('SQLITE_PATH', str(BASE_DIR / 'db.sqlite3')),
+        # Keep connections, and the pragmas applied to them, across requests
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', '600')) if SQLITE_TUNING else 0,
+        'CONN_HEALTH_CHECKS': True,
+        # Take the write lock at BEGIN: a deferred transaction that reads first
+        # and then writes fails immediately instead of waiting for busy_timeout
+        'OPTIONS': {'transaction_mode': 'IMMEDIATE'} if SQLITE_TUNING else {},
+    }
+}
+
+# Applied to every new SQLite connection by core.db.configure_sqlite_connection
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,  # KiB
+    'temp_store': 'MEMORY',
+} if SQLITE_TUNING else {}
+SQLITE_LOCK_RETRY_ATTEMPTS = 5
+SQLITE_LOCK_RETRY_DELAY = 0.05
+
+# Read replica for public pages (core/routers.py): '' (off), 'readonly' (mode=ro
+# connection to the primary file) or 'backup' (copy refreshed with the backup API)
+SQLITE_READ_REPLICA = os.environ.get('SQLITE_READ_REPLICA', '')
+SQLITE_REPLICA_PATH = os.environ.get('SQLITE_REPLICA_PATH', str(BASE_DIR / 'db.replica.sqlite3'))
+SQLITE_REPLICA_REFRESH_SECONDS = int(os.environ.get('SQLITE_REPLICA_REFRESH_SECONDS', '30'))
+# Views whose GET requests may read from the replica
+READ_REPLICA_VIEWS = [
+    'core:home',
+    'courses:courses',
+    'courses:course_detail',
+    'core:blog',
+    'core:blog_detail',
+    'core:events',
+    'core:event_detail',
+    'core:careers',
+    'core:career_detail',
+]
+# Always read from the primary: a session or user created moments ago must be found
+READ_REPLICA_EXCLUDED_APPS = ['sessions', 'auth']
+# How long a client stays on the primary after a write ('backup' mode)
+READ_REPLICA_PIN_SECONDS = 2 * SQLITE_REPLICA_REFRESH_SECONDS
+
+if SQLITE_READ_REPLICA in ('readonly', 'backup'):
+    replica_path = DATABASES['default']['NAME'] if SQLITE_READ_REPLICA == 'readonly' else SQLITE_REPLICA_PATH
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': f'file:{replica_path}?mode=ro',
+        # A refreshed backup replica is a new file: reconnect per request to pick it up
+        'CONN_MAX_AGE': DATABASES['default']['CONN_MAX_AGE'] if SQLITE_READ_REPLICA == 'readonly' else 0,
+        'CONN_HEALTH_CHECKS': True,
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_ROUTERS = ['core.routers.ReadReplicaRouter']
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+# One SQLite file shared by all workers on the host (core/cache.py)
+CACHES = {
+    'default': {
+        'BACKEND': 'core.cache.SQLiteCache',
+        'LOCATION': os.environ.get('CACHE_DB_PATH', str(BASE_DIR / 'cache.sqlite3')),
+        'OPTIONS': {
+            'MAX_ENTRIES': 50000,
+            'MAX_BYTES': 256 * 1024 * 1024,
+        },
     }
 }
 
+# Gives the test suite a cache and metrics store of its own (core/testing.py)
+TEST_RUNNER = 'core.testing.TestRunner'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -139,9 +218,16 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
-# WhiteNoise configuration for production static files
-if not DEBUG:
-    STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
+STORAGES = {
+    # Identical uploads share one file on disk (core/storage.py); gc_media removes orphans
+    'default': {
+        'BACKEND': 'core.storage.ContentHashedStorage',
+    },
+    # Served from STATIC_ROOT by WhiteNoiseMiddleware in every environment
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
 
 # CSRF and CORS settings for Replit and production
 default_replit_origins = [
@@ -285,6 +371,12 @@ CKEDITOR_5_CONFIGS = {
 }
 
 CKEDITOR_5_UPLOAD_PATH = "uploads/"
+# Editor uploads are resized and re-encoded (core/storage.py), and stored HTML gets srcset attributes (core/images.py)
+CKEDITOR_5_FILE_STORAGE = 'core.storage.CKEditorUploadStorage'
+CKEDITOR_IMAGE_MAX_SIZE = 1600
+# Format of the srcset written into stored HTML: a single <img> attribute, so every browser must support it
+CKEDITOR_IMAGE_SRCSET_FORMAT = 'jpeg'
+CKEDITOR_IMAGE_SIZES = '(min-width: 1024px) 768px, 100vw'
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
@@ -323,4 +415,81 @@ LOGIN_REDIRECT_URL = '/accounts/dashboard/'
 LOGOUT_REDIRECT_URL = '/'
 
 # Session settings
-SESSION_COOKIE_AGE = 1209600  # 2 weeks
\ No newline at end of file
+SESSION_COOKIE_AGE = 1209600  # 2 weeks
+
+# Background tasks (see core/tasks.py); run inline instead of on a worker thread when enabled
+BACKGROUND_TASKS_EAGER = os.environ.get('BACKGROUND_TASKS_EAGER', '0') == '1'
+
+# Responsive image variants (see core/images.py)
+IMAGE_VARIANT_WIDTHS = [320, 640, 960, 1280]
+IMAGE_VARIANT_QUALITY = {'webp': 78, 'jpeg': 80}
+
+# Pygments style of pre-rendered code examples; run "manage.py highlight_code_examples --css" after changing it
+CODE_HIGHLIGHT_STYLE = 'monokai'
+
+# Sandboxed runs of interactive code examples (see courses/runner.py and courses/sandbox_worker.py)
+CODE_RUNNER_WORKERS = int(os.environ.get('CODE_RUNNER_WORKERS', '2'))  # per web process
+CODE_RUNNER_PRELOAD = ['numpy', 'pandas', 'matplotlib.pyplot']
+CODE_RUNNER_CPU_SECONDS = 5
+CODE_RUNNER_WALL_SECONDS = 10
+CODE_RUNNER_MEMORY_MB = 256
+CODE_RUNNER_FILE_BYTES = 16 * 1024 * 1024
+CODE_RUNNER_OUTPUT_BYTES = 64 * 1024
+CODE_RUNNER_MAX_CODE_LENGTH = 20000
+CODE_RUNNER_QUEUE_SECONDS = 5
+CODE_RUNNER_CACHE_SECONDS = 60 * 60 * 24 * 7
+# Workers refuse to start where they cannot be cut off from the network, unless this is set
+CODE_RUNNER_ALLOW_NETWORK = os.environ.get('CODE_RUNNER_ALLOW_NETWORK', '0') == '1'
+# Likewise where they cannot be given a read-only root filesystem without the site's files (development only)
+CODE_RUNNER_ALLOW_FILESYSTEM = os.environ.get('CODE_RUNNER_ALLOW_FILESYSTEM', '0') == '1'
+# Size of the writable /tmp of each worker
+CODE_RUNNER_SCRATCH_MB = 64
+
+# Exercise auto-grading, in a sandbox pool of its own (see ExerciseGradingService in courses/services.py)
+GRADING_WORKERS = int(os.environ.get('GRADING_WORKERS', '4'))
+GRADING_TEST_SECONDS = 5
+GRADING_WALL_SECONDS = 60
+GRADING_QUEUE_SECONDS = 300
+
+# Maximum age in seconds of the cached admin dashboard counters (see core/services.py)
+ADMIN_STATS_REFRESH_SECONDS = 300
+
+# Per-request SQL recording and N+1 detection (see core/middleware.py)
+QUERY_INSPECTOR_ENABLED = os.environ.get('QUERY_INSPECTOR_ENABLED', '1' if DEBUG else '0') == '1'
+QUERY_INSPECTOR_N_PLUS_ONE_THRESHOLD = 3
+
+# Per-view latency histograms, /metrics and the slow-request log (see core/metrics.py)
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') == '1'
+METRICS_DB_PATH = os.environ.get('METRICS_DB_PATH', str(BASE_DIR / 'metrics.sqlite3'))
+METRICS_FLUSH_SECONDS = 10
+METRICS_SLOW_REQUEST_MS = int(os.environ.get('METRICS_SLOW_REQUEST_MS', '1000'))
+# Bearer token Prometheus sends to scrape /metrics; staff sessions are always allowed
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# On-demand cProfile/tracemalloc profiling through signed links (see core/profiling.py)
+PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', '1') == '1'
+PROFILING_TOKEN_MAX_AGE = 60 * 60
+PROFILING_TRACEMALLOC_FRAMES = 10
+PROFILING_TOP_ALLOCATIONS = 25
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'standard': {
+            'format': '%(asctime)s %(levelname)s %(name)s %(message)s',
+        },
+    },
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'standard',
+        },
+    },
+    'loggers': {
+        'accounts': {'handlers': ['console'], 'level': 'DEBUG' if DEBUG else 'INFO'},
+        'core': {'handlers': ['console'], 'level': 'DEBUG' if DEBUG else 'INFO'},
+        'courses': {'handlers': ['console'], 'level': 'DEBUG' if DEBUG else 'INFO'},
+        'emails': {'handlers': ['console'], 'level': 'DEBUG' if DEBUG else 'INFO'},
+    },
+}